@@ -9,28 +9,17 @@
 """
 
 from __future__ import print_function
-from datanator import io
-from datanator.core import data_model, common_schema, upload_data, data_query  # , json_schema
-from datanator.core.render_form import render_html_from_schema
-from datanator.data_source import *
-from datanator.data_source import refseq
-from datanator.util import molecule_util
-from datanator.util import taxonomy_util
+# The modules which the commands need are imported by the commands themselves so that starting the command line
+# program doesn't require importing all of the data sources, Flask, SQLAlchemy, Open Babel, etc.
+from datanator.util import import_util
+from datanator.util.constants import DATA_CACHE_DIR
 from pkg_resources import resource_filename
-import bioservices
 import cement
-import flask_migrate
 import datanator
 import os
-import pubchempy
 import re
 import shutil
-import sqlalchemy_utils
 import sys
-from Bio import SeqIO
-from datanator.api.query import reaction_kinetics
-#from datanator.core import data_query
-from datanator.util.constants import DATA_CACHE_DIR
 
 
 class BaseController(cement.Controller):
@@ -40,6 +29,8 @@ class BaseController(cement.Controller):
         description = 'Utilities for aggregating data for biochemical models'
         arguments = [
             (['-v', '--version'], dict(action='version', version=datanator.__version__)),
+            (['--import-profile'], dict(action='store_true',
+                                        help='Report the time spent importing modules to run the command')),
         ]
 
     @cement.ex(hide=True)
@@ -75,6 +66,7 @@ class UploadReferenceGenome(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from datanator.core import upload_data
         pargs = self.app.pargs
         #bio_seqio_object = SeqIO.parse(pargs.genome_path, "genbank")
         #list_of_bio_seqio_objects = [bio_seqio_object]
@@ -96,6 +88,8 @@ class UploadRNASeqExperiment(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from Bio import SeqIO
+        from datanator.data_source import refseq
         pargs = self.app.pargs
         bio_seqio_object = SeqIO.parse(pargs.ref_genome_path, "genbank")
         list_of_bio_seqio_objects = [bio_seqio_object]
@@ -115,6 +109,8 @@ class UploadData(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from datanator.core import json_schema
+        from datanator.core.render_form import render_html_from_schema
         pargs = self.app.pargs
         data_type = pargs.data_type
 
@@ -154,47 +150,55 @@ class BuildController(cement.Controller):
 
     @cement.ex(help='Builds Corum Complex DB from source')
     def corum(self):
+        from datanator.data_source import corum
         pargs = self.app.pargs
         corum.Corum(cache_dirname=pargs.path, load_content=True, download_backups=False,
                     max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds IntAct Interactions and Complex DB from source')
     def intact(self):
+        from datanator.data_source import intact
         pargs = self.app.pargs
         intact.IntAct(cache_dirname=pargs.path, load_content=True, download_backups=False,
                       max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds Sabio Reaction Kinetics DB from source')
     def sabio(self):
+        from datanator.data_source import sabio_rk
         pargs = self.app.pargs
         sabio_rk.SabioRk(cache_dirname=pargs.path, load_content=True, download_backups=False,
                          max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds Pax Protein Abundance DB from source')
     def pax(self):
+        from datanator.data_source import pax
         pargs = self.app.pargs
         pax.Pax(cache_dirname=pargs.path, load_content=True, download_backups=False, max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds Array Express RNA Seq DB from source')
     def array_express(self):
+        from datanator.data_source import array_express
         pargs = self.app.pargs
         array_express.ArrayExpress(cache_dirname=pargs.path, load_content=True, download_backups=False,
                                    max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds Jaspar DNA protein interaction DB from source')
     def jaspar(self):
+        from datanator.data_source import jaspar
         pargs = self.app.pargs
         jaspar.Jaspar(cache_dirname=pargs.path, load_content=True, download_backups=False,
                       max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds Uniprot Protein DB from source')
     def uniprot(self):
+        from datanator.data_source import uniprot
         pargs = self.app.pargs
         uniprot.Uniprot(cache_dirname=pargs.path, load_content=True, download_backups=False,
                         max_entries=pargs.max_entries, verbose=pargs.verbose)
 
     @cement.ex(help='Builds ECMDB metabolite DB from source')
     def ecmdb(self):
+        from datanator.data_source import ecmdb
         pargs = self.app.pargs
         ecmdb.Ecmdb(cache_dirname=pargs.path, load_content=True, download_backups=False,
                     max_entries=pargs.max_entries, verbose=pargs.verbose)
@@ -231,11 +235,16 @@ class AggregateBuildController(cement.Controller):
             (['--load-full-small-dbs'], dict(
                 type=bool,
                 default=True,
-                help="loads entire small database modules"))
+                help="loads entire small database modules")),
+            (['--jobs'], dict(
+                type=int,
+                default=None,
+                help="number of processes to use to build the database. Default: number of cores"))
         ]
 
     @cement.ex(help='Controller that controls aggregated')
     def _default(self):
+        from datanator.core import common_schema
         pargs = self.app.pargs
         # todo: set restore_backup_schema=False after fixing Alembic issue with migrations
         # todo: restore_backup_exit_on_error=True after fixing Alembic issue with migrations
@@ -243,7 +252,8 @@ class AggregateBuildController(cement.Controller):
                                    restore_backup_data=True, restore_backup_schema=True,
                                    restore_backup_exit_on_error=False,
                                    max_entries=pargs.max_entries,
-                                   verbose=pargs.verbose)
+                                   verbose=pargs.verbose,
+                                   jobs=pargs.jobs)
 
 
 class DownloadController(cement.Controller):
@@ -259,46 +269,55 @@ class DownloadController(cement.Controller):
 
     @cement.ex(help='Loads Corum Complex DB from Karr Lab Server')
     def corum(self):
+        from datanator.data_source import corum
         pargs = self.app.pargs
         corum.Corum(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads IntAct Interactions and Complex DB from Karr Lab Server')
     def intact(self):
+        from datanator.data_source import intact
         pargs = self.app.pargs
         intact.IntAct(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Sabio Reaction Kinetics DB from Karr Lab Server')
     def sabio(self):
+        from datanator.data_source import sabio_rk
         pargs = self.app.pargs
         sabio_rk.SabioRk(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Pax Protein Abundance DB from Karr Lab Server')
     def pax(self):
+        from datanator.data_source import pax
         pargs = self.app.pargs
         pax.Pax(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Array Express RNA Seq DB from Karr Lab Server')
     def array_express(self):
+        from datanator.data_source import array_express
         pargs = self.app.pargs
         array_express.ArrayExpress(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Jaspar DNA protein interaction DB from Karr Lab Server')
     def jaspar(self):
+        from datanator.data_source import jaspar
         pargs = self.app.pargs
         jaspar.Jaspar(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Uniprot Protein DB from Karr Lab Server')
     def uniprot(self):
+        from datanator.data_source import uniprot
         pargs = self.app.pargs
         uniprot.Uniprot(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads ECMDB metabolite DB from Karr Lab Server')
     def ecmdb(self):
+        from datanator.data_source import ecmdb
         pargs = self.app.pargs
         ecmdb.Ecmdb(cache_dirname=pargs.path, download_backups=True)
 
     @cement.ex(help='Loads Aggregated DB from Karr Lab Server')
     def aggregate(self):
+        from datanator.core import common_schema
         pargs = self.app.pargs
         # todo: set restore_backup_schema=False after fixing Alembic issue with migrations
         # todo: restore_backup_exit_on_error=True after fixing Alembic issue with migrations
@@ -338,6 +357,9 @@ class GetDataController(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from datanator import io
+        from datanator.api.query import reaction_kinetics
+        from datanator.core import data_query
         pargs = self.app.pargs
         genetics, compartments, species, reactions = io.InputReader().run(pargs.input_file)
         # print(reactions)
@@ -584,9 +606,12 @@ class MoleculeGetStructureController(cement.Controller):
     @cement.ex(hide=True)
     def _default(self):
         if self.app.pargs.by_name:
-            compounds = pubchempy.get_compounds(self.app.pargs.name_or_id, 'name')
-            results = [[compound.synonyms[0], 'pubchem.compound', compound.cid, compound.inchi] for compound in compounds]
+            from datanator.data_source import pubchem
+            name = self.app.pargs.name_or_id
+            compounds = pubchem.get_name_resolver().resolve(name)
+            results = [[name, 'pubchem.compound', compound.cid, compound.inchi] for compound in compounds]
         else:
+            import bioservices
             unichem = bioservices.UniChem()
             structure = unichem.get_structure(int(float(self.app.pargs.name_or_id)), self.app.pargs.namespace)
             if structure:
@@ -625,6 +650,7 @@ class MoleculeConvertStructureController(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from datanator.util import molecule_util
         structure = self.app.pargs.structure
         format = self.app.pargs.format
         print(molecule_util.Molecule(structure=structure).to_format(format))
@@ -662,12 +688,17 @@ class ReactionGetEcNumberController(cement.Controller):
     # todo: add find_ec
     @cement.ex(hide=True)
     def _default(self):
+        from datanator.core import data_model
+        from datanator.data_source import ezyme
+        from datanator.data_source import pubchem
+        from datanator.util import molecule_util
+
         # parse input
         def parse_participants(side, coefficient, reaction, errors):
             for participant in side.split(' + '):
                 participant = participant.strip()
 
-                pubchem_compounds = pubchempy.get_compounds(participant, 'name')
+                pubchem_compounds = pubchem_compounds_by_name[participant]
                 if len(pubchem_compounds) == 1:
                     structure = pubchem_compounds[0].inchi
                 elif molecule_util.Molecule(structure=participant).get_format():
@@ -686,6 +717,10 @@ class ReactionGetEcNumberController(cement.Controller):
             print('The reaction is ill-formed', file=sys.stderr)
             return
 
+        # resolve the names of all of the participants at once
+        pubchem_compounds_by_name = pubchem.get_name_resolver().resolve_many(
+            participant.strip() for participant in (match.group(1) + ' + ' + match.group(2)).split(' + '))
+
         reaction = data_model.Reaction()
         errors = []
         parse_participants(match.group(1), -1, reaction, errors)
@@ -695,7 +730,7 @@ class ReactionGetEcNumberController(cement.Controller):
             return
 
         # predict EC number
-        results = ezyme.Ezyme().run(reaction)
+        results = ezyme.get_ezyme().run(reaction)
 
         # print results
         if results:
@@ -722,12 +757,16 @@ class DbController(cement.Controller):
 
     @cement.ex(help='Create the structure of the Datanator database')
     def create(self):
+        from datanator.core import models  # registers the tables of the database
+        import sqlalchemy_utils
         if not sqlalchemy_utils.functions.database_exists(datanator.db.engine.url):
             sqlalchemy_utils.functions.create_database(datanator.db.engine.url)
         datanator.db.create_all()
 
     @cement.ex(help='Migrate the structure of the Datanator database')
     def migrate(self):
+        from datanator.core import models  # registers the tables of the database
+        import flask_migrate
         with datanator.app.app_context():
             if not os.path.isdir('migrations'):
                 flask_migrate.init()
@@ -736,6 +775,7 @@ class DbController(cement.Controller):
 
     @cement.ex(help='Drop the Datanator database')
     def drop(self):
+        import sqlalchemy_utils
         datanator.db.engine.dispose()
         sqlalchemy_utils.functions.drop_database(datanator.db.engine.url)
 
@@ -764,6 +804,7 @@ class DbRestoreController(cement.Controller):
 
     @cement.ex(hide=True)
     def _default(self):
+        from datanator.core import common_schema
         pargs = self.app.pargs
         common_schema.CommonSchema(clear_content=True,
                                    restore_backup_data=pargs.restore_data,
@@ -825,6 +866,7 @@ def create_taxon(id_or_name):
     Returns:
         :obj:`taxonomy_util.Taxon`: taxon
     """
+    from datanator.util import taxonomy_util
     ncbi_id = None
     name = None
     try:
@@ -836,6 +878,11 @@ def create_taxon(id_or_name):
 
 
 def main():
+    argv = sys.argv[1:]
+    if '--import-profile' in argv:
+        argv.remove('--import-profile')
+        sys.exit(import_util.profile_imports(['-m', 'datanator'] + argv))
+
     with App() as app:
         app.run()
 
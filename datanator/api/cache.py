@@ -0,0 +1,197 @@
+""" Cache of serialized responses of the REST API
+
+:Date: 2018-09-12
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util.constants import API_RESPONSE_CACHE_MAX_SIZE, API_RESPONSE_CACHE_VERSION_CHECK_INTERVAL
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache(object):
+    """ Two-tier cache of the serialized JSON responses of the REST API, keyed by endpoint and arguments
+
+    Responses are kept in an in-process least-recently-used tier and, optionally, in a SQLite file which is
+    shared by all of the processes which serve the API. Each response is stored with the version of the database
+    build it was computed from, and the cache is invalidated whenever that version changes (e.g. when a new build
+    of the common schema is restored).
+
+    Attributes:
+        get_build_version (:obj:`callable`): function which returns the version of the database build
+        max_size (:obj:`int`): maximum number of responses to keep in memory
+        dirname (:obj:`str`): directory for the shared on-disk tier; if :obj:`None`, responses are only cached
+            in memory
+        version_check_interval (:obj:`float`): minimum time in seconds between checks of the build version
+        hits (:obj:`int`): number of lookups answered from the cache
+        misses (:obj:`int`): number of lookups which weren't in the cache
+        _responses (:obj:`collections.OrderedDict`): responses in least-recently-used order
+        _version (:obj:`str`): version of the database build of the cached responses
+        _version_time (:obj:`float`): time of the last check of the build version
+        _lock (:obj:`threading.RLock`): lock which protects the in-memory tier
+        _connections (:obj:`threading.local`): per-thread connections to the on-disk tier
+    """
+
+    FILENAME = 'api_responses.sqlite'
+
+    def __init__(self, get_build_version, max_size=API_RESPONSE_CACHE_MAX_SIZE, dirname=None,
+                 version_check_interval=API_RESPONSE_CACHE_VERSION_CHECK_INTERVAL):
+        """
+        Args:
+            get_build_version (:obj:`callable`): function which returns the version of the database build
+            max_size (:obj:`int`, optional): maximum number of responses to keep in memory
+            dirname (:obj:`str`, optional): directory for the shared on-disk tier
+            version_check_interval (:obj:`float`, optional): minimum time in seconds between checks of the
+                build version
+        """
+        self.get_build_version = get_build_version
+        self.max_size = max_size
+        self.dirname = dirname
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self._responses = collections.OrderedDict()
+        self._version = None
+        self._version_time = None
+        self._lock = threading.RLock()
+        self._connections = threading.local()
+
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+    @staticmethod
+    def get_key(endpoint, args):
+        """ Get the key of a response
+
+        Args:
+            endpoint (:obj:`str`): name of the endpoint
+            args (:obj:`dict`): arguments of the request
+
+        Returns:
+            :obj:`str`: key
+        """
+        return json.dumps([endpoint, args], sort_keys=True, default=str)
+
+    def get(self, key):
+        """ Get a cached response
+
+        Args:
+            key (:obj:`str`): key of the response
+
+        Returns:
+            :obj:`tuple`: body (:obj:`bytes`) and headers (:obj:`dict`) of the response, or :obj:`None` if the
+            response isn't cached
+        """
+        version = self.get_version()
+
+        with self._lock:
+            response = self._responses.pop(key, None)
+            if response is not None:
+                self._responses[key] = response
+                self.hits += 1
+                return response
+
+        response = None
+        if self.dirname:
+            row = self.get_connection().execute('SELECT body, headers FROM response WHERE key = ? AND version = ?',
+                                                (key, version)).fetchone()
+            if row is not None:
+                response = (bytes(row[0]), json.loads(row[1]))
+
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._add(key, response)
+        return response
+
+    def set(self, key, body, headers=None):
+        """ Cache a response
+
+        Args:
+            key (:obj:`str`): key of the response
+            body (:obj:`bytes`): serialized body of the response
+            headers (:obj:`dict`, optional): headers of the response
+        """
+        version = self.get_version()
+        response = (body, dict(headers or {}))
+
+        with self._lock:
+            self._add(key, response)
+
+        if self.dirname:
+            connection = self.get_connection()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO response (key, version, body, headers) VALUES (?, ?, ?, ?)',
+                                   (key, version, sqlite3.Binary(body), json.dumps(response[1])))
+
+    def _add(self, key, response):
+        """ Add a response to the in-memory tier, evicting the least recently used responses if the tier is full
+
+        Args:
+            key (:obj:`str`): key of the response
+            response (:obj:`tuple`): body and headers of the response
+        """
+        self._responses.pop(key, None)
+        self._responses[key] = response
+        while len(self._responses) > self.max_size:
+            self._responses.popitem(last=False)
+
+    def get_version(self):
+        """ Get the version of the database build, and clear the cache if it has changed. To avoid querying the
+        database for each request, the version is checked at most once every :obj:`version_check_interval`
+        seconds.
+
+        Returns:
+            :obj:`str`: version of the database build
+        """
+        now = time.time()
+        with self._lock:
+            if self._version_time is not None and now - self._version_time < self.version_check_interval:
+                return self._version
+            self._version_time = now
+
+        version = str(self.get_build_version())
+
+        with self._lock:
+            if version != self._version:
+                self._responses.clear()
+                if self.dirname:
+                    connection = self.get_connection()
+                    with connection:
+                        connection.execute('DELETE FROM response WHERE version != ?', (version, ))
+                self._version = version
+        return version
+
+    def clear(self):
+        """ Remove all of the responses from the cache """
+        with self._lock:
+            self._responses.clear()
+            self._version = None
+            self._version_time = None
+        if self.dirname:
+            connection = self.get_connection()
+            with connection:
+                connection.execute('DELETE FROM response')
+
+    def get_connection(self):
+        """ Get the calling thread's connection to the on-disk tier
+
+        Returns:
+            :obj:`sqlite3.Connection`: connection
+        """
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None or self._connections.pid != os.getpid():
+            connection = sqlite3.connect(os.path.join(self.dirname, self.FILENAME), timeout=30.)
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS response '
+                                   '(key TEXT PRIMARY KEY, version TEXT, body BLOB, headers TEXT)')
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+        return connection
@@ -0,0 +1,316 @@
+""" Compiled serializers which produce the same output as the marshmallow serializers of the API without walking
+the relationships of the ORM objects one at a time
+
+:Date: 2018-09-19
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from marshmallow import fields
+from marshmallow_sqlalchemy import ModelSchema
+from marshmallow_sqlalchemy.fields import Related
+import collections
+import sqlalchemy
+import sqlalchemy.orm
+import threading
+
+MISSING = object()
+# :obj:`object`: sentinel for attributes which objects don't have
+
+
+class CompileError(Exception):
+    """ Exception raised when a schema has a field which can't be compiled """
+    pass
+
+
+class CompiledSerializer(object):
+    """ Compiled version of a marshmallow schema
+
+    Model schemas (:obj:`ModelSchema`) are compiled into a fixed set of queries: one query for the columns of the
+    objects, and one query for the related ids of each relationship, which are applied recursively to nested
+    schemas. This produces the same dictionaries as :obj:`ModelSchema.dump` with a number of queries which doesn't
+    depend on the number of objects, instead of lazily loading the relationships of each object.
+
+    Other schemas (e.g. of :obj:`datanator.core.data_model` objects) are compiled into a list of getters and
+    converters, which avoids the per-object overhead of marshmallow.
+
+    Schemas with fields which can't be compiled (e.g. methods or functions) are dumped with marshmallow.
+
+    Attributes:
+        schema (:obj:`marshmallow.Schema`): schema
+        model (:obj:`type`): model of the schema, or :obj:`None` if it isn't a model schema
+        compiled (:obj:`bool`): :obj:`True` if the schema has been compiled
+        columns (:obj:`list` of :obj:`tuple`): key, attribute and converter of each column (or, for other
+            schemas, simple attribute)
+        relationships (:obj:`list` of :obj:`tuple`): key, attribute, relationship (:obj:`None` for other
+            schemas), whether the relationship is a list, and :obj:`CompiledSerializer` of the related objects
+            (:obj:`None` to only dump their ids) of each relationship (or, for other schemas, nested attribute)
+        _lock (:obj:`threading.Lock`): lock which protects the compilation
+    """
+
+    _serializers = {}
+    _serializers_lock = threading.Lock()
+
+    IDENTITY_FIELDS = (fields.String, fields.Integer, fields.Float, fields.Boolean)
+    # :obj:`tuple` of :obj:`type`: fields which don't transform the values of columns of the matching types
+
+    def __init__(self, schema):
+        """
+        Args:
+            schema (:obj:`marshmallow.Schema` or :obj:`type`): schema or class of the schema
+        """
+        if isinstance(schema, type):
+            schema = schema()
+        self.schema = schema
+        self.model = schema.opts.model if isinstance(schema, ModelSchema) else None
+        self.compiled = False
+        self.columns = None
+        self.relationships = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, schema_cls):
+        """ Get the compiled serializer of a schema, creating it on first use
+
+        Args:
+            schema_cls (:obj:`type`): class of the schema
+
+        Returns:
+            :obj:`CompiledSerializer`: compiled serializer
+        """
+        serializer = cls._serializers.get(schema_cls, None)
+        if serializer is None:
+            with cls._serializers_lock:
+                serializer = cls._serializers.get(schema_cls, None)
+                if serializer is None:
+                    serializer = cls._serializers[schema_cls] = cls(schema_cls)
+        return serializer
+
+    def compile(self):
+        """ Compile the schema
+
+        Raises:
+            :obj:`CompileError`: if the schema has a field which can't be compiled
+        """
+        if self.compiled:
+            return
+
+        with self._lock:
+            if self.compiled:
+                return
+
+            columns = []
+            relationships = []
+            mapper = sqlalchemy.inspect(self.model) if self.model else None
+            for name, field in self.schema.fields.items():
+                if field.load_only:
+                    continue
+                key = field.dump_to or name
+                attr_name = field.attribute or name
+
+                many = isinstance(field, fields.List)
+                item_field = field.container if many else field
+
+                if isinstance(item_field, fields.Nested):
+                    related_serializer = CompiledSerializer(item_field.schema)
+                    many = many or item_field.many
+                elif isinstance(item_field, Related) and mapper:
+                    related_serializer = None
+                elif many or isinstance(field, (fields.Method, fields.Function, Related)):
+                    raise CompileError('Field {} of {} cannot be compiled'.format(name, self.schema.__class__.__name__))
+                else:
+                    columns.append((key, attr_name, self.get_converter(field, name)))
+                    continue
+
+                if mapper:
+                    if attr_name not in mapper.relationships:
+                        raise CompileError('{} is not a relationship of {}'.format(attr_name, self.model.__name__))
+                    relationship = mapper.relationships[attr_name]
+                    if related_serializer is None:
+                        many = relationship.uselist
+                    elif related_serializer.model is not relationship.mapper.class_:
+                        raise CompileError('The model of field {} of {} does not match its relationship'.format(
+                            name, self.schema.__class__.__name__))
+                    self.get_primary_key(relationship.mapper.class_)
+                elif related_serializer.model:
+                    raise CompileError('Field {} of {} nests a model schema'.format(name, self.schema.__class__.__name__))
+                else:
+                    relationship = None
+                relationships.append((key, attr_name, relationship, many, related_serializer))
+
+            if mapper:
+                self.get_primary_key(self.model)
+                for _, attr_name, _ in columns:
+                    if attr_name not in mapper.column_attrs:
+                        raise CompileError('{} is not a column of {}'.format(attr_name, self.model.__name__))
+
+            for _, _, _, _, related_serializer in relationships:
+                if related_serializer is not None:
+                    related_serializer.compile()
+
+            self.columns = columns
+            self.relationships = relationships
+            self.compiled = True
+
+    @classmethod
+    def get_converter(cls, field, name):
+        """ Get the function which converts the values of a field
+
+        Args:
+            field (:obj:`marshmallow.fields.Field`): field
+            name (:obj:`str`): name of the field
+
+        Returns:
+            :obj:`callable`: converter, or :obj:`None` if values don't have to be converted
+        """
+        if type(field) in cls.IDENTITY_FIELDS or type(field) is fields.Field:
+            return None
+        return lambda value: field._serialize(value, name, None)
+
+    def dump(self, obj, many=False):
+        """ Serialize one or more objects
+
+        Args:
+            obj (:obj:`object` or :obj:`list`): object, or list of objects if :obj:`many` is :obj:`True`
+            many (:obj:`bool`, optional): if :obj:`True`, serialize a list of objects
+
+        Returns:
+            :obj:`dict` or :obj:`list` of :obj:`dict`: serialized object(s)
+        """
+        objs = list(obj) if many else [obj]
+        if not many and obj is None:
+            return {}
+
+        try:
+            self.compile()
+        except CompileError:
+            return self.schema.dump(obj, many=many).data
+
+        if self.model:
+            session = next((sqlalchemy.orm.object_session(o) for o in objs if o is not None), None)
+            pk_key = self.get_primary_key(self.model)
+            ids = [getattr(o, pk_key) for o in objs]
+            dumped = self.dump_ids(session, ids)
+            data = [dumped.get(id, {}) for id in ids]
+        else:
+            data = [self.dump_object(o) for o in objs]
+
+        return data if many else data[0]
+
+    def dump_ids(self, session, ids):
+        """ Serialize the objects of the schema's model with a list of ids
+
+        Args:
+            session (:obj:`sqlalchemy.orm.Session`): session
+            ids (:obj:`list`): ids of the objects
+
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each object to its serialization
+        """
+        ids = list(collections.OrderedDict.fromkeys(id for id in ids if id is not None))
+        if not ids or session is None:
+            return {}
+
+        model = self.model
+        pk = getattr(model, self.get_primary_key(model))
+
+        dumped = collections.OrderedDict()
+        q = session.query(pk, *[getattr(model, attr_name) for _, attr_name, _ in self.columns]).filter(pk.in_(ids))
+        for row in q:
+            obj = dumped[row[0]] = {}
+            for (key, _, converter), value in zip(self.columns, row[1:]):
+                obj[key] = converter(value) if converter is not None and value is not None else value
+
+        for key, _, relationship, many, related_serializer in self.relationships:
+            related_model = relationship.mapper.class_
+            related = sqlalchemy.orm.aliased(related_model, flat=True)
+            related_pk = getattr(related, self.get_primary_key(related_model))
+            q = session.query(pk, related_pk) \
+                .select_from(model) \
+                .join(related, getattr(model, relationship.key)) \
+                .filter(pk.in_(ids)) \
+                .order_by(pk, related_pk)
+            related_ids = collections.defaultdict(list)
+            for id, related_id in q:
+                related_ids[id].append(related_id)
+
+            if related_serializer is None:
+                related_dumped = None
+            else:
+                related_dumped = related_serializer.dump_ids(session, set(
+                    related_id for values in related_ids.values() for related_id in values))
+
+            for id, obj in dumped.items():
+                values = related_ids[id]
+                if related_dumped is not None:
+                    values = [related_dumped[value] for value in values]
+                if many:
+                    obj[key] = values
+                else:
+                    obj[key] = values[0] if values else None
+
+        return dumped
+
+    def dump_object(self, obj):
+        """ Serialize an object which isn't an instance of a model
+
+        Args:
+            obj (:obj:`object`): object
+
+        Returns:
+            :obj:`dict`: serialized object
+        """
+        if obj is None:
+            return None
+
+        data = {}
+        for key, attr_name, converter in self.columns:
+            value = getattr(obj, attr_name, MISSING)
+            if value is MISSING:
+                continue
+            data[key] = converter(value) if converter is not None and value is not None else value
+
+        for key, attr_name, _, many, related_serializer in self.relationships:
+            value = getattr(obj, attr_name, MISSING)
+            if value is MISSING:
+                continue
+            if value is None:
+                data[key] = None
+            elif many:
+                data[key] = [related_serializer.dump_object(item) for item in value]
+            else:
+                data[key] = related_serializer.dump_object(value)
+
+        return data
+
+    @staticmethod
+    def get_primary_key(model):
+        """ Get the name of the attribute which holds the primary key of a model, as used by :obj:`Related`
+
+        Args:
+            model (:obj:`type`): model
+
+        Returns:
+            :obj:`str`: name of the attribute
+
+        Raises:
+            :obj:`CompileError`: if the model has a composite primary key
+        """
+        mapper = sqlalchemy.inspect(model)
+        if len(mapper.primary_key) != 1:
+            raise CompileError('{} has a composite primary key'.format(model.__name__))
+        return mapper.get_property_by_column(mapper.primary_key[0]).key
+
+
+def dump(schema_cls, obj, many=False):
+    """ Serialize one or more objects with the compiled version of a schema
+
+    Args:
+        schema_cls (:obj:`type`): class of the schema
+        obj (:obj:`object` or :obj:`list`): object, or list of objects if :obj:`many` is :obj:`True`
+        many (:obj:`bool`, optional): if :obj:`True`, serialize a list of objects
+
+    Returns:
+        :obj:`dict` or :obj:`list` of :obj:`dict`: serialized object(s)
+    """
+    return CompiledSerializer.get(schema_cls).dump(obj, many=many)
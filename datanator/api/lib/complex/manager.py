@@ -8,16 +8,31 @@
 from datanator.core import data_model, data_query, common_schema, models
 from datanator.api.lib.data_manager import BaseManager
 from datanator.util.constants import DATA_CACHE_DIR
+import collections
+import sqlalchemy.orm
 
 class ProteinComplexManager(BaseManager):
     """ Manages protein complex information for API """
 
     def __init__(self, cache_dirname = DATA_CACHE_DIR):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
+        super(ProteinComplexManager, self).__init__(cache_dirname=cache_dirname)
 
     def get_complex_by_id(self, id):
         return self.data_source.session.query(models.ProteinComplex).get(id)
 
+    def get_complexes_by_ids(self, ids):
+        """ Get protein complexes, together with their cross references, with a single query
+
+        Args:
+            ids (:obj:`list` of :obj:`int`): ids of the complexes
+
+        Returns:
+            :obj:`list` of :obj:`models.ProteinComplex`: complexes in the order of their ids
+        """
+        return self.get_by_ids(models.ProteinComplex, models.ProteinComplex.complex_id, ids,
+                               options=[sqlalchemy.orm.selectinload(models.ProteinComplex._metadata)
+                                        .selectinload(models.Metadata.resource)])
+
     def _search(self, value):
         return models.ProteinComplex.query.search(value, vector=models.ProteinComplex.simple_search_vector).all()
 
@@ -40,20 +55,36 @@ class ProteinComplexManager(BaseManager):
         Returns:
             :obj:`list` of :obj:`data_model.ObservedSpecie`: list of Protein Subunits
         """
-        subunits = self.get_subunits_by_known_complex(protein_complex.complex_name).all()
-        observed_specie = []
-        for item in subunits:
-            metadata = self.metadata_dump(item)
-            resource = data_model.Resource(namespace = item._metadata.resource[0].namespace,
-                id = item._metadata.resource[0]._id)
-            specie = data_model.ProteinSpecie(name = item.subunit_name, uniprot_id = item.uniprot_id,
-                sequence = item.canonical_sequence, entrez_id = item.entrez_id,
-                gene_name = item.gene_name, length = item.length, mass= item.mass,
-                cross_references = [resource])
+        return self.get_observable_subunits_by_complexes([protein_complex])[protein_complex.complex_id]
+
+    def get_observable_subunits_by_complexes(self, protein_complexes):
+        """ Get the known protein subunits of each of a list of protein complexes with a fixed number of queries
 
-            observed_specie.append(data_model.ObservedSpecie(specie = specie, metadata=metadata))
+        Args:
+            protein_complexes (:obj:`list` of :obj:`models.ProteinComplex`): complexes to find subunits for
 
-        return observed_specie
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each complex to a :obj:`list` of its protein subunits
+            (:obj:`data_model.ObservedSpecie`)
+        """
+        complex_names = set(complex.complex_name for complex in protein_complexes)
+        subunits = collections.defaultdict(list)
+        if complex_names:
+            q = self.get_subunits_by_known_complex(complex_names,
+                                                   select=(models.ProteinComplex.complex_name, models.ProteinSubunit)) \
+                .options(*self.get_metadata_load_options(models.ProteinSubunit._metadata))
+            for complex_name, item in q:
+                metadata = self.metadata_dump(item)
+                resource = data_model.Resource(namespace = item._metadata.resource[0].namespace,
+                    id = item._metadata.resource[0]._id)
+                specie = data_model.ProteinSpecie(name = item.subunit_name, uniprot_id = item.uniprot_id,
+                    sequence = item.canonical_sequence, entrez_id = item.entrez_id,
+                    gene_name = item.gene_name, length = item.length, mass= item.mass,
+                    cross_references = [resource])
+
+                subunits[complex_name].append(data_model.ObservedSpecie(specie = specie, metadata=metadata))
+
+        return {complex.complex_id: list(subunits[complex.complex_name]) for complex in protein_complexes}
 
     def get_known_complex_by_subunit(self, uniprot, select = models.ProteinComplex):
         """ Get known complexes that were observed for a given uniprot id subunit
@@ -72,13 +103,21 @@ class ProteinComplexManager(BaseManager):
         """ Get known protein subunits that were observed for a given complex
 
         Args:
-            complex_name (:obj:`str`): complex to find subunits for
+            complex_name (:obj:`str` or :obj:`set` of :obj:`str`): complex to find subunits for, or a set of
+                complexes
+            select (:obj:`object` or :obj:`tuple`, optional): entity or tuple of entities to select
 
         Returns:
             :obj:`sqlalchemy.orm.query.Query`: query for protein subunits that are within the given protein complex
         """
-        q = self.data_source.session.query(select).join(models.ProteinComplex, select.proteincomplex)
-        condition = models.ProteinComplex.complex_name == complex_name
+        if not isinstance(select, tuple):
+            select = (select, )
+        q = self.data_source.session.query(*select).select_from(models.ProteinSubunit) \
+            .join(models.ProteinComplex, models.ProteinSubunit.proteincomplex)
+        if isinstance(complex_name, (set, list, tuple)):
+            condition = models.ProteinComplex.complex_name.in_(list(complex_name))
+        else:
+            condition = models.ProteinComplex.complex_name == complex_name
         return q.filter(condition)
 
 complex_manager = ProteinComplexManager()
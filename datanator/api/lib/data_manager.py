@@ -1,10 +1,96 @@
-from datanator.core import data_model, common_schema
+from datanator.core import data_model, common_schema, models
+from datanator.util import molecule_util
+from datanator.util.constants import DATA_CACHE_DIR, INCHI_NORMALIZATION_CACHE_FILENAME
+import collections
+import os
+import sqlalchemy.orm
+import threading
+
+data_sources = {}
+data_sources_lock = threading.Lock()
+
+def get_data_source(cache_dirname=DATA_CACHE_DIR):
+    """ Get the common schema data source which is shared by all of the managers, creating it on first use
+
+    The data source's session is scoped to the current thread and is removed when each request's application
+    context is torn down, and its engine pools the connections of all of the requests (see the `SQLALCHEMY_POOL_*`
+    settings in :obj:`datanator.config.config`). The InChI normalizer persists its results in the same directory,
+    so that the managers share the structures normalized by the loaders.
+
+    Args:
+        cache_dirname (:obj:`str`, optional): directory to store the local copy of the data source
+
+    Returns:
+        :obj:`common_schema.CommonSchema`: data source
+    """
+    data_source = data_sources.get(cache_dirname, None)
+    if data_source is None:
+        with data_sources_lock:
+            data_source = data_sources.get(cache_dirname, None)
+            if data_source is None:
+                data_source = data_sources[cache_dirname] = common_schema.CommonSchema(cache_dirname=cache_dirname)
+                molecule_util.get_inchi_normalizer(os.path.join(cache_dirname, INCHI_NORMALIZATION_CACHE_FILENAME))
+    return data_source
 
 
 class BaseManager(object):
+    """ Base class for the managers of the API
 
-    def __init__(self, cache_dirname=None):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
+    Attributes:
+        cache_dirname (:obj:`str`): directory to store the local copy of the data source
+    """
+
+    def __init__(self, cache_dirname=DATA_CACHE_DIR):
+        self.cache_dirname = cache_dirname
+        self._data_source = None
+
+    @property
+    def data_source(self):
+        """ :obj:`common_schema.CommonSchema`: data source, which is shared by all of the managers and is only
+        created when it is first used """
+        if self._data_source is None:
+            self._data_source = get_data_source(self.cache_dirname)
+        return self._data_source
+
+    @data_source.setter
+    def data_source(self, value):
+        self._data_source = value
+
+    def get_by_ids(self, model, id_column, ids, options=()):
+        """ Get the rows of a model with a list of ids using a single query
+
+        Args:
+            model (:obj:`type`): model
+            id_column (:obj:`sqlalchemy.orm.attributes.InstrumentedAttribute`): column which holds the ids
+            ids (:obj:`list`): ids
+            options (:obj:`list`, optional): loader options of the query
+
+        Returns:
+            :obj:`list`: rows in the order of their ids; ids without a row and repeated ids are skipped
+        """
+        ids = list(collections.OrderedDict.fromkeys(ids))
+        if not ids:
+            return []
+        rows = self.data_source.session.query(model).filter(id_column.in_(ids)).options(*options).all()
+        rows_by_id = {getattr(row, id_column.key): row for row in rows}
+        return [rows_by_id[id] for id in ids if id in rows_by_id]
+
+    @staticmethod
+    def get_metadata_load_options(relationship):
+        """ Get the loader options which load the metadata of a relationship, together with its taxa, cell lines,
+        conditions, methods, resources and synonyms, with a fixed number of queries
+
+        Args:
+            relationship (:obj:`sqlalchemy.orm.attributes.InstrumentedAttribute` or :obj:`sqlalchemy.orm.Load`):
+                relationship to a :obj:`models.Metadata`, or loader option of a relationship
+
+        Returns:
+            :obj:`list` of :obj:`sqlalchemy.orm.Load`: loader options
+        """
+        if not isinstance(relationship, sqlalchemy.orm.Load):
+            relationship = sqlalchemy.orm.selectinload(relationship)
+        return [relationship.selectinload(getattr(models.Metadata, name))
+                for name in ['resource', 'taxon', 'cell_line', 'conditions', 'method', 'synonym', 'cell_compartment']]
 
     def metadata_dump(self, component):
         """ Calculate a consensus statistical representation of the one or more observed values
@@ -6,7 +6,7 @@ class FilterManager(BaseManager):
     """ Manages filtering of information for API. Filters objects """
 
     def __init__(self, cache_dirname = DATA_CACHE_DIR, params=None, data=None):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
+        super(FilterManager, self).__init__(cache_dirname=cache_dirname)
         self.params = params
         self.data = data
 
@@ -10,14 +10,15 @@ from datanator.core import data_model, common_schema, models
 from datanator.api.lib.data_manager import BaseManager
 from datanator.util import molecule_util
 from datanator.util.constants import DATA_CACHE_DIR
+import collections
+import sqlalchemy.orm
 
 class MetaboliteManager(BaseManager):
 
     """ Manages metabolite information for API """
 
     def __init__(self, cache_dirname = DATA_CACHE_DIR):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
-        # super(MetaboliteManager, self).__init__(cache_dirname=cache_dirname)
+        super(MetaboliteManager, self).__init__(cache_dirname=cache_dirname)
 
     def get_metabolite_by_id(self, id):
         return self.data_source.session.query(models.Metabolite).get(id)
@@ -31,25 +32,52 @@ class MetaboliteManager(BaseManager):
         Returns:
             :obj:`list` of :obj:`data_model.ObservedValue`: list of relevant observations
         """
+        return self.get_observed_concentrations_by_metabolites([metabolite])[metabolite.metabolite_id]
 
-        concentrations = self.get_concentration_by_structure(metabolite.structure._value_inchi, only_formula_and_connectivity=False)
-        observed_values = []
+    def get_observed_concentrations_by_metabolites(self, metabolites):
+        """ Find observed concentrations for each of a list of metabolites with a fixed number of queries
 
-        for c in concentrations:
-            metadata = self.metadata_dump(c)
-
-            observable = data_model.Observable(
-                specie = self._port(metabolite),
-                compartment = data_model.Compartment(name = c._metadata.cell_compartment[0].name)
-            )
+        Args:
+            metabolites (:obj:`list` of :obj:`models.Metabolite`): metabolites to find data for
 
-            observed_values.append(data_model.ObservedValue(
-                metadata = metadata,
-                observable = observable,
-                value = c.value,
-                error = c.error,
-                units = c.units
-            ))
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each metabolite to a :obj:`list` of its relevant
+            observations (:obj:`data_model.ObservedValue`)
+        """
+        inchis = set(metabolite.structure._value_inchi for metabolite in metabolites if metabolite.structure)
+        concentrations = collections.defaultdict(list)
+        if inchis:
+            q = self.data_source.session.query(models.Structure._value_inchi, models.Concentration) \
+                .select_from(models.Concentration) \
+                .join((models.Metabolite, models.Concentration.metabolite)) \
+                .join((models.Structure, models.Metabolite.structure)) \
+                .filter(models.Structure._value_inchi.in_(list(inchis))) \
+                .options(*self.get_metadata_load_options(models.Concentration._metadata))
+            for inchi, c in q:
+                concentrations[inchi].append(c)
+
+        observed_values = {}
+        for metabolite in metabolites:
+            observed_values[metabolite.metabolite_id] = values = []
+            if not metabolite.structure:
+                continue
+
+            specie = self._port(metabolite)
+            for c in concentrations[metabolite.structure._value_inchi]:
+                metadata = self.metadata_dump(c)
+
+                observable = data_model.Observable(
+                    specie = specie,
+                    compartment = data_model.Compartment(name = c._metadata.cell_compartment[0].name)
+                )
+
+                values.append(data_model.ObservedValue(
+                    metadata = metadata,
+                    observable = observable,
+                    value = c.value,
+                    error = c.error,
+                    units = c.units
+                ))
 
         return observed_values
 
@@ -66,7 +94,7 @@ class MetaboliteManager(BaseManager):
             join((models.Structure, models.Metabolite.structure))
 
         if only_formula_and_connectivity:
-            formula_and_connectivity = molecule_util.InchiMolecule(inchi).get_formula_and_connectivity()
+            formula_and_connectivity = molecule_util.get_inchi_normalizer().get_formula_and_connectivity(inchi)
             condition = models.Structure._structure_formula_connectivity == formula_and_connectivity
         else:
             condition = models.Structure._value_inchi == inchi
@@ -90,7 +118,7 @@ class MetaboliteManager(BaseManager):
         """
         q = self.data_source.session.query(select).join((models.Structure, models.Metabolite.structure))
         if only_formula_and_connectivity:
-            formula_and_connectivity = molecule_util.InchiMolecule(inchi).get_formula_and_connectivity()
+            formula_and_connectivity = molecule_util.get_inchi_normalizer().get_formula_and_connectivity(inchi)
             condition = models.Structure._structure_formula_connectivity == formula_and_connectivity
         else:
             condition = models.Structure._value_inchi == inchi
@@ -98,6 +126,49 @@ class MetaboliteManager(BaseManager):
         return q.filter(condition).all()
 
 
+    def get_metabolites_by_ids(self, ids):
+        """ Get metabolites, together with their structures and cross references, with a single query
+
+        Args:
+            ids (:obj:`list` of :obj:`int`): ids of the metabolites
+
+        Returns:
+            :obj:`list` of :obj:`models.Metabolite`: metabolites in the order of their ids
+        """
+        return self.get_by_ids(models.Metabolite, models.Metabolite.metabolite_id, ids, options=self.get_load_options())
+
+    def get_metabolites_by_structures(self, inchis):
+        """ Get the metabolites with each of a list of structures with a single query
+
+        Args:
+            inchis (:obj:`list` of :obj:`str`): molecule structures in InChI format
+
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps each structure to a :obj:`list` of the
+            :obj:`models.Metabolite` with the structure
+        """
+        metabolites = collections.OrderedDict((inchi, []) for inchi in inchis)
+        if not metabolites:
+            return metabolites
+
+        q = self.data_source.session.query(models.Metabolite) \
+            .join((models.Structure, models.Metabolite.structure)) \
+            .filter(models.Structure._value_inchi.in_(list(metabolites.keys()))) \
+            .options(*self.get_load_options()) \
+            .order_by(models.Metabolite.metabolite_id)
+        for metabolite in q:
+            metabolites[metabolite.structure._value_inchi].append(metabolite)
+        return metabolites
+
+    def get_load_options(self):
+        """ Get the loader options which load the structures and cross references of metabolites
+
+        Returns:
+            :obj:`list` of :obj:`sqlalchemy.orm.Load`: loader options
+        """
+        return [sqlalchemy.orm.joinedload(models.Metabolite.structure),
+                sqlalchemy.orm.selectinload(models.Metabolite._metadata).selectinload(models.Metadata.resource)]
+
     def _search_simple(self, value):
         """
         Args:
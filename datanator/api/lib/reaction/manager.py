@@ -7,10 +7,14 @@
 :License: MIT
 """
 
-from datanator.core import data_model, data_query, models, common_schema
+from datanator.core import data_model, data_query, data_source, models, common_schema
+from datanator.data_source import ezyme
 from datanator.util import molecule_util
-from wc_utils.util import string
+import collections
+import itertools
 import sqlalchemy
+import sqlalchemy.orm
+import warnings
 from datanator.api.lib.data_manager import BaseManager
 from datanator.util.constants import DATA_CACHE_DIR
 
@@ -37,7 +41,20 @@ class ReactionManager(BaseManager):
     """
 
     def __init__(self, cache_dirname = DATA_CACHE_DIR):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
+        super(ReactionManager, self).__init__(cache_dirname=cache_dirname)
+        self._ezyme = None
+
+    @property
+    def ezyme(self):
+        """ :obj:`ezyme.Ezyme`: Ezyme client which predicts the EC numbers of reactions, and which is only created
+        when it is first used """
+        if self._ezyme is None:
+            self._ezyme = ezyme.get_ezyme(self.cache_dirname)
+        return self._ezyme
+
+    @ezyme.setter
+    def ezyme(self, value):
+        self._ezyme = value
 
     def get_observed_parameter_value(self, reaction):
         """ Find observed kinetics for the reaction or similar reactions
@@ -61,7 +78,11 @@ class ReactionManager(BaseManager):
             :obj:`list` of :obj:`data_model.ObservedValue`: list of relevant observed values
         """
 
-        q_law = self.get_kinetic_laws_by_reaction(reaction)
+        # order participants as reactants, then products, then modifiers
+        def participant_order(rxn_part):
+            return (0 if rxn_part._is_reactant else 1 if rxn_part._is_product else 2, rxn_part.reaction_id)
+
+        q_law = self.load_kinetic_law_details(self.get_kinetic_laws_by_reaction(reaction))
         observed_vals = []
         for law in q_law:
             common_schema_reaction_id = next(xr._id for xr in law._metadata.resource if xr.namespace == 'sabiork.reaction')
@@ -75,60 +96,29 @@ class ReactionManager(BaseManager):
             species = {}
             compartments = {}
 
-            cs_rxn = self.data_source.session.query(models.Reaction).filter_by(kinetic_law_id = law.kinetic_law_id)
-            reactants = cs_rxn.filter_by(_is_reactant = True).all()
-            products = cs_rxn.filter_by(_is_product = True).all()
-            modifiers = cs_rxn.filter_by(_is_modifier = True).all()
-
-
-            for reactant in reactants:
-                part = data_model.ReactionParticipant(coefficient=-1)
-
-                if reactant.metabolite_id not in species:
-                    species[reactant.metabolite_id] = data_model.Specie(name=reactant.metabolite.metabolite_name)
-                part.specie = species[reactant.metabolite_id]
-
-                if reactant.metabolite.structure_id:
-                    part.specie.structure = reactant.metabolite.structure._value_inchi
-
-                if reactant.compartment_id:
-                    if reactant.compartment.name not in compartments:
-                        compartments[reactant.compartment.name] = data_model.Compartment(name=reactant.compartment.name)
-                    part.compartment = compartments[reactant.compartment.name]
-
-                reaction.participants.append(part)
-
-            for product in products:
-                part = data_model.ReactionParticipant(coefficient=1)
-
-                if product.metabolite_id not in species:
-                    species[product.metabolite_id] = data_model.Specie(name=product.metabolite.metabolite_name)
-                part.specie = species[product.metabolite_id]
-
-                if product.metabolite.structure_id:
-                    part.specie.structure = product.metabolite.structure._value_inchi
+            rxn_parts = sorted((rxn_part for rxn_part in law.reaction
+                                if rxn_part._is_reactant or rxn_part._is_product or rxn_part._is_modifier),
+                               key=participant_order)
 
-                if product.compartment_id:
-                    if product.compartment.name not in compartments:
-                        compartments[product.compartment.name] = data_model.Compartment(name=product.compartment.name)
-                    part.compartment = compartments[product.compartment.name]
-
-                reaction.participants.append(part)
-
-            for modifier in modifiers:
-                part = data_model.ReactionParticipant(coefficient=0)
+            for rxn_part in rxn_parts:
+                if rxn_part._is_reactant:
+                    part = data_model.ReactionParticipant(coefficient=-1)
+                elif rxn_part._is_product:
+                    part = data_model.ReactionParticipant(coefficient=1)
+                else:
+                    part = data_model.ReactionParticipant(coefficient=0)
 
-                if modifier.metabolite_id not in species:
-                    species[modifier.metabolite_id] = data_model.Specie(name=modifier.metabolite.metabolite_name)
-                part.specie = species[modifier.metabolite_id]
+                if rxn_part.metabolite_id not in species:
+                    species[rxn_part.metabolite_id] = data_model.Specie(name=rxn_part.metabolite.metabolite_name)
+                part.specie = species[rxn_part.metabolite_id]
 
-                if modifier.metabolite.structure_id:
-                    part.specie.structure = modifier.metabolite.structure._value_inchi
+                if rxn_part.metabolite.structure_id:
+                    part.specie.structure = rxn_part.metabolite.structure._value_inchi
 
-                if modifier.compartment_id:
-                    if modifier.compartment.name not in compartments:
-                        compartments[modifier.compartment.name] = data_model.Compartment(name=modifier.compartment.name)
-                    part.compartment = compartments[modifier.compartment.name]
+                if rxn_part.compartment_id:
+                    if rxn_part.compartment.name not in compartments:
+                        compartments[rxn_part.compartment.name] = data_model.Compartment(name=rxn_part.compartment.name)
+                    part.compartment = compartments[rxn_part.compartment.name]
 
                 reaction.participants.append(part)
 
@@ -161,6 +151,38 @@ class ReactionManager(BaseManager):
         return observed_vals
 
 
+    def load_kinetic_law_details(self, laws):
+        """ Load kinetic laws together with their participants, structures, compartments, parameters, and metadata
+        using a fixed number of queries, rather than lazily loading them for each law
+
+        Args:
+            laws (:obj:`list` of :obj:`models.KineticLaw`): kinetic laws
+
+        Returns:
+            :obj:`list` of :obj:`models.KineticLaw`: kinetic laws in the same order, with their details loaded
+        """
+        laws = list(laws)
+        if not laws:
+            return laws
+
+        selectinload = sqlalchemy.orm.selectinload
+        participants = selectinload(models.KineticLaw.reaction)
+
+        ids = [law.kinetic_law_id for law in laws]
+        loaded_laws = self.data_source.session.query(models.KineticLaw) \
+            .filter(models.KineticLaw.kinetic_law_id.in_(ids)) \
+            .options(
+                participants.joinedload(models.Reaction.metabolite).joinedload(models.Metabolite.structure),
+                participants.joinedload(models.Reaction.compartment),
+                selectinload(models.KineticLaw.parameter),
+                *self.get_metadata_load_options(models.KineticLaw._metadata)
+            ) \
+            .populate_existing() \
+            .all()
+
+        laws_by_id = {law.kinetic_law_id: law for law in loaded_laws}
+        return [laws_by_id[id] for id in ids]
+
     def _port(self, reaction_list):
         """
         Converts SQL model reaction into a Obj Model based data_model reaction
@@ -205,6 +227,56 @@ class ReactionManager(BaseManager):
         rxn_list = self.data_source.session.query(models.Reaction).filter_by(kinetic_law_id=id).all()
         return self._port(rxn_list)
 
+    def get_reactions_by_kinetic_law_ids(self, ids):
+        """ Get the reactions of a list of kinetic laws, loading their participants, structures and references
+        with a single query
+
+        Args:
+            ids (:obj:`list` of :obj:`int`): ids of the kinetic laws
+
+        Returns:
+            :obj:`list` of :obj:`data_model.Reaction`: reactions in the order of their kinetic laws; laws without
+            participants and repeated laws are skipped
+        """
+        ids = list(collections.OrderedDict.fromkeys(ids))
+        if not ids:
+            return []
+
+        joinedload = sqlalchemy.orm.joinedload
+        rxn_parts = self.data_source.session.query(models.Reaction) \
+            .filter(models.Reaction.kinetic_law_id.in_(ids)) \
+            .options(joinedload(models.Reaction.metabolite).joinedload(models.Metabolite.structure),
+                     joinedload(models.Reaction.kinetic_law).joinedload(models.KineticLaw._metadata)
+                     .selectinload(models.Metadata.resource)) \
+            .order_by(models.Reaction.kinetic_law_id, models.Reaction.reaction_id) \
+            .all()
+
+        rxn_parts_by_law = collections.defaultdict(list)
+        for rxn_part in rxn_parts:
+            rxn_parts_by_law[rxn_part.kinetic_law_id].append(rxn_part)
+        return [self._port(rxn_parts_by_law[id]) for id in ids if id in rxn_parts_by_law]
+
+    def get_kinetic_law_ids_by_metabolites(self, metabolite_ids):
+        """ Get the ids of the kinetic laws which contain each of a list of metabolites with a single query
+
+        Args:
+            metabolite_ids (:obj:`list` of :obj:`int`): ids of the metabolites
+
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps the id of each metabolite to the ids of the kinetic
+            laws which contain it
+        """
+        law_ids = collections.OrderedDict((id, []) for id in metabolite_ids)
+        if not law_ids:
+            return law_ids
+
+        rows = self.data_source.session.query(models.Reaction.metabolite_id, models.Reaction.kinetic_law_id) \
+            .filter(models.Reaction.metabolite_id.in_(list(law_ids.keys()))) \
+            .order_by(models.Reaction.reaction_id)
+        for metabolite_id, law_id in rows:
+            if law_id not in law_ids[metabolite_id]:
+                law_ids[metabolite_id].append(law_id)
+        return law_ids
 
     def get_reaction_by_metabolite(self, metabolite, select=models.Reaction):
         """ Get reaction that contains the metabolite role :obj:`models.Metabolite`
@@ -215,21 +287,30 @@ class ReactionManager(BaseManager):
         Returns:
             :obj:`data_model.Reaction`: reaction to find data for
         """
+        return self.get_reactions_by_metabolites([metabolite])[metabolite.metabolite_id]
 
-        rxn_cluster= [self.data_source.session.query(models.Reaction).filter_by(kinetic_law_id=rxn.kinetic_law_id).all() for rxn in metabolite.reaction]
-
-        reaction_list = []
-        for rxn in rxn_cluster:
-            reaction= self._port(rxn)
-            reaction_list.append(reaction)
+    def get_reactions_by_metabolites(self, metabolites):
+        """ Get the reactions which contain each of a list of metabolites with a fixed number of queries
 
+        Args:
+            metabolites (:obj:`list` of :obj:`models.Metabolite`): metabolites
 
-        return reaction_list
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each metabolite to the reactions which contain it
+        """
+        law_ids = self.get_kinetic_law_ids_by_metabolites([metabolite.metabolite_id for metabolite in metabolites])
+        reactions = self.get_reactions_by_kinetic_law_ids(itertools.chain(*law_ids.values()))
+        reactions_by_law = {reaction.kinetic_law_id: reaction for reaction in reactions}
+        return {metabolite_id: [reactions_by_law[id] for id in ids if id in reactions_by_law]
+                for metabolite_id, ids in law_ids.items()}
 
 
     def get_kinetic_laws_by_reaction(self, reaction, select=models.KineticLaw):
         """ Get kinetic laws that were observed for similar reactions (same participants or same EC class)
 
+        If Ezyme can't predict the EC numbers of the reaction, e.g. because it is unavailable, the error is reported with
+        a :obj:`data_source.DataSourceWarning` and no kinetic laws are returned for the predicted EC numbers.
+
         Args:
             reaction (:obj:`data_model.Reaction`): reaction to find data for
 
@@ -249,20 +330,44 @@ class ReactionManager(BaseManager):
         if q.count():
             return q.all()
 
-        # by predicted EC numbers
+        # by predicted EC numbers, which Ezyme predicts to the third level
+        if not reaction.get_predicted_ec_numbers():
+            try:
+                self.predict_ec_numbers([reaction])
+            except Exception as error:
+                warnings.warn('Unable to predict the EC numbers of the reaction with Ezyme: {}'.format(error),
+                              data_source.DataSourceWarning)
         ec_numbers = [xr.id for xr in reaction.get_predicted_ec_numbers()]
-        q = self.get_kinetic_laws_by_ec_numbers(ec_numbers, select=select)
+        q = self.get_kinetic_laws_by_ec_numbers(ec_numbers, match_levels=3, select=select)
         if q.count():
             return q.all()
 
         # return empty list if no relevant observations were found
         return self.data_source.session.query(select).filter_by(id=-1)
 
+    def predict_ec_numbers(self, reactions):
+        """ Use Ezyme to predict the EC numbers of the reactions which don't already have predicted EC numbers, and
+        add them to the cross references of the reactions. The reactions are submitted to Ezyme together.
+
+        Args:
+            reactions (:obj:`list` of :obj:`data_model.Reaction`): reactions
+        """
+        reactions = [reaction for reaction in reactions if not reaction.get_predicted_ec_numbers()]
+        for reaction, results in zip(reactions, self.ezyme.run_many(reactions)):
+            for result in results or []:
+                reaction.cross_references.append(data_model.Resource(
+                    namespace='ec-code',
+                    id=result.ec_number,
+                    relevance=result.score,
+                    assignment_method=data_model.ResourceAssignmentMethod.predicted))
+
 
     def get_kinetic_laws_by_participants(self, participants, only_formula_and_connectivity=False, include_water_hydrogen=False,
                                          select=models.KineticLaw):
         """ Get kinetic laws with the participants :obj:`participants`
 
+        The kinetic laws are looked up in the participant index of the common schema with a single query.
+
         Args:
             participants (:obj:`list` of :obj:`data_model.ReactionParticipant`): list of reaction participants
             only_formula_and_connectivity (:obj:`bool`, optional): if :obj:`True`, find kinetic laws which contain species with the same
@@ -274,39 +379,32 @@ class ReactionManager(BaseManager):
             :obj:`list` of :obj:`models.KineticLaw`: a list kinetic laws that contain all of the participants
 
         """
-        q_laws = None
-        for i_part, part in enumerate(participants):
-            if only_formula_and_connectivity == True:
+        reactants = []
+        products = []
+        modifiers = []
+        for part in participants:
+            if only_formula_and_connectivity:
                 try:
-                    structure = part.specie.to_inchi(only_formula_and_connectivity=only_formula_and_connectivity)
+                    structure = part.specie.to_inchi(only_formula_and_connectivity=True)
                 except ValueError:
-                    return self.data_source.session.query(select).filter(common_schema.KineticLaw.kinetic_law_id == -1)
+                    return []
             else:
                 structure = part.specie.structure
 
-            if not include_water_hydrogen:
-                if only_formula_and_connectivity:
-                    formula_and_connectivity = structure
-                else:
-                    if structure:
-                        formula_and_connectivity = part.specie.to_inchi(only_formula_and_connectivity=True)
-                # if formula_and_connectivity in ['', 'H2O', 'H2O']:
-                #     continue
+            # participants without structures can't be matched
+            if not structure:
+                return []
 
-            role = None
             if part.coefficient < 0:
-                role = 'reactant'
+                reactants.append(structure)
             elif part.coefficient > 0:
-                role = 'product'
-
-            q_part = self.get_kinetic_laws_by_structure(structure, role=role)
-
-            if not q_laws:
-                q_laws = q_part
+                products.append(structure)
             else:
-                q_laws = [val for val in q_laws if val in q_part]
+                modifiers.append(structure)
 
-        return q_laws
+        return self.data_source.get_kinetic_laws_by_participant_structures(
+            reactants=reactants, products=products, modifiers=modifiers,
+            only_formula_and_connectivity=only_formula_and_connectivity, select=select)
 
     def get_kinetic_laws_by_structure(self, structure, only_formula_and_connectivity=False, role='reactant', select=models.KineticLaw):
         """ Get kinetic laws that contain a structure in role :obj:`role`
@@ -377,6 +475,8 @@ class ReactionManager(BaseManager):
         """ Get kinetic laws which have one of a list of EC numbers or, optionally,
         belong to one of a list of EC classes.
 
+        The kinetic laws are looked up in the EC number index of the common schema.
+
         Args:
             ec_numbers (:obj:`list` of :obj:`str`): EC numbers to search for
             match_levels (:obj:`int`): number of EC levels that the EC number must match
@@ -384,20 +484,6 @@ class ReactionManager(BaseManager):
         Returns:
             :obj:`sqlalchemy.orm.query.Query`: query for matching kinetic laws
         """
-        # find kinetic laws with identical EC number
-        q = self.data_source.session.query(select) \
-            .join((models.Metadata, models.KineticLaw._metadata)).join((models.Resource, models.Metadata.resource))\
-            .filter(models.Resource.namespace == 'ec-code')
-
-        if match_levels == 4:
-            result = q.filter(models.Resource._id.in_(ec_numbers))
-        else:
-            conditions = []
-            for ec_number in ec_numbers:
-                ec_class, _, _ = string.partition_nth(ec_number, '.', match_levels)
-                conditions.append(models.Resource._id.like('{}.%'.format(ec_class)))
-            result = q.filter(sqlalchemy.or_(*conditions))
-
-        return result
+        return self.data_source.get_kinetic_laws_by_ec_numbers(ec_numbers, match_levels=match_levels, select=select)
 
 reaction_manager = ReactionManager()
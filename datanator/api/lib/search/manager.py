@@ -7,11 +7,19 @@
 """
 
 import abc
+import base64
+import collections
+import decimal
+import itertools
+import json
+import re
 import six
 import os
+import sqlalchemy
 # from datanator.api.query import reaction_kinetics
 from datanator.core import models, common_schema
-from datanator.util.constants import DATA_CACHE_DIR, METABOLITE_REACTION_LIMIT
+from datanator.util.constants import (DATA_CACHE_DIR, METABOLITE_REACTION_LIMIT, SEARCH_PAGE_SIZE,
+                                      SEARCH_RANK_PRECISION, SEARCH_REACTION_LIMIT, SEARCH_REGCONFIG)
 from datanator.api.lib.data_manager import BaseManager
 from datanator.api.lib.metabolite.manager import metabolite_manager
 from datanator.api.lib.subunit.manager import subunit_manager
@@ -26,39 +34,167 @@ class SearchManager(BaseManager):
         db_cache_dirname (:obj:`str`): path location for DB
     """
 
+    SEARCH_TYPES = collections.OrderedDict([
+        ('Metabolite', (models.Metabolite, models.Metabolite.metabolite_id, models.Metabolite.simple_search_vector)),
+        ('ProteinComplex', (models.ProteinComplex, models.ProteinComplex.complex_id,
+                            models.ProteinComplex.simple_search_vector)),
+        ('ProteinSubunit', (models.ProteinSubunit, models.ProteinSubunit.subunit_id,
+                            models.ProteinSubunit.simple_search_vector)),
+    ])
+    # :obj:`collections.OrderedDict`: dictionary which maps the name of each type of search result to its model, the
+    # column of its id, and its search vector
+
     def __init__(self, cache_dirname = DATA_CACHE_DIR):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
-        # self.data_source = common_schema.CommonSchema(cache_dirname= cache_dirname)
+        super(SearchManager, self).__init__(cache_dirname=cache_dirname)
         # self.q = reaction_kinetics.ReactionKineticsQuery(cache_dirname=cache_dirname, include_variants=True)
 
-    def search(self, string):
+    def search(self, string, limit=SEARCH_PAGE_SIZE, offset=0, cursor=None):
         """
         Collects and creates dictionary of all Database objects coming up in a full
         text search for related string
 
+        Metabolites, protein complexes and protein subunits are searched and ranked with a single query, and the
+        reactions of the best matching metabolites are loaded with a single query.
+
         Args:
             string (:obj :`str`): item to be searched for
+            limit (:obj:`int`, optional): maximum number of metabolites, complexes and subunits to return
+            offset (:obj:`int`, optional): number of results to skip
+            cursor (:obj:`str`, optional): cursor returned with the previous page of results; if provided, return
+                the results after this page
 
         Returns:
-            list_db_models (:obj:`list`): List of ranked collected items from text search
-            dict_db_models (:obj:`dict`): Dictionary of collected items from text search
+            dict_db_models (:obj:`dict`): Dictionary of collected items from text search, ordered by rank, with
+                the number of results of each type (`facets`) and the cursor of the next page (`next_cursor`,
+                :obj:`None` if this is the last page)
+
+        Raises:
+            :obj:`ValueError`: if the cursor is invalid
         """
+        hits, facets = self.search_ranked(string, limit=limit, offset=offset, cursor=cursor)
 
-        metabolite = metabolite_manager._search_simple(string)
-        complex = complex_manager._search(string)
-        subunit = subunit_manager._search_simple(string)
+        found_dict = {type: [] for type in self.SEARCH_TYPES}
+        for type, type_hits in itertools.groupby(sorted(hits, key=lambda hit: hit[0]), key=lambda hit: hit[0]):
+            model, id_column, _ = self.SEARCH_TYPES[type]
+            found_dict[type] = self.get_by_ids(model, id_column, [hit[1] for hit in type_hits])
 
-        rxns = []
-        for _metabolite in metabolite[:METABOLITE_REACTION_LIMIT]:
-            rxn_list = reaction_manager.get_reaction_by_metabolite(_metabolite)
-            if rxn_list:
-                rxns.append(rxn_list)
+        found_dict['Reaction'] = self.get_reactions_by_metabolites(found_dict['Metabolite'][:METABOLITE_REACTION_LIMIT])
+        found_dict['facets'] = facets
+        found_dict['next_cursor'] = self.encode_cursor(hits[-1]) if len(hits) == limit else None
 
-        reactions = [y for x in rxns for y in x]
+        return found_dict
 
-        found_dict = {'Metabolite':metabolite, 'ProteinSubunit':subunit, 'ProteinComplex':complex, 'Reaction': reactions}
+    def search_ranked(self, string, limit=SEARCH_PAGE_SIZE, offset=0, cursor=None):
+        """ Find the metabolites, protein complexes and protein subunits which match a string, ranked by their
+        relevance across all of the types
 
-        return found_dict
+        Args:
+            string (:obj :`str`): item to be searched for
+            limit (:obj:`int`, optional): maximum number of results to return
+            offset (:obj:`int`, optional): number of results to skip
+            cursor (:obj:`str`, optional): cursor of the last result of the previous page
+
+        Returns:
+            :obj:`tuple`:
+
+                * :obj:`list` of :obj:`tuple`: type, id and rank of each result
+                * :obj:`dict`: dictionary which maps each type to its number of results
+        """
+        facets = {type: 0 for type in self.SEARCH_TYPES}
+        query = self.get_tsquery(string)
+        if query is None:
+            return ([], facets)
+        tsquery = sqlalchemy.func.to_tsquery(SEARCH_REGCONFIG, query)
+
+        # ranks are rounded to exact decimals so that they survive the round trip through the cursor
+        selects = []
+        for type, (model, id_column, vector) in self.SEARCH_TYPES.items():
+            selects.append(sqlalchemy.select([
+                sqlalchemy.literal(type).label('type'),
+                id_column.label('id'),
+                sqlalchemy.func.round(sqlalchemy.cast(sqlalchemy.func.ts_rank(vector, tsquery), sqlalchemy.Numeric),
+                                      SEARCH_RANK_PRECISION).label('rank'),
+            ]).where(vector.op('@@')(tsquery)))
+        hits = sqlalchemy.union_all(*selects).alias('hits')
+
+        q = sqlalchemy.select([hits]) \
+            .order_by(hits.c.rank.desc(), hits.c.type, hits.c.id) \
+            .limit(limit).offset(offset)
+        if cursor is not None:
+            rank, type, id = self.decode_cursor(cursor)
+            q = q.where(sqlalchemy.or_(hits.c.rank < rank,
+                                       sqlalchemy.and_(hits.c.rank == rank,
+                                                       sqlalchemy.tuple_(hits.c.type, hits.c.id) > (type, id))))
+        rows = self.data_source.session.execute(q).fetchall()
+
+        # the facets count all of the results, including the types which aren't on this page
+        counts = sqlalchemy.select([hits.c.type, sqlalchemy.func.count()]).group_by(hits.c.type)
+        for type, count in self.data_source.session.execute(counts):
+            facets[type] = count
+
+        return ([(row.type, row.id, row.rank) for row in rows], facets)
+
+    @staticmethod
+    def get_tsquery(string):
+        """ Get a Postgres text search query which matches all of the words of a string as prefixes
+
+        Args:
+            string (:obj:`str`): search string
+
+        Returns:
+            :obj:`str`: text search query, or :obj:`None` if the string doesn't contain any words
+        """
+        words = re.findall(r'\w+', string, re.UNICODE)
+        if not words:
+            return None
+        return ' & '.join(word + ':*' for word in words)
+
+    @staticmethod
+    def encode_cursor(hit):
+        """ Encode the position of a search result as a cursor
+
+        Args:
+            hit (:obj:`tuple`): type, id and rank of the result
+
+        Returns:
+            :obj:`str`: cursor
+        """
+        type, id, rank = hit
+        return base64.urlsafe_b64encode(json.dumps([str(rank), type, id]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """ Decode a cursor
+
+        Args:
+            cursor (:obj:`str`): cursor
+
+        Returns:
+            :obj:`tuple`: rank, type and id of the result
+
+        Raises:
+            :obj:`ValueError`: if the cursor is invalid
+        """
+        try:
+            rank, type, id = json.loads(base64.urlsafe_b64decode(str(cursor)).decode())
+            return (decimal.Decimal(rank), str(type), int(id))
+        except (TypeError, ValueError, UnicodeDecodeError, decimal.InvalidOperation):
+            raise ValueError('Invalid cursor {}'.format(cursor))
+
+    def get_reactions_by_metabolites(self, metabolites, limit=SEARCH_REACTION_LIMIT):
+        """ Get the reactions which contain metabolites with a fixed number of queries
+
+        Args:
+            metabolites (:obj:`list` of :obj:`models.Metabolite`): metabolites
+            limit (:obj:`int`, optional): maximum number of reactions to return
+
+        Returns:
+            :obj:`list` of :obj:`data_model.Reaction`: reactions, grouped by metabolite
+        """
+        law_ids = reaction_manager.get_kinetic_law_ids_by_metabolites(
+            [metabolite.metabolite_id for metabolite in metabolites])
+        law_ids = list(collections.OrderedDict.fromkeys(itertools.chain(*law_ids.values())))[:limit]
+        return reaction_manager.get_reactions_by_kinetic_law_ids(law_ids)
 
     def get_object_by_id(self, id):
         return self.data_source.session.query(models.Observation).get(id)
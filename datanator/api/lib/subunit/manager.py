@@ -10,16 +10,50 @@ from datanator.api.lib.data_manager import BaseManager
 from datanator.util.constants import DATA_CACHE_DIR
 from datanator.api.lib.complex.manager import complex_manager
 from sqlalchemy import or_
+import collections
+import sqlalchemy.orm
 
 class ProteinSubunitManager(BaseManager):
     """ Manages subunit information for API """
 
     def __init__(self, cache_dirname = DATA_CACHE_DIR):
-        self.data_source = common_schema.CommonSchema(cache_dirname=cache_dirname)
+        super(ProteinSubunitManager, self).__init__(cache_dirname=cache_dirname)
 
     def get_subunit_by_id(self, id):
         return self.data_source.session.query(models.ProteinSubunit).get(id)
 
+    def get_subunits_by_ids(self, ids):
+        """ Get protein subunits with a single query
+
+        Args:
+            ids (:obj:`list` of :obj:`int`): ids of the subunits
+
+        Returns:
+            :obj:`list` of :obj:`models.ProteinSubunit`: subunits in the order of their ids
+        """
+        return self.get_by_ids(models.ProteinSubunit, models.ProteinSubunit.subunit_id, ids)
+
+    def get_subunits_by_uniprot_ids(self, uniprot_ids):
+        """ Get the protein subunits with each of a list of UniProt ids with a single query
+
+        Args:
+            uniprot_ids (:obj:`list` of :obj:`str`): UniProt ids
+
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps each UniProt id to a :obj:`list` of the
+            :obj:`models.ProteinSubunit` with the id
+        """
+        subunits = collections.OrderedDict((uniprot_id, []) for uniprot_id in uniprot_ids)
+        if not subunits:
+            return subunits
+
+        q = self.data_source.session.query(models.ProteinSubunit) \
+            .filter(models.ProteinSubunit.uniprot_id.in_(list(subunits.keys()))) \
+            .order_by(models.ProteinSubunit.subunit_id)
+        for subunit in q:
+            subunits[subunit.uniprot_id].append(subunit)
+        return subunits
+
     def _search_simple(self, value):
         return models.ProteinSubunit.query.search(value, vector=models.ProteinSubunit.simple_search_vector).all()
 
@@ -83,16 +117,31 @@ class ProteinSubunitManager(BaseManager):
         Returns:
             :obj:`list` of :obj:`data_model.ObservedSpecie`: list of Protein Complexes
         """
-        observed_specie = []
-        _complex = self.get_known_complex_by_subunit(protein_subunit.uniprot_id)
+        return self.get_observable_complexes_by_subunits([protein_subunit])[protein_subunit.subunit_id]
 
-        for complex in _complex:
-            metadata= self.metadata_dump(complex)
-            ported_complex = complex_manager._port(complex)
+    def get_observable_complexes_by_subunits(self, protein_subunits):
+        """ Get the known protein complexes of each of a list of subunits with a fixed number of queries
 
-            observed_specie.append(data_model.ObservedSpecie(specie = ported_complex, metadata=metadata))
+        Args:
+            protein_subunits (:obj:`list` of :obj:`models.ProteinSubunit`): subunits to find complexes for
 
-        return observed_specie
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each subunit to a :obj:`list` of its protein complexes
+            (:obj:`data_model.ObservedSpecie`)
+        """
+        uniprot_ids = set(subunit.uniprot_id for subunit in protein_subunits)
+        complexes = collections.defaultdict(list)
+        if uniprot_ids:
+            q = self.data_source.session.query(models.ProteinSubunit.uniprot_id, models.ProteinComplex) \
+                .select_from(models.ProteinComplex) \
+                .join(models.ProteinSubunit, models.ProteinComplex.protein_subunit) \
+                .filter(models.ProteinSubunit.uniprot_id.in_(list(uniprot_ids))) \
+                .options(*self.get_metadata_load_options(models.ProteinComplex._metadata))
+            for uniprot_id, complex in q:
+                complexes[uniprot_id].append(data_model.ObservedSpecie(specie=complex_manager._port(complex),
+                                                                       metadata=self.metadata_dump(complex)))
+
+        return {subunit.subunit_id: list(complexes[subunit.uniprot_id]) for subunit in protein_subunits}
 
     def get_observed_abundances(self, protein):
         """ Find the observed values for protein abundance
@@ -104,33 +153,55 @@ class ProteinSubunitManager(BaseManager):
             :obj:`list` of :obj:`data_model.ObservedValue`: list of relevant observed values
 
         """
-        abundances = self.get_abundance_by_uniprot(protein.uniprot_id)
-        observed_vals = []
-
-        for abundance in abundances:
-            metadata = self.metadata_dump(abundance.dataset)
-
-            observable = data_model.Observable(
-                specie=self._port(protein)
-            )
-
-            observable.specie.cross_references = [
-                data_model.Resource(namespace='publication',
-                                    id=abundance.dataset.file_name),
-                data_model.Resource(
-                    namespace='url', id=abundance.dataset._metadata.resource[0]._id)
-            ]
-
-            observed_vals.append(data_model.ObservedValue(
-                metadata=metadata,
-                observable=observable,
-                value=abundance.abundance,
-                error=0,
-                units='PPM',
-            ))
+        return self.get_observed_abundances_by_subunits([protein])[protein.subunit_id]
 
-        return observed_vals
+    def get_observed_abundances_by_subunits(self, proteins):
+        """ Find the observed abundances of each of a list of protein subunits with a fixed number of queries
+
+        Args:
+            proteins (:obj:`list` of :obj:`models.ProteinSubunit`): Protein Subunits to find data for
 
+        Returns:
+            :obj:`dict`: dictionary which maps the id of each subunit to a :obj:`list` of its relevant observed
+            values (:obj:`data_model.ObservedValue`)
+        """
+        uniprot_ids = set(protein.uniprot_id for protein in proteins)
+        abundances = collections.defaultdict(list)
+        if uniprot_ids:
+            dataset = sqlalchemy.orm.joinedload(models.AbundanceData.dataset)
+            metadata = dataset.selectinload(models.AbundanceDataSet._metadata)
+            q = self.get_abundance_by_uniprot(uniprot_ids,
+                                              select=(models.ProteinSubunit.uniprot_id, models.AbundanceData)) \
+                .options(dataset, *self.get_metadata_load_options(metadata))
+            for uniprot_id, abundance in q:
+                abundances[uniprot_id].append(abundance)
+
+        observed_vals = {}
+        for protein in proteins:
+            observed_vals[protein.subunit_id] = values = []
+            for abundance in abundances[protein.uniprot_id]:
+                metadata = self.metadata_dump(abundance.dataset)
+
+                observable = data_model.Observable(
+                    specie=self._port(protein)
+                )
+
+                observable.specie.cross_references = [
+                    data_model.Resource(namespace='publication',
+                                        id=abundance.dataset.file_name),
+                    data_model.Resource(
+                        namespace='url', id=abundance.dataset._metadata.resource[0]._id)
+                ]
+
+                values.append(data_model.ObservedValue(
+                    metadata=metadata,
+                    observable=observable,
+                    value=abundance.abundance,
+                    error=0,
+                    units='PPM',
+                ))
+
+        return observed_vals
 
     def get_interaction_by_subunit(self, uniprot, select = models.ProteinInteraction):
         """ Get interactions that were observed for a given uniprot id
@@ -148,15 +219,21 @@ class ProteinSubunitManager(BaseManager):
         """ Find the abundance from a uniprot id
 
         Args:
-            uniprot (:obj:`str`): protein id from Uniprot Database
+            uniprot (:obj:`str` or :obj:`set` of :obj:`str`): protein id from Uniprot Database, or a set of ids
+            select (:obj:`object` or :obj:`tuple`, optional): entity or tuple of entities to select
 
         Returns:
             :obj:`sqlalchemy.orm.query.Query`: query for matching abundance rows
 
         """
-        q = self.data_source.session.query(select).join(
+        if not isinstance(select, tuple):
+            select = (select, )
+        q = self.data_source.session.query(*select).select_from(models.AbundanceData).join(
             models.ProteinSubunit, models.AbundanceData.subunit)
-        condition = models.ProteinSubunit.uniprot_id == uniprot
+        if isinstance(uniprot, (set, list, tuple)):
+            condition = models.ProteinSubunit.uniprot_id.in_(list(uniprot))
+        else:
+            condition = models.ProteinSubunit.uniprot_id == uniprot
         return q.filter(condition)
 
 
@@ -1,6 +1,11 @@
-from . import dna_protein_interactions
-from . import metabolite_concentrations
-from . import protein_abundance
-from . import protein_protein_interactions
-from . import reaction_kinetics
-from . import text_search
+from datanator.util import import_util
+
+# submodules are imported when they are first accessed
+import_util.make_lazy(__name__, submodules=[
+    'dna_protein_interactions',
+    'metabolite_concentrations',
+    'protein_abundance',
+    'protein_protein_interactions',
+    'reaction_kinetics',
+    'text_search',
+])
@@ -6,12 +6,12 @@
 """
 
 from datanator.core import data_model, data_query,  models, common_schema
+from datanator.util import motif_util
+from datanator.util.constants import PWM_SCAN_MIN_SCORE, PWM_SCAN_WINDOW_SIZE
 from Bio import motifs
-from Bio.Seq import Seq
 from Bio.Alphabet import IUPAC
-import tempfile
-import shutil
-import csv
+import itertools
+import sqlalchemy.orm
 
 
 class ProteintoDNAInteractionQuery(data_query.CachedDataSourceQueryGenerator):
@@ -51,33 +51,19 @@ class ProteintoDNAInteractionQuery(data_query.CachedDataSourceQueryGenerator):
         """
         versions = self.get_DNA_by_protein(protein)
 
-        index = 0
         observed_result = []
         for motif in versions:
-            binding_matrix = []
-            for position in motif.all():
-                binding_matrix.append([position.frequency_a, position.frequency_c, position.frequency_g, position.frequency_t])
-            binding_matrix = map(list, zip(*binding_matrix))
-            self.cache_dirname = tempfile.mkdtemp()
-            with open(self.cache_dirname+'/data.pfm', 'w') as pfm:
-                for items in binding_matrix:
-                    writer = csv.writer(pfm, delimiter = '\t')
-                    writer.writerow(items)
-
-            m = motifs.read(open(self.cache_dirname+'/data.pfm'), 'pfm')
+            positions = motif.all()
+            counts = {base: [float(getattr(position, 'frequency_' + base.lower())) for position in positions]
+                      for base in 'ACGT'}
+            m = motifs.Motif(alphabet=IUPAC.unambiguous_dna, counts=counts)
             dna_specie = data_model.DnaSpecie(binding_matrix = m.counts, sequence = str(m.counts.consensus))
 
-            metadata = self.metadata_dump(motif.all()[0].dataset)
+            metadata = self.metadata_dump(positions[0].dataset)
             observed_result.append(data_model.ObservedSpecie(specie = dna_specie, metadata=metadata))
 
-            for position in motif.all():
-                observed_result[index].specie.cross_references = data_model.Resource(namespace ='pubmed',\
-                id = position.dataset._metadata.resource[0]._id),
-                break
-
-            shutil.rmtree(self.cache_dirname)
-            index += 1
-
+            observed_result[-1].specie.cross_references = data_model.Resource(namespace ='pubmed',\
+                id = positions[0].dataset._metadata.resource[0]._id),
 
         return observed_result
 
@@ -129,6 +115,7 @@ class DNAtoProteinInteractionQuery(data_query.CachedDataSourceQueryGenerator):
             temperature=temperature, temperature_std=temperature_std,
             ph=ph, ph_std=ph_std,
             data_source=common_schema.CommonSchema(cache_dirname=cache_dirname))
+        self._pwm_library = None
 
 
     def get_observed_result(self, DnaSpecie):
@@ -163,8 +150,9 @@ class DNAtoProteinInteractionQuery(data_query.CachedDataSourceQueryGenerator):
         return observed_result;
 
 
-    def get_protein_by_DNA_sequence(self,sequence, select = models.ProteinSubunit):
-        """
+    def get_protein_by_DNA_sequence(self, sequence, select = models.ProteinSubunit,
+                                    min_score=PWM_SCAN_MIN_SCORE, max_p_value=None):
+        """ Find the transcription factors whose binding matrices span the sequence and match it on either strand
 
         NOTE: Currently there are no Gene objects in common schema models. When added this
         query will be updated to input models.Gene and output data_model.ProteinSpecie
@@ -172,34 +160,81 @@ class DNAtoProteinInteractionQuery(data_query.CachedDataSourceQueryGenerator):
 
         Args:
             sequence (:obj:`data_model.DnaSpecie.sequence`): sequence of DNA segment
+            min_score (:obj:`float`, optional): minimum log-odds score of a binding site
+            max_p_value (:obj:`float`, optional): maximum p-value of a binding site
 
         Returns:
-            :obj:`list` of :obj:`tuple`: Returns the query for a protein, sequence position, and score
+            :obj:`list` of :obj:`tuple`: Returns the query for a protein, sequence position, and score. As in
+            :obj:`Bio.motifs`, the positions of matches on the reverse strand are negative.
+
+        """
+        sites = self.get_pwm_library().scan(sequence, min_score=min_score, max_p_value=max_p_value,
+                                            widths=[len(sequence)])
+        sites = sorted(((index, position if strand == 1 else position - len(sequence), score)
+                        for index, position, strand, score in sites),
+                       key=lambda site: site[0:2])
+        subunits = self.get_binding_matrix_subunits(sites)
+        return [(subunits[index], position, score) for index, position, score in sites]
+
+    def scan_DNA_sequence(self, sequence, min_score=PWM_SCAN_MIN_SCORE, max_p_value=None,
+                          window_size=PWM_SCAN_WINDOW_SIZE):
+        """ Find the binding sites of all of the transcription factors in a long sequence (e.g. a promoter or a
+        genome), which is scanned in windows
 
+        Args:
+            sequence (:obj:`str` or iterable of :obj:`str`): DNA sequence, or chunks of a DNA sequence
+            min_score (:obj:`float`, optional): minimum log-odds score of a binding site
+            max_p_value (:obj:`float`, optional): maximum p-value of a binding site
+            window_size (:obj:`int`, optional): number of positions which are scored at once
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: protein subunit, position (0-based, on the forward strand), strand (1 or
+            -1), and score of each binding site
+        """
+        sites = self.get_pwm_library().scan(sequence, min_score=min_score, max_p_value=max_p_value,
+                                            window_size=window_size)
+        subunits = self.get_binding_matrix_subunits(sites)
+        return [(subunits[index], position, strand, score) for index, position, strand, score in sites]
+
+    def get_pwm_library(self):
+        """ Get the library of all of the binding matrices, loading it from the database on first use
+
+        Returns:
+            :obj:`motif_util.PositionWeightMatrixLibrary`: library of binding matrices, identified by the ids of
+            their datasets
+        """
+        if self._pwm_library is None:
+            rows = self.data_source.session.query(models.DNABindingData.dataset_id,
+                                                  models.DNABindingData.frequency_a,
+                                                  models.DNABindingData.frequency_c,
+                                                  models.DNABindingData.frequency_g,
+                                                  models.DNABindingData.frequency_t) \
+                .order_by(models.DNABindingData.dataset_id, models.DNABindingData.position).all()
+
+            ids = []
+            counts = []
+            for dataset_id, positions in itertools.groupby(rows, key=lambda row: row[0]):
+                ids.append(dataset_id)
+                counts.append([row[1:] for row in positions])
+            self._pwm_library = motif_util.PositionWeightMatrixLibrary(counts, ids=ids)
+        return self._pwm_library
+
+    def get_binding_matrix_subunits(self, sites):
+        """ Get the transcription factors of the binding matrices of binding sites
+
+        Args:
+            sites (:obj:`list` of :obj:`tuple`): binding sites, starting with the indices of their matrices
+
+        Returns:
+            :obj:`dict`: dictionary which maps the index of each matrix to its :obj:`models.ProteinSubunit`
         """
-        #TODO: Make more efficient. Add gene location filter
-
-        ans = []
-
-        size = len(sequence)
-        all_matricies = self.data_source.session.query(models.DNABindingDataset).all()
-        all_sequences = []
-        for matricies in all_matricies:
-            if len(matricies.dna_binding_data) == size:
-                binding_matrix = []
-                for position in matricies.dna_binding_data:
-                    binding_matrix.append([position.frequency_a, position.frequency_c, position.frequency_g, position.frequency_t])
-                binding_matrix = map(list, zip(*binding_matrix))
-                self.cache_dirname = tempfile.mkdtemp()
-                with open(self.cache_dirname+'/data.pfm', 'w') as pfm:
-                    for items in binding_matrix:
-                        writer = csv.writer(pfm, delimiter = '\t')
-                        writer.writerow(items)
-                m = motifs.read(open(self.cache_dirname+'/data.pfm'), 'pfm')
-                my_seq = Seq(sequence, IUPAC.unambiguous_dna)
-                ##TODO: Include selective threshold
-                # distribution = m.pssm.distribution().threshold_paster()
-                # print distribution.threshold_paster()
-                for position, score in m.pssm.search(my_seq, threshold = 2):
-                    ans.append((matricies.subunit, position, score))
-        return ans
+        library = self.get_pwm_library()
+        indices = set(site[0] for site in sites)
+        if not indices:
+            return {}
+
+        datasets = self.data_source.session.query(models.DNABindingDataset) \
+            .filter(models.DNABindingDataset.dataset_id.in_([library.ids[index] for index in indices])) \
+            .options(sqlalchemy.orm.joinedload(models.DNABindingDataset.subunit)).all()
+        subunits = {dataset.dataset_id: dataset.subunit for dataset in datasets}
+        return {index: subunits[library.ids[index]] for index in indices}
@@ -86,7 +86,7 @@ class MetaboliteConcentrationQuery(data_query.CachedDataSourceQueryGenerator):
             join((models.Structure, models.Metabolite.structure))
 
         if only_formula_and_connectivity:
-            formula_and_connectivity = molecule_util.InchiMolecule(inchi).get_formula_and_connectivity()
+            formula_and_connectivity = molecule_util.get_inchi_normalizer().get_formula_and_connectivity(inchi)
             condition = models.Structure._structure_formula_connectivity == formula_and_connectivity
         else:
             condition = models.Structure._value_inchi == inchi
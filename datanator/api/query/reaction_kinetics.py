@@ -9,7 +9,6 @@
 
 from datanator.core import data_model, data_query, models, common_schema
 from datanator.util import molecule_util
-from wc_utils.util import string
 import sqlalchemy
 import sqlalchemy.orm
 
@@ -284,6 +283,8 @@ class ReactionKineticsQuery(data_query.CachedDataSourceQueryGenerator):
                                          select=models.KineticLaw):
         """ Get kinetic laws with the participants :obj:`participants`
 
+        The kinetic laws are looked up in the participant index of the common schema with a single query.
+
         Args:
             participants (:obj:`list` of :obj:`data_model.ReactionParticipant`): list of reaction participants
             only_formula_and_connectivity (:obj:`bool`, optional): if :obj:`True`, find kinetic laws which contain species with the same
@@ -295,39 +296,32 @@ class ReactionKineticsQuery(data_query.CachedDataSourceQueryGenerator):
             :obj:`list` of :obj:`models.KineticLaw`: a list kinetic laws that contain all of the participants
 
         """
-        q_laws = None
-        for i_part, part in enumerate(participants):
-            if only_formula_and_connectivity == True:
+        reactants = []
+        products = []
+        modifiers = []
+        for part in participants:
+            if only_formula_and_connectivity:
                 try:
-                    structure = part.specie.to_inchi(only_formula_and_connectivity=only_formula_and_connectivity)
+                    structure = part.specie.to_inchi(only_formula_and_connectivity=True)
                 except ValueError:
-                    return self.data_source.session.query(select).filter(common_schema.KineticLaw.kinetic_law_id == -1)
+                    return []
             else:
                 structure = part.specie.structure
 
-            if not include_water_hydrogen:
-                if only_formula_and_connectivity:
-                    formula_and_connectivity = structure
-                else:
-                    if structure:
-                        formula_and_connectivity = part.specie.to_inchi(only_formula_and_connectivity=True)
-                # if formula_and_connectivity in ['', 'H2O', 'H2O']:
-                #     continue
+            # participants without structures can't be matched
+            if not structure:
+                return []
 
-            role = None
             if part.coefficient < 0:
-                role = 'reactant'
+                reactants.append(structure)
             elif part.coefficient > 0:
-                role = 'product'
-
-            q_part = self.get_kinetic_laws_by_structure(structure, role=role)
-
-            if not q_laws:
-                q_laws = q_part
+                products.append(structure)
             else:
-                q_laws = [val for val in q_laws if val in q_part]
+                modifiers.append(structure)
 
-        return q_laws
+        return self.data_source.get_kinetic_laws_by_participant_structures(
+            reactants=reactants, products=products, modifiers=modifiers,
+            only_formula_and_connectivity=only_formula_and_connectivity, select=select)
 
     def get_kinetic_laws_by_structure(self, structure, only_formula_and_connectivity=False, role='reactant', select=models.KineticLaw):
         """ Get kinetic laws that contain a structure in role :obj:`role`
@@ -398,6 +392,8 @@ class ReactionKineticsQuery(data_query.CachedDataSourceQueryGenerator):
         """ Get kinetic laws which have one of a list of EC numbers or, optionally,
         belong to one of a list of EC classes.
 
+        The kinetic laws are looked up in the EC number index of the common schema.
+
         Args:
             ec_numbers (:obj:`list` of :obj:`str`): EC numbers to search for
             match_levels (:obj:`int`): number of EC levels that the EC number must match
@@ -405,21 +401,7 @@ class ReactionKineticsQuery(data_query.CachedDataSourceQueryGenerator):
         Returns:
             :obj:`sqlalchemy.orm.query.Query`: query for matching kinetic laws
         """
-        # find kinetic laws with identical EC number
-        q = self.data_source.session.query(select) \
-            .join((models.Metadata, models.KineticLaw._metadata)).join((models.Resource, models.Metadata.resource))\
-            .filter(models.Resource.namespace == 'ec-code')
-
-        if match_levels == 4:
-            result = q.filter(models.Resource._id.in_(ec_numbers))
-        else:
-            conditions = []
-            for ec_number in ec_numbers:
-                ec_class, _, _ = string.partition_nth(ec_number, '.', match_levels)
-                conditions.append(models.Resource._id.like('{}.%'.format(ec_class)))
-            result = q.filter(sqlalchemy.or_(*conditions))
-
-        return result
+        return self.data_source.get_kinetic_laws_by_ec_numbers(ec_numbers, match_levels=match_levels, select=select)
 
     def get_metabolites_by_structure(self, inchi, only_formula_and_connectivity=False, select=models.Metabolite):
         """ Get metabolites with the same structure. Optionally, get metabolites which only have
@@ -437,7 +419,7 @@ class ReactionKineticsQuery(data_query.CachedDataSourceQueryGenerator):
         """
         q = self.data_source.session.query(select).join((models.Structure, models.Metabolite.structure))
         if only_formula_and_connectivity:
-            formula_and_connectivity = molecule_util.InchiMolecule(inchi).get_formula_and_connectivity()
+            formula_and_connectivity = molecule_util.get_inchi_normalizer().get_formula_and_connectivity(inchi)
             condition = models.Structure._structure_formula_connectivity == formula_and_connectivity
         else:
             condition = models.Structure._value_inchi == inchi
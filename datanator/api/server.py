@@ -0,0 +1,9 @@
+""" Flask application of Datanator with the routes of the API registered
+
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.flask_app import app, register_blueprints
+
+register_blueprints(app)
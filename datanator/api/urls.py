@@ -16,6 +16,12 @@ api.add_resource(ProteinSubunit, get_version_endpoint('/subunit/<id>'))
 api.add_resource(ProteinComplex, get_version_endpoint('/complex/<id>'))
 api.add_resource(Reaction, get_version_endpoint('/reaction/<id>'))
 
+# Batch Queries
+api.add_resource(MetaboliteBatch, get_version_endpoint('/batch/metabolite'))
+api.add_resource(ProteinSubunitBatch, get_version_endpoint('/batch/subunit'))
+api.add_resource(ProteinComplexBatch, get_version_endpoint('/batch/complex'))
+api.add_resource(ReactionBatch, get_version_endpoint('/batch/reaction'))
+
 # Data Specific Queries
 api.add_resource(MetaboliteConcentration, get_version_endpoint('/concentrations/<id>'))
 api.add_resource(ProteinAbundance, get_version_endpoint('/abundances/<id>'))
@@ -6,8 +6,10 @@
 """
 
 from flask_restplus import Api, Resource, reqparse
+import collections
 import json
-from flask import  Blueprint, Response, render_template, make_response
+from flask import  Blueprint, Response, render_template, make_response, request, current_app
+from datanator.api.cache import ResponseCache
 from datanator.core import common_schema, models
 from datanator.api.lib.search.manager import search_manager
 from datanator.api.lib.metabolite.manager import metabolite_manager
@@ -15,7 +17,8 @@ from datanator.api.lib.subunit.manager import subunit_manager
 from datanator.api.lib.complex.manager import complex_manager
 from datanator.api.lib.reaction.manager import reaction_manager
 from datanator.api.serializer import *
-from datanator.util.constants import DATA_CACHE_DIR
+from datanator.api.compiled_serializer import dump
+from datanator.util.constants import API_BATCH_MAX_SIZE, DATA_CACHE_DIR, SEARCH_PAGE_SIZE
 import json
 import os
 
@@ -28,6 +31,45 @@ api = Api(api_blueprint, version='0.0', title='Datanator API',
 parser = reqparse.RequestParser()
 parser.add_argument('download', type=bool, default=False)
 
+search_parser = parser.copy()
+search_parser.add_argument('limit', type=int, default=SEARCH_PAGE_SIZE)
+search_parser.add_argument('offset', type=int, default=0)
+search_parser.add_argument('cursor', type=str, default=None)
+
+def get_batch_parser(**types):
+    """ Get a parser for the lists of identifiers of a batch request, which can be provided as JSON
+    (e.g. `{"ids": [1, 2]}`) or repeated query arguments (e.g. `?ids=1&ids=2`)
+
+    Args:
+        **types: dictionary which maps the name of each list to the type of its elements
+
+    Returns:
+        :obj:`reqparse.RequestParser`: parser
+    """
+    batch_parser = reqparse.RequestParser()
+    for name, type in types.items():
+        batch_parser.add_argument(name, type=type, action='append', default=[], location=('json', 'values'))
+    return batch_parser
+
+def parse_batch_args(batch_parser):
+    """ Parse the lists of identifiers of a batch request, and abort with a 400 error if the request is empty or
+    too large
+
+    Args:
+        batch_parser (:obj:`reqparse.RequestParser`): parser
+
+    Returns:
+        :obj:`dict`: dictionary which maps the name of each list to its identifiers, without duplicates
+    """
+    args = batch_parser.parse_args()
+    args = {name: list(collections.OrderedDict.fromkeys(values or [])) for name, values in args.items()}
+    n_ids = sum(len(values) for values in args.values())
+    if not n_ids:
+        api.abort(400, 'No identifiers were provided')
+    if n_ids > API_BATCH_MAX_SIZE:
+        api.abort(400, 'At most {} identifiers can be requested at once'.format(API_BATCH_MAX_SIZE))
+    return args
+
 # @api.representation('text/html')
 # def output_html(data, code, headers=None):
 #     resp = make_response(render_template('api/api.html', content = json.dumps(data, sort_keys=True, indent=4)), code)
@@ -36,72 +78,126 @@ parser.add_argument('download', type=bool, default=False)
 
 @api.representation('application/json')
 def output_json(data, code, headers=None):
-    resp = make_response(json.dumps(data, sort_keys=True, indent=4), code)
+    """ Encode a response as compact JSON, or as indented JSON if the `pretty` argument is true """
+    if request.args.get('pretty', '').lower() in ('1', 'true', 'yes'):
+        body = json.dumps(data, sort_keys=True, indent=4)
+    else:
+        body = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    resp = make_response(body, code)
     resp.headers.extend(headers or {})
     return resp
 
+response_cache = None
+
+def get_response_cache():
+    """ Get the response cache of the API, creating it on first use
+
+    Returns:
+        :obj:`ResponseCache`: response cache
+    """
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache(metabolite_manager.data_source.get_build_version,
+                                       dirname=current_app.config.get('API_RESPONSE_CACHE_DIR'))
+    return response_cache
+
+class CachedResource(Resource):
+    """ Resource whose serialized GET responses are cached until the database is rebuilt """
+
+    def dispatch_request(self, *args, **kwargs):
+        if request.method != 'GET':
+            return super(CachedResource, self).dispatch_request(*args, **kwargs)
 
-class Search(Resource):
+        cache = get_response_cache()
+        key = cache.get_key(self.__class__.__name__, {
+            'view_args': kwargs,
+            'args': sorted(request.args.items(multi=True)),
+        })
+        cached = cache.get(key)
+        if cached is not None:
+            body, headers = cached
+            return Response(body, 200, headers)
+
+        resp = super(CachedResource, self).dispatch_request(*args, **kwargs)
+        if resp.status_code == 200:
+            headers = {name: value for name, value in resp.headers.items() if name != 'Content-Length'}
+            cache.set(key, resp.get_data(), headers)
+        return resp
+
+
+class Search(CachedResource):
 
     @api.doc(params={'value': 'Value to search for over the database',
-                    'download': 'Boolean option to download content'})
+                    'download': 'Boolean option to download content',
+                    'limit': 'Maximum number of metabolites, complexes and subunits to return',
+                    'offset': 'Number of results to skip',
+                    'cursor': 'Cursor of the next page, returned with the previous page'})
     def get(self, value):
-        search_dict = search_manager.search(value)
-
-        serialized_metabolites = MetaboliteSerializer().dump(search_dict['Metabolite'], many=True)
-        serialized_complexes = ProteinComplexSerializer().dump(search_dict['ProteinComplex'], many=True)
-        serialized_subunits = ProteinSubunitSerializer().dump(search_dict['ProteinSubunit'], many=True)
-        serialized_reactions = ReactionSerializer().dump(search_dict['Reaction'], many=True)
+        args = search_parser.parse_args()
+        if args['limit'] < 1 or args['offset'] < 0:
+            api.abort(400, 'The limit must be positive and the offset must be non-negative')
+        try:
+            search_dict = search_manager.search(value, limit=args['limit'], offset=args['offset'],
+                                                cursor=args['cursor'])
+        except ValueError as error:
+            api.abort(400, str(error))
+
+        serialized_metabolites = dump(MetaboliteSerializer, search_dict['Metabolite'], many=True)
+        serialized_complexes = dump(ProteinComplexSerializer, search_dict['ProteinComplex'], many=True)
+        serialized_subunits = dump(ProteinSubunitSerializer, search_dict['ProteinSubunit'], many=True)
+        serialized_reactions = dump(ReactionSerializer, search_dict['Reaction'], many=True)
 
         headers = {}
-        if parser.parse_args()['download'] == True:
+        if args['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(value)
 
-        return {'metabolites': serialized_metabolites.data,
-                'complexes': serialized_complexes.data,
-                'subunits': serialized_subunits.data,
-                'reactions': serialized_reactions.data}, 200, headers
+        return {'metabolites': serialized_metabolites,
+                'complexes': serialized_complexes,
+                'subunits': serialized_subunits,
+                'reactions': serialized_reactions,
+                'facets': search_dict['facets'],
+                'next_cursor': search_dict['next_cursor']}, 200, headers
 
-class MetaboliteSearch(Resource):
+class MetaboliteSearch(CachedResource):
     @api.doc(params={'value': 'Value to search over in the metabolite space',
                     'download': 'Boolean option to download content'})
     def get(self,value):
         metabolite_search = metabolite_manager._search_complex(value)
-        serialized_metabolites = MetaboliteSerializer().dump(metabolite_search, many=True)
+        serialized_metabolites = dump(MetaboliteSerializer, metabolite_search, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(value)
 
-        return {'metabolites': serialized_metabolites.data}, 200, headers
+        return {'metabolites': serialized_metabolites}, 200, headers
 
-class ProteinSubunitSearch(Resource):
+class ProteinSubunitSearch(CachedResource):
     @api.doc(params={'value': 'Value to search over in the protein subunit space',
                     'download': 'Boolean option to download content'})
     def get(self,value):
         subunit_search = subunit_manager._search_complex(value)
-        serialized_subunits = ProteinSubunitSerializer().dump(subunit_search, many=True)
+        serialized_subunits = dump(ProteinSubunitSerializer, subunit_search, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(value)
 
-        return {'subunits': serialized_subunits.data}, 200, headers
+        return {'subunits': serialized_subunits}, 200, headers
 
-class ProteinComplexSearch(Resource):
+class ProteinComplexSearch(CachedResource):
     @api.doc(params={'value': 'Value to search over in the protein complex space',
                     'download': 'Boolean option to download content'})
     def get(self,value):
         complex_search  = complex_manager._search(value)
-        serialized_complexes = ProteinComplexSerializer().dump(complex_search, many=True)
+        serialized_complexes = dump(ProteinComplexSerializer, complex_search, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(value)
 
-        return {'complexes': serialized_complexes.data}, 200, headers
+        return {'complexes': serialized_complexes}, 200, headers
 
-class Metabolite(Resource):
+class Metabolite(CachedResource):
 
     @api.doc(params={'id': 'Metabolite ID to find information for',
                     'download': 'Boolean option to download content'})
@@ -110,19 +206,19 @@ class Metabolite(Resource):
         observed_concentrations = metabolite_manager.get_observed_concentrations(metabolite)
         reactions = reaction_manager.get_reaction_by_metabolite(metabolite)
 
-        serialized_metabolite = MetaboliteSerializer().dump(metabolite)
-        serialized_concentrations = ObservedValueSerializer().dump(observed_concentrations, many=True)
-        serialized_reactions =  ReactionSerializer().dump(reactions, many=True)
+        serialized_metabolite = dump(MetaboliteSerializer, metabolite)
+        serialized_concentrations = dump(ObservedValueSerializer, observed_concentrations, many=True)
+        serialized_reactions =  dump(ReactionSerializer, reactions, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(metabolite.metabolite_name)
 
-        return {'object':serialized_metabolite.data,
-                'concentrations': serialized_concentrations.data,
-                'reactions' : serialized_reactions.data}, 200, headers
+        return {'object':serialized_metabolite,
+                'concentrations': serialized_concentrations,
+                'reactions' : serialized_reactions}, 200, headers
 
-class ProteinSubunit(Resource):
+class ProteinSubunit(CachedResource):
 
     @api.doc(params={'id': 'Protein Subunit ID to find information for',
                     'download': 'Boolean option to download content'})
@@ -132,22 +228,22 @@ class ProteinSubunit(Resource):
         observed_interactions = subunit_manager.get_observable_interactions(subunit)
         observed_complexes = subunit_manager.get_observable_complex(subunit)
 
-        serialized_subunit = ProteinSubunitSerializer().dump(subunit)
-        serialized_abundances = ObservedValueSerializer().dump(observed_abundances, many=True)
-        serialized_interactions = ObservedInteractionSerializer().dump(observed_interactions, many=True)
-        serialized_complexes = ObservedComplexSpecieSerializer().dump(observed_complexes, many=True)
+        serialized_subunit = dump(ProteinSubunitSerializer, subunit)
+        serialized_abundances = dump(ObservedValueSerializer, observed_abundances, many=True)
+        serialized_interactions = dump(ObservedInteractionSerializer, observed_interactions, many=True)
+        serialized_complexes = dump(ObservedComplexSpecieSerializer, observed_complexes, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(subunit.uniprot_id)
 
 
-        return {'object': serialized_subunit.data,
-                'abundances': serialized_abundances.data,
-                'interactions': serialized_interactions.data,
-                'complexes': serialized_complexes.data}, 200, headers
+        return {'object': serialized_subunit,
+                'abundances': serialized_abundances,
+                'interactions': serialized_interactions,
+                'complexes': serialized_complexes}, 200, headers
 
-class ProteinComplex(Resource):
+class ProteinComplex(CachedResource):
 
     @api.doc(params={'id': 'Protein Complex ID to find information for',
                     'download': 'Boolean option to download content'})
@@ -155,8 +251,8 @@ class ProteinComplex(Resource):
         complex = complex_manager.get_complex_by_id(id)
         observed_subunits = complex_manager.get_observable_subunits(complex)
 
-        serialized_complex = ProteinComplexSerializer().dump(complex)
-        serialized_subunits = ObservedProteinSpecieSerializer().dump(observed_subunits, many=True)
+        serialized_complex = dump(ProteinComplexSerializer, complex)
+        serialized_subunits = dump(ObservedProteinSpecieSerializer, observed_subunits, many=True)
 
 
         headers = {}
@@ -164,10 +260,10 @@ class ProteinComplex(Resource):
             headers['Content-Disposition'] = "attachment; filename={0}.json".format(complex.complex_name)
 
 
-        return {'object':serialized_complex.data,
-                'subunits': serialized_subunits.data}, 200, headers
+        return {'object':serialized_complex,
+                'subunits': serialized_subunits}, 200, headers
 
-class Reaction(Resource):
+class Reaction(CachedResource):
 
     @api.doc(params={'id': 'Reaction ID to find information for',
                     'download': 'Boolean option to download content'})
@@ -175,25 +271,25 @@ class Reaction(Resource):
         reaction = reaction_manager.get_reaction_by_kinetic_law_id(id)
         observed_parameters = reaction_manager.get_observed_parameter_value(reaction)
 
-        serialized_reaction = ReactionSerializer().dump(reaction)
-        serialized_parameters = ObservedValueSerializer().dump(observed_parameters, many=True)
+        serialized_reaction = dump(ReactionSerializer, reaction)
+        serialized_parameters = dump(ObservedValueSerializer, observed_parameters, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}_reaction.json".format(reaction.id)
 
 
-        return {'object': serialized_reaction.data,
-                'parameters': serialized_parameters.data}, 200, headers
+        return {'object': serialized_reaction,
+                'parameters': serialized_parameters}, 200, headers
 
-class MetaboliteConcentration(Resource):
+class MetaboliteConcentration(CachedResource):
 
     @api.doc(params={'id': 'Metabolite ID to find concentration information for',
                     'download': 'Boolean option to download content'})
     def get(self, id):
         metabolite = metabolite_manager.get_metabolite_by_id(id)
         observed_concentrations = metabolite_manager.get_observed_concentrations(metabolite)
-        serialized_concentrations = ObservedValueSerializer().dump(observed_concentrations, many=True)
+        serialized_concentrations = dump(ObservedValueSerializer, observed_concentrations, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
@@ -202,14 +298,14 @@ class MetaboliteConcentration(Resource):
 
         return {'concentrations': serialized_concentrations}, 200, headers
 
-class ProteinAbundance(Resource):
+class ProteinAbundance(CachedResource):
 
     @api.doc(params={'id': 'Protein Subunit ID to find abundance information for',
                     'download': 'Boolean option to download content'})
     def get(self, id):
         subunit = subunit_manager.get_subunit_by_id(id)
         observed_abundances = subunit_manager.get_observed_abundances(subunit)
-        serialized_abundances =  ObservedValueSerializer().dump(observed_abundances, many=True).data
+        serialized_abundances =  dump(ObservedValueSerializer, observed_abundances, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
@@ -223,17 +319,125 @@ class ProteinInteraction(Resource):
     def get(self,id):
         pass
 
-class ReactionParameter(Resource):
+class ReactionParameter(CachedResource):
 
     @api.doc(params={'id': 'Reaction ID to find reaction paramater information for',
                     'download': 'Boolean option to download content'})
     def get(self,id):
         reaction = reaction_manager.get_reaction_by_kinetic_law_id(id)
         observed_parameters = reaction_manager.get_observed_parameter_value(reaction)
-        serialized_parameters = ObservedValueSerializer().dump(observed_parameters, many=True).data
+        serialized_parameters = dump(ObservedValueSerializer, observed_parameters, many=True)
 
         headers = {}
         if parser.parse_args()['download'] == True:
             headers['Content-Disposition'] = "attachment; filename={0}_rxn_parameters.json".format(reaction.id)
 
         return {'parameters': serialized_parameters}, 200, headers
+
+class MetaboliteBatch(CachedResource):
+    """ Metabolites, their concentrations and their reactions for a list of ids and/or InChI structures """
+
+    batch_parser = get_batch_parser(ids=int, inchis=str)
+
+    @api.doc(params={'ids': 'Metabolite IDs to find information for',
+                    'inchis': 'InChI structures of the metabolites to find information for'})
+    def get(self):
+        args = parse_batch_args(self.batch_parser)
+
+        metabolites = metabolite_manager.get_metabolites_by_ids(args['ids'])
+        not_found = {'ids': sorted(set(args['ids']) - set(metabolite.metabolite_id for metabolite in metabolites))}
+
+        metabolites_by_structure = metabolite_manager.get_metabolites_by_structures(args['inchis'])
+        not_found['inchis'] = [inchi for inchi, structure_metabolites in metabolites_by_structure.items()
+                               if not structure_metabolites]
+        for structure_metabolites in metabolites_by_structure.values():
+            metabolites.extend(structure_metabolites)
+        metabolites = list(collections.OrderedDict((metabolite.metabolite_id, metabolite)
+                                                   for metabolite in metabolites).values())
+
+        observed_concentrations = metabolite_manager.get_observed_concentrations_by_metabolites(metabolites)
+        reactions = reaction_manager.get_reactions_by_metabolites(metabolites)
+
+        serialized_metabolites = dump(MetaboliteSerializer, metabolites, many=True)
+        return {'metabolites': [{
+            'object': serialized_metabolite,
+            'concentrations': dump(ObservedValueSerializer, observed_concentrations[metabolite.metabolite_id],
+                                   many=True),
+            'reactions': dump(ReactionSerializer, reactions[metabolite.metabolite_id], many=True),
+        } for metabolite, serialized_metabolite in zip(metabolites, serialized_metabolites)],
+            'not_found': not_found}, 200
+
+    post = get
+
+class ProteinSubunitBatch(CachedResource):
+    """ Protein subunits, their abundances and their complexes for a list of ids and/or UniProt ids """
+
+    batch_parser = get_batch_parser(ids=int, uniprot_ids=str)
+
+    @api.doc(params={'ids': 'Protein Subunit IDs to find information for',
+                    'uniprot_ids': 'UniProt IDs of the subunits to find information for'})
+    def get(self):
+        args = parse_batch_args(self.batch_parser)
+
+        subunits = subunit_manager.get_subunits_by_ids(args['ids'])
+        not_found = {'ids': sorted(set(args['ids']) - set(subunit.subunit_id for subunit in subunits))}
+
+        subunits_by_uniprot_id = subunit_manager.get_subunits_by_uniprot_ids(args['uniprot_ids'])
+        not_found['uniprot_ids'] = [uniprot_id for uniprot_id, uniprot_subunits in subunits_by_uniprot_id.items()
+                                    if not uniprot_subunits]
+        for uniprot_subunits in subunits_by_uniprot_id.values():
+            subunits.extend(uniprot_subunits)
+        subunits = list(collections.OrderedDict((subunit.subunit_id, subunit) for subunit in subunits).values())
+
+        observed_abundances = subunit_manager.get_observed_abundances_by_subunits(subunits)
+        observed_complexes = subunit_manager.get_observable_complexes_by_subunits(subunits)
+
+        serialized_subunits = dump(ProteinSubunitSerializer, subunits, many=True)
+        return {'subunits': [{
+            'object': serialized_subunit,
+            'abundances': dump(ObservedValueSerializer, observed_abundances[subunit.subunit_id], many=True),
+            'complexes': dump(ObservedComplexSpecieSerializer, observed_complexes[subunit.subunit_id], many=True),
+        } for subunit, serialized_subunit in zip(subunits, serialized_subunits)],
+            'not_found': not_found}, 200
+
+    post = get
+
+class ProteinComplexBatch(CachedResource):
+    """ Protein complexes and their subunits for a list of ids """
+
+    batch_parser = get_batch_parser(ids=int)
+
+    @api.doc(params={'ids': 'Protein Complex IDs to find information for'})
+    def get(self):
+        args = parse_batch_args(self.batch_parser)
+
+        complexes = complex_manager.get_complexes_by_ids(args['ids'])
+        not_found = {'ids': sorted(set(args['ids']) - set(complex.complex_id for complex in complexes))}
+
+        observed_subunits = complex_manager.get_observable_subunits_by_complexes(complexes)
+
+        serialized_complexes = dump(ProteinComplexSerializer, complexes, many=True)
+        return {'complexes': [{
+            'object': serialized_complex,
+            'subunits': dump(ObservedProteinSpecieSerializer, observed_subunits[complex.complex_id], many=True),
+        } for complex, serialized_complex in zip(complexes, serialized_complexes)],
+            'not_found': not_found}, 200
+
+    post = get
+
+class ReactionBatch(CachedResource):
+    """ Reactions for a list of ids (kinetic law ids) """
+
+    batch_parser = get_batch_parser(ids=int)
+
+    @api.doc(params={'ids': 'Reaction IDs to find information for'})
+    def get(self):
+        args = parse_batch_args(self.batch_parser)
+
+        reactions = reaction_manager.get_reactions_by_kinetic_law_ids(args['ids'])
+        not_found = {'ids': sorted(set(args['ids']) - set(reaction.kinetic_law_id for reaction in reactions))}
+
+        return {'reactions': dump(ReactionSerializer, reactions, many=True),
+                'not_found': not_found}, 200
+
+    post = get
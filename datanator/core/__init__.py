@@ -1,5 +1,10 @@
-from . import data_model
-from . import data_query
-from . import data_source
-from . import common_schema
-from . import models
+from datanator.util import import_util
+
+# submodules are imported when they are first accessed
+import_util.make_lazy(__name__, submodules=[
+    'data_model',
+    'data_query',
+    'data_source',
+    'common_schema',
+    'models',
+])
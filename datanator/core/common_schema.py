@@ -11,11 +11,21 @@ from datanator import db
 from datanator.config import config
 from datanator.core import data_source, models
 from datanator.data_source import corum, pax, jaspar, jaspar, ecmdb, sabio_rk, intact, uniprot, array_express
+from datanator.util import ec_util, fingerprint_util
 from datanator.util.build_util import timemethod, timeloadcontent, continuousload
 from datanator.util.constants import *
+import collections
+import datetime
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import pandas
 import re
-import threading
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.orm
 import time
 
 class CommonSchema(data_source.PostgresDataSource):
@@ -25,15 +35,87 @@ class CommonSchema(data_source.PostgresDataSource):
         load_entire_small_dbs (:obj:`bool`): Loads all entire databases that fall under 50 MB
         load_small_db_switch (:obj:`bool`)
         test (:obj:`bool`): Designates whether tests are being completed for brevity of tests
+        jobs (:obj:`int`): number of processes to use to build the database; if :obj:`None`, use all of the cores
+        build_timings (:obj:`collections.OrderedDict`): dictionary which maps the name of each stage of the last
+            build to its duration in seconds
+        pax_dataset_timings (:obj:`collections.OrderedDict`): dictionary which maps the file name of each PaxDB
+            dataset integrated by the last call to :obj:`build_pax` to the durations in seconds of reading, inserting,
+            and linking its abundances
     """
     base_model = db
 
+    # stages of the build and the stages which they depend on, in the order in which a serial build runs them
+    BUILD_STAGES = collections.OrderedDict([
+        ('build_pax', ()),
+        ('build_ecmdb', ()),
+        ('build_intact_complexes', ()),
+        ('build_corum', ()),
+        ('build_jaspar', ()),
+        ('build_intact_interactions', ('build_pax',)),
+        ('build_array_express', ('build_pax',)),
+        ('build_sabio', ('build_pax', 'build_ecmdb', 'build_intact_complexes', 'build_corum')),
+        ('build_uniprot', ('build_pax', 'build_ecmdb', 'build_intact_complexes', 'build_corum', 'build_jaspar',
+                           'build_intact_interactions', 'build_array_express', 'build_sabio')),
+        ('build_ncbi', ('build_pax', 'build_ecmdb', 'build_intact_complexes', 'build_corum', 'build_jaspar',
+                        'build_intact_interactions', 'build_array_express', 'build_sabio')),
+    ])
+    SMALL_DB_BUILD_STAGES = ('build_ecmdb', 'build_intact_complexes', 'build_corum', 'build_jaspar')
+
+    # models whose objects several stages can get or create, in the order in which their duplicates are merged after
+    # a parallel build, with the attributes which the stages get or create their objects by and, optionally, the
+    # condition which the objects that are merged must meet. Objects which refer to others are merged after them
+    # because they only become equal once the objects which they refer to have been merged. The subunits of the
+    # PaxDB datasets are inserted in bulk rather than got or created, and are never merged.
+    SHARED_MODELS = (
+        (models.Method, ('name', 'comments', 'performer', 'hardware', 'software'), None),
+        (models.Resource, ('namespace', '_id', 'release_date'), None),
+        (models.Synonym, ('name',), None),
+        (models.CellLine, ('name',), None),
+        (models.Conditions, ('growth_status', 'media', 'temperature', 'ph', 'growth_system'), None),
+        (models.CellCompartment, ('name',), None),
+        (models.Characteristic, ('category', 'value'), None),
+        (models.Variable, ('category', 'value', 'units'), None),
+        (models.ExperimentDesign, ('name',), None),
+        (models.ExperimentType, ('name',), None),
+        (models.DataFormat, ('name', 'bio_assay_data_cubes'), None),
+        (models.Metadata, ('name',), None),
+        (models.ExperimentMetadata, ('name', 'description'), None),
+        (models.Structure, ('type', 'name', '_value_smiles', '_value_inchi', '_structure_formula_connectivity',
+                            '_metadata'), None),
+        (models.Metabolite, ('type', 'name', 'metabolite_name', 'description', 'comment', 'structure', '_metadata'),
+         None),
+        (models.ProteinComplex, ('type', 'name', 'complex_name', 'go_id', 'go_dsc', 'funcat_id', 'funcat_dsc',
+                                 'su_cmt', 'complex_cmt', 'disease_cmt', 'class_name', 'family_name', '_metadata'),
+         None),
+        (models.ProteinSubunit, ('type', 'name', 'subunit_name', 'uniprot_id', 'entrez_id', 'gene_name', 'gene_syn',
+                                 'class_name', 'family_name', 'proteincomplex', '_metadata'),
+         models.ProteinSubunit.pax_load == None),
+    )
+
+    # relationships of the source records whose content is included in their fingerprints
+    ARRAY_EXPRESS_FINGERPRINT_PATHS = (
+        'organisms', 'protocols', 'designs', 'types', 'data_formats',
+        'samples', 'samples.characteristics', 'samples.variables', 'samples.ensembl_info',
+    )
+    SABIO_FINGERPRINT_PATHS = (
+        'synonyms', 'cross_references', 'references', 'enzyme', 'structures',
+        'reactants', 'reactants.compound', 'reactants.compartment',
+        'products', 'products.compound', 'products.compartment',
+        'modifiers', 'modifiers.compound', 'modifiers.compartment',
+        'parameters', 'parameters.compound',
+    )
+
+    KINETIC_LAW_PARTICIPANT_INDEX_COLUMNS = (
+        'reactant_inchis', 'product_inchis', 'modifier_inchis',
+        'reactant_formula_connectivities', 'product_formula_connectivities', 'modifier_formula_connectivities',
+    )
+
     def __init__(self, name=None, 
                  clear_content=False, 
                  load_content=False, max_entries=float('inf'),
                  restore_backup_data=False, restore_backup_schema=False, restore_backup_exit_on_error=True,
                  quilt_owner=None, quilt_package=None, cache_dirname=None, 
-                 verbose=False, load_entire_small_dbs=False, test=False):
+                 verbose=False, load_entire_small_dbs=False, test=False, jobs=None):
         """
         Args:
             name (:obj:`str`, optional): name
@@ -49,11 +131,16 @@ class CommonSchema(data_source.PostgresDataSource):
             verbose (:obj:`bool`, optional): if :obj:`True`, self.vprint status information to the standard output
             load_entire_small_dbs (:obj:`bool`, optional): Loads all entire databases that fall under 50 MB
             test (:obj:`bool`, optional): Designates whether tests are being completed for brevity of tests
+            jobs (:obj:`int`, optional): number of processes to use to build the database; if :obj:`None`, use all
+                of the cores
         """
 
         self.load_entire_small_dbs = load_entire_small_dbs
         self.load_small_db_switch = False
         self.test = test
+        self.jobs = jobs
+        self.build_timings = collections.OrderedDict()
+        self.pax_dataset_timings = collections.OrderedDict()
 
         super(CommonSchema, self).__init__(
             name=name, clear_content=clear_content,
@@ -80,54 +167,330 @@ class CommonSchema(data_source.PostgresDataSource):
         A wrapper for loading all the databases into common ORM database
 
         """
+        stages = [stage for stage in self.BUILD_STAGES
+                  if self.load_small_db_switch or stage not in self.SMALL_DB_BUILD_STAGES]
+        self.build_timings = self.run_build_stages(stages, jobs=self.jobs)
+
+        self.vprint('Build stage timings:')
+        for stage, duration in self.build_timings.items():
+            self.vprint('  {}: {:.2f} sec'.format(stage, duration))
+
+    def run_build_stages(self, stages, jobs=None):
+        """ Run stages of the build, each in its own process with its own engine and session, starting each stage
+        once all of the stages that it depends on (see :obj:`BUILD_STAGES`) have finished
+
+        Args:
+            stages (:obj:`list` of :obj:`str`): names of the stages to run
+            jobs (:obj:`int`, optional): maximum number of stages to run at once; if :obj:`None`, use all of the
+                cores. If 1, run the stages serially in this process.
+
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps the name of each stage to its duration in seconds
+        """
+        dependencies = {stage: [dep for dep in self.BUILD_STAGES[stage] if dep in stages] for stage in stages}
+        jobs = min(jobs or multiprocessing.cpu_count(), len(stages))
+
+        timings = {}
+        if jobs <= 1:
+            for stage in stages:
+                timings[stage] = self.run_build_stage(stage)
+            return collections.OrderedDict((stage, timings[stage]) for stage in stages)
+
+        # don't share the connections of this process with the workers
+        self.session.commit()
+        max_ids, taxon_ids = self.get_build_watermarks()
+        self.session.close()
+        data_source.get_object_cache(self.session).clear()
+        self.engine.dispose()
+
+        options = {
+            'name': self.name,
+            'cache_dirname': self.cache_dirname,
+            'max_entries': self.max_entries,
+            'verbose': self.verbose,
+            'load_entire_small_dbs': self.load_entire_small_dbs,
+            'test': self.test,
+        }
+        pool = multiprocessing.Pool(jobs, initializer=data_source.set_concurrent_writers, initargs=(True,))
+        try:
+            waiting = list(stages)
+            running = {}
+            while waiting or running:
+                for stage in list(waiting):
+                    if all(dep in timings for dep in dependencies[stage]):
+                        waiting.remove(stage)
+                        running[stage] = pool.apply_async(run_build_stage, (options, stage))
+
+                finished = [stage for stage, result in running.items() if result.ready()]
+                if not finished:
+                    time.sleep(BUILD_STAGE_POLL_INTERVAL)
+                for stage in finished:
+                    timings[stage] = running.pop(stage).get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.merge_duplicate_objects(max_ids, taxon_ids)
+
+        return collections.OrderedDict((stage, timings[stage]) for stage in stages)
+
+    def get_build_watermarks(self):
+        """ Get the objects which exist before stages are run in parallel, so that only the objects which the stages
+        create are merged afterwards by :obj:`merge_duplicate_objects`
+
+        Returns:
+            :obj:`tuple`:
+
+                * :obj:`dict`: dictionary which maps each of the :obj:`SHARED_MODELS` to the largest id of its objects
+                * :obj:`set` of :obj:`int`: NCBI ids of the taxa
+        """
+        max_ids = {model: data_source.get_max_id(self.session, model) for model, _, _ in self.SHARED_MODELS}
+        taxon_ids = set(ncbi_id for ncbi_id, in self.session.query(models.Taxon.ncbi_id))
+        return (max_ids, taxon_ids)
+
+    def merge_duplicate_objects(self, max_ids, taxon_ids):
+        """ Merge the objects which stages that ran at the same time each created (see :obj:`SHARED_MODELS`), and
+        delete the taxa which only the stages that failed referred to. The objects which existed before the stages
+        ran (e.g. the objects of earlier builds) aren't merged or deleted.
+
+        Args:
+            max_ids (:obj:`dict`): dictionary which maps each of the :obj:`SHARED_MODELS` to the largest id of its
+                objects before the stages ran
+            taxon_ids (:obj:`set` of :obj:`int`): NCBI ids of the taxa which existed before the stages ran
+        """
+        for model, attrs, criterion in self.SHARED_MODELS:
+            n_duplicates = data_source.merge_duplicates(self.session, model, attrs,
+                                                        after_id=max_ids.get(model, 0), criterion=criterion)
+            if n_duplicates:
+                self.vprint('Merged {} duplicate {} objects'.format(n_duplicates, model.__name__))
+
+        new_taxon_ids = set(ncbi_id for ncbi_id, in self.session.query(models.Taxon.ncbi_id)) - taxon_ids
+        data_source.delete_unreferenced(self.session, models.Taxon, ids=new_taxon_ids)
+        self.session.commit()
+        data_source.get_object_cache(self.session).clear()
+
+    def run_build_stage(self, stage):
+        """ Run a stage of the build
 
+        Args:
+            stage (:obj:`str`): name of the stage (e.g. `build_pax`)
+
+        Returns:
+            :obj:`float`: duration of the stage in seconds
+        """
         observation = models.Observation()
         observation.physical_entity = models.PhysicalEntity()
         self.entity = observation.physical_entity
         observation.physical_property = models.PhysicalProperty()
         self.property = observation.physical_property
 
-        self.build_pax()
+        start = time.time()
+        getattr(self, stage)()
+        return time.time() - start
+
+    def preload_metadata_objects(self):
+        """ Preload the metadata objects which are shared by many observations into the identity cache of
+        the session so that :obj:`get_or_create_object` only has to query the database for new objects
+        """
+        self.preload_objects(models.Metadata, 'name')
+        self.preload_objects(models.Taxon, 'ncbi_id')
+        self.preload_objects(models.Resource, 'namespace', '_id')
+        self.preload_objects(models.Method, 'name')
+
+    def get_build_version(self):
+        """ Get a version identifier of the content of the database, which changes whenever the database is
+        (re)built or a new dump is restored
+
+        Returns:
+            :obj:`str`: version of the build
+        """
+        progress = self.session.query(models.Progress.database_name, models.Progress.amount_loaded) \
+            .order_by(models.Progress.database_name).all()
+
+        dump_path = os.path.join(self.cache_dirname, self._get_dump_path())
+        dump_time = os.path.getmtime(dump_path) if os.path.isfile(dump_path) else None
+
+        # delta builds can change the content without changing the progress
+        fingerprint = models.SourceRecordFingerprint
+        fingerprints = self.session.query(fingerprint.database_name, sqlalchemy.func.count(fingerprint.record_id),
+                                          sqlalchemy.func.max(fingerprint.updated)) \
+            .group_by(fingerprint.database_name) \
+            .order_by(fingerprint.database_name).all()
+
+        version = json.dumps([[list(row) for row in progress],
+                              [[name, count, str(updated)] for name, count, updated in fingerprints],
+                              dump_time])
+        return hashlib.sha1(version.encode()).hexdigest()
+
+    def get_changed_records(self, database_name, fingerprints, complete=True):
+        """ Get the records of a source database whose content has changed since they were last integrated
+
+        Args:
+            database_name (:obj:`str`): name of the source database
+            fingerprints (:obj:`collections.OrderedDict`): dictionary which maps the ids of the current records of the
+                source database to the fingerprints of their content
+            complete (:obj:`bool`, optional): if :obj:`True`, :obj:`fingerprints` contains all of the records of the
+                source database, and the integrated records which it doesn't contain have been deleted from the source
+                database
+
+        Returns:
+            :obj:`list` of :obj:`str`: ids of the records which are new or have changed, in the order of
+                :obj:`fingerprints`
+            :obj:`list` of :obj:`str`: ids of the records which have been deleted from the source database
+        """
+        previous = dict(self.session.query(models.SourceRecordFingerprint.record_id,
+                                           models.SourceRecordFingerprint.fingerprint)
+                        .filter_by(database_name=database_name))
+
+        changed = [record_id for record_id, fingerprint in fingerprints.items()
+                   if previous.get(record_id, None) != fingerprint]
+        if complete:
+            deleted = sorted(set(previous.keys()).difference(fingerprints.keys()))
+        else:
+            deleted = []
+        return changed, deleted
 
-        # # Chunk Larger DBs
-        t1 = threading.Thread(target=self.build_intact_interactions)
-        t2 = threading.Thread(target=self.build_sabio)
-        t3 = threading.Thread(target=self.build_array_express)
+    def save_record_fingerprints(self, database_name, fingerprints):
+        """ Insert or update the fingerprints of records of a source database which have been integrated
 
-        t1.start()
-        t2.start()
-        t3.start()
+        Args:
+            database_name (:obj:`str`): name of the source database
+            fingerprints (:obj:`dict`): dictionary which maps the ids of the records to the fingerprints of their content
+        """
+        table = models.SourceRecordFingerprint.__table__
+        updated = datetime.datetime.utcnow()
+        rows = [dict(database_name=database_name, record_id=record_id, fingerprint=fingerprint, updated=updated)
+                for record_id, fingerprint in fingerprints.items()]
+        for i_chunk in range(0, len(rows), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+            stmt = sqlalchemy.dialects.postgresql.insert(table).values(
+                rows[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE])
+            self.session.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.database_name, table.c.record_id],
+                set_=dict(fingerprint=stmt.excluded.fingerprint, updated=stmt.excluded.updated)))
+
+    def delete_record_fingerprints(self, database_name, record_ids):
+        """ Delete the fingerprints of records of a source database, e.g. before their integrated content is deleted
 
+        Args:
+            database_name (:obj:`str`): name of the source database
+            record_ids (:obj:`list` of :obj:`str`): ids of the records
+        """
+        table = models.SourceRecordFingerprint.__table__
+        record_ids = list(record_ids)
+        for i_chunk in range(0, len(record_ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+            self.session.execute(table.delete()
+                                 .where(table.c.database_name == database_name)
+                                 .where(table.c.record_id.in_(
+                                     record_ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE])))
 
-        t1.join()
-        t2.join()
-        t3.join()
+    def get_observation_ids_by_metadata_names(self, model, names, *conditions):
+        """ Get the ids of the observations of a type whose metadata have one of a list of names
 
+        Args:
+            model (:obj:`type`): subclass of :obj:`models.Observation`
+            names (:obj:`list` of :obj:`str`): names of the metadata
+            *conditions (:obj:`list`, optional): additional conditions on the observations
 
+        Returns:
+            :obj:`list` of :obj:`int`: ids of the observations
+        """
+        observation = models.Observation.__table__
+        metadata = models.Metadata.__table__
+        table = model.__table__
+        id_column = list(table.primary_key.columns)[0]
+
+        names = list(names)
+        ids = []
+        for i_chunk in range(0, len(names), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+            ids.extend(id for id, in self.session.execute(
+                sqlalchemy.select([id_column])
+                .select_from(table
+                             .join(observation, observation.c.id == id_column)
+                             .join(metadata, metadata.c.id == observation.c._metadata_id))
+                .where(metadata.c.name.in_(names[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE]))
+                .where(sqlalchemy.and_(*conditions))))
+        return ids
+
+    def delete_observations(self, model, ids):
+        """ Delete observations of a type from each of the tables of their class hierarchy, from the table of
+        :obj:`model` to the table of :obj:`models.Observation`
 
-        # # Add complete smaller DBs
-        if self.load_small_db_switch:
-            t4 = threading.Thread(target=self.build_intact_complexes)
-            t5 = threading.Thread(target=self.build_corum)
-            t6 = threading.Thread(target=self.build_jaspar)
-            t7 = threading.Thread(target=self.build_ecmdb)
+        Args:
+            model (:obj:`type`): subclass of :obj:`models.Observation`
+            ids (:obj:`list` of :obj:`int`): ids of the observations
+        """
+        ids = list(ids)
+        for mapper in sqlalchemy.inspect(model).iterate_to_root():
+            table = mapper.local_table
+            id_column = list(table.primary_key.columns)[0]
+            for i_chunk in range(0, len(ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+                self.session.execute(table.delete().where(id_column.in_(
+                    ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE])))
 
-            t4.start()
-            t5.start()
-            t6.start()
-            t7.start()
+        # the identity cache mustn't return the deleted objects
+        data_source.get_object_cache(self.session).clear()
 
-            t4.join()
-            t5.join()
-            t6.join()
-            t7.join()
+    def get_pax_dataset_fingerprints(self, pax_ses, datasets):
+        """ Get the fingerprints of the content of PaxDB datasets, including their abundances
 
+        Args:
+            pax_ses (:obj:`sqlalchemy.orm.session.Session`): session of the PaxDB database
+            datasets (:obj:`list` of :obj:`pax.Dataset`): datasets
 
-        # # Add missing subunit information
-        self.build_uniprot()
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps the file name of each dataset to its fingerprint
+        """
+        abundances = pax_ses.query(pax.Observation.dataset_id, pax.Observation.abundance, pax.Protein.uniprot_id) \
+            .outerjoin(pax.Observation.protein) \
+            .filter(pax.Observation.dataset_id.in_([dataset.id for dataset in datasets])) \
+            .order_by(pax.Observation.dataset_id, pax.Observation.id) \
+            .yield_per(SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE)
+        abundance_fingerprints = {}
+        for dataset_id, rows in itertools.groupby(abundances, lambda row: row[0]):
+            abundance_fingerprints[dataset_id] = fingerprint_util.calc_fingerprint(
+                [[abundance, uniprot_id] for _, abundance, uniprot_id in rows])
+
+        fingerprints = collections.OrderedDict()
+        for dataset in datasets:
+            values = fingerprint_util.get_column_values(dataset)
+            values['taxon_ncbi_id'] = dataset.taxon_ncbi_id
+            values['abundances'] = abundance_fingerprints.get(dataset.id, None)
+            fingerprints[dataset.file_name] = fingerprint_util.calc_fingerprint(values)
+        return fingerprints
+
+    def delete_pax_datasets(self, file_names):
+        """ Delete integrated PaxDB datasets, including their abundances and the subunits which they created.
+        The subunits which other sources link to, i.e. which belong to a protein complex, which a DNA binding
+        dataset describes, or which the abundances of another dataset are linked to, are kept.
 
-        # Add missing Taxon information
-        self.build_ncbi()
+        Args:
+            file_names (:obj:`list` of :obj:`str`): file names of the datasets
+        """
+        subunit = models.ProteinSubunit.__table__
+        abundance_data = models.AbundanceData.__table__
+        dna_binding_dataset = models.DNABindingDataset.__table__
+
+        dataset_ids = self.get_observation_ids_by_metadata_names(models.AbundanceDataSet, file_names)
+
+        other_abundances = sqlalchemy.select([abundance_data.c.subunit_id]) \
+            .where(abundance_data.c.subunit_id != None)
+        if dataset_ids:
+            other_abundances = other_abundances.where(~abundance_data.c.dataset_id.in_(dataset_ids))
+        subunit_ids = self.get_observation_ids_by_metadata_names(
+            models.ProteinSubunit, file_names,
+            subunit.c.pax_load != None,
+            subunit.c.proteincomplex_id == None,
+            ~subunit.c.subunit_id.in_(sqlalchemy.select([dna_binding_dataset.c.subunit_id])
+                                      .where(dna_binding_dataset.c.subunit_id != None)),
+            ~subunit.c.subunit_id.in_(other_abundances))
+
+        for column, ids in [(abundance_data.c.dataset_id, dataset_ids), (abundance_data.c.subunit_id, subunit_ids)]:
+            for i_chunk in range(0, len(ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+                self.session.execute(abundance_data.delete().where(column.in_(
+                    ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE])))
+
+        self.delete_observations(models.ProteinSubunit, subunit_ids)
+        self.delete_observations(models.AbundanceDataSet, dataset_ids)
 
     @continuousload
     @timemethod
@@ -141,6 +504,7 @@ class CommonSchema(data_source.PostgresDataSource):
 
         paxdb = pax.Pax(cache_dirname=self.cache_dirname, verbose=self.verbose)
         pax_ses = paxdb.session
+        self.preload_metadata_objects()
         batch = PAX_TEST_BATCH if self.test else PAX_BUILD_BATCH
 
         pax_progress = self.session.query(models.Progress).filter_by(database_name=PAX_NAME).first()
@@ -152,39 +516,92 @@ class CommonSchema(data_source.PostgresDataSource):
         else:
             pax_dataset = pax_ses.query(pax.Dataset).filter(pax.Dataset.id.in_(range(load_count, load_count + batch))).all()
 
+        # only integrate the datasets which have changed since the previous build
+        fingerprints = self.get_pax_dataset_fingerprints(pax_ses, pax_dataset)
+        changed, deleted = self.get_changed_records(PAX_NAME, fingerprints,
+                                                    complete=self.max_entries == float('inf'))
+        self.delete_pax_datasets(changed + deleted)
+        self.delete_record_fingerprints(PAX_NAME, changed + deleted)
+        self.session.commit()
+        self.vprint('{} of {} datasets changed, {} deleted'.format(len(changed), len(pax_dataset), len(deleted)))
+        changed = set(changed)
+
+        observation = models.Observation.__table__
+        subunit = models.ProteinSubunit.__table__
+        abundance_data = models.AbundanceData.__table__
+        self.pax_dataset_timings = collections.OrderedDict()
+
         for dataset in pax_dataset:
+            if dataset.file_name not in changed:
+                continue
+
+            start_time = time.time()
             metadata = self.get_or_create_object(models.Metadata, name=dataset.file_name)
-            metadata.taxon.append(self.get_or_create_object(models.Taxon, ncbi_id=dataset.taxon_ncbi_id))
-            metadata.resource.append(self.get_or_create_object(models.Resource, namespace='url', _id=dataset.publication))
+            # the metadata of a changed dataset are reused, so its relationships are replaced rather than extended
+            metadata.taxon = [self.get_or_create_object(models.Taxon, ncbi_id=dataset.taxon_ncbi_id)]
+            metadata.resource = [self.get_or_create_object(models.Resource, namespace='url', _id=dataset.publication)]
             self.property.abundance_dataset = self.get_or_create_object(models.AbundanceDataSet, type='Protein Abundance Dataset',
                                                                         name=dataset.file_name, file_name=dataset.file_name,
                                                                         score=dataset.score, weight=dataset.weight,
                                                                         coverage=dataset.coverage, _metadata=metadata)
+            self.session.flush()
 
-            abundance = pax_ses.query(pax.Observation).filter_by(dataset_id=dataset.id).all()
+            abundance = pax_ses.query(pax.Observation.abundance, pax.Protein.uniprot_id) \
+                .outerjoin(pax.Observation.protein) \
+                .filter(pax.Observation.dataset_id == dataset.id) \
+                .all()
+            read_time = time.time()
 
+            # the datasets of the abundances are resolved before they are inserted
             self.session.bulk_insert_mappings(models.AbundanceData,
                                               [
-                                                  dict(abundance=data.abundance, pax_load=data.dataset_id,
-                                                       uniprot_id=data.protein.uniprot_id)
-                                                  for data in abundance
+                                                  dict(abundance=abundance_value, pax_load=dataset.id,
+                                                       uniprot_id=uniprot_id,
+                                                       dataset_id=self.property.abundance_dataset.dataset_id)
+                                                  for abundance_value, uniprot_id in abundance
                                               ])
 
             self.session.bulk_insert_mappings(models.ProteinSubunit,
                                               [
-                                                  dict(uniprot_id=data.protein.uniprot_id, type='Protein Subunit',
-                                                       pax_load=data.dataset_id) for data in abundance
+                                                  dict(uniprot_id=uniprot_id, type='Protein Subunit',
+                                                       pax_load=dataset.id) for _, uniprot_id in abundance
                                               ])
-
+            insert_time = time.time()
+
+            # link the subunits to the metadata and the abundances to the first subunit with the same UniProt id
+            # with set-based updates
+            # rows of the previous builds can have the same `pax_load` because the ids of the Pax datasets aren't
+            # stable, so the new rows are also identified by their (still unset) metadata and by their dataset
+            self.session.execute(observation.update()
+                                 .values(_metadata_id=metadata.id)
+                                 .where(observation.c.id == subunit.c.subunit_id)
+                                 .where(observation.c._metadata_id == None)
+                                 .where(subunit.c.pax_load == dataset.id))
+
+            first_subunits = sqlalchemy.select([subunit.c.uniprot_id,
+                                                sqlalchemy.func.min(subunit.c.subunit_id).label('subunit_id')]) \
+                .select_from(subunit.join(observation, observation.c.id == subunit.c.subunit_id)) \
+                .where(subunit.c.pax_load == dataset.id) \
+                .where(observation.c._metadata_id == metadata.id) \
+                .group_by(subunit.c.uniprot_id) \
+                .alias('first_subunit')
+            self.session.execute(abundance_data.update()
+                                 .values(subunit_id=first_subunits.c.subunit_id)
+                                 .where(abundance_data.c.dataset_id == self.property.abundance_dataset.dataset_id)
+                                 .where(abundance_data.c.uniprot_id == first_subunits.c.uniprot_id))
+
+            self.save_record_fingerprints(PAX_NAME, {dataset.file_name: fingerprints[dataset.file_name]})
             self.session.commit()
+            end_time = time.time()
 
-            for subunit in self.session.query(models.ProteinSubunit).filter_by(pax_load=dataset.id).all():
-                subunit._metadata = metadata
-
-            for rows in self.session.query(models.AbundanceData).filter_by(pax_load=dataset.id).all():
-                rows.subunit = self.session.query(models.ProteinSubunit).filter_by(
-                    pax_load=dataset.id).filter_by(uniprot_id=rows.uniprot_id).first()
-                rows.dataset = self.property.abundance_dataset
+            self.pax_dataset_timings[dataset.file_name] = collections.OrderedDict([
+                ('read', read_time - start_time),
+                ('insert', insert_time - read_time),
+                ('link', end_time - insert_time),
+            ])
+            self.vprint('{}: {} abundances in {:.2f} sec (read {:.2f} sec, insert {:.2f} sec, link {:.2f} sec)'.format(
+                dataset.file_name, len(abundance), end_time - start_time,
+                read_time - start_time, insert_time - read_time, end_time - insert_time))
 
         pax_progress.amount_loaded = self.session.query(models.AbundanceDataSet).count()
 
@@ -200,6 +617,7 @@ class CommonSchema(data_source.PostgresDataSource):
         """
         t0 = time.time()
         intactdb = intact.IntAct(cache_dirname=self.cache_dirname)
+        self.preload_metadata_objects()
         batch = INTACT_INTERACTION_TEST_BATCH if self.test else INTACT_INTERACTION_BUILD_BATCH
         intact_progress = self.session.query(models.Progress).filter_by(database_name=INTACT_NAME).first()
         load_count = intact_progress.amount_loaded
@@ -211,44 +629,86 @@ class CommonSchema(data_source.PostgresDataSource):
             interactions = intactdb.session.query(intact.ProteinInteraction).filter(intact.ProteinInteraction.index.in_
                 (range(load_count, load_count + batch))).all()
 
+        # only integrate the interactions which have changed since the previous build. The interactions are
+        # identified by their IntAct ids and participants rather than by their positions in the IntAct export, which
+        # shift whenever interactions are added or removed upstream.
+        record_values = collections.OrderedDict()
+        for i in interactions:
+            record_values.setdefault(self.get_intact_interaction_record_id(i), []).append(
+                fingerprint_util.get_column_values(i))
+        fingerprints = collections.OrderedDict(
+            (record_id, fingerprint_util.calc_fingerprint(values)) for record_id, values in record_values.items())
+        changed, deleted = self.get_changed_records(INTACT_NAME, fingerprints,
+                                                    complete=self.max_entries == float('inf'))
+        self.delete_observations(models.ProteinInteraction, self.get_observation_ids_by_metadata_names(
+            models.ProteinInteraction, ['protein_interaction_' + record_id for record_id in changed + deleted]))
+        self.delete_record_fingerprints(INTACT_NAME, changed + deleted)
+        self.session.commit()
+        self.vprint('{} of {} interactions changed, {} deleted'.format(len(changed), len(interactions), len(deleted)))
+        changed = set(changed)
+
         sub_batch = []
+        sub_batch_record_ids = []
         for i in interactions:
-            if len(sub_batch) < INTACT_INTERACTION_BUILD_SUB_BATCH:
-                metadata = self.get_or_create_object(models.Metadata, name='protein_interaction_' + str(i.index))
-                metadata.method.append(self.get_or_create_object(models.Method, name=i.method))
-                metadata.resource.append(self.get_or_create_object(models.Resource, namespace='pubmed', _id=i.publication))
-                metadata.resource.append(self.get_or_create_object(models.Resource, namespace='paper', _id=i.publication_author))
-
-                for c in dir(i):
-                    if getattr(i, c) == None and '__' not in c:
-                        setattr(i, c, '')
-
-                for type, protein, gene in [(i.type_a, i.protein_a, i.gene_a), (i.type_b, i.protein_b, i.gene_b)]:
-                    if type == 'protein':
-                        self.get_or_create_object(models.ProteinSubunit, uniprot_id=protein, gene_name=gene)
-
-                sub_batch.append(models.ProteinInteraction(name=i.protein_a + " + " + i.protein_b, type='protein protein interaction', protein_a=i.protein_a,
-                    protein_b=i.protein_b,gene_a=i.gene_a, gene_b=i.gene_b, loc_a=i.feature_a, loc_b=i.feature_b, type_a=i.type_a, type_b=i.type_b,
-                    stoich_a=i.stoich_a, stoich_b=i.stoich_b, confidence=i.confidence,interaction_type=i.interaction_type,
-                    role_a = i.role_a, role_b= i.role_b, _metadata=metadata))
-            else:
+            record_id = self.get_intact_interaction_record_id(i)
+            if record_id not in changed:
+                continue
+
+            metadata = self.get_or_create_object(models.Metadata, name='protein_interaction_' + record_id)
+            metadata.method = [self.get_or_create_object(models.Method, name=i.method)]
+            metadata.resource = [self.get_or_create_object(models.Resource, namespace='pubmed', _id=i.publication),
+                                 self.get_or_create_object(models.Resource, namespace='paper', _id=i.publication_author)]
+
+            for c in dir(i):
+                if getattr(i, c) == None and '__' not in c:
+                    setattr(i, c, '')
+
+            for type, protein, gene in [(i.type_a, i.protein_a, i.gene_a), (i.type_b, i.protein_b, i.gene_b)]:
+                if type == 'protein':
+                    self.get_or_create_object(models.ProteinSubunit, uniprot_id=protein, gene_name=gene)
+
+            sub_batch.append(models.ProteinInteraction(name=i.protein_a + " + " + i.protein_b, type='protein protein interaction', protein_a=i.protein_a,
+                protein_b=i.protein_b,gene_a=i.gene_a, gene_b=i.gene_b, loc_a=i.feature_a, loc_b=i.feature_b, type_a=i.type_a, type_b=i.type_b,
+                stoich_a=i.stoich_a, stoich_b=i.stoich_b, confidence=i.confidence,interaction_type=i.interaction_type,
+                role_a = i.role_a, role_b= i.role_b, _metadata=metadata))
+            sub_batch_record_ids.append(record_id)
+
+            if len(sub_batch) >= INTACT_INTERACTION_BUILD_SUB_BATCH:
                 self.vprint('Batch of {} interactions was loaded'.format(INTACT_INTERACTION_BUILD_SUB_BATCH))
                 self.session.add_all(sub_batch)
+                self.save_record_fingerprints(INTACT_NAME, collections.OrderedDict(
+                    (record_id, fingerprints[record_id]) for record_id in sub_batch_record_ids))
                 self.session.commit()
                 sub_batch = []
-
+                sub_batch_record_ids = []
 
         self.session.add_all(sub_batch)
+        self.save_record_fingerprints(INTACT_NAME, collections.OrderedDict(
+            (record_id, fingerprints[record_id]) for record_id in sub_batch_record_ids))
         intact_progress.amount_loaded = self.session.query(models.ProteinInteraction).count()
 
         self.vprint('Comitting')
         self.session.commit()
 
+    @staticmethod
+    def get_intact_interaction_record_id(interaction):
+        """ Get the id of the record of an IntAct interaction, which is stable across releases of IntAct: the
+        IntAct id of the interaction and the ids of its participants
+
+        Args:
+            interaction (:obj:`intact.ProteinInteraction`): interaction
+
+        Returns:
+            :obj:`str`: id of the record of the interaction
+        """
+        return '{}:{}:{}'.format(interaction.interaction_id, interaction.protein_a, interaction.protein_b)
+
     @continuousload
     @timemethod
     def build_array_express(self):
 
         ae = array_express.ArrayExpress(cache_dirname=self.cache_dirname)
+        self.preload_metadata_objects()
         batch = ARRAY_EXPRESS_TEST_BATCH if self.test else ARRAY_EXPRESS_BUILD_BATCH
         array_progress = self.session.query(models.Progress).filter_by(
             database_name=ARRAY_EXPRESS_NAME).first()
@@ -258,9 +718,24 @@ class CommonSchema(data_source.PostgresDataSource):
             experiments = ae.session.query(array_express.Experiment).all()
         else:
             experiments = ae.session.query(array_express.Experiment).filter(array_express.Experiment._id.in_
-                                                                            (range(load_count, load_count + batch)))
+                                                                            (range(load_count, load_count + batch))).all()
+
+        # only integrate the experiments which have changed since the previous build
+        fingerprints = collections.OrderedDict(
+            (exp.id, fingerprint_util.calc_fingerprint(fingerprint_util.get_object_values(
+                exp, self.ARRAY_EXPRESS_FINGERPRINT_PATHS)))
+            for exp in experiments)
+        changed, deleted = self.get_changed_records(ARRAY_EXPRESS_NAME, fingerprints,
+                                                    complete=self.max_entries == float('inf'))
+        self.delete_array_express_experiments(changed + deleted)
+        self.delete_record_fingerprints(ARRAY_EXPRESS_NAME, changed + deleted)
+        self.session.commit()
+        self.vprint('{} of {} experiments changed, {} deleted'.format(len(changed), len(experiments), len(deleted)))
+        changed = set(changed)
 
         for exp in experiments:
+            if exp.id not in changed:
+                continue
 
             exp_metadata = self.get_or_create_object(
                 models.ExperimentMetadata,
@@ -275,12 +750,12 @@ class CommonSchema(data_source.PostgresDataSource):
                 )
                 for org in exp.organisms]
 
-            exp_metadata.resource.append(self.get_or_create_object(
+            exp_metadata.resource = [self.get_or_create_object(
                 models.Resource,
                 namespace="ArrayExpress",
                 _id=exp.id,
                 release_date=str(exp.release_date)
-            ))
+            )]
 
             exp_metadata.method = [
                 self.get_or_create_object(
@@ -368,12 +843,36 @@ class CommonSchema(data_source.PostgresDataSource):
 
                 flask_experiment.samples.append(flask_sample)
 
+            self.save_record_fingerprints(ARRAY_EXPRESS_NAME, {exp.id: fingerprints[exp.id]})
+
         array_progress.amount_loaded = load_count + batch
 
 
         self.vprint('Comitting')
         self.session.commit()
 
+    def delete_array_express_experiments(self, accession_numbers):
+        """ Delete integrated ArrayExpress experiments and their samples
+
+        Args:
+            accession_numbers (:obj:`list` of :obj:`str`): accession numbers of the experiments
+        """
+        accession_numbers = list(accession_numbers)
+        for i_chunk in range(0, len(accession_numbers), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+            chunk = accession_numbers[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE]
+
+            # the objects are deleted with the ORM so that the rows of their association tables are also deleted
+            for experiment in self.session.query(models.RNASeqExperiment) \
+                    .filter(models.RNASeqExperiment.accession_number.in_(chunk)):
+                self.session.delete(experiment)
+            self.session.flush()
+            for sample in self.session.query(models.RNASeqDataSet) \
+                    .filter(models.RNASeqDataSet.experiment_accession_number.in_(chunk)):
+                self.session.delete(sample)
+            self.session.flush()
+
+        data_source.get_object_cache(self.session).clear()
+
     @continuousload
     @timemethod
     def build_sabio(self):
@@ -386,6 +885,7 @@ class CommonSchema(data_source.PostgresDataSource):
         sabiodb = sabio_rk.SabioRk(
             cache_dirname=self.cache_dirname, verbose=self.verbose)
         sabio_ses = sabiodb.session
+        self.preload_metadata_objects()
         batch = SABIO_TEST_BATCH if self.test else SABIO_BUILD_BATCH
         sabio_progress = self.session.query(
             models.Progress).filter_by(database_name=SABIO_NAME).first()
@@ -396,8 +896,39 @@ class CommonSchema(data_source.PostgresDataSource):
         else:
             sabio_entry = sabio_ses.query(sabio_rk.Entry).filter(sabio_rk.Entry._id.in_
                                                                  (range(load_count, load_count + batch)))
+        sabio_entry = sabio_entry.all()
+
+        # only integrate the entries which have changed since the previous build. The kinetic laws which have changed
+        # or have been deleted are deleted and recreated; the other entries are identified by their names and are
+        # updated in place, so that the unchanged kinetic laws stay linked to them.
+        fingerprints = collections.OrderedDict(
+            ('{}:{}'.format(item._type, item.id), fingerprint_util.calc_fingerprint(fingerprint_util.get_object_values(
+                item, self.SABIO_FINGERPRINT_PATHS, exclude=('created', 'modified'))))
+            for item in sabio_entry)
+        changed, deleted = self.get_changed_records(SABIO_NAME, fingerprints,
+                                                    complete=self.max_entries == float('inf'))
+        self.delete_kinetic_laws(self.get_observation_ids_by_metadata_names(models.KineticLaw, [
+            'Kinetic Law ' + record_id.partition(':')[2]
+            for record_id in changed + deleted if record_id.partition(':')[0] == 'kinetic_law']))
+        self.delete_record_fingerprints(SABIO_NAME, changed + deleted)
+        self.session.commit()
+        self.vprint('{} of {} entries changed, {} deleted'.format(len(changed), len(sabio_entry), len(deleted)))
+        changed = set(changed)
+
+        # the metabolites of SABIO-RK are distinguished from the metabolites of other sources with the same names by
+        # the ambiguity of their names, which only SABIO-RK sets
+        metabolites = {metabolite.metabolite_name: metabolite for metabolite in self.session.query(models.Metabolite)
+                       .options(sqlalchemy.orm.joinedload(models.Metabolite.structure))
+                       .filter_by(type='Metabolite')
+                       .filter(models.Metabolite._is_name_ambiguous != None)}
+        updated_metabolites = []
+        replaced_structures = []
+        kinetic_laws = []
 
         for item in sabio_entry:
+            if '{}:{}'.format(item._type, item.id) not in changed:
+                continue
+
             metadata = self.get_or_create_object(models.Metadata, name='Kinetic Law ' + str(
                 item.id)) if item._type == 'kinetic_law' else self.get_or_create_object(models.Metadata, name=item.name)
             metadata.synonym = [self.get_or_create_object(
@@ -421,28 +952,36 @@ class CommonSchema(data_source.PostgresDataSource):
                                                           _structure_formula_connectivity=struct._value_inchi_formula_connectivity, _metadata=metadata)\
                         if struct.format == 'smiles' else None
 
-                self.entity.metabolite = self.get_or_create_object(models.Metabolite, type='Metabolite',
-                                                                 name=item.name, metabolite_name=item.name,
-                                                                 _is_name_ambiguous=sabio_ses.query(
-                                                                     sabio_rk.Compound).get(item._id)._is_name_ambiguous,
-                                                                 structure=structure, _metadata=metadata)
+                metabolite = metabolites.get(item.name, None)
+                if metabolite is None:
+                    metabolite = metabolites[item.name] = models.Metabolite(type='Metabolite', metabolite_name=item.name)
+                    self.session.add(metabolite)
+                elif metabolite.structure is not structure:
+                    # the kinetic laws of the metabolite must be indexed with its new structure
+                    updated_metabolites.append(metabolite)
+                    if metabolite.structure is not None:
+                        replaced_structures.append(metabolite.structure)
+                metabolite.name = item.name
+                metabolite._is_name_ambiguous = sabio_ses.query(sabio_rk.Compound).get(item._id)._is_name_ambiguous
+                metabolite.structure = structure
+                metabolite._metadata = metadata
+                self.entity.metabolite = metabolite
                 continue
 
             elif item._type == 'enzyme':
                 complx = sabio_ses.query(sabio_rk.Enzyme).get(item._id)
-                self.entity.protein_complex = self.get_or_create_object(models.ProteinComplex, type='Enzyme',
-                                                                        name=item.name, complex_name=item.name,
-                                                                        molecular_weight=item.molecular_weight, funcat_dsc='Enzyme', _metadata=metadata)
+                self.entity.protein_complex = self.update_or_create_object(
+                    models.ProteinComplex, dict(type='Enzyme', complex_name=item.name),
+                    name=item.name, molecular_weight=item.molecular_weight, funcat_dsc='Enzyme', _metadata=metadata)
                 continue
 
             elif item._type == 'enzyme_subunit':
                 result = self.session.query(models.ProteinComplex).filter_by(
                     complex_name=item.enzyme.name).first()
-                self.entity.protein_subunit = self.get_or_create_object(models.ProteinSubunit, type='Enzyme Subunit',
-                                                                        name=item.name, subunit_name=item.name,
-                                                                        uniprot_id=uniprot, coefficient=item.coefficient,
-                                                                        molecular_weight=item.molecular_weight,
-                                                                        proteincomplex=result, _metadata=metadata)
+                self.entity.protein_subunit = self.update_or_create_object(
+                    models.ProteinSubunit, dict(type='Enzyme Subunit', subunit_name=item.name, proteincomplex=result),
+                    name=item.name, uniprot_id=uniprot, coefficient=item.coefficient,
+                    molecular_weight=item.molecular_weight, _metadata=metadata)
                 continue
 
             elif item._type == 'kinetic_law':
@@ -453,12 +992,13 @@ class CommonSchema(data_source.PostgresDataSource):
                     models.Resource, namespace=resource.namespace, _id=resource.id) for resource in item.references])
                 metadata.taxon.append(self.get_or_create_object(
                     models.Taxon, ncbi_id=item.taxon))
-                metadata.cell_line.append(self.get_or_create_object(
-                    models.CellLine, name=item.taxon_variant))
-                metadata.conditions.append(self.get_or_create_object(
-                    models.Conditions, temperature=item.temperature, ph=item.ph, media=item.media))
+                metadata.cell_line = [self.get_or_create_object(
+                    models.CellLine, name=item.taxon_variant)]
+                metadata.conditions = [self.get_or_create_object(
+                    models.Conditions, temperature=item.temperature, ph=item.ph, media=item.media)]
                 self.property.kinetic_law = self.get_or_create_object(models.KineticLaw, type='Kinetic Law', enzyme=catalyst,
                                                                       enzyme_type=item.enzyme_type, tissue=item.tissue, mechanism=item.mechanism, equation=item.equation, _metadata=metadata)
+                kinetic_laws.append(self.property.kinetic_law)
 
                 def common_schema_metabolite(sabio_object):
                     metabolite_name = sabio_object.name
@@ -493,10 +1033,210 @@ class CommonSchema(data_source.PostgresDataSource):
                 continue
 
         sabio_progress.amount_loaded = load_count + batch
+        self.save_record_fingerprints(SABIO_NAME, collections.OrderedDict(
+            (record_id, fingerprint) for record_id, fingerprint in fingerprints.items() if record_id in changed))
+
+        self.session.flush()
+
+        # delete the structures which have been replaced and which no other metabolites link to
+        structure_ids = set(structure.struct_id for structure in replaced_structures)
+        if structure_ids:
+            structure_ids.difference_update(id for id, in self.session.query(models.Metabolite.structure_id)
+                                            .filter(models.Metabolite.structure_id.in_(structure_ids)))
+            self.delete_observations(models.Structure, structure_ids)
 
         self.vprint('Comitting')
         self.session.commit()
 
+        # only index the kinetic laws which have been created and the kinetic laws of the metabolites whose
+        # structures have changed
+        law_ids = set(law.kinetic_law_id for law in kinetic_laws)
+        metabolite_ids = [metabolite.metabolite_id for metabolite in updated_metabolites]
+        for i_chunk in range(0, len(metabolite_ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+            law_ids.update(id for id, in self.session.query(models.Reaction.kinetic_law_id)
+                           .filter(models.Reaction.metabolite_id.in_(
+                               metabolite_ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE]))
+                           .filter(models.Reaction.kinetic_law_id != None))
+        self.build_kinetic_law_participant_index(law_ids)
+        self.build_kinetic_law_ec_number_index([law.kinetic_law_id for law in kinetic_laws])
+
+    def delete_kinetic_laws(self, ids):
+        """ Delete integrated kinetic laws, including their participants, parameters, and index entries
+
+        Args:
+            ids (:obj:`list` of :obj:`int`): ids of the kinetic laws
+        """
+        ids = list(ids)
+        for model in [models.Reaction, models.Parameter, models.KineticLawParticipantSet, models.KineticLawEcNumber]:
+            table = model.__table__
+            for i_chunk in range(0, len(ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE):
+                self.session.execute(table.delete().where(table.c.kinetic_law_id.in_(
+                    ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE])))
+
+        self.delete_observations(models.KineticLaw, ids)
+
+    def build_kinetic_law_participant_index(self, law_ids=None):
+        """ Rebuild the index of the structures of the reactants, products and modifiers of each kinetic law
+        (:obj:`models.KineticLawParticipantSet`), which is used to find kinetic laws by their participants
+
+        Args:
+            law_ids (:obj:`list` of :obj:`int`, optional): ids of the kinetic laws to reindex, e.g. the kinetic
+                laws which changed since the previous build; if :obj:`None`, reindex all of the kinetic laws
+        """
+        index = models.KineticLawParticipantSet.__table__
+        for law_ids_chunk in self.get_kinetic_law_id_chunks(law_ids):
+            q = self.session.query(models.Reaction.kinetic_law_id, models.Reaction._is_reactant,
+                                   models.Reaction._is_product, models.Reaction._is_modifier,
+                                   models.Structure._value_inchi, models.Structure._structure_formula_connectivity) \
+                .join(models.Metabolite, models.Reaction.metabolite) \
+                .join(models.Structure, models.Metabolite.structure) \
+                .filter(models.Reaction.kinetic_law_id != None)
+            if law_ids_chunk is not None:
+                q = q.filter(models.Reaction.kinetic_law_id.in_(law_ids_chunk))
+
+            participant_sets = collections.defaultdict(lambda: collections.defaultdict(set))
+            for law_id, is_reactant, is_product, is_modifier, inchi, formula_connectivity in q:
+                if is_reactant:
+                    role = 'reactant'
+                elif is_product:
+                    role = 'product'
+                elif is_modifier:
+                    role = 'modifier'
+                else:
+                    continue
+
+                participant_set = participant_sets[law_id]
+                if inchi:
+                    participant_set[role + '_inchis'].add(inchi)
+                if formula_connectivity:
+                    participant_set[role + '_formula_connectivities'].add(formula_connectivity)
+
+            if law_ids_chunk is None:
+                self.session.execute(index.delete())
+            else:
+                self.session.execute(index.delete().where(index.c.kinetic_law_id.in_(law_ids_chunk)))
+            self.session.bulk_insert_mappings(models.KineticLawParticipantSet, [
+                dict([('kinetic_law_id', law_id)] + [(key, sorted(participant_set[key]))
+                                                     for key in self.KINETIC_LAW_PARTICIPANT_INDEX_COLUMNS])
+                for law_id, participant_set in participant_sets.items()])
+        self.session.commit()
+
+    @staticmethod
+    def get_kinetic_law_id_chunks(law_ids):
+        """ Split the ids of the kinetic laws to reindex into chunks which can be queried at once
+
+        Args:
+            law_ids (:obj:`list` of :obj:`int`): ids of the kinetic laws, or :obj:`None` for all of the kinetic laws
+
+        Returns:
+            :obj:`list` of :obj:`list` of :obj:`int`: chunks of the ids, or a single chunk :obj:`None` for all of the
+            kinetic laws
+        """
+        if law_ids is None:
+            return [None]
+        law_ids = sorted(set(law_ids))
+        return [law_ids[i_chunk:i_chunk + SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE]
+                for i_chunk in range(0, len(law_ids), SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE)]
+
+    def get_kinetic_laws_by_participant_structures(self, reactants=(), products=(), modifiers=(),
+                                                   only_formula_and_connectivity=False, select=models.KineticLaw):
+        """ Get the kinetic laws which contain all of a set of reactants, products and modifiers with a single
+        query of the participant index (:obj:`models.KineticLawParticipantSet`)
+
+        Args:
+            reactants (:obj:`list` of :obj:`str`, optional): structures of the reactants
+            products (:obj:`list` of :obj:`str`, optional): structures of the products
+            modifiers (:obj:`list` of :obj:`str`, optional): structures of the modifiers
+            only_formula_and_connectivity (:obj:`bool`, optional): if :obj:`True`, the structures are InChI formula
+                and connectivity layers; otherwise, they are complete InChI structures
+            select (:obj:`object`, optional): entity to select
+
+        Returns:
+            :obj:`list` of :obj:`models.KineticLaw`: kinetic laws which contain all of the participants
+        """
+        index = models.KineticLawParticipantSet
+        suffix = '_formula_connectivities' if only_formula_and_connectivity else '_inchis'
+
+        conditions = []
+        for role, structures in [('reactant', reactants), ('product', products), ('modifier', modifiers)]:
+            structures = sorted(set(structures))
+            if structures:
+                conditions.append(getattr(index, role + suffix).contains(structures))
+        if not conditions:
+            return []
+
+        return self.session.query(select) \
+            .join(index, index.kinetic_law_id == models.KineticLaw.kinetic_law_id) \
+            .filter(*conditions) \
+            .order_by(models.KineticLaw.kinetic_law_id) \
+            .all()
+
+    def build_kinetic_law_ec_number_index(self, law_ids=None):
+        """ Rebuild the index of the EC numbers of the kinetic laws and their classes at each level
+        (:obj:`models.KineticLawEcNumber`), which is used to find kinetic laws by their EC classes
+
+        Args:
+            law_ids (:obj:`list` of :obj:`int`, optional): ids of the kinetic laws to reindex, e.g. the kinetic
+                laws which changed since the previous build; if :obj:`None`, reindex all of the kinetic laws
+        """
+        index = models.KineticLawEcNumber.__table__
+        for law_ids_chunk in self.get_kinetic_law_id_chunks(law_ids):
+            q = self.session.query(models.KineticLaw.kinetic_law_id, models.Resource._id) \
+                .join(models.Metadata, models.KineticLaw._metadata) \
+                .join(models.Resource, models.Metadata.resource) \
+                .filter(models.Resource.namespace == 'ec-code') \
+                .distinct()
+            if law_ids_chunk is None:
+                self.session.execute(index.delete())
+            else:
+                q = q.filter(models.KineticLaw.kinetic_law_id.in_(law_ids_chunk))
+                self.session.execute(index.delete().where(index.c.kinetic_law_id.in_(law_ids_chunk)))
+
+            self.session.bulk_insert_mappings(models.KineticLawEcNumber, [
+                dict([('kinetic_law_id', law_id), ('ec_number', ec_number)] +
+                     [('ec{}'.format(i_level + 1), ec_class)
+                      for i_level, ec_class in enumerate(ec_util.get_ec_classes(ec_number))])
+                for law_id, ec_number in q])
+        self.session.commit()
+
+    def get_kinetic_laws_by_ec_numbers(self, ec_numbers, match_levels=EC_NUMBER_LEVELS, select=models.KineticLaw):
+        """ Get the kinetic laws which have one of a list of EC numbers or, optionally, belong to the classes of
+        one of a list of EC numbers, with indexed equality lookups of the EC number index
+        (:obj:`models.KineticLawEcNumber`)
+
+        If :obj:`match_levels` is 4, the EC numbers must match exactly. Otherwise, the kinetic laws must belong to
+        the class of one of the EC numbers at level :obj:`match_levels`, or at the deepest level of the EC numbers
+        which have fewer levels.
+
+        Args:
+            ec_numbers (:obj:`list` of :obj:`str`): EC numbers
+            match_levels (:obj:`int`, optional): number of EC levels that the EC numbers must match
+            select (:obj:`object`, optional): entity to select
+
+        Returns:
+            :obj:`sqlalchemy.orm.query.Query`: query for the matching kinetic laws
+        """
+        index = models.KineticLawEcNumber
+
+        conditions = []
+        if match_levels >= EC_NUMBER_LEVELS:
+            if ec_numbers:
+                conditions.append(index.ec_number.in_(sorted(set(ec_numbers))))
+        else:
+            ec_classes = collections.defaultdict(set)
+            for ec_number in ec_numbers:
+                level = min(match_levels, ec_util.get_ec_level(ec_number))
+                if level:
+                    ec_classes[level].add(ec_util.get_ec_classes(ec_number)[level - 1])
+            for level, level_ec_classes in sorted(ec_classes.items()):
+                conditions.append(getattr(index, 'ec{}'.format(level)).in_(sorted(level_ec_classes)))
+
+        if not conditions:
+            conditions.append(sqlalchemy.false())
+
+        law_ids = self.session.query(index.kinetic_law_id).filter(sqlalchemy.or_(*conditions))
+        return self.session.query(select).filter(models.KineticLaw.kinetic_law_id.in_(law_ids.subquery()))
+
 
     @continuousload
     @timemethod
@@ -763,30 +1503,102 @@ class CommonSchema(data_source.PostgresDataSource):
         """
         Collects Uniprot.sqlite file and integrates data into existing ProteinSubunit table
 
+        The UniProt entries are loaded once and merged against the unchecked subunits in chunks of
+        :obj:`UNIPROT_BUILD_CHUNK_SIZE`, and the subunits are updated with batched statements rather than one ORM
+        object at a time.
         """
 
         unidb = uniprot.Uniprot(cache_dirname=self.cache_dirname)
         unidb_ses = unidb.session
 
-        com_unis = self.session.query(models.ProteinSubunit).filter_by(
-            uniprot_checked=None).all()
-
-        for subunit in com_unis:
-            info = unidb_ses.query(uniprot.UniprotData).filter_by(
-                uniprot_id=subunit.uniprot_id).first()
-            subunit.uniprot_checked = True
-            if info:
-                subunit.subunit_name = subunit.name = info.entry_name if not subunit.subunit_name else subunit.subunit_name
-                # subunit.entrez_id = info.entrez_id if not subunit.entrez_id else subunit.entrez_id
-                subunit.gene_name = info.gene_name if not subunit.gene_name else subunit.gene_name
-                subunit.canonical_sequence = info.canonical_sequence if not subunit.canonical_sequence else subunit.canonical_sequence
-                subunit.length = info.length if not subunit.length else subunit.length
-                subunit.mass = info.mass if not subunit.mass else subunit.mass
+        # load the UniProt entries once, keyed by their ids
+        uniprot_data = pandas.read_sql(
+            unidb_ses.query(uniprot.UniprotData.uniprot_id, uniprot.UniprotData.entry_name,
+                            uniprot.UniprotData.gene_name, uniprot.UniprotData.canonical_sequence,
+                            uniprot.UniprotData.length, uniprot.UniprotData.mass).statement,
+            unidb.engine) \
+            .drop_duplicates('uniprot_id')
+
+        physical_entity = models.PhysicalEntity.__table__
+        subunit = models.ProteinSubunit.__table__
+        update_subunits = subunit.update() \
+            .where(subunit.c.subunit_id == sqlalchemy.bindparam('_subunit_id')) \
+            .values(subunit_name=sqlalchemy.bindparam('_subunit_name'),
+                    gene_name=sqlalchemy.bindparam('_gene_name'),
+                    canonical_sequence=sqlalchemy.bindparam('_canonical_sequence'),
+                    length=sqlalchemy.bindparam('_length'),
+                    mass=sqlalchemy.bindparam('_mass'))
+        update_names = physical_entity.update() \
+            .where(physical_entity.c.observation_id == sqlalchemy.bindparam('_subunit_id')) \
+            .values(name=sqlalchemy.bindparam('_subunit_name'))
+
+        # merge the entries against the unchecked subunits in chunks of consecutive ids
+        last_subunit_id = 0
+        n_subunits = 0
+        while True:
+            q = sqlalchemy.select([subunit.c.subunit_id, subunit.c.uniprot_id, subunit.c.subunit_name,
+                                   subunit.c.gene_name, subunit.c.canonical_sequence, subunit.c.length,
+                                   subunit.c.mass]) \
+                .where(subunit.c.uniprot_checked == None) \
+                .where(subunit.c.subunit_id > last_subunit_id) \
+                .order_by(subunit.c.subunit_id) \
+                .limit(UNIPROT_BUILD_CHUNK_SIZE)
+            subunits = pandas.read_sql(q, self.session.connection())
+            if subunits.empty:
+                break
+            first_subunit_id = int(subunits['subunit_id'].iloc[0])
+            last_subunit_id = int(subunits['subunit_id'].iloc[-1])
+
+            updates = self.merge_uniprot_data(subunits, uniprot_data)
+            if updates:
+                self.session.execute(update_subunits, updates)
+                self.session.execute(update_names, updates)
+            self.session.execute(subunit.update()
+                                 .values(uniprot_checked=True)
+                                 .where(subunit.c.uniprot_checked == None)
+                                 .where(subunit.c.subunit_id.between(first_subunit_id, last_subunit_id)))
+            self.session.commit()
 
+            n_subunits += len(subunits)
+            self.vprint('Checked {} subunits against UniProt'.format(n_subunits))
 
         self.vprint('Comitting')
         self.session.commit()
 
+    @staticmethod
+    def merge_uniprot_data(subunits, uniprot_data):
+        """ Fill in the missing names, gene names, sequences, lengths, and masses of protein subunits from their UniProt
+        entries
+
+        Args:
+            subunits (:obj:`pandas.DataFrame`): ids, UniProt ids, and current values of the subunits
+            uniprot_data (:obj:`pandas.DataFrame`): UniProt ids, entry names, gene names, canonical sequences, lengths,
+                and masses of UniProt entries
+
+        Returns:
+            :obj:`list` of :obj:`dict`: id and new values of each subunit which has a UniProt entry, keyed by the names
+            of their columns prefixed with an underscore (e.g. `_subunit_id`)
+        """
+        merged = subunits.merge(uniprot_data, how='inner', on='uniprot_id', suffixes=('', '_uniprot'))
+
+        def fill(column, uniprot_column):
+            current = merged[column]
+            new = merged[uniprot_column]
+            if uniprot_column in ('length_uniprot', 'mass_uniprot'):
+                new = new.map(lambda value: None if pandas.isnull(value) else str(int(value)))
+            return current.where(current.notnull() & (current != ''), new)
+
+        updates = pandas.DataFrame({
+            '_subunit_id': merged['subunit_id'],
+            '_subunit_name': fill('subunit_name', 'entry_name'),
+            '_gene_name': fill('gene_name', 'gene_name_uniprot'),
+            '_canonical_sequence': fill('canonical_sequence', 'canonical_sequence_uniprot'),
+            '_length': fill('length', 'length_uniprot'),
+            '_mass': fill('mass', 'mass_uniprot'),
+        })
+        updates['_subunit_id'] = updates['_subunit_id'].map(int)
+        updates = updates.astype(object).where(updates.notnull(), None)
+        return updates.to_dict('records')
 
     @continuousload
     @timemethod
@@ -812,3 +1624,27 @@ class CommonSchema(data_source.PostgresDataSource):
 
         self.vprint('Comitting')
         self.session.commit()
+
+
+def run_build_stage(options, stage):
+    """ Run a stage of the build of the common schema in a worker process, using its own engine and session
+
+    Args:
+        options (:obj:`dict`): arguments to construct the :obj:`CommonSchema`
+        stage (:obj:`str`): name of the stage (e.g. `build_pax`)
+
+    Returns:
+        :obj:`float`: duration of the stage in seconds
+    """
+    schema = CommonSchema(**options)
+
+    # replace the engine and the session which the constructor opened with ones which only this process uses
+    schema.session.close()
+    schema.engine.dispose()
+    schema.engine = sqlalchemy.create_engine(schema.engine.url)
+    schema.session = sqlalchemy.orm.sessionmaker(bind=schema.engine)()
+    try:
+        return schema.run_build_stage(stage)
+    finally:
+        schema.session.close()
+        schema.engine.dispose()
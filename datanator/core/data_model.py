@@ -172,12 +172,12 @@ class Specie(EntityInteractionOrProperty):
         Returns:
             :obj:`str`: structure in InChi format or just the formula and connectivity layers
                 if :obj:`only_formula_and_connectivity` is :obj:`True`
+
+        Raises:
+            :obj:`ValueError`: if the structure is not valid
         """
-        inchi = molecule_util.Molecule(structure=self.structure).to_inchi()
-        if only_formula_and_connectivity:
-            return molecule_util.InchiMolecule(inchi).get_formula_and_connectivity()
-        else:
-            return inchi
+        return molecule_util.get_inchi_normalizer().to_inchi(
+            self.structure, only_formula_and_connectivity=only_formula_and_connectivity)
 
     def to_mol(self):
         """ Get the structure in .mol format
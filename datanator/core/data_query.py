@@ -8,6 +8,7 @@
 
 from datetime import datetime
 from datanator.core import data_model
+from datanator.util import ec_util
 from datanator.util import molecule_util
 from datanator.util import taxonomy_util
 import abc
@@ -20,7 +21,6 @@ import numpy
 import scipy.stats
 import six
 import wc_utils.util.stats
-import wc_utils.util.string
 
 
 class DataQueryGenerator(six.with_metaclass(abc.ABCMeta, object)):
@@ -293,9 +293,21 @@ class FilterRunner(object):
         n_obs = len(observed_results)
         n_filt = len(self.filters)
         scores = numpy.full((n_obs, n_filt, ), numpy.nan)
+        columns = {}
         for i_filter, filter in enumerate(self.filters):
-            for i_obs, obs in enumerate(observed_results):
-                scores[i_obs, i_filter] = filter.score(target_component, obs)
+            # project the observed values into a column for each attribute once, and share it among filters
+            try:
+                attribute = tuple(filter.attribute)
+            except TypeError:
+                attribute = None
+            if attribute is None:
+                column = None
+            elif attribute in columns:
+                column = columns[attribute]
+            else:
+                column = columns[attribute] = filter.get_attribute_column(observed_results)
+
+            scores[:, i_filter] = filter.score_many(target_component, observed_results, column=column)
 
         return scores
 
@@ -409,6 +421,17 @@ class Filter(object):
                 return None
         return val
 
+    def get_attribute_column(self, observed_results):
+        """ Get the values of the attribute of a list of observed values
+
+        Args:
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+
+        Returns:
+            :obj:`list` of :obj:`object`: values of the attribute of the observed values
+        """
+        return [self.get_attribute_of_observed_value(observed_value) for observed_value in observed_results]
+
     def compare_observed_value_with_target_component(self, target_component, observed_value):
         """ Compare the observed biological component with the target component
 
@@ -421,6 +444,27 @@ class Filter(object):
         """
         return self.get_attribute_of_observed_value(observed_value)
 
+    def compare_observed_results_with_target_component(self, target_component, observed_results, column=None):
+        """ Compare a list of observed biological components with the target component. If the comparison
+        isn't overridden, the column of attribute values is used directly.
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`list` of :obj:`object`: transformed values
+        """
+        if six.get_unbound_function(type(self).compare_observed_value_with_target_component) is \
+                six.get_unbound_function(Filter.compare_observed_value_with_target_component):
+            if column is None:
+                column = self.get_attribute_column(observed_results)
+            return column
+
+        return [self.compare_observed_value_with_target_component(target_component, observed_value)
+                for observed_value in observed_results]
+
     def score(self, target_component, observed_value):
         """ Calculate a scaled numeric score betwen 0 and 1 which indicates how well the observed value matches
         one or more criteria. Please see :obj:`FilterRunner` to see how these scores are used to filter and
@@ -438,6 +482,42 @@ class Filter(object):
             return 0.5
         return val
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values. Filters which can score entire columns of
+        observed values at once override this method; by default, each observed value is scored separately.
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the criteria
+        """
+        return numpy.array([self.score(target_component, observed_value) for observed_value in observed_results],
+                           dtype=numpy.float64)
+
+    @staticmethod
+    def to_float_array(values):
+        """ Convert a list of numeric values, some of which may be :obj:`None`, to a numpy array
+
+        Args:
+            values (:obj:`list` of :obj:`float`): values
+
+        Returns:
+            :obj:`tuple`:
+
+                * :obj:`numpy.ndarray`: values, with :obj:`numpy.nan` in place of :obj:`None`
+                * :obj:`numpy.ndarray`: indicates which values are :obj:`None`
+
+        Raises:
+            :obj:`TypeError`: if any of the values are not numeric
+            :obj:`ValueError`: if any of the values are not numeric
+        """
+        is_none = numpy.array([val is None for val in values], dtype=bool)
+        floats = numpy.array([numpy.nan if val is None else val for val in values], dtype=numpy.float64)
+        return floats, is_none
+
 
 class OptionsFilter(Filter):
     """ Filters out observed values whose attributes have values that are not in a list of acceptable options.
@@ -475,6 +555,21 @@ class OptionsFilter(Filter):
             return 1
         return -1
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values at once
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the criteria
+        """
+        values = self.compare_observed_results_with_target_component(target_component, observed_results, column=column)
+        return numpy.array([0.5 if val is None else (1. if val in self.options else -1.) for val in values],
+                           dtype=numpy.float64)
+
 class RangeFilter(Filter):
     """ Filters out observed values whose attributes have values that fall outside a specified range.
 
@@ -516,6 +611,32 @@ class RangeFilter(Filter):
             return -1
         return 1
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values at once
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the criteria
+        """
+        values = self.compare_observed_results_with_target_component(target_component, observed_results, column=column)
+        try:
+            values, is_none = self.to_float_array(values)
+        except (TypeError, ValueError):
+            return super(RangeFilter, self).score_many(target_component, observed_results, column=column)
+
+        scores = numpy.ones(len(values))
+        with numpy.errstate(invalid='ignore'):
+            if not numpy.isnan(self.min):
+                scores[numpy.isnan(values) | (values < self.min)] = -1
+            if not numpy.isnan(self.max):
+                scores[numpy.isnan(values) | (values > self.max)] = -1
+        scores[is_none] = 0.5
+        return scores
+
 
 class NormalFilter(Filter):
     """ Prioritizes observed values whose attributes have values that are closed to `mean`.
@@ -553,6 +674,27 @@ class NormalFilter(Filter):
             return 0.5
         return 1 - 2 * abs(scipy.stats.norm.cdf(val, loc=self.mean, scale=self.std) - 0.5)
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values at once
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the normal distribution (mean, std)
+        """
+        values = self.compare_observed_results_with_target_component(target_component, observed_results, column=column)
+        try:
+            values, is_none = self.to_float_array(values)
+        except (TypeError, ValueError):
+            return super(NormalFilter, self).score_many(target_component, observed_results, column=column)
+
+        scores = 1 - 2 * numpy.abs(scipy.stats.norm.cdf(values, loc=self.mean, scale=self.std) - 0.5)
+        scores[is_none] = 0.5
+        return scores
+
 
 class ExponentialFilter(Filter):
     """ Prioritizes observed values based on an exponential scale
@@ -590,6 +732,27 @@ class ExponentialFilter(Filter):
             return 0.5
         return math.exp(-(val - self.center) / self.scale)
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values at once
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the distribution (center, scale)
+        """
+        values = self.compare_observed_results_with_target_component(target_component, observed_results, column=column)
+        try:
+            values, is_none = self.to_float_array(values)
+        except (TypeError, ValueError):
+            return super(ExponentialFilter, self).score_many(target_component, observed_results, column=column)
+
+        scores = numpy.exp(-(values - self.center) / self.scale)
+        scores[is_none] = 0.5
+        return scores
+
 
 class SpecieSimilarityFilter(Filter):
     """ Proritize observed species based on their similarity to target species
@@ -693,6 +856,9 @@ class ReactionSimilarityFilter(Filter):
         min_ec_level (:obj:`int`): minimum EC level that must be common to the observed and target reaction
         scale (:obj:`float`): How to exponentially scale of the scores. This determines how quickly the score
             falls to zero.
+        _ec_levels (:obj:`dict`): dictionary which maps pairs of the EC numbers of target and observed reactions
+            to their deepest common EC level, so that the level is only calculated once for all of the observed
+            values of a kinetic law
     """
 
     def __init__(self, min_ec_level=3, scale=2./5.):
@@ -705,6 +871,7 @@ class ReactionSimilarityFilter(Filter):
         super(ReactionSimilarityFilter, self).__init__(('observable', 'interaction'))
         self.min_ec_level = min_ec_level
         self.scale = scale
+        self._ec_levels = {}
 
     def compare_observed_value_with_target_component(self, target_component, observed_value):
         """ Compare the observed biological component with the target component
@@ -767,11 +934,9 @@ class ReactionSimilarityFilter(Filter):
 
         # check directions are the same
         def get_side_similarity(target_connectivities, observed_connectivities):
-            similarities = numpy.full((len(target_connectivities), len(observed_connectivities)), numpy.nan)
-            for t, t_conn in enumerate(target_connectivities):
-                for o, o_conn in enumerate(observed_connectivities):
-                    similarities[t, o] = molecule_util.Molecule(structure='InChI=1S/' + t_conn) \
-                        .get_similarity(molecule_util.Molecule(structure='InChI=1S/' + o_conn))
+            similarities = molecule_util.get_fingerprint_store().get_similarities(
+                ['InChI=1S/' + t_conn for t_conn in target_connectivities],
+                ['InChI=1S/' + o_conn for o_conn in observed_connectivities])
 
             # greedy search
             max_vals = []
@@ -790,28 +955,13 @@ class ReactionSimilarityFilter(Filter):
                 return -1
 
         # check membership to same EC class
-        target_ecs = target_reaction.get_ec_numbers()
-        observed_ecs = observed_reaction.get_ec_numbers()
-
-        for level in range(4, 0, -1):
-            part_target_ecs = []
-            for target_ec in target_ecs:
-                if target_ec.id.count('.') >= level - 1:
-                    part_target_ec, _, _ = wc_utils.util.string.partition_nth(target_ec.id, '.', level)
-                    if part_target_ec[-1] != '.':
-                        part_target_ecs.append(part_target_ec)
+        target_ecs = tuple(sorted(set(xr.id for xr in target_reaction.get_ec_numbers())))
+        observed_ecs = tuple(sorted(set(xr.id for xr in observed_reaction.get_ec_numbers())))
+        key = (target_ecs, observed_ecs)
+        if key not in self._ec_levels:
+            self._ec_levels[key] = ec_util.get_common_ec_level(target_ecs, observed_ecs)
 
-            part_observed_ecs = []
-            for observed_ec in observed_ecs:
-                if observed_ec.id.count('.') >= level - 1:
-                    part_observed_ec, _, _ = wc_utils.util.string.partition_nth(observed_ec.id, '.', level)
-                    if part_observed_ec[-1] != '.':
-                        part_observed_ecs.append(part_observed_ec)
-
-            if part_observed_ecs and set(part_observed_ecs).intersection(part_target_ecs):
-                return level
-
-        return 0
+        return self._ec_levels[key]
 
     def score(self, target_component, observed_value):
         """ Calculate a scaled numeric score betwen 0 and 1 which indicates how well the observed value matches
@@ -894,7 +1044,8 @@ class ReactionParticipantFilter(Filter):
             return 1
 
         # return maximal similarity to target species
-        return max(target_specie.get_similarity(observed_specie) for target_specie in target_species)
+        similarities = molecule_util.get_fingerprint_store().get_similarities(target_structures, [observed_structure])
+        return float(numpy.max(similarities))
 
     def score(self, target_component, observed_value):
         """ Calculate a scaled numeric score betwen 0 and 1 which indicates how well the observed value matches
@@ -921,6 +1072,10 @@ class TaxonomicDistanceFilter(Filter):
 
     Attributes:
         taxon (:obj:`str`): name of the taxon to find data for
+        max (:obj:`float`): maximum distance to the latest common ancestor with the observed taxon
+        scale (:obj:`float`): The scale of the distribution
+        _distances (:obj:`dict`): cache of the distances from the target taxon to the latest common ancestors
+            with observed taxa
     """
 
     def __init__(self, taxon, max=None, scale=None):
@@ -944,6 +1099,7 @@ class TaxonomicDistanceFilter(Filter):
         self.taxon = taxon
         self.max = max
         self.scale = scale
+        self._distances = {}
 
     def compare_observed_value_with_target_component(self, target_component, observed_value):
         """ Compare the observed biological component with the target component
@@ -958,11 +1114,24 @@ class TaxonomicDistanceFilter(Filter):
         observed_taxon = self.get_attribute_of_observed_value(observed_value)
         if not observed_taxon:
             return None
+        return self.get_distance_to_common_ancestor(observed_taxon)
+
+    def get_distance_to_common_ancestor(self, observed_taxon):
+        """ Get the distance from the target taxon to its latest common ancestor with an observed taxon
+
+        Args:
+            observed_taxon (:obj:`str`): name of the observed taxon
 
-        target_taxon_obj = taxonomy_util.Taxon(name=self.taxon)
-        obsserved_taxon_obj = taxonomy_util.Taxon(name=observed_taxon)
+        Returns:
+            :obj:`int`: distance to latest common ancestor with the observed taxon
+        """
+        key = (self.taxon, observed_taxon)
+        if key not in self._distances:
+            target_taxon_obj = taxonomy_util.Taxon(name=self.taxon)
+            observed_taxon_obj = taxonomy_util.Taxon(name=observed_taxon)
+            self._distances[key] = target_taxon_obj.get_distance_to_common_ancestor(observed_taxon_obj)
 
-        return target_taxon_obj.get_distance_to_common_ancestor(obsserved_taxon_obj)
+        return self._distances[key]
 
     def score(self, target_component, observed_value):
         """ Calculate a scaled numeric score betwen 0 and 1 which indicates how well the observed value matches
@@ -985,6 +1154,38 @@ class TaxonomicDistanceFilter(Filter):
 
         return math.exp(-val / self.scale)
 
+    def score_many(self, target_component, observed_results, column=None):
+        """ Calculate the scores of a list of observed values at once. The distance to each distinct observed
+        taxon is only calculated once.
+
+        Args:
+            target_component (:obj:`data_model.EntityInteractionOrProperty`): interaction, species, or property to find data about
+            observed_results (:obj:`list` of :obj:`data_model.ObservedValue`): list of observed values
+            column (:obj:`list` of :obj:`object`, optional): values of the attribute of the observed values
+
+        Returns:
+            :obj:`numpy.ndarray`: scores which indicate how well the observed values match the criteria
+        """
+        if column is None:
+            column = self.get_attribute_column(observed_results)
+
+        taxa = numpy.array([observed_taxon or '' for observed_taxon in column], dtype=object)
+        distinct_taxa, i_taxa = numpy.unique(taxa, return_inverse=True)
+        distances = [self.get_distance_to_common_ancestor(observed_taxon) if observed_taxon else None
+                     for observed_taxon in distinct_taxa]
+
+        # like :obj:`score`, values whose taxa are missing or can't be resolved are scored 0.5
+        is_none = numpy.array([distance is None for distance in distances], dtype=bool)[i_taxa]
+        values = numpy.array([numpy.nan if distance is None else distance for distance in distances],
+                             dtype=numpy.float64)[i_taxa]
+
+        with numpy.errstate(invalid='ignore'):
+            scores = numpy.exp(-values / self.scale)
+            if not numpy.isnan(self.max):
+                scores[numpy.isnan(values) | (values > self.max)] = -1
+        scores[is_none] = 0.5
+        return scores
+
 
 class WildtypeFilter(OptionsFilter):
     """ Filter out observed values which were observed for taxa with genetic perturbations """
@@ -6,21 +6,27 @@
 """
 
 import abc
+import collections
 import datanator.config
+import multiprocessing.pool
 import os
 import requests
 import requests_cache
 import shutil
 import six
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
 import sqlalchemy.orm
 from sqlalchemy_utils.functions import database_exists, create_database
-from datanator.util.constants import DATA_CACHE_DIR, DATA_DUMP_PATH
+from datanator.util.constants import (DATA_CACHE_DIR, DATA_DUMP_PATH, HTTP_DOWNLOAD_CHUNK_SIZE, OBJECT_CACHE_MAX_SIZE,
+                                      OBJECT_MERGE_CHUNK_SIZE)
 import sys
 import tarfile
 import subprocess
 import tempfile
+import threading
 import time
+import weakref
 import wc_utils.quilt
 
 
@@ -287,14 +293,33 @@ class PostgresDataSource(DataSource):
         Returns:
             :obj:`base_model`: SQLAlchemy object of type :obj:`cls`
         """
-        q = self.session.query(cls).filter_by(**kwargs)
-        self.session.flush()
-        if q.count():
-            return q.first()
-        else:
-            obj = cls(**kwargs)
-            self.session.add(obj)
-            return obj
+        return get_object_cache(self.session).get_or_create(cls, **kwargs)
+
+    def update_or_create_object(self, cls, keys, **kwargs):
+        """ Get the SQLAlchemy object of type :obj:`cls` which is identified by the attribute/value pairs
+        :obj:`keys`, or create it and add it to the SQLAlchemy session, and set its other attributes to the values
+        specified by `**kwargs`
+
+        Args:
+            cls (:obj:`class`): child class of :obj:`base_model`
+            keys (:obj:`dict`): attribute-value pairs which identify the desired SQLAlchemy object
+            **kwargs (:obj:`dict`, optional): values of the other attributes of the object
+
+        Returns:
+            :obj:`base_model`: SQLAlchemy object of type :obj:`cls`
+        """
+        return get_object_cache(self.session).update_or_create(cls, keys, **kwargs)
+
+    def preload_objects(self, cls, *attrs):
+        """ Load all of the existing objects of type :obj:`cls` into the identity cache of the session, keyed by
+        the values of :obj:`attrs`, so that subsequent calls to :obj:`get_or_create_object` with exactly these
+        attributes don't query the database
+
+        Args:
+            cls (:obj:`class`): child class of :obj:`base_model`
+            *attrs (:obj:`list` of :obj:`str`): names of the columns which identify each object
+        """
+        get_object_cache(self.session).preload(cls, *attrs)
 
 
 class CachedDataSource(DataSource):
@@ -504,14 +529,33 @@ class CachedDataSource(DataSource):
         Returns:
             :obj:`base_model`: SQLAlchemy object of type :obj:`cls`
         """
-        q = self.session.query(cls).filter_by(**kwargs)
-        self.session.flush()
-        if q.count():
-            return q.first()
-        else:
-            obj = cls(**kwargs)
-            self.session.add(obj)
-            return obj
+        return get_object_cache(self.session).get_or_create(cls, **kwargs)
+
+    def update_or_create_object(self, cls, keys, **kwargs):
+        """ Get the SQLAlchemy object of type :obj:`cls` which is identified by the attribute/value pairs
+        :obj:`keys`, or create it and add it to the SQLAlchemy session, and set its other attributes to the values
+        specified by `**kwargs`
+
+        Args:
+            cls (:obj:`class`): child class of :obj:`base_model`
+            keys (:obj:`dict`): attribute-value pairs which identify the desired SQLAlchemy object
+            **kwargs (:obj:`dict`, optional): values of the other attributes of the object
+
+        Returns:
+            :obj:`base_model`: SQLAlchemy object of type :obj:`cls`
+        """
+        return get_object_cache(self.session).update_or_create(cls, keys, **kwargs)
+
+    def preload_objects(self, cls, *attrs):
+        """ Load all of the existing objects of type :obj:`cls` into the identity cache of the session, keyed by
+        the values of :obj:`attrs`, so that subsequent calls to :obj:`get_or_create_object` with exactly these
+        attributes don't query the database
+
+        Args:
+            cls (:obj:`class`): child class of :obj:`base_model`
+            *attrs (:obj:`list` of :obj:`str`): names of the columns which identify each object
+        """
+        get_object_cache(self.session).preload(cls, *attrs)
 
 
 class FtpDataSource(CachedDataSource):
@@ -531,10 +575,18 @@ class HttpDataSource(CachedDataSource):
         requests_session (:obj:`requests_cache.core.CachedSession`): cache-enabled HTTP request session
         ENDPOINT_DOMAINS (:obj:`dict` of :obj:`str`, :obj:`str`): dictionary of domains to retry
         MAX_HTTP_RETRIES (:obj:`int`): maximum number of times to retry each HTTP request
+        MAX_HTTP_CONCURRENT_REQUESTS (:obj:`int`): maximum number of HTTP requests that :obj:`iter_requests` keeps in flight
+        MIN_HTTP_REQUEST_INTERVAL (:obj:`float`): minimum delay in seconds between the starts of the HTTP requests
+            issued by :obj:`iter_requests`
+        HTTP_RETRY_BACKOFF (:obj:`float`): delay in seconds before the first retry of a failed HTTP request; the delay
+            doubles with each retry
     """
 
     ENDPOINT_DOMAINS = {}
     MAX_HTTP_RETRIES = 5
+    MAX_HTTP_CONCURRENT_REQUESTS = 4
+    MIN_HTTP_REQUEST_INTERVAL = 0.1
+    HTTP_RETRY_BACKOFF = 1.
 
     def __init__(self, name=None, cache_dirname=None, clear_content=False, load_content=False, max_entries=float('inf'),
                  commit_intermediate_results=False, download_backups=True, verbose=False,
@@ -568,6 +620,9 @@ class HttpDataSource(CachedDataSource):
         # pickle which is not backwards compatible
         self.requests_cache_filename = os.path.join(cache_dirname, name + '.requests.py{}.sqlite'.format(sys.version_info[0]))
         self.requests_session = self.get_requests_session()
+        self._download_sessions = threading.local()
+        self._request_rate_lock = threading.Lock()
+        self._next_request_time = 0.
 
         if clear_requests_cache:
             self.clear_requests_cache()
@@ -604,6 +659,131 @@ class HttpDataSource(CachedDataSource):
         """ Clear the cache-enabled HTTP request session """
         self.requests_session.cache.clear()
 
+    def iter_requests(self, url_params, max_concurrent_requests=None):
+        """ Issue GET requests for a sequence of URLs and query parameters, keeping up to
+        :obj:`max_concurrent_requests` requests in flight, and yield the responses in the same order as the requests.
+
+        Responses which are already in the requests cache are read from the cache by the calling thread. The other
+        requests are downloaded by a pool of threads (see :obj:`download_request`) and their responses are saved to
+        the cache by the calling thread, so only the calling thread ever touches the cache.
+
+        Args:
+            url_params (:obj:`iterable` of :obj:`tuple` of :obj:`str`, :obj:`dict`): URL and query parameters of
+                each request
+            max_concurrent_requests (:obj:`int`, optional): maximum number of requests to keep in flight; defaults to
+                :obj:`MAX_HTTP_CONCURRENT_REQUESTS`
+
+        Yields:
+            :obj:`requests.Response`: response to each request
+        """
+        max_concurrent_requests = max_concurrent_requests or self.MAX_HTTP_CONCURRENT_REQUESTS
+        session = self.requests_session
+        cache = session.cache
+
+        pool = multiprocessing.pool.ThreadPool(max_concurrent_requests)
+        pending = collections.deque()
+        url_params_iter = iter(url_params)
+        try:
+            while True:
+                for url, params in url_params_iter:
+                    request = session.prepare_request(requests.Request('GET', url, params=params))
+                    key = cache.create_key(request)
+                    if cache.has_key(key):
+                        pending.append((url, params, key, None))
+                    else:
+                        pending.append((url, params, key, pool.apply_async(self.download_request, (request,))))
+                    if len(pending) >= max_concurrent_requests:
+                        break
+
+                if not pending:
+                    break
+
+                url, params, key, result = pending.popleft()
+                if result is None:
+                    response = session.get(url, params=params)
+                else:
+                    response = result.get()
+                    if response.status_code == 200:
+                        cache.save_response(key, response)
+                yield response
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def download_request(self, request):
+        """ Send a prepared HTTP request, waiting at least :obj:`MIN_HTTP_REQUEST_INTERVAL` between the starts of
+        requests and retrying connection errors and server errors with exponential backoff. This is thread-safe.
+
+        Args:
+            request (:obj:`requests.PreparedRequest`): request
+
+        Returns:
+            :obj:`requests.Response`: response
+
+        Raises:
+            :obj:`requests.exceptions.RequestException`: if the request still fails after :obj:`MAX_HTTP_RETRIES` retries
+        """
+        session = getattr(self._download_sessions, 'session', None)
+        if session is None:
+            session = self._download_sessions.session = requests.Session()
+
+        for i_try in range(self.MAX_HTTP_RETRIES + 1):
+            with self._request_rate_lock:
+                delay = self._next_request_time - time.time()
+                self._next_request_time = max(self._next_request_time, time.time()) + self.MIN_HTTP_REQUEST_INTERVAL
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                response = session.send(request)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if i_try == self.MAX_HTTP_RETRIES:
+                    raise
+
+            if i_try < self.MAX_HTTP_RETRIES:
+                time.sleep(self.HTTP_RETRY_BACKOFF * 2 ** i_try)
+
+        return response
+
+    def download_file(self, url, filename, chunk_size=HTTP_DOWNLOAD_CHUNK_SIZE):
+        """ Stream the body of a GET request to a file, bypassing the requests cache, so that large files don't have
+        to be held in memory. The body is written to a temporary file which is only moved to :obj:`filename` once the
+        download is complete, and files which have already been downloaded aren't downloaded again.
+
+        Args:
+            url (:obj:`str`): URL
+            filename (:obj:`str`): path to save the body to
+            chunk_size (:obj:`int`, optional): number of bytes to read from the response and write at once
+
+        Raises:
+            :obj:`requests.exceptions.HTTPError`: if the request fails
+        """
+        if os.path.isfile(filename):
+            return
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        session = getattr(self._download_sessions, 'session', None)
+        if session is None:
+            session = self._download_sessions.session = requests.Session()
+            for endpoint_domain in self.ENDPOINT_DOMAINS.values():
+                session.mount(endpoint_domain, requests.adapters.HTTPAdapter(max_retries=self.MAX_HTTP_RETRIES))
+
+        tmp_filename = filename + '.download'
+        response = session.get(url, stream=True)
+        try:
+            response.raise_for_status()
+            with open(tmp_filename, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+        finally:
+            response.close()
+        os.rename(tmp_filename, filename)
+
     def get_paths_to_backup(self, download=False):
         """ Get a list of the files to backup/unpack
 
@@ -637,6 +817,629 @@ class WebserviceDataSource(DataSource):
             self.requests_session.mount(endpoint_domain, requests.adapters.HTTPAdapter(max_retries=self.MAX_HTTP_RETRIES))
 
 
+class ObjectCache(object):
+    """ Session-scoped identity map of SQLAlchemy objects, keyed by their class and by the attribute/value pairs
+    which were used to get or create them. Repeated lookups of the same object are answered from memory, and
+    lookups which miss the cache are run without flushing the session.
+
+    The caches which :obj:`get_object_cache` attaches to sessions are kept consistent with changes which bypass
+    them: objects which are added to the session directly make the next miss for their class flush the session
+    and query the database, and cached objects whose key attributes are changed are removed from the cache.
+
+    Attributes:
+        session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+        max_size (:obj:`int`): maximum number of objects to keep in the cache
+        hits (:obj:`int`): number of lookups answered from the cache
+        misses (:obj:`int`): number of lookups which required a database query
+        _session (:obj:`weakref.ref`): weak reference to the session, so that the cache doesn't keep it alive
+        _objects (:obj:`collections.OrderedDict`): cached objects in least-recently-used order
+        _keys (:obj:`dict`): dictionary which maps the ids of the cached objects to their keys
+        _adding (:obj:`object`): object which the cache is adding to the session
+        _preloaded (:obj:`set` of :obj:`tuple`): pairs of classes and sets of attribute names whose objects
+            have all been loaded into the cache
+        _unflushed_classes (:obj:`set` of :obj:`class`): classes with unflushed objects which the cache can't
+            find (e.g. objects which were added to the session directly or which were evicted from the cache);
+            the session must be flushed before the next query for one of these classes
+        concurrent (:obj:`bool`): if :obj:`True`, other processes write to the same database at the same time
+            (e.g. the workers of a parallel build). The objects which are identified by their primary keys (e.g.
+            taxa) then can't be created twice, so they are inserted with conflicts ignored. The duplicates of the
+            other objects can be merged afterwards with :obj:`merge_duplicates`.
+    """
+
+    def __init__(self, session, max_size=OBJECT_CACHE_MAX_SIZE, concurrent=False):
+        """
+        Args:
+            session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+            max_size (:obj:`int`, optional): maximum number of objects to keep in the cache
+            concurrent (:obj:`bool`, optional): if :obj:`True`, other processes write to the same database at the
+                same time
+        """
+        self._session = weakref.ref(session)
+        self.max_size = max_size
+        self.concurrent = concurrent
+        self.hits = 0
+        self.misses = 0
+        self._objects = collections.OrderedDict()
+        self._keys = {}
+        self._preloaded = set()
+        self._unflushed_classes = set()
+        self._adding = None
+
+    @property
+    def session(self):
+        """ Get the session of the cache
+
+        Returns:
+            :obj:`sqlalchemy.orm.session.Session`: SQLAlchemy session
+        """
+        return self._session()
+
+    def get_or_create(self, cls, **kwargs):
+        """ Get the object of type :obj:`cls` with the attribute/value pairs specified by `**kwargs`, or create
+        it and add it to the session if no such object exists
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            **kwargs (:obj:`dict`, optional): attribute-value pairs of the desired object
+
+        Returns:
+            :obj:`object`: object of type :obj:`cls`
+        """
+        key = self.get_key(cls, kwargs)
+        if key is None:
+            # unhashable values (e.g. lists) can't be cached
+            self.misses += 1
+            self.session.flush()
+            obj = self.session.query(cls).filter_by(**kwargs).first()
+            if obj is None:
+                obj = cls(**kwargs)
+                self.add_to_session(obj)
+            return obj
+
+        obj = self._objects.pop(key, None)
+        if obj is not None:
+            self.hits += 1
+            self._objects[key] = obj
+            return obj
+
+        obj = None
+        if self.concurrent:
+            obj = self.get_or_insert_by_primary_key(cls, kwargs)
+            if obj is not None:
+                self.add(key, obj)
+                return obj
+
+        if not self.is_known_to_be_absent(cls, kwargs):
+            self.misses += 1
+            if self.has_unflushed_objects(cls):
+                self.session.flush()
+                self._unflushed_classes.clear()
+            with self.session.no_autoflush:
+                obj = self.session.query(cls).filter_by(**kwargs).first()
+
+        if obj is None:
+            obj = cls(**kwargs)
+            self.add_to_session(obj)
+
+        self.add(key, obj)
+        return obj
+
+    def update_or_create(self, cls, keys, **kwargs):
+        """ Get the object of type :obj:`cls` which is identified by the attribute/value pairs :obj:`keys`, or
+        create it and add it to the session if no such object exists, and set its other attributes to the values
+        specified by `**kwargs`. Unlike :obj:`get_or_create`, objects whose other attributes change, e.g. between
+        builds, are updated rather than duplicated.
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            keys (:obj:`dict`): attribute-value pairs which identify the desired object
+            **kwargs (:obj:`dict`, optional): values of the other attributes of the object
+
+        Returns:
+            :obj:`object`: object of type :obj:`cls`
+        """
+        obj = self.get_or_create(cls, **keys)
+        for attr, val in kwargs.items():
+            setattr(obj, attr, val)
+        return obj
+
+    def add_to_session(self, obj):
+        """ Add an object which the cache created to the session
+
+        Args:
+            obj (:obj:`object`): object
+        """
+        self._adding = obj
+        try:
+            self.session.add(obj)
+        finally:
+            self._adding = None
+
+    def get_or_insert_by_primary_key(self, cls, kwargs):
+        """ Get an object which is identified by its primary key, and which other processes may be creating at the
+        same time. The object is inserted with conflicts ignored in its own short transaction, which doesn't wait
+        for the transactions of the other processes, and then loaded into the session. The object is therefore
+        committed even if the transaction of the session is rolled back; such objects can be removed with
+        :obj:`delete_unreferenced`.
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            kwargs (:obj:`dict`): attribute-value pairs of the desired object
+
+        Returns:
+            :obj:`object`: object of type :obj:`cls`, or :obj:`None` if the object isn't identified by the primary
+            key of a model which is stored in a single table
+        """
+        mapper = sqlalchemy.inspect(cls)
+        if mapper.inherits is not None:
+            return None
+
+        values = {}
+        for attr, val in kwargs.items():
+            if attr not in mapper.column_attrs or sqlalchemy.inspect(val, raiseerr=False) is not None:
+                return None
+            values[mapper.column_attrs[attr].columns[0].name] = val
+        if any(column.name not in values for column in mapper.primary_key):
+            return None
+
+        with self.session.get_bind(mapper=mapper).begin() as connection:
+            connection.execute(insert_ignore(mapper.local_table, connection.dialect).values(values))
+
+        self.misses += 1
+        with self.session.no_autoflush:
+            return self.session.query(cls).filter_by(**kwargs).first()
+
+    def is_known_to_be_absent(self, cls, kwargs):
+        """ Determine whether an object which missed the cache can't be in the database, either because all of
+        the objects with these attributes were preloaded or because it refers to an object which hasn't been
+        flushed yet
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            kwargs (:obj:`dict`): attribute-value pairs of the desired object
+
+        Returns:
+            :obj:`bool`: :obj:`True` if the object doesn't exist in the database
+        """
+        if self.has_unflushed_objects(cls):
+            return False
+        if (cls, frozenset(kwargs.keys())) in self._preloaded:
+            return True
+        for val in kwargs.values():
+            if is_pending(val):
+                return True
+        return False
+
+    def has_unflushed_objects(self, cls):
+        """ Determine whether the session may contain unflushed objects of type :obj:`cls` which the cache can't
+        find
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+
+        Returns:
+            :obj:`bool`: :obj:`True` if the session must be flushed before querying for objects of type :obj:`cls`
+        """
+        for unflushed_cls in self._unflushed_classes:
+            if issubclass(unflushed_cls, cls):
+                return True
+        return False
+
+    def preload(self, cls, *attrs):
+        """ Load all of the objects of type :obj:`cls` into the cache, keyed by the values of :obj:`attrs`
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            *attrs (:obj:`list` of :obj:`str`): names of the columns which identify each object
+        """
+        self.session.flush()
+        self._unflushed_classes.clear()
+        n_objects = 0
+        for obj in self.session.query(cls):
+            key = self.get_key(cls, {attr: getattr(obj, attr) for attr in attrs})
+            if key is not None and key not in self._objects:
+                self.add(key, obj)
+                n_objects += 1
+
+        # only trust misses if all of the objects fit into the cache
+        if n_objects <= self.max_size:
+            self._preloaded.add((cls, frozenset(attrs)))
+
+    def add(self, key, obj):
+        """ Add an object to the cache, evicting the least recently used objects if the cache is full
+
+        Args:
+            key (:obj:`tuple`): key
+            obj (:obj:`object`): object
+        """
+        self._objects[key] = obj
+        self._keys.setdefault(id(obj), set()).add(key)
+        for attr, _ in key[1]:
+            listen_for_key_changes(key[0], attr)
+        while len(self._objects) > self.max_size:
+            evicted_key, evicted_obj = self._objects.popitem(last=False)
+            self.discard_key(evicted_key, evicted_obj)
+            if is_pending(evicted_obj):
+                self._unflushed_classes.add(type(evicted_obj))
+            self._preloaded.clear()
+
+    def discard_key(self, key, obj):
+        """ Forget that an object is cached under a key
+
+        Args:
+            key (:obj:`tuple`): key
+            obj (:obj:`object`): object
+        """
+        keys = self._keys.get(id(obj), None)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._keys.pop(id(obj))
+
+    def invalidate(self, cls):
+        """ Stop trusting misses for objects of a class, and flush the session before the next query for the class,
+        e.g. because an object of the class was added to the session without the cache, or because the key
+        attributes of an object of the class changed. The other classes aren't affected.
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+        """
+        if cls in self._unflushed_classes:
+            return
+        self._unflushed_classes.add(cls)
+        self._preloaded = set(preloaded for preloaded in self._preloaded if not issubclass(cls, preloaded[0]))
+
+    def on_transient_to_pending(self, obj):
+        """ Handle an object being added to the session
+
+        Args:
+            obj (:obj:`object`): object
+        """
+        if obj is not self._adding:
+            self.invalidate(type(obj))
+
+    def on_after_flush(self):
+        """ Handle the session being flushed """
+        self._unflushed_classes.clear()
+
+    def on_key_change(self, obj, attr, val):
+        """ Remove a cached object from the cache under the keys which include an attribute whose value is being
+        changed
+
+        Args:
+            obj (:obj:`object`): object
+            attr (:obj:`str`): name of the attribute
+            val (:obj:`object`): new value of the attribute
+        """
+        keys = self._keys.get(id(obj), None)
+        if not keys:
+            return
+
+        for key in list(keys):
+            cls, items = key
+            for item_attr, item_val in items:
+                if item_attr == attr:
+                    current_key = self.get_key(cls, {attr: val})
+                    if current_key is None or current_key[1][0][1] != item_val:
+                        self._objects.pop(key, None)
+                        self.discard_key(key, obj)
+                        self.invalidate(cls)
+                    break
+
+    def clear(self):
+        """ Empty the cache """
+        self._objects.clear()
+        self._keys.clear()
+        self._preloaded.clear()
+        self._unflushed_classes.clear()
+
+    @staticmethod
+    def get_key(cls, kwargs):
+        """ Get the cache key for the object of type :obj:`cls` with the attribute/value pairs :obj:`kwargs`.
+        Column values are coerced to the Python type of the column so that, e.g., :obj:`'9606'` and
+        :obj:`9606` refer to the same taxon.
+
+        Args:
+            cls (:obj:`class`): SQLAlchemy model
+            kwargs (:obj:`dict`): attribute-value pairs
+
+        Returns:
+            :obj:`tuple`: key, or :obj:`None` if one of the values is unhashable
+        """
+        columns = sqlalchemy.inspect(cls).columns
+        items = []
+        for attr, val in sorted(kwargs.items(), key=lambda item: item[0]):
+            column = columns.get(attr, None)
+            if column is not None and isinstance(val, (int, float, six.string_types)):
+                try:
+                    python_type = column.type.python_type
+                except NotImplementedError:
+                    python_type = None
+                if python_type in (int, float, str, six.text_type) and not isinstance(val, python_type):
+                    try:
+                        val = python_type(val)
+                    except ValueError:
+                        pass
+            try:
+                hash(val)
+            except TypeError:
+                return None
+            items.append((attr, val))
+        return (cls, tuple(items))
+
+
+def is_pending(obj):
+    """ Determine whether a value is a SQLAlchemy object which has been added to a session, but not flushed
+
+    Args:
+        obj (:obj:`object`): value
+
+    Returns:
+        :obj:`bool`: :obj:`True` if :obj:`obj` is a pending SQLAlchemy object
+    """
+    state = sqlalchemy.inspect(obj, raiseerr=False)
+    return isinstance(state, sqlalchemy.orm.state.InstanceState) and state.pending
+
+
+def insert_ignore(table, dialect):
+    """ Get a statement which inserts rows into a table, ignoring the rows which conflict with existing rows
+
+    Args:
+        table (:obj:`sqlalchemy.Table`): table
+        dialect (:obj:`sqlalchemy.engine.interfaces.Dialect`): dialect of the database
+
+    Returns:
+        :obj:`sqlalchemy.sql.expression.Insert`: statement
+
+    Raises:
+        :obj:`ValueError`: if the dialect doesn't support ignoring conflicts
+    """
+    if dialect.name == 'postgresql':
+        return sqlalchemy.dialects.postgresql.insert(table).on_conflict_do_nothing()
+    if dialect.name == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+    raise ValueError('Dialect {} does not support ignoring conflicts'.format(dialect.name))
+
+
+def get_referencing_columns(table):
+    """ Get the columns which refer to the rows of a table, other than primary keys (e.g. the primary keys of
+    the tables of subclasses)
+
+    Args:
+        table (:obj:`sqlalchemy.Table`): table
+
+    Returns:
+        :obj:`list` of :obj:`sqlalchemy.Column`: columns
+    """
+    return [fk.parent
+            for other_table in table.metadata.tables.values()
+            for fk in other_table.foreign_keys
+            if fk.column.table is table and not fk.parent.primary_key]
+
+
+def merge_duplicates(session, cls, attrs, after_id=None, criterion=None):
+    """ Merge the objects of a model which have the same values of the attributes which identify them, e.g. because
+    concurrent processes created them. Only the objects whose ids are greater than :obj:`after_id` (e.g. the objects
+    which the processes created) are merged, each into the object with the same values and the lowest id. The
+    references to each duplicate are redirected to the object which it is merged into, the rows of association
+    tables which thereby become duplicates are merged, and the duplicates are deleted.
+
+    Args:
+        session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+        cls (:obj:`class`): SQLAlchemy model with a single-column primary key
+        attrs (:obj:`list` of :obj:`str`): names of the columns and many-to-one relationships which identify the
+            objects (e.g. the attributes which :obj:`ObjectCache.get_or_create` gets them by)
+        after_id (:obj:`int`, optional): id after which the objects which can be merged into others begin; if
+            :obj:`None`, all objects can be merged
+        criterion (:obj:`sqlalchemy.sql.expression.ClauseElement`, optional): condition which the objects which
+            are merged must meet
+
+    Returns:
+        :obj:`int`: number of duplicates which were merged
+    """
+    mapper = sqlalchemy.inspect(cls)
+    tables = [class_mapper.local_table for class_mapper in mapper.iterate_to_root()]
+    id_column = list(tables[0].primary_key.columns)[0]
+    from_obj = tables[0]
+    for table in tables[1:]:
+        from_obj = from_obj.join(table, list(table.primary_key.columns)[0] == id_column)
+
+    key_columns = []
+    for attr in attrs:
+        prop = mapper.attrs[attr]
+        if isinstance(prop, sqlalchemy.orm.RelationshipProperty):
+            key_columns.extend(sorted(prop.local_columns, key=lambda column: column.name))
+        else:
+            key_columns.extend(prop.columns)
+
+    ids = sqlalchemy.select([id_column.label('id'),
+                             sqlalchemy.func.min(id_column).over(partition_by=key_columns).label('kept_id')]) \
+        .select_from(from_obj)
+    if criterion is not None:
+        ids = ids.where(criterion)
+    ids = ids.alias('ids')
+    query = sqlalchemy.select([ids.c.id, ids.c.kept_id]).where(ids.c.id != ids.c.kept_id)
+    if after_id is not None:
+        query = query.where(ids.c.id > after_id)
+    duplicates = session.execute(query.order_by(ids.c.id)).fetchall()
+    if not duplicates:
+        return 0
+
+    kept_ids = sorted(set(kept_id for _, kept_id in duplicates))
+    for table in tables:
+        for column in get_referencing_columns(table):
+            session.execute(column.table.update()
+                            .where(column == sqlalchemy.bindparam('merge_duplicate_id'))
+                            .values({column.name: sqlalchemy.bindparam('merge_kept_id')}),
+                            [{'merge_duplicate_id': id, 'merge_kept_id': kept_id} for id, kept_id in duplicates])
+
+            if not column.table.primary_key.columns:
+                merge_duplicate_rows(session, column, kept_ids)
+
+    duplicate_ids = [id for id, _ in duplicates]
+    for table in tables:
+        table_id_column = list(table.primary_key.columns)[0]
+        for i_chunk in range(0, len(duplicate_ids), OBJECT_MERGE_CHUNK_SIZE):
+            session.execute(table.delete().where(table_id_column.in_(
+                duplicate_ids[i_chunk:i_chunk + OBJECT_MERGE_CHUNK_SIZE])))
+
+    return len(duplicates)
+
+
+def get_max_id(session, cls):
+    """ Get the largest id of the objects of a model, e.g. to tell the objects which are created afterwards apart
+    for :obj:`merge_duplicates`
+
+    Args:
+        session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+        cls (:obj:`class`): SQLAlchemy model with a single-column primary key
+
+    Returns:
+        :obj:`int`: largest id, or 0 if there are no objects
+    """
+    # the ids of models with joined-table inheritance are assigned by the table of their base model
+    table = sqlalchemy.inspect(cls).base_mapper.local_table
+    id_column = list(table.primary_key.columns)[0]
+    return session.execute(sqlalchemy.select([sqlalchemy.func.max(id_column)])).scalar() or 0
+
+
+def merge_duplicate_rows(session, column, ids):
+    """ Merge the equal rows of a table without a primary key (e.g. an association table) which refer to objects
+
+    Args:
+        session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+        column (:obj:`sqlalchemy.Column`): column of the table which refers to the objects
+        ids (:obj:`list` of :obj:`int`): ids of the objects
+    """
+    table = column.table
+    columns = list(table.columns)
+    for i_chunk in range(0, len(ids), OBJECT_MERGE_CHUNK_SIZE):
+        rows = session.execute(sqlalchemy.select(columns)
+                               .where(column.in_(ids[i_chunk:i_chunk + OBJECT_MERGE_CHUNK_SIZE]))
+                               .group_by(*columns)
+                               .having(sqlalchemy.func.count() > 1)).fetchall()
+        for row in rows:
+            session.execute(table.delete().where(sqlalchemy.and_(*[col == row[col.name] for col in columns])))
+            session.execute(table.insert().values({col.name: row[col.name] for col in columns}))
+
+
+def delete_unreferenced(session, cls, ids=None):
+    """ Delete the objects of a model which no other rows refer to, e.g. objects which were committed by
+    :obj:`ObjectCache.get_or_insert_by_primary_key` for a transaction which was rolled back
+
+    Args:
+        session (:obj:`sqlalchemy.orm.session.Session`): SQLAlchemy session
+        cls (:obj:`class`): SQLAlchemy model which is stored in a single table with a single-column primary key
+        ids (:obj:`list`, optional): ids of the objects which can be deleted (e.g. the objects which a build
+            created); if :obj:`None`, all of the objects of the model can be deleted
+
+    Returns:
+        :obj:`int`: number of deleted objects
+    """
+    table = sqlalchemy.inspect(cls).local_table
+    id_column = list(table.primary_key.columns)[0]
+    conditions = [~id_column.in_(sqlalchemy.select([column]).where(column != None))
+                  for column in get_referencing_columns(table)]
+    if ids is None:
+        return session.execute(table.delete().where(sqlalchemy.and_(*conditions))).rowcount
+
+    ids = sorted(ids)
+    n_deleted = 0
+    for i_chunk in range(0, len(ids), OBJECT_MERGE_CHUNK_SIZE):
+        n_deleted += session.execute(table.delete().where(sqlalchemy.and_(
+            id_column.in_(ids[i_chunk:i_chunk + OBJECT_MERGE_CHUNK_SIZE]), *conditions))).rowcount
+    return n_deleted
+
+
+OBJECT_CACHE_SESSION_INFO_KEY = 'datanator_object_cache'
+# :obj:`str`: key of the identity cache in the :obj:`info` dictionary of its session
+_object_caches_lock = threading.Lock()
+_concurrent_writers = False
+
+
+def set_concurrent_writers(concurrent):
+    """ Set whether other processes write to the same database as this process at the same time (e.g. the workers
+    of a parallel build). Identity caches which are created afterwards then avoid conflicting inserts.
+
+    Args:
+        concurrent (:obj:`bool`): if :obj:`True`, other processes write to the same database
+    """
+    global _concurrent_writers
+    _concurrent_writers = concurrent
+
+
+def get_object_cache(session):
+    """ Get the identity cache of a session, creating it if necessary. Each thread of a
+    :obj:`sqlalchemy.orm.scoping.scoped_session` has its own cache.
+
+    Args:
+        session (:obj:`sqlalchemy.orm.session.Session` or :obj:`sqlalchemy.orm.scoping.scoped_session`): SQLAlchemy session
+
+    Returns:
+        :obj:`ObjectCache`: identity cache of the session
+    """
+    if isinstance(session, sqlalchemy.orm.scoping.scoped_session):
+        session = session()
+
+    # the cache is stored in the session so that it is collected with the session
+    with _object_caches_lock:
+        cache = session.info.get(OBJECT_CACHE_SESSION_INFO_KEY, None)
+        if cache is None:
+            cache = session.info[OBJECT_CACHE_SESSION_INFO_KEY] = ObjectCache(
+                session, concurrent=_concurrent_writers)
+    return cache
+
+
+def _clear_object_cache(session, *args):
+    cache = session.info.get(OBJECT_CACHE_SESSION_INFO_KEY, None)
+    if cache is not None:
+        cache.clear()
+
+
+def _on_transient_to_pending(session, obj):
+    cache = session.info.get(OBJECT_CACHE_SESSION_INFO_KEY, None)
+    if cache is not None:
+        cache.on_transient_to_pending(obj)
+
+
+def _on_after_flush(session, flush_context):
+    cache = session.info.get(OBJECT_CACHE_SESSION_INFO_KEY, None)
+    if cache is not None:
+        cache.on_after_flush()
+
+
+def _on_key_attribute_set(obj, val, old_val, initiator):
+    session = sqlalchemy.orm.object_session(obj)
+    if session is not None:
+        cache = session.info.get(OBJECT_CACHE_SESSION_INFO_KEY, None)
+        if cache is not None:
+            cache.on_key_change(obj, initiator.key, val)
+
+
+_key_attributes = set()
+
+
+def listen_for_key_changes(cls, attr):
+    """ Notify the object caches when an attribute which cached objects of type :obj:`cls` are keyed by is
+    changed. Only the attributes which are used as keys are instrumented, so that changes to the other attributes
+    (e.g. of the observations which are added during builds) don't have to be checked.
+
+    Args:
+        cls (:obj:`class`): SQLAlchemy model
+        attr (:obj:`str`): name of the attribute
+    """
+    if (cls, attr) in _key_attributes:
+        return
+    _key_attributes.add((cls, attr))
+    if attr in sqlalchemy.inspect(cls).attrs:
+        sqlalchemy.event.listen(getattr(cls, attr), 'set', _on_key_attribute_set, propagate=True)
+
+
+sqlalchemy.event.listen(sqlalchemy.orm.Session, 'after_rollback', _clear_object_cache)
+sqlalchemy.event.listen(sqlalchemy.orm.Session, 'transient_to_pending', _on_transient_to_pending)
+sqlalchemy.event.listen(sqlalchemy.orm.Session, 'after_flush', _on_after_flush)
+
+
 class DataSourceWarning(UserWarning):
     """ Data source warning """
     pass
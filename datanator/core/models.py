@@ -2,6 +2,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy, BaseQuery
 from sqlalchemy_searchable import SearchQueryMixin, make_searchable
 from sqlalchemy_utils.types import TSVectorType
+from sqlalchemy.dialects import postgresql
 from flask_migrate import Migrate
 from datanator.config import config
 from datanator import db
@@ -822,6 +823,74 @@ class Reaction(db.Model):
         return 'Reaction(%s)' % (self.reaction_id)
 
 
+class KineticLawParticipantSet(db.Model):
+    """
+    Represents the structures of the participants of a kinetic law, sorted by role, which index kinetic laws by
+    their participants (rebuilt by :obj:`datanator.core.common_schema.CommonSchema.build_kinetic_law_participant_index`)
+
+    Attributes:
+        kinetic_law_id (:obj:`int`): ID of the kinetic law
+        reactant_inchis (:obj:`list` of :obj:`str`): sorted InChI structures of the reactants
+        product_inchis (:obj:`list` of :obj:`str`): sorted InChI structures of the products
+        modifier_inchis (:obj:`list` of :obj:`str`): sorted InChI structures of the modifiers
+        reactant_formula_connectivities (:obj:`list` of :obj:`str`): sorted InChI formula and connectivity layers
+            of the reactants
+        product_formula_connectivities (:obj:`list` of :obj:`str`): sorted InChI formula and connectivity layers
+            of the products
+        modifier_formula_connectivities (:obj:`list` of :obj:`str`): sorted InChI formula and connectivity layers
+            of the modifiers
+    """
+
+    __tablename__ = 'kinetic_law_participant_set'
+
+    kinetic_law_id = db.Column(db.Integer, db.ForeignKey(
+        'kinetic_law.kinetic_law_id'), primary_key=True)
+    reactant_inchis = db.Column(postgresql.ARRAY(db.Unicode))
+    product_inchis = db.Column(postgresql.ARRAY(db.Unicode))
+    modifier_inchis = db.Column(postgresql.ARRAY(db.Unicode))
+    reactant_formula_connectivities = db.Column(postgresql.ARRAY(db.Unicode))
+    product_formula_connectivities = db.Column(postgresql.ARRAY(db.Unicode))
+    modifier_formula_connectivities = db.Column(postgresql.ARRAY(db.Unicode))
+
+    __table_args__ = tuple(
+        db.Index('ix_kinetic_law_participant_set_' + column, column, postgresql_using='gin')
+        for column in ['reactant_inchis', 'product_inchis', 'modifier_inchis', 'reactant_formula_connectivities',
+                       'product_formula_connectivities', 'modifier_formula_connectivities'])
+
+    def __repr__(self):
+        return 'KineticLawParticipantSet(%s)' % (self.kinetic_law_id)
+
+
+class KineticLawEcNumber(db.Model):
+    """
+    Represents an EC number of a kinetic law and its classes at each level, which index kinetic laws by their EC
+    classes (rebuilt by :obj:`datanator.core.common_schema.CommonSchema.build_kinetic_law_ec_number_index`)
+
+    Attributes:
+        id (:obj:`int`): ID
+        kinetic_law_id (:obj:`int`): ID of the kinetic law
+        ec_number (:obj:`str`): EC number
+        ec1 (:obj:`str`): class of the EC number at the first level (e.g. 1)
+        ec2 (:obj:`str`): class of the EC number at the second level (e.g. 1.1)
+        ec3 (:obj:`str`): class of the EC number at the third level (e.g. 1.1.1)
+        ec4 (:obj:`str`): class of the EC number at the fourth level (e.g. 1.1.1.1)
+    """
+
+    __tablename__ = 'kinetic_law_ec_number'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kinetic_law_id = db.Column(db.Integer, db.ForeignKey(
+        'kinetic_law.kinetic_law_id'), index=True)
+    ec_number = db.Column(db.Unicode, index=True)
+    ec1 = db.Column(db.Unicode, index=True)
+    ec2 = db.Column(db.Unicode, index=True)
+    ec3 = db.Column(db.Unicode, index=True)
+    ec4 = db.Column(db.Unicode, index=True)
+
+    def __repr__(self):
+        return 'KineticLawEcNumber(%s, %s)' % (self.kinetic_law_id, self.ec_number)
+
+
 class AbundanceDataSet(PhysicalProperty):
     """
     Represents a dataset for protein abundance
@@ -1046,3 +1115,25 @@ class Progress(db.Model):
 
     def __repr__(self):
         return 'Progress(%s||%s)' % (self.database_name, self.amount_loaded)
+
+
+class SourceRecordFingerprint(db.Model):
+    """
+    Represents the fingerprint of the content of a record of a source database (Ex. a Pax dataset) when it was last
+    integrated, which is used to only integrate the records which have changed since the previous build
+
+    Attributes:
+        database_name (:obj:`str`): Name of the source database
+        record_id (:obj:`str`): Identifier of the record within the source database
+        fingerprint (:obj:`str`): SHA1 digest of the content of the record
+        updated (:obj:`datetime.datetime`): Time when the record was last integrated
+    """
+    __tablename__ = 'source_record_fingerprint'
+
+    database_name = db.Column(db.Unicode, primary_key=True)
+    record_id = db.Column(db.Unicode, primary_key=True)
+    fingerprint = db.Column(db.Unicode)
+    updated = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return 'SourceRecordFingerprint(%s||%s)' % (self.database_name, self.record_id)
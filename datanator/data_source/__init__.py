@@ -1,13 +1,18 @@
-from . import array_express
-from . import array_express_tools
-from . import bio_portal
-from . import corum
-from . import ecmdb
-from . import ensembl
-from . import ezyme
-from . import intact
-from . import jaspar
-from . import pax
-from . import process_rna_seq
-from . import sabio_rk
-from . import uniprot
+from datanator.util import import_util
+
+# submodules are imported when they are first accessed
+import_util.make_lazy(__name__, submodules=[
+    'array_express',
+    'array_express_tools',
+    'bio_portal',
+    'corum',
+    'ecmdb',
+    'ensembl',
+    'ezyme',
+    'intact',
+    'jaspar',
+    'pax',
+    'process_rna_seq',
+    'sabio_rk',
+    'uniprot',
+])
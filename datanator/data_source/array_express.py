@@ -14,6 +14,7 @@ import sqlalchemy.ext.declarative
 import sqlalchemy.orm
 from datanator.core import data_source
 from datanator.data_source.array_express_tools import ensembl_tools
+from datanator.util.constants import ARRAY_EXPRESS_HARVEST_CHECKPOINT_INTERVAL
 import requests
 import time
 from ete3 import NCBITaxa
@@ -319,6 +320,18 @@ class Protocol(Base):
     __tablename__ = 'protocol'
 
 
+class ExperimentHarvest(Base):
+    """ Records that the samples and protocols of an experiment have been loaded, so that an interrupted harvest
+    can resume with the remaining experiments
+
+    Attributes:
+        experiment_id (:obj:`str`): identifier of the experiment
+    """
+    experiment_id = sqlalchemy.Column(sqlalchemy.String(), primary_key=True)
+
+    __tablename__ = 'experiment_harvest'
+
+
 class ArrayExpress(data_source.HttpDataSource):
     """ A local sqlite copy of the ArrayExpress database
     Attributes:
@@ -389,21 +402,71 @@ class ArrayExpress(data_source.HttpDataSource):
         if self.verbose:
             print('Loading samples and protocols for experiments ...')
 
-       # download and parse experiments
-        if self.verbose:
-            print('Loading samples and protocols for experiments ...')
-
-        total_experiments = session.query(Experiment).all()
-        for i_experiment, experiment in enumerate(total_experiments):
-            if self.verbose and i_experiment % 500 == 0:
-                print('  Loading samples and protocols for experiment {} of {}'.format(i_experiment + 1, len(total_experiments)))
-            self.load_experiment_samples(experiment)
-            self.load_experiment_protocols(experiment)
+        self.harvest_experiments()
 
         if self.verbose:
             print('  done.')
         self.session.commit()
 
+    def harvest_experiments(self):
+        """ Load the samples and protocols of the experiments which haven't been harvested yet. The samples and
+        protocols of many experiments are downloaded concurrently, and then loaded into the database in order by this
+        thread. Progress is committed every :obj:`ARRAY_EXPRESS_HARVEST_CHECKPOINT_INTERVAL` experiments so that an
+        interrupted harvest resumes where it stopped. Experiments whose samples or protocols couldn't be loaded aren't
+        recorded as harvested, so that they are retried by the next harvest.
+        """
+        session = self.session
+        ExperimentHarvest.__table__.create(self.engine, checkfirst=True)
+
+        harvested_ids = set(id for id, in session.query(ExperimentHarvest.experiment_id))
+        experiments = [experiment for experiment in session.query(Experiment).order_by(Experiment.id)
+                       if experiment.id not in harvested_ids]
+
+        def get_url_params():
+            for experiment in experiments:
+                yield (self.get_experiment_samples_url(experiment), None)
+                yield (self.get_experiment_protocols_url(experiment), None)
+        responses = self.iter_requests(get_url_params())
+
+        for i_experiment, experiment in enumerate(experiments):
+            if self.verbose and i_experiment % 500 == 0:
+                print('  Loading samples and protocols for experiment {} of {}'.format(i_experiment + 1, len(experiments)))
+            samples_response = next(responses)
+            protocols_response = next(responses)
+
+            # the protocols are loaded first because loading them again is harmless, whereas the samples of an
+            # experiment would be duplicated if they were loaded again when its harvest is retried
+            if not self.load_experiment_protocols(experiment, response=protocols_response):
+                continue
+            if not self.load_experiment_samples(experiment, response=samples_response):
+                continue
+            session.add(ExperimentHarvest(experiment_id=experiment.id))
+
+            if (i_experiment + 1) % ARRAY_EXPRESS_HARVEST_CHECKPOINT_INTERVAL == 0:
+                session.commit()
+
+    def get_experiment_samples_url(self, experiment):
+        """ Get the URL of the samples of an experiment
+
+        Args:
+            experiment (:obj:`Experiment`): experiment
+
+        Returns:
+            :obj:`str`: URL
+        """
+        return self.ENDPOINT_DOMAINS['array_express'] + "/{}/samples".format(experiment.id)
+
+    def get_experiment_protocols_url(self, experiment):
+        """ Get the URL of the protocols of an experiment
+
+        Args:
+            experiment (:obj:`Experiment`): experiment
+
+        Returns:
+            :obj:`str`: URL
+        """
+        return self.ENDPOINT_DOMAINS['array_express'] + "/{}/protocols".format(experiment.id)
+
     def load_experiment_metadata(self, test_url=""):
         """ Get a list of accession identifiers for the experiments from the year :obj:`start_year` to year :obj:`end_year`
         Args:
@@ -482,30 +545,38 @@ class ArrayExpress(data_source.HttpDataSource):
 
             db_session.add(experiment)
 
-    def load_experiment_samples(self, experiment):
+    def load_experiment_samples(self, experiment, response=None):
         """ Load the samples for an experiment
         Args:
             experiment (:obj:`Experiment`): experiment
+            response (:obj:`requests.Response`, optional): response to the request for the samples of the experiment;
+                if :obj:`None`, download the samples
+
+        Returns:
+            :obj:`bool`: :obj:`True` if the samples were loaded, or :obj:`False` if ArrayExpress failed to provide them
+
+        Raises:
+            :obj:`requests.HTTPError`: if the request for the samples failed for a reason other than a server error
         """
         #while time.clock>1
         try:
-            url = self.ENDPOINT_DOMAINS['array_express'] + "/{}/samples".format(experiment.id)
-            response = self.requests_session.get(url)
+            if response is None:
+                response = self.requests_session.get(self.get_experiment_samples_url(experiment))
             response.raise_for_status()
         except requests.HTTPError as resp:
             print(str(resp))
             if str(resp).startswith("500 Server Error: Internal Server Error for url:"):
-                return 
+                return False
             else:
                 raise
 
         json = response.json()
 
         if 'experiment' not in json:
-            return
+            return True
         experiment_json = json['experiment']
         if 'sample' not in experiment_json:
-            return
+            return True
         samples = experiment_json['sample']
 
         paired_end = False
@@ -554,6 +625,7 @@ class ArrayExpress(data_source.HttpDataSource):
                                     new_sample.fastq_urls.append(self.get_or_create_object(Url, url=comment['value']))
                                     experiment.has_fastq_files = True
 
+        return True
 
     def load_experiment_sample(self, experiment, sample_json, index):
         """ Load the samples for an experiment
@@ -635,33 +707,45 @@ class ArrayExpress(data_source.HttpDataSource):
             
         return sample
 
-    def load_experiment_protocols(self, experiment):
+    def load_experiment_protocols(self, experiment, response=None):
         """ Load the protocols for an experiment
         Args:
             experiment (:obj:`Experiment`): experiment
+            response (:obj:`requests.Response`, optional): response to the request for the protocols of the
+                experiment; if :obj:`None`, download the protocols
+
+        Returns:
+            :obj:`bool`: :obj:`True` if the protocols were loaded, or :obj:`False` if ArrayExpress failed to provide them
+
+        Raises:
+            :obj:`requests.HTTPError`: if the request for the protocols failed for a reason other than a server error
         """
         try:
-            response = self.requests_session.get(self.ENDPOINT_DOMAINS['array_express'] + "/{}/protocols".format(experiment.id))
-            json = response.json()
+            if response is None:
+                response = self.requests_session.get(self.get_experiment_protocols_url(experiment))
+            response.raise_for_status()
         except requests.HTTPError as resp:
             print(str(resp))
             if str(resp).startswith("500 Server Error: Internal Server Error for url:"):
-                return 
+                return False
             else:
                 raise
-        
+
+        json = response.json()
+
         session = self.session
         if 'protocols' not in json:
-            return
+            return True
         protocol_json = json['protocols']
         if 'protocol' not in protocol_json:
-            return
+            return True
         protocols = protocol_json['protocol']
         session = self.session
         if not isinstance(protocols, list):
             protocols = [protocols]
         for protocol in protocols:
             self.load_experiment_protocol(experiment, protocol)
+        return True
 
     def load_experiment_protocol(self, experiment, protocol_json):
         """ Load the protocols for an experiment
@@ -697,21 +781,5 @@ class ArrayExpress(data_source.HttpDataSource):
             protocol.hardware = protocol_json['hardware']
         if 'software' in protocol_json:
             protocol.software = protocol_json['software']
-        protocol.experiments.append(experiment)
-
-    def get_or_create_object(self, cls, **kwargs):
-        """ Get the first instance of :obj:`cls` that has the property-values pairs described by kwargs, or create an instance of :obj:`cls`
-        if there is no instance with the property-values pairs described by kwargs
-        Args:
-            cls (:obj:`class`): type of object to find or create
-            **kwargs: values of the properties of the object
-        Returns:
-            :obj:`Base`: instance of :obj:`cls` hat has the property-values pairs described by kwargs
-        """
-        q = self.session.query(cls).filter_by(**kwargs)
-        if self.session.query(q.exists()).scalar():
-            return q.first()
-
-        obj = cls(**kwargs)
-        self.session.add(obj)
-        return obj
+        if experiment not in protocol.experiments:
+            protocol.experiments.append(experiment)
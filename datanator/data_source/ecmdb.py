@@ -262,8 +262,8 @@ class Ecmdb(data_source.HttpDataSource):
 
             # calculate core InChI layers to facilitate searching
             try:
-                compound._structure_formula_connectivity = molecule_util.InchiMolecule(compound.structure) \
-                    .get_formula_and_connectivity()
+                compound._structure_formula_connectivity = molecule_util.get_inchi_normalizer() \
+                    .get_formula_and_connectivity(compound.structure)
             except ValueError:
                 warnings.warn('Unable to encode structure for {} in InChI'.format(entry['m2m_id']), data_source.DataSourceWarning)
                 compound._structure_formula_connectivity = None
@@ -9,9 +9,19 @@
 
 from datanator.core import data_model
 from datanator.core import data_source
+from datanator.util import molecule_util
+from datanator.util.constants import (DATA_CACHE_DIR, EZYME_CACHE_FILENAME, EZYME_MAX_CONCURRENT_REQUESTS,
+                                     EZYME_REQUEST_TIMEOUT)
+import collections
 import itertools
+import json
+import multiprocessing.pool
+import os
 import re
 import requests
+import sqlite3
+import threading
+import warnings
 
 
 class Ezyme(data_source.WebserviceDataSource):
@@ -19,7 +29,22 @@ class Ezyme(data_source.WebserviceDataSource):
 
     See Ezyme (http://www.genome.jp/tools-bin/predict_reaction) for more information.
 
+    Predictions are cached by the pairs of similar reactants and products of each reaction
+    (:obj:`data_model.Reaction.get_reactant_product_pairs`) in memory and, optionally, in a SQLite database, which
+    persists them across processes and runs. Reactions which aren't cached are submitted concurrently, and each
+    prediction is cached as soon as it completes. Reactions which can't be predicted, e.g. because Ezyme times out,
+    aren't cached, so that they are submitted again later.
+
     Attributes:
+        cache_filename (:obj:`str`): path to the SQLite database which persists the predictions, or :obj:`None` to
+            only cache them in memory
+        max_concurrent_requests (:obj:`int`): maximum number of reactions to submit to Ezyme at once
+        request_timeout (:obj:`float`): number of seconds to wait for each response from Ezyme
+        _cache (:obj:`dict`): dictionary which maps the pairs of reactions to their predictions
+        _connection (:obj:`sqlite3.Connection`): connection to the SQLite database
+        _lock (:obj:`threading.RLock`): lock which protects the caches
+        _sessions (:obj:`threading.local`): HTTP session of each thread
+
         REQUEST_URL (:obj:`str`): URL to request Ezyme EC number prediction
         RETRIEVAL_URL (:obj:`str`): URL to retrieve Ezyme results
         EC_PREDICTION_URL (:obj:`str`): URL where predicted EC number is encoded
@@ -29,6 +54,41 @@ class Ezyme(data_source.WebserviceDataSource):
     RETRIEVAL_URL = ENDPOINT_DOMAINS['ezyme'] + '/tools-bin/e-zyme2/result.cgi'
     EC_PREDICTION_URL = ENDPOINT_DOMAINS['ezyme'] + '/kegg-bin/get_htext?htext=ko01000.keg&query='
 
+    SQLITE_MAX_VARIABLES = 999
+    # :obj:`int`: maximum number of parameters of a SQLite query
+
+    def __init__(self, cache_filename=None, max_concurrent_requests=EZYME_MAX_CONCURRENT_REQUESTS,
+                 request_timeout=EZYME_REQUEST_TIMEOUT):
+        """
+        Args:
+            cache_filename (:obj:`str`, optional): path to the SQLite database which persists the predictions
+            max_concurrent_requests (:obj:`int`, optional): maximum number of reactions to submit to Ezyme at once
+            request_timeout (:obj:`float`, optional): number of seconds to wait for each response from Ezyme
+        """
+        super(Ezyme, self).__init__()
+        self.cache_filename = cache_filename
+        self.max_concurrent_requests = max_concurrent_requests
+        self.request_timeout = request_timeout
+        self._cache = {}
+        self._connection = None
+        self._lock = threading.RLock()
+        self._sessions = threading.local()
+
+        if cache_filename:
+            dirname = os.path.dirname(cache_filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._connection = sqlite3.connect(cache_filename, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS predictions (pairs TEXT PRIMARY KEY, results TEXT)')
+            self._connection.commit()
+
+    def close(self):
+        """ Close the SQLite database """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
     def run(self, reaction):
         """ Use Ezyme to predict the first three digits of the EC number of a reaction.
 
@@ -39,21 +99,173 @@ class Ezyme(data_source.WebserviceDataSource):
             :obj:`list` of :obj:`EzymeResult` or :obj:`None`: ranked list of predicted EC numbers and their scores
                 or :obj:`None` if one or more participant doesn't have a defined structure
         """
+        return self.run_many([reaction])[0]
+
+    def run_many(self, reactions):
+        """ Use Ezyme to predict the first three digits of the EC numbers of several reactions. Predictions are
+        read from the cache, and the reactions which aren't cached are submitted to Ezyme concurrently. Each
+        prediction is cached as soon as it completes. Reactions which can't be predicted are reported with a
+        :obj:`data_source.DataSourceWarning` and aren't cached.
+
+        Args:
+            reactions (:obj:`list` of :obj:`data_model.Reaction`): reactions
+
+        Returns:
+            :obj:`list` of :obj:`list` of :obj:`EzymeResult`: ranked list of predicted EC numbers and their scores of
+            each reaction, or :obj:`None` for reactions which have a participant without a defined structure or
+            which couldn't be predicted
+        """
+        keys = [self.get_key(reaction) for reaction in reactions]
+        unique_keys = list(collections.OrderedDict.fromkeys(key for key in keys if key is not None))
+        predictions = {}
+
+        with self._lock:
+            for key in unique_keys:
+                if key in self._cache:
+                    predictions[key] = self._cache[key]
+
+            missing = [key for key in unique_keys if key not in predictions]
+            if missing and self._connection is not None:
+                for i_chunk in range(0, len(missing), self.SQLITE_MAX_VARIABLES):
+                    chunk = missing[i_chunk:i_chunk + self.SQLITE_MAX_VARIABLES]
+                    rows = self._connection.execute('SELECT pairs, results FROM predictions WHERE pairs IN ({})'.format(
+                        ', '.join('?' * len(chunk))), chunk)
+                    for key, results in rows:
+                        predictions[key] = self._cache[key] = self.decode_results(results)
+                missing = [key for key in missing if key not in predictions]
+
+        if missing:
+            pool = multiprocessing.pool.ThreadPool(min(self.max_concurrent_requests, len(missing)))
+            try:
+                for key, key_results, error in pool.imap_unordered(self.try_predict, missing):
+                    if error is not None:
+                        warnings.warn('Unable to predict the EC numbers of the reaction {} with Ezyme: {}'.format(
+                            key, error), data_source.DataSourceWarning)
+                        predictions[key] = None
+                        continue
+
+                    with self._lock:
+                        predictions[key] = self._cache[key] = key_results
+                        if self._connection is not None:
+                            self._connection.execute('INSERT OR REPLACE INTO predictions (pairs, results) VALUES (?, ?)',
+                                                     (key, self.encode_results(key_results)))
+                            self._connection.commit()
+            finally:
+                pool.terminate()
+                pool.join()
+
+        return [None if key is None else predictions[key] for key in keys]
+
+    @staticmethod
+    def get_key(reaction):
+        """ Get the canonical representation of the pairs of similar reactants and products of a reaction which
+        is used to cache its predictions: a JSON-encoded list of the InChI-encoded structures of the reactant and
+        product (or an empty string) of each pair. The pairs aren't sorted because Ezyme's predictions depend on
+        their order.
+
+        Args:
+            reaction (:obj:`data_model.Reaction`): reaction
+
+        Returns:
+            :obj:`str`: key, or :obj:`None` if one or more participant doesn't have a defined structure
+        """
         if next((part for part in reaction.participants if not part.specie.structure), None):
             return None
 
-        pairs = reaction.get_reactant_product_pairs()
+        normalizer = molecule_util.get_inchi_normalizer()
+
+        def get_structure(participant):
+            if participant is None:
+                return ''
+            try:
+                return normalizer.get_inchi(participant.specie.structure)
+            except ValueError:
+                return participant.specie.structure
+
+        pairs = [[get_structure(reactant), get_structure(product)]
+                 for reactant, product in reaction.get_reactant_product_pairs()]
+        return json.dumps(pairs)
+
+    def predict(self, pairs):
+        """ Use Ezyme to predict the first three digits of the EC number of a reaction from its pairs of similar
+        reactants and products
+
+        Args:
+            pairs (:obj:`list` of :obj:`list` of :obj:`str`): structure of the reactant and product (or an empty
+                string) of each pair
 
+        Returns:
+            :obj:`list` of :obj:`EzymeResult` or :obj:`None`: ranked list of predicted EC numbers and their scores
+                or :obj:`None` if one or more participant doesn't have a defined structure
+        """
         reactants = []
         products = []
-        for pair in pairs:
-            if pair[0]:
-                reactants.append(pair[0].specie.to_mol())
-            if pair[1]:
-                products.append(pair[1].specie.to_mol())
+        for reactant, product in pairs:
+            if reactant:
+                reactants.append(molecule_util.Molecule(structure=reactant).to_mol())
+            if product:
+                products.append(molecule_util.Molecule(structure=product).to_mol())
 
         return self._run(reactants, products)
 
+    def try_predict(self, key):
+        """ Predict the EC numbers of a reaction from its key, returning rather than raising the error of a failed
+        prediction so that the other reactions can still be predicted. This is thread-safe.
+
+        Args:
+            key (:obj:`str`): key of the reaction (see :obj:`get_key`)
+
+        Returns:
+            :obj:`tuple`: key, its ranked list of :obj:`EzymeResult` (or :obj:`None` if the prediction failed), and the
+            error of the prediction (or :obj:`None` if it succeeded)
+        """
+        try:
+            return (key, self.predict(json.loads(key)), None)
+        except Exception as error:
+            return (key, None, error)
+
+    @staticmethod
+    def encode_results(results):
+        """ Encode predictions as JSON
+
+        Args:
+            results (:obj:`list` of :obj:`EzymeResult`): predictions, or :obj:`None`
+
+        Returns:
+            :obj:`str`: JSON-encoded predictions
+        """
+        if results is None:
+            return json.dumps(None)
+        return json.dumps([[result.ec_number, result.score] for result in results])
+
+    @staticmethod
+    def decode_results(value):
+        """ Decode JSON-encoded predictions
+
+        Args:
+            value (:obj:`str`): JSON-encoded predictions
+
+        Returns:
+            :obj:`list` of :obj:`EzymeResult`: predictions, or :obj:`None`
+        """
+        results = json.loads(value)
+        if results is None:
+            return None
+        return [EzymeResult(ec_number, score) for ec_number, score in results]
+
+    def get_requests_session(self):
+        """ Get the HTTP session of the current thread, so that reactions can be submitted concurrently
+
+        Returns:
+            :obj:`requests.Session`: HTTP session
+        """
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+            for endpoint_domain in self.ENDPOINT_DOMAINS.values():
+                session.mount(endpoint_domain, requests.adapters.HTTPAdapter(max_retries=self.MAX_HTTP_RETRIES))
+        return session
+
     def _run(self, reactants, products):
         """ Low level interface to use Ezyme to predict the first three digits of the EC number of a reaction.
 
@@ -68,25 +280,34 @@ class Ezyme(data_source.WebserviceDataSource):
         Returns:
             :obj:`list` of :obj:`EzymeResult` or :obj:`None`: ranked list of predicted EC numbers and their scores
                 or :obj:`None` if one or more participant doesn't have a defined structure
+
+        Raises:
+            :obj:`requests.exceptions.RequestException`: if Ezyme can't be reached, times out, or returns an error
+            :obj:`ValueError`: if Ezyme's response doesn't contain the location of the results
         """
         # return `None` if one or more participant doesn't have a defined structure
         if not all(reactants) or not all(products):
             return None
 
+        session = self.get_requests_session()
+
         # Request Ezyme to predict the EC number
-        response = self.requests_session.post(self.REQUEST_URL, data={
+        response = session.post(self.REQUEST_URL, data={
             'QUERY_MODE': 'MULTI',
             'S_MOLTEXT': reactants,
             'P_MOLTEXT': products,
-        })
+        }, timeout=self.request_timeout)
         response.raise_for_status()
-        file = re.findall('<input type=hidden name=file value="(.*?)">', response.text)[0]
+        files = re.findall('<input type=hidden name=file value="(.*?)">', response.text)
+        if not files:
+            raise ValueError('Ezyme did not return the location of the results')
+        file = files[0]
 
         # retrieve the predicted EC number(s)
-        response = self.requests_session.post(self.RETRIEVAL_URL, data={
+        response = session.post(self.RETRIEVAL_URL, data={
             'file': file,
             'name': ''.join(':' + str(i) for i, c in enumerate(itertools.chain(reactants, products)))
-        })
+        }, timeout=self.request_timeout)
         response.raise_for_status()
         results = re.findall(
             '<td align=center><a href="{}{}">[0-9]+\.[0-9]+\.[0-9]+</a></td>\n<td align=center>([0-9\.]+)</td>'.format(
@@ -111,3 +332,60 @@ class EzymeResult(object):
         """
         self.ec_number = ec_number
         self.score = score
+
+
+class LocalEzyme(Ezyme):
+    """ Stand-in for Ezyme which predicts EC numbers from a dictionary, e.g. to test without submitting reactions to
+    Ezyme
+
+    Attributes:
+        predictions (:obj:`dict`): dictionary which maps the keys of reactions (see :obj:`Ezyme.get_key`) to their
+            predictions
+        submitted (:obj:`list` of :obj:`list`): pairs of the reactions which have been submitted
+    """
+
+    def __init__(self, predictions=None, cache_filename=None, max_concurrent_requests=EZYME_MAX_CONCURRENT_REQUESTS):
+        """
+        Args:
+            predictions (:obj:`dict`, optional): dictionary which maps the keys of reactions to their predictions
+            cache_filename (:obj:`str`, optional): path to the SQLite database which persists the predictions
+            max_concurrent_requests (:obj:`int`, optional): maximum number of reactions to submit at once
+        """
+        super(LocalEzyme, self).__init__(cache_filename=cache_filename,
+                                         max_concurrent_requests=max_concurrent_requests)
+        self.predictions = predictions or {}
+        self.submitted = []
+
+    def predict(self, pairs):
+        """ Get the predictions of a reaction from :obj:`predictions`
+
+        Args:
+            pairs (:obj:`list` of :obj:`list` of :obj:`str`): structure of the reactant and product (or an empty
+                string) of each pair
+
+        Returns:
+            :obj:`list` of :obj:`EzymeResult`: ranked list of predicted EC numbers and their scores
+        """
+        self.submitted.append(pairs)
+        return list(self.predictions.get(json.dumps(pairs), []))
+
+
+_ezymes = {}
+_ezymes_lock = threading.Lock()
+
+
+def get_ezyme(cache_dirname=None):
+    """ Get the process-wide Ezyme client which persists its predictions in a directory
+
+    Args:
+        cache_dirname (:obj:`str`, optional): directory to persist the predictions in; defaults to
+            :obj:`DATA_CACHE_DIR`
+
+    Returns:
+        :obj:`Ezyme`: Ezyme client
+    """
+    filename = os.path.join(cache_dirname or DATA_CACHE_DIR, EZYME_CACHE_FILENAME)
+    with _ezymes_lock:
+        if filename not in _ezymes:
+            _ezymes[filename] = Ezyme(cache_filename=filename)
+        return _ezymes[filename]
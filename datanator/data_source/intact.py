@@ -9,6 +9,7 @@
 
 from ftplib import FTP
 from datanator.core import data_source
+from datanator.util.constants import INTACT_INTERACTION_CHUNK_SIZE
 from six import BytesIO
 from sqlalchemy import Column, Integer, String
 import glob
@@ -86,7 +87,13 @@ class ProteinComplex(Base):
 
 
 class IntAct(data_source.FtpDataSource):
-    """ A local SQLite copy of the IntAct database """
+    """ A local SQLite copy of the IntAct database
+
+    Attributes:
+        full_interactions (:obj:`bool`): if :obj:`True`, load all of the interactions (`intact.txt`) rather than
+            only the negative interactions (`intact_negative.txt`)
+        chunk_size (:obj:`int`): number of interactions to parse and insert at once
+    """
     base_model = Base
 
     ENDPOINT_DOMAINS = {
@@ -94,6 +101,45 @@ class IntAct(data_source.FtpDataSource):
         'complextab': 'ftp://ftp.ebi.ac.uk/pub/databases/intact/complex/current/complextab/',
     }
 
+    PSIMITAB_COLUMNS = [
+        '#ID(s) interactor A', 'ID(s) interactor B', 'Alias(es) interactor A', 'Alias(es) interactor B',
+        'Interaction detection method(s)', 'Publication 1st author(s)', 'Publication Identifier(s)',
+        'Interaction type(s)', 'Interaction identifier(s)', 'Confidence value(s)',
+        'Biological role(s) interactor A', 'Biological role(s) interactor B',
+        'Type(s) interactor A', 'Type(s) interactor B',
+        'Feature(s) interactor A', 'Feature(s) interactor B',
+        'Stoichiometry(s) interactor A', 'Stoichiometry(s) interactor B',
+    ]
+
+    def __init__(self, name=None, cache_dirname=None, clear_content=False, load_content=False, max_entries=float('inf'),
+                 commit_intermediate_results=False, download_backups=True, verbose=False,
+                 quilt_owner=None, quilt_package=None,
+                 full_interactions=False, chunk_size=INTACT_INTERACTION_CHUNK_SIZE):
+        """
+        Args:
+            name (:obj:`str`, optional): name
+            cache_dirname (:obj:`str`, optional): directory to store the local copy of the data source
+            clear_content (:obj:`bool`, optional): if :obj:`True`, clear the content of the sqlite local copy of the data source
+            load_content (:obj:`bool`, optional): if :obj:`True`, load the content of the local sqlite database from the external source
+            max_entries (:obj:`float`, optional): maximum number of entries to save locally
+            commit_intermediate_results (:obj:`bool`, optional): if :obj:`True`, commit the changes throughout the loading
+                process. This is particularly helpful for restarting this method when webservices go offline.
+            download_backups (:obj:`bool`, optional): if :obj:`True`, load the local copy of the data source from the Karr Lab server
+            verbose (:obj:`bool`, optional): if :obj:`True`, print status information to the standard output
+            quilt_owner (:obj:`str`, optional): owner of Quilt package to save data
+            quilt_package (:obj:`str`, optional): identifier of Quilt package to save data
+            full_interactions (:obj:`bool`, optional): if :obj:`True`, load all of the interactions (`intact.txt`)
+                rather than only the negative interactions (`intact_negative.txt`)
+            chunk_size (:obj:`int`, optional): number of interactions to parse and insert at once
+        """
+        self.full_interactions = full_interactions
+        self.chunk_size = chunk_size
+        super(IntAct, self).__init__(name=name, cache_dirname=cache_dirname, clear_content=clear_content,
+                                     load_content=load_content, max_entries=max_entries,
+                                     commit_intermediate_results=commit_intermediate_results,
+                                     download_backups=download_backups, verbose=verbose,
+                                     quilt_owner=quilt_owner, quilt_package=quilt_package)
+
     def get_paths_to_backup(self, download=False):
         """ Get a list of the files to backup/unpack
 
@@ -141,9 +187,10 @@ class IntAct(data_source.FtpDataSource):
                     ftp.retrbinary('RETR ' + rel_filename, file.write)
 
         ftp.cwd('/pub/databases/intact/current/psimitab/')
-        local_filename = os.path.join(self.cache_dirname, 'intact', 'psimitab', 'intact_negative.txt')
+        rel_filename = os.path.basename(self.get_psimitab_filename())
+        local_filename = self.get_psimitab_filename()
         with open(local_filename, 'wb') as file:
-            ftp.retrbinary('RETR ' + 'intact_negative.txt', file.write)
+            ftp.retrbinary('RETR ' + rel_filename, file.write)
 
         ftp.quit()
 
@@ -164,32 +211,131 @@ class IntAct(data_source.FtpDataSource):
             relabeled_data = relabeled_data.set_index('identifier')
             relabeled_data.to_sql(name='Protein_Complex', con=self.engine, if_exists='append')
 
+    def get_psimitab_filename(self):
+        """ Get the path to the local copy of the PSI-MI TAB file of interactions
+
+        Returns:
+            :obj:`str`: path to the PSI-MI TAB file
+        """
+        if self.full_interactions:
+            rel_filename = 'intact.zip'
+        else:
+            rel_filename = 'intact_negative.txt'
+        return os.path.join(self.cache_dirname, 'intact', 'psimitab', rel_filename)
+
     def add_interactions(self):
-        """ Parse interactions from data and add interactions to SQLite database """
-        data = pandas.read_csv(os.path.join(self.cache_dirname, 'intact', 'psimitab', 'intact_negative.txt'),
-                               delimiter='\t', encoding='utf-8')
-        for index, row in data.iterrows():
-            if index == self.max_entries:
+        """ Parse interactions from data and add interactions to SQLite database. The PSI-MI TAB file is read and
+        inserted in chunks of :obj:`chunk_size` interactions so that the memory usage doesn't depend on the size
+        of the file.
+        """
+        filename = self.get_psimitab_filename()
+        if filename.endswith('.zip'):
+            with zipfile.ZipFile(filename) as zip_file:
+                with zip_file.open('intact.txt') as file:
+                    self.add_interactions_from_file(file)
+        else:
+            with open(filename, 'rb') as file:
+                self.add_interactions_from_file(file)
+
+    def add_interactions_from_file(self, file):
+        """ Parse interactions from a PSI-MI TAB file and add them to the SQLite database
+
+        Args:
+            file (:obj:`file`): PSI-MI TAB file
+        """
+        n_interactions = 0
+        chunks = pandas.read_csv(file, delimiter='\t', encoding='utf-8', usecols=self.PSIMITAB_COLUMNS,
+                                 dtype=str, na_filter=False, chunksize=self.chunk_size)
+        for chunk in chunks:
+            if n_interactions + len(chunk) > self.max_entries:
+                chunk = chunk.iloc[0:int(self.max_entries - n_interactions)]
+
+            self.session.bulk_insert_mappings(ProteinInteraction, self.parse_interactions(chunk))
+            if self.commit_intermediate_results:
+                self.session.commit()
+
+            n_interactions += len(chunk)
+            if n_interactions >= self.max_entries:
                 break
 
-            interaction = ProteinInteraction()
-            interaction.protein_a, interaction.gene_a = self.find_protein_gene(row['#ID(s) interactor A'], row['Alias(es) interactor A'])
-            interaction.protein_b, interaction.gene_b = self.find_protein_gene(row['ID(s) interactor B'], row['Alias(es) interactor B'])
-            interaction.interaction_type = self.find_between_psi_mi_parentheses(row['Interaction type(s)'])
-            interaction.method = self.find_between_psi_mi_parentheses(row['Interaction detection method(s)'])
-            interaction.type_a = self.find_between_psi_mi_parentheses(row['Type(s) interactor A'])
-            interaction.type_b = self.find_between_psi_mi_parentheses(row['Type(s) interactor B'])
-            interaction.role_a = self.find_between_psi_mi_parentheses(row['Biological role(s) interactor A'])
-            interaction.role_b = self.find_between_psi_mi_parentheses(row['Biological role(s) interactor B'])
-            interaction.feature_a = row['Feature(s) interactor A']
-            interaction.feature_b = row['Feature(s) interactor B']
-            interaction.stoich_a = row['Stoichiometry(s) interactor A']
-            interaction.stoich_b = row['Stoichiometry(s) interactor B']
-            interaction.interaction_id = row['Interaction identifier(s)']
-            interaction.publication = self.find_pubmed_id(row['Publication Identifier(s)'])
-            interaction.publication_author = row['Publication 1st author(s)']
-            interaction.confidence = row['Confidence value(s)']
-            self.session.add(interaction)
+    def parse_interactions(self, chunk):
+        """ Parse a chunk of the rows of a PSI-MI TAB file
+
+        Args:
+            chunk (:obj:`pandas.DataFrame`): rows of a PSI-MI TAB file
+
+        Returns:
+            :obj:`list` of :obj:`dict`: list of the attributes of each interaction
+        """
+        interactions = pandas.DataFrame(index=chunk.index)
+        interactions['protein_a'] = self.find_proteins(chunk['#ID(s) interactor A'], chunk['Alias(es) interactor A'])
+        interactions['protein_b'] = self.find_proteins(chunk['ID(s) interactor B'], chunk['Alias(es) interactor B'])
+        interactions['gene_a'] = self.find_genes(chunk['Alias(es) interactor A'])
+        interactions['gene_b'] = self.find_genes(chunk['Alias(es) interactor B'])
+        interactions['interaction_type'] = self.find_all_between_psi_mi_parentheses(chunk['Interaction type(s)'])
+        interactions['method'] = self.find_all_between_psi_mi_parentheses(chunk['Interaction detection method(s)'])
+        interactions['type_a'] = self.find_all_between_psi_mi_parentheses(chunk['Type(s) interactor A'])
+        interactions['type_b'] = self.find_all_between_psi_mi_parentheses(chunk['Type(s) interactor B'])
+        interactions['role_a'] = self.find_all_between_psi_mi_parentheses(chunk['Biological role(s) interactor A'])
+        interactions['role_b'] = self.find_all_between_psi_mi_parentheses(chunk['Biological role(s) interactor B'])
+        interactions['feature_a'] = chunk['Feature(s) interactor A']
+        interactions['feature_b'] = chunk['Feature(s) interactor B']
+        interactions['stoich_a'] = chunk['Stoichiometry(s) interactor A']
+        interactions['stoich_b'] = chunk['Stoichiometry(s) interactor B']
+        interactions['interaction_id'] = chunk['Interaction identifier(s)']
+        interactions['publication'] = self.find_pubmed_ids(chunk['Publication Identifier(s)'])
+        interactions['publication_author'] = chunk['Publication 1st author(s)']
+        interactions['confidence'] = chunk['Confidence value(s)']
+
+        interactions = interactions.astype(object).where(interactions.notnull(), None)
+        return interactions.to_dict('records')
+
+    def find_proteins(self, interactors, aliases):
+        """ Vectorized version of :obj:`find_protein_gene` which parses the protein identifiers of interactors
+
+        Args:
+            interactors (:obj:`pandas.Series`): key-value pairs of interactors
+            aliases (:obj:`pandas.Series`): key-value pairs of the aliases of the interactors
+
+        Returns:
+            :obj:`pandas.Series`: protein identifiers
+        """
+        uniprot_ids = interactors.str.extract(r'^[^:]*:([^:]*)', expand=False)
+        display_names = aliases.str.extract(r'psi-mi:(.*?)\(display_short\)', expand=False)
+        return uniprot_ids.where(interactors.str.contains('uniprotkb', regex=False), display_names)
+
+    def find_genes(self, aliases):
+        """ Vectorized version of :obj:`find_protein_gene` which parses the gene identifiers of interactors
+
+        Args:
+            aliases (:obj:`pandas.Series`): key-value pairs of the aliases of the interactors
+
+        Returns:
+            :obj:`pandas.Series`: gene identifiers
+        """
+        return aliases.str.findall(r'(?:^|\|)[^|]*?uniprotkb:([^|]*?)\(gene name\)').str[-1]
+
+    def find_pubmed_ids(self, strings):
+        """ Vectorized version of :obj:`find_pubmed_id`
+
+        Args:
+            strings (:obj:`pandas.Series`): key-value pairs of publication types-identifiers
+
+        Returns:
+            :obj:`pandas.Series`: PubMed identifiers
+        """
+        return strings.str.extract(r'(?:^|\|)(?=[^|]*pubmed:)[^:|]*:([^:|]*)', expand=False)
+
+    def find_all_between_psi_mi_parentheses(self, strings):
+        """ Vectorized version of :obj:`find_between_psi_mi_parentheses`
+
+        Args:
+            strings (:obj:`pandas.Series`): strings
+
+        Returns:
+            :obj:`pandas.Series`: substrings between the first pair of parentheses of each psi-mi key-value pair
+        """
+        return strings.str.extract(r'\(([^)]*)\)', expand=False).where(strings.str.contains('psi-mi:', regex=False))
 
     def find_protein_gene(self, interactor, alias):
         """ Parse the protein and gene identifiers from key-value pairs of interactors and their aliases
@@ -16,10 +16,10 @@ from sqlalchemy import create_engine, ForeignKey, exists, Column, Integer, Strin
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref, sessionmaker
 from datanator.core import data_source
+from datanator.util.constants import PAX_PARSE_WINDOW_SIZE
+import multiprocessing
 import os
 import zipfile
-from operator import itemgetter
-from six import BytesIO
 import shutil
 import pandas as pd
 
@@ -120,10 +120,132 @@ def find_files(path):
     return data_files
 
 
+""" ------------------------- Method for Parsing Files -------------------------------"""
+def parse_dataset_header(lines):
+    """ Parse the metadata of a dataset from the header of its file
+
+    Args:
+        lines (:obj:`list` of :obj:`str`): first 12 lines of the file
+
+    Returns:
+        :obj:`dict`: species name, score, weight, publication, organ, and coverage of the dataset
+
+    Raises:
+        :obj:`ValueError`: if a field of the header is invalid
+    """
+    # Get species name
+    field_name, _, _ = lines[1].partition(':')
+    if field_name != '#name':
+        raise ValueError('invalid #name field')
+    start = lines[1].find(':')+2
+    finish = lines[1].find('-')-1
+    species_name = lines[1][start:finish]
+
+    # Get score
+    field_name, _, _ = lines[2].partition(':')
+    if field_name != '#score':
+        raise ValueError('invalid #score field')
+    finish = len(lines[2])-1
+    score = float(lines[2][8:finish])
+
+    # Get weight
+    field_name, _, _ = lines[3].partition(':')
+    if field_name != '#weight':
+        raise ValueError('invalid #weight field')
+    finish = lines[3].find('%')
+    if finish == -1:
+        weight = None
+    else:
+        weight = float(lines[3][9:finish])
+
+    # Get publication link
+    field_name, _, _ = lines[4].partition(':')
+    if field_name != '#description':
+        raise ValueError('invalid #description field')
+    start = lines[4].find('http:')
+    finish = lines[4].find('"', start)
+    publication = lines[4][start:finish]
+
+    # Get organ
+    field_name, _, _ = lines[5].partition(':')
+    if field_name != '#organ':
+        raise ValueError('invalid #organ field')
+    start = lines[5].find(':')+2
+    finish = len(lines[5])-1
+    organ = lines[5][start:finish]
+
+    # Get coverage
+    field_name, _, _ = lines[7].partition(':')
+    if field_name != '#coverage':
+        raise ValueError('invalid #coverage field')
+    start = lines[7].find(':')+2
+    finish = len(lines[7])-1
+    coverage = float(lines[7][start:finish])
+
+    # Check column header
+    column_headers = lines[11].split()
+    if column_headers[0] != '#internal_id' \
+            or column_headers[1] != 'string_external_id' \
+            or column_headers[2] != 'abundance' \
+            or len(column_headers) >= 5:
+        raise ValueError('invalid column headers')
+
+    return {
+        'species_name': species_name,
+        'score': score,
+        'weight': weight,
+        'publication': publication,
+        'organ': organ,
+        'coverage': coverage,
+    }
+
+
+def parse_dataset_file(file_path):
+    """ Parse a PaxDB dataset file. This is a function, rather than a method, so that files can be parsed by a pool
+    of processes.
+
+    Args:
+        file_path (:obj:`str`): path to the file, which is in the directory of its taxon (e.g.
+            `.../882/882-Desulfo_Form_Exp_SC_zhang_2006.txt`)
+
+    Returns:
+        :obj:`tuple`:
+
+            * :obj:`dict`: metadata of the dataset, or :obj:`None` if the header of the file is invalid
+            * :obj:`pandas.DataFrame`: internal id, STRING id, and abundance of each protein, or the error message if
+              the header of the file is invalid
+    """
+    dirname, basename = os.path.split(file_path)
+    file_name = os.path.basename(dirname) + '/' + basename
+
+    with open(file_path, 'r') as f:
+        lines = [f.readline() for i_line in range(12)]
+
+        try:
+            metadata = parse_dataset_header(lines)
+        except ValueError as error:
+            return (None, str(error))
+
+        metadata['ncbi_id'] = int(file_name.partition('/')[0])
+        metadata['file_name'] = file_name
+
+        try:
+            observations = pd.read_csv(f, sep=r'\s+', header=None, usecols=[0, 1, 2],
+                                       names=['protein_id', 'string_id', 'abundance'],
+                                       dtype={'protein_id': int, 'string_id': str, 'abundance': str})
+        except pd.errors.EmptyDataError:
+            observations = pd.DataFrame(columns=['protein_id', 'string_id', 'abundance'])
+
+    return (metadata, observations)
+
+
 """ ----------------------------- Pax DB Class  ---------------------------------"""
 class Pax(data_source.HttpDataSource):
     """ A local sqlite copy of the Pax database
 
+    Attributes:
+        processes (:obj:`int`): number of processes to parse the dataset files with
+        parse_window_size (:obj:`int`): maximum number of parsed dataset files to hold in memory at once
     """
 
     base_model = Base
@@ -132,202 +254,139 @@ class Pax(data_source.HttpDataSource):
         'pax_protein': 'http://pax-db.org/downloads/latest/paxdb-uniprot-links-v4.1.zip'
     }
 
+    def __init__(self, name=None, cache_dirname=None, clear_content=False, load_content=False, max_entries=float('inf'),
+                 commit_intermediate_results=False, download_backups=True, verbose=False,
+                 clear_requests_cache=False, download_request_backup=False,
+                 quilt_owner=None, quilt_package=None,
+                 processes=None, parse_window_size=PAX_PARSE_WINDOW_SIZE):
+        """
+        Args:
+            name (:obj:`str`, optional): name
+            cache_dirname (:obj:`str`, optional): directory to store the local copy of the data source and the HTTP requests cache
+            clear_content (:obj:`bool`, optional): if :obj:`True`, clear the content of the sqlite local copy of the data source
+            load_content (:obj:`bool`, optional): if :obj:`True`, load the content of the local sqlite database from the external source
+            max_entries (:obj:`float`, optional): maximum number of entries to save locally
+            commit_intermediate_results (:obj:`bool`, optional): if :obj:`True`, commit the changes throughout the loading
+                process. This is particularly helpful for restarting this method when webservices go offline.
+            download_backups (:obj:`bool`, optional): if :obj:`True`, load the local copy of the data source from the Karr Lab server
+            verbose (:obj:`bool`, optional): if :obj:`True`, print status information to the standard output
+            clear_requests_cache (:obj:`bool`, optional): if :obj:`True`, clear the HTTP requests cache
+            download_request_backup (:obj:`bool`, optional): if :obj:`True`, download the request backup
+            quilt_owner (:obj:`str`, optional): owner of Quilt package to save data
+            quilt_package (:obj:`str`, optional): identifier of Quilt package to save data
+            processes (:obj:`int`, optional): number of processes to parse the dataset files with; defaults to the
+                number of CPUs
+            parse_window_size (:obj:`int`, optional): maximum number of parsed dataset files to hold in memory at once
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.parse_window_size = parse_window_size
+        super(Pax, self).__init__(name=name, cache_dirname=cache_dirname, clear_content=clear_content,
+                                  load_content=load_content, max_entries=max_entries,
+                                  commit_intermediate_results=commit_intermediate_results,
+                                  download_backups=download_backups, verbose=verbose,
+                                  clear_requests_cache=clear_requests_cache,
+                                  download_request_backup=download_request_backup,
+                                  quilt_owner=quilt_owner, quilt_package=quilt_package)
+
     def load_content(self):
         """ Collects and Parses all data from Pax DB website and adds to SQLlite DB
 
-        Args:
-            req (:obj:`requests object`): Requests session object
+        The archives are streamed to the cache directory, the dataset files are parsed by a pool of processes, the
+        STRING ids of the proteins are mapped to UniProt ids with a join against the PaxDB-UniProt links, and the
+        proteins and observations of each dataset are bulk inserted.
         """
 
-        database_url = self.ENDPOINT_DOMAINS['pax']
-        protein_conversion_url = self.ENDPOINT_DOMAINS['pax_protein']
-        req = self.requests_session
-
-        # Extract All Main Files and Save to Cache Directory
-        response = req.get(database_url)
-        z = zipfile.ZipFile(BytesIO(response.content))
-        z.extractall(self.cache_dirname)
+        # Download and Extract All Main Files to Cache Directory
+        archive_filename = os.path.join(self.cache_dirname, 'paxdb-abundance-files-v4.1.zip')
+        self.download_file(self.ENDPOINT_DOMAINS['pax'], archive_filename)
+        with zipfile.ZipFile(archive_filename) as z:
+            z.extractall(self.cache_dirname)
         self.cwd = self.cache_dirname+'/paxdb-abundance-files-v4.1'
-        shutil.rmtree(self.cwd+'/paxdb-abundance-files-v4.1')
+        shutil.rmtree(self.cwd+'/paxdb-abundance-files-v4.1', ignore_errors=True)
         self.data_files = find_files(self.cwd)
 
-        # Extract All Protein Relation Files and Save to Cache Directory
-        response = req.get(protein_conversion_url)
-        z = zipfile.ZipFile(BytesIO(response.content))
-        z.extractall(self.cache_dirname)
+        # Download and Extract All Protein Relation Files to Cache Directory
+        archive_filename = os.path.join(self.cache_dirname, 'paxdb-uniprot-links-v4.1.zip')
+        self.download_file(self.ENDPOINT_DOMAINS['pax_protein'], archive_filename)
+        with zipfile.ZipFile(archive_filename) as z:
+            z.extractall(self.cache_dirname)
         self.cwd_prot = self.cache_dirname+'/paxdb-uniprot-links-v4.1'
 
         # Insert Error Report in Cache
-        new_file = '/report.txt'
         new_path = self.cache_dirname + '/report.txt'
         self.report = open(new_path, 'w+')
         self.report.write('Errors found:\n')
 
-        self.uniprot_pd = pd.read_csv(self.cwd_prot+'/paxdb-uniprot-links-v4.1.tsv',
-                                      delimiter='\t', names=['string_id', 'uniprot_id'], index_col=0)
+        self.uniprot_pd = pd.read_csv(self.cwd_prot+'/paxdb-uniprot-links-v4.1.tsv', delimiter='\t',
+                                      names=['string_id', 'uniprot_id'], dtype=str) \
+            .drop_duplicates('string_id')
 
         # Find data and parse individual files
-        for self.file_id in range(int(self.max_entries)):
-            if self.verbose:
-                print('Processing file_id = '+str(self.file_id+1)+' (out of '+str(int(self.max_entries)) +
-                      '; '+str(round(100*self.file_id/self.max_entries, 2))+'%'+' already done)')
-            self.parse_paxDB_files()
+        n_files = int(min(self.max_entries, len(self.data_files)))
+        file_paths = self.data_files[0:n_files]
+        self.taxa = {}
+        self.protein_ids = set()
+
+        pool = multiprocessing.Pool(min(self.processes, max(n_files, 1)))
+        try:
+            for i_window in range(0, n_files, self.parse_window_size):
+                window = file_paths[i_window:i_window + self.parse_window_size]
+                for self.file_id, (file_path, (metadata, observations)) in enumerate(
+                        zip(window, pool.map(parse_dataset_file, window)), i_window):
+                    if self.verbose:
+                        print('Processing file_id = '+str(self.file_id+1)+' (out of '+str(n_files) +
+                              '; '+str(round(100*self.file_id/n_files, 2))+'%'+' already done)')
+                    if metadata is None:
+                        print('Error found, see reports.txt')
+                        self.report.write('Warning: ' + observations + ', excluding file form DB (file_id=' +
+                                          str(self.file_id)+'; '+os.path.relpath(file_path, self.cwd)+')\n')
+                        continue
+                    self.add_dataset(metadata, observations)
+
+                if self.commit_intermediate_results:
+                    self.session.commit()
+        finally:
+            pool.close()
+            pool.join()
+            self.report.close()
 
         # Commit Session
         if self.verbose:
             print('Finished parsing files, committing to DB.')
         self.session.commit()
 
-    def parse_paxDB_files(self):
-        """ This function parses pax DB files and adds them to the SQL database
-        Attributes:
-            session     (:obj:)     : SQLalchemy object
-            file_id     (:obj:`str`): internal ID of the file
-            data_files  (:obj:`str`): list of the files to be processed
-            data_folder (:obj:`str`): root folder of the database
+    def add_dataset(self, metadata, observations):
+        """ Add a parsed dataset, its proteins, and its observations to the SQL database
+
+        Args:
+            metadata (:obj:`dict`): metadata of the dataset
+            observations (:obj:`pandas.DataFrame`): internal id, STRING id, and abundance of each protein
         """
-        file_path = self.data_files[self.file_id]
-        if self.verbose:
-            print(file_path)
-
-        # Get NCBI taxonomy ID from file name
-        start = file_path.find('/', len(self.cwd)-1)+1
-        finish = file_path.find('/', len(self.cwd)+4)
-        ncbi_id = int(file_path[start:finish])
-
-        # Get file_name
-        start = file_path.find('/', len(self.cwd))+1
-        file_name = file_path[start:]
-
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-
-            # Get species name
-            start = lines[1].find(':')+2
-            finish = lines[1].find('-')-1
-            species_name = lines[1][start:finish]
-
-            field_name, _, _ = lines[1].partition(':')
-            if field_name == '#name':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #name field, excluding file form DB (file_id='+str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Get score
-            finish = len(lines[2])-1
-            score = float(lines[2][8:finish])
-
-            field_name, _, _ = lines[2].partition(':')
-            if field_name == '#score':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #score field, excluding file form DB (file_id='+str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Get weight
-            finish = lines[3].find('%')
-            if finish == -1:
-                weight = None
-            else:
-                weight = float(lines[3][9:finish])
-
-            field_name, _, _ = lines[3].partition(':')
-            if field_name == '#weight':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #weight field, excluding file form DB (file_id=' +
-                                  str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Get publication link
-            start = lines[4].find('http:')
-            finish = lines[4].find('"', start)
-            publication = lines[4][start:finish]
-
-            field_name, _, _ = lines[4].partition(':')
-            if field_name == '#description':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #description field, excluding file form DB (file_id=' +
-                                  str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Get organ
-            start = lines[5].find(':')+2
-            finish = len(lines[5])-1
-            organ = lines[5][start:finish]
-
-            field_name, _, _ = lines[5].partition(':')
-            if field_name == '#organ':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #organ field, excluding file form DB (file_id='+str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Get coverage
-            start = lines[7].find(':')+2
-            finish = len(lines[7])-1
-            coverage = float(lines[7][start:finish])
-
-            field_name, _, _ = lines[7].partition(':')
-            if field_name == '#coverage':
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid #coverage field, excluding file form DB (file_id=' +
-                                  str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            # Check column header
-            column_headers = lines[11].split()
-            if column_headers[0] == '#internal_id' \
-                    and column_headers[1] == 'string_external_id' \
-                    and column_headers[2] == 'abundance' \
-                    and len(column_headers) < 5:
-                pass
-            else:
-                print('Error found, see reports.txt')
-                self.report.write('Warning: invalid column headers, excluding file form DB (file_id=' +
-                                  str(self.file_id)+'; '+file_name+')\n')
-                return
-
-            """ --- Add taxon and database (metadata info) to session ---------- """
-            q = self.session.query(Taxon).filter(Taxon.ncbi_id == ncbi_id)
-            if self.session.query(q.exists()).scalar():
-                taxon = q.first()
-            else:
-                taxon = Taxon(ncbi_id=ncbi_id, species_name=species_name)
+        """ --- Add taxon and database (metadata info) to session ---------- """
+        ncbi_id = metadata['ncbi_id']
+        taxon = self.taxa.get(ncbi_id, None)
+        if taxon is None:
+            taxon = self.session.query(Taxon).get(ncbi_id)
+            if taxon is None:
+                taxon = Taxon(ncbi_id=ncbi_id, species_name=metadata['species_name'])
                 self.session.add(taxon)
-
-            dataset = Dataset(publication=publication, file_name=file_name, score=score, weight=weight, coverage=coverage, taxon=taxon)
-            self.session.add(dataset)
-
-            """ --- Parse individual measurements and add them to DB ----------- """
-            for i in range(11, len(lines)):
-                split_line = lines[i].split()
-                protein_id = split_line[0]
-                string_id = split_line[1]
-                abundance = split_line[2]
-
-                # Insert relevant table entries
-                q = self.session.query(Protein).filter(Protein.protein_id == protein_id)
-                if self.session.query(q.exists()).scalar():
-                    protein = q.first()
-                else:
-                    if string_id in self.uniprot_pd.index.values:
-                        protein = Protein(string_id=string_id, uniprot_id=str(self.uniprot_pd.loc[string_id]))
-                        self.session.add(protein)
-                    else:
-                        protein = Protein(string_id=string_id)
-                        self.session.add(protein)
-
-                observation = Observation(dataset=dataset, abundance=abundance, protein=protein)
-                self.session.add(observation)
-
-        return
+            self.taxa[ncbi_id] = taxon
+
+        dataset = Dataset(publication=metadata['publication'], file_name=metadata['file_name'],
+                          score=metadata['score'], weight=metadata['weight'], coverage=metadata['coverage'],
+                          taxon=taxon)
+        self.session.add(dataset)
+        self.session.flush()
+
+        """ --- Add new proteins and the measurements to DB ----------- """
+        new_proteins = observations[~observations['protein_id'].isin(self.protein_ids)] \
+            .drop_duplicates('protein_id') \
+            .merge(self.uniprot_pd, how='left', on='string_id')
+        new_proteins = new_proteins[['protein_id', 'string_id', 'uniprot_id']]
+        new_proteins = new_proteins.astype(object).where(new_proteins.notnull(), None)
+        self.session.bulk_insert_mappings(Protein, new_proteins.to_dict('records'))
+        self.protein_ids.update(new_proteins['protein_id'])
+
+        observations = observations[['protein_id', 'abundance']].assign(dataset_id=dataset.id)
+        observations = observations.astype(object).where(observations.notnull(), None)
+        self.session.bulk_insert_mappings(Observation, observations.to_dict('records'))
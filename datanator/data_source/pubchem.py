@@ -0,0 +1,270 @@
+""" Resolution of the names of compounds to their PubChem ids and structures
+
+:Date: 2018-09-21
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.core import data_source
+from datanator.util.constants import (DATA_CACHE_DIR, PUBCHEM_CACHE_FILENAME, PUBCHEM_MAX_CONCURRENT_REQUESTS,
+                                      PUBCHEM_MIN_REQUEST_INTERVAL)
+import collections
+import json
+import multiprocessing.pool
+import os
+import pubchempy
+import sqlite3
+import threading
+import time
+import warnings
+
+PubChemCompound = collections.namedtuple('PubChemCompound', ['cid', 'inchi'])
+# :obj:`collections.namedtuple`: id and InChI-encoded structure of a PubChem compound
+
+
+class PubChemBackend(object):
+    """ Backend which looks up compounds by their names with the PubChem REST API
+
+    Attributes:
+        max_tries (:obj:`int`): maximum number of times to try each query before failing
+        try_delay (:obj:`float`): delay in seconds before trying a failed query again
+    """
+
+    def __init__(self, max_tries=10, try_delay=0.25):
+        """
+        Args:
+            max_tries (:obj:`int`, optional): maximum number of times to try each query before failing
+            try_delay (:obj:`float`, optional): delay in seconds before trying a failed query again
+        """
+        self.max_tries = max_tries
+        self.try_delay = try_delay
+
+    def get_compounds(self, name):
+        """ Get the compounds which have a name
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`list` of :obj:`PubChemCompound`: compounds
+
+        Raises:
+            :obj:`pubchempy.PubChemHTTPError`: if PubChem still can't be queried after :obj:`max_tries` tries
+        """
+        for i_try in range(self.max_tries):
+            try:
+                compounds = pubchempy.get_compounds(name, 'name')
+                break
+            except pubchempy.PubChemHTTPError:
+                if i_try < self.max_tries - 1:
+                    # sleep to avoid overloading the PubChem server and then try again
+                    time.sleep(self.try_delay)
+                else:
+                    raise
+
+        return [PubChemCompound(cid=compound.cid, inchi=compound.inchi) for compound in compounds]
+
+
+class LocalPubChemBackend(object):
+    """ Backend which looks up compounds in a dictionary, e.g. to test without querying PubChem
+
+    Attributes:
+        compounds (:obj:`dict`): dictionary which maps names to lists of :obj:`PubChemCompound`
+        names (:obj:`list` of :obj:`str`): names which have been looked up
+    """
+
+    def __init__(self, compounds=None):
+        """
+        Args:
+            compounds (:obj:`dict`, optional): dictionary which maps names to lists of :obj:`PubChemCompound`
+        """
+        self.compounds = compounds or {}
+        self.names = []
+
+    def get_compounds(self, name):
+        """ Get the compounds which have a name
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`list` of :obj:`PubChemCompound`: compounds
+        """
+        self.names.append(name)
+        return list(self.compounds.get(name, []))
+
+
+class PubChemNameResolver(object):
+    """ Resolves the names of compounds to PubChem compounds
+
+    The compounds of each name are cached in memory and, optionally, in a SQLite database, which persists them
+    across processes and runs. Names which don't match any compound are also cached. Names which aren't cached are
+    resolved concurrently by a pool of threads, which wait at least :obj:`min_request_interval` between the starts
+    of their queries. Each name is cached as soon as it has been resolved, and names which can't be resolved are
+    skipped with a warning and aren't cached, so that they are tried again later.
+
+    Attributes:
+        backend (:obj:`PubChemBackend` or :obj:`LocalPubChemBackend`): backend which looks up the compounds
+        filename (:obj:`str`): path to the SQLite database which persists the compounds, or :obj:`None` to only cache
+            them in memory
+        max_concurrent_requests (:obj:`int`): maximum number of queries to run at once
+        min_request_interval (:obj:`float`): minimum delay in seconds between the starts of queries
+        _cache (:obj:`dict`): dictionary which maps names to their compounds
+        _connection (:obj:`sqlite3.Connection`): connection to the SQLite database
+        _lock (:obj:`threading.RLock`): lock which protects the caches
+        _request_rate_lock (:obj:`threading.Lock`): lock which protects :obj:`_next_request_time`
+        _next_request_time (:obj:`float`): earliest time at which the next query can start
+    """
+
+    SQLITE_MAX_VARIABLES = 999
+    # :obj:`int`: maximum number of parameters of a SQLite query
+
+    def __init__(self, backend=None, filename=None, max_concurrent_requests=PUBCHEM_MAX_CONCURRENT_REQUESTS,
+                 min_request_interval=PUBCHEM_MIN_REQUEST_INTERVAL):
+        """
+        Args:
+            backend (:obj:`PubChemBackend` or :obj:`LocalPubChemBackend`, optional): backend which looks up the
+                compounds; defaults to the PubChem REST API
+            filename (:obj:`str`, optional): path to the SQLite database which persists the compounds
+            max_concurrent_requests (:obj:`int`, optional): maximum number of queries to run at once
+            min_request_interval (:obj:`float`, optional): minimum delay in seconds between the starts of queries
+        """
+        self.backend = backend or PubChemBackend()
+        self.filename = filename
+        self.max_concurrent_requests = max_concurrent_requests
+        self.min_request_interval = min_request_interval
+        self._cache = {}
+        self._connection = None
+        self._lock = threading.RLock()
+        self._request_rate_lock = threading.Lock()
+        self._next_request_time = 0.
+
+        if filename:
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._connection = sqlite3.connect(filename, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS compounds (name TEXT PRIMARY KEY, compounds TEXT)')
+            self._connection.commit()
+
+    def close(self):
+        """ Close the SQLite database """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def resolve(self, name):
+        """ Get the compounds which have a name
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`list` of :obj:`PubChemCompound`: compounds
+        """
+        return self.resolve_many([name])[name]
+
+    def resolve_many(self, names):
+        """ Get the compounds which have each of a list of names
+
+        Args:
+            names (:obj:`list` of :obj:`str`): names
+
+        Returns:
+            :obj:`collections.OrderedDict`: dictionary which maps each name to its list of :obj:`PubChemCompound`;
+            the names which couldn't be resolved map to empty lists
+        """
+        names = list(collections.OrderedDict.fromkeys(names))
+        results = {}
+        with self._lock:
+            for name in names:
+                if name in self._cache:
+                    results[name] = self._cache[name]
+
+            missing = [name for name in names if name not in results]
+            if missing and self._connection is not None:
+                for i_chunk in range(0, len(missing), self.SQLITE_MAX_VARIABLES):
+                    chunk = missing[i_chunk:i_chunk + self.SQLITE_MAX_VARIABLES]
+                    rows = self._connection.execute('SELECT name, compounds FROM compounds WHERE name IN ({})'.format(
+                        ', '.join('?' * len(chunk))), chunk)
+                    for name, compounds in rows:
+                        results[name] = self._cache[name] = [PubChemCompound(*compound)
+                                                             for compound in json.loads(compounds)]
+                missing = [name for name in missing if name not in results]
+
+        if missing:
+            pool = multiprocessing.pool.ThreadPool(min(self.max_concurrent_requests, len(missing)))
+            try:
+                for name, name_compounds, error in pool.imap_unordered(self.try_query, missing):
+                    if error is not None:
+                        warnings.warn('Unable to resolve the name {} with PubChem: {}'.format(name, error),
+                                      data_source.DataSourceWarning)
+                        results[name] = []
+                        continue
+
+                    with self._lock:
+                        results[name] = self._cache[name] = name_compounds
+                        if self._connection is not None:
+                            self._connection.execute('INSERT OR REPLACE INTO compounds (name, compounds) VALUES (?, ?)', (
+                                name, json.dumps([list(compound) for compound in name_compounds])))
+                            self._connection.commit()
+            finally:
+                pool.terminate()
+                pool.join()
+
+        return collections.OrderedDict((name, results[name]) for name in names)
+
+    def query(self, name):
+        """ Query the backend for the compounds which have a name, waiting at least :obj:`min_request_interval`
+        since the start of the previous query. This is thread-safe.
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`list` of :obj:`PubChemCompound`: compounds
+        """
+        with self._request_rate_lock:
+            delay = self._next_request_time - time.time()
+            self._next_request_time = max(self._next_request_time, time.time()) + self.min_request_interval
+        if delay > 0:
+            time.sleep(delay)
+        return self.backend.get_compounds(name)
+
+    def try_query(self, name):
+        """ Query the backend for the compounds which have a name, returning rather than raising the error of a
+        failed query so that the other names can still be resolved. This is thread-safe.
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`tuple`: name, its list of :obj:`PubChemCompound` (or :obj:`None` if the query failed), and the
+            error of the query (or :obj:`None` if it succeeded)
+        """
+        try:
+            return (name, self.query(name), None)
+        except Exception as error:
+            return (name, None, error)
+
+
+_name_resolvers = {}
+_name_resolvers_lock = threading.Lock()
+
+
+def get_name_resolver(cache_dirname=None):
+    """ Get the process-wide name resolver which persists its results in a directory
+
+    Args:
+        cache_dirname (:obj:`str`, optional): directory to persist the results in; defaults to
+            :obj:`DATA_CACHE_DIR`
+
+    Returns:
+        :obj:`PubChemNameResolver`: name resolver
+    """
+    filename = os.path.join(cache_dirname or DATA_CACHE_DIR, PUBCHEM_CACHE_FILENAME)
+    with _name_resolvers_lock:
+        if filename not in _name_resolvers:
+            _name_resolvers[filename] = PubChemNameResolver(filename=filename)
+        return _name_resolvers[filename]
@@ -299,24 +299,6 @@ class Refseq(data_source.HttpDataSource):
         return text
 
 
-    def get_or_create_object(self, cls, **kwargs):
-        """ Get the first instance of :obj:`cls` that has the property-values pairs described by kwargs, or create an instance of :obj:`cls`
-        if there is no instance with the property-values pairs described by kwargs
-        Args:
-            cls (:obj:`class`): type of object to find or create
-            **kwargs: values of the properties of the object
-        Returns:
-            :obj:`Base`: instance of :obj:`cls` hat has the property-values pairs described by kwargs
-        """
-        q = self.session.query(cls).filter_by(**kwargs)
-        if self.session.query(q.exists()).scalar():
-            return q.first()
-
-        obj = cls(**kwargs)
-        self.session.add(obj)
-        return obj
-
-
     def find_nth(self, haystack, needle, n):
         start = haystack.find(needle)
         while start >= 0 and n > 1:
@@ -9,7 +9,9 @@
 """
 
 from datanator.core import data_source
+from datanator.data_source import pubchem
 from datanator.util import molecule_util
+from datanator.util.constants import INCHI_NORMALIZATION_CACHE_FILENAME
 from xml import etree
 import Bio.Alphabet
 import Bio.SeqUtils
@@ -20,7 +22,6 @@ import libsbml
 import math
 import os
 import pint
-import pubchempy
 import re
 import requests
 import requests_cache
@@ -29,7 +30,6 @@ import sqlalchemy
 import sqlalchemy.ext.declarative
 import sqlalchemy.orm
 import sys
-import time
 import warnings
 import wc_utils.util.list
 import wc_utils.workbook.core
@@ -321,18 +321,18 @@ class CompoundStructure(Base):
         """
 
         # if necessary, convert structure to InChI
+        normalizer = molecule_util.get_inchi_normalizer()
         if self.format == 'inchi':
             self._value_inchi = self.value
         else:
             try:
-                self._value_inchi = molecule_util.Molecule(structure=self.value).to_inchi() or None
+                self._value_inchi = normalizer.get_inchi(self.value) or None
             except ValueError:
                 self._value_inchi = None
 
         # calculate formula (without hydrogen) and connectivity
         if self._value_inchi:
-            self._value_inchi_formula_connectivity = molecule_util.InchiMolecule(self._value_inchi) \
-                .get_formula_and_connectivity()
+            self._value_inchi_formula_connectivity = normalizer.get_formula_and_connectivity(self._value_inchi)
 
 
 class Compound(Entry):
@@ -436,8 +436,6 @@ class SabioRk(data_source.HttpDataSource):
         ENDPOINT_COMPOUNDS_PAGE (:obj:`str`): URL to download information about a SABIO-RK compound
         SKIP_KINETIC_LAW_IDS (:obj:`tuple` of :obj:`int`): IDs of kinetic laws that should be skipped (because they cannot contained
             errors and can't be downloaded from SABIO)
-        PUBCHEM_MAX_TRIES (:obj:`int`): maximum number of times to time querying PubChem before failing
-        PUBCHEM_TRY_DELAY (:obj:`float`): delay in seconds between PubChem queries (to delay overloading the server)
     """
 
     base_model = Base
@@ -451,8 +449,6 @@ class SabioRk(data_source.HttpDataSource):
     ENDPOINT_COMPOUNDS_PAGE = ENDPOINT_DOMAINS['sabio_rk'] + '/compdetails.jsp'
     ENDPOINT_KINETIC_LAWS_PAGE = ENDPOINT_DOMAINS['sabio_rk'] + '/kindatadirectiframe.jsp'
     SKIP_KINETIC_LAW_IDS = (51286,)
-    PUBCHEM_MAX_TRIES = 10
-    PUBCHEM_TRY_DELAY = 0.25
 
     def __init__(self, name=None, cache_dirname=None, clear_content=False, load_content=False, max_entries=float('inf'),
                  commit_intermediate_results=False, download_backups=True, verbose=False,
@@ -578,6 +574,16 @@ class SabioRk(data_source.HttpDataSource):
         if self.verbose:
             print('Calculating searchable structures for {} structures ...'.format(len(compound_structures)))
 
+        # normalize all of the structures at once, reusing the structures normalized by previous runs
+        normalizer = molecule_util.get_inchi_normalizer(
+            os.path.join(self.cache_dirname, INCHI_NORMALIZATION_CACHE_FILENAME))
+        inchis = [compound_structure.value for compound_structure in compound_structures
+                  if compound_structure.format == 'inchi' and compound_structure.value]
+        inchis.extend(inchi for inchi in normalizer.get_inchis([
+            compound_structure.value for compound_structure in compound_structures
+            if compound_structure.format != 'inchi' and compound_structure.value]) if inchi)
+        normalizer.get_formulas_and_connectivities(inchis)
+
         for i_compound_structure, compound_structure in enumerate(compound_structures):
             if self.verbose and (i_compound_structure % 100 == 0):
                 print('  Calculating searchable structure for compound {} of {}'.format(
@@ -671,19 +677,21 @@ class SabioRk(data_source.HttpDataSource):
         session = self.requests_session
 
         batch_size = self.webservice_batch_size
+        batches = [ids[i_batch * batch_size:min((i_batch + 1) * batch_size, len(ids))]
+                   for i_batch in range(int(math.ceil(float(len(ids)) / batch_size)))]
+
+        # download the batches concurrently, and parse and store them in order
+        responses = self.iter_requests((self.ENDPOINT_WEBSERVICE, {
+            'kinlawids': ','.join(str(id) for id in batch_ids),
+        }) for batch_ids in batches)
 
-        for i_batch in range(int(math.ceil(float(len(ids)) / batch_size))):
+        for i_batch, (batch_ids, response) in enumerate(six.moves.zip(batches, responses)):
             if self.verbose and (i_batch % max(1, 100. / batch_size) == 0):
                 print('  Downloading kinetic laws {}-{} of {} in SBML format'.format(
                     i_batch * batch_size + 1,
                     min(len(ids), i_batch * batch_size + max(100, batch_size)),
                     len(ids)))
 
-            batch_ids = ids[i_batch * batch_size:min((i_batch + 1) * batch_size, len(ids))]
-            response = session.get(self.ENDPOINT_WEBSERVICE, params={
-                'kinlawids': ','.join(str(id) for id in batch_ids),
-            })
-
             response.raise_for_status()
             if not response.text:
                 cache = session.cache
@@ -1282,12 +1290,7 @@ class SabioRk(data_source.HttpDataSource):
                         resources = [(parsed_url[2], parsed_url[3])]
 
                 for namespace, id in resources:
-                    query = self.session.query(Resource).filter_by(namespace=namespace, id=id)
-                    if query.count():
-                        resource = query.first()
-                    else:
-                        resource = Resource(namespace=namespace, id=id)
-                        self.session.add(resource)
+                    resource = self.get_or_create_object(Resource, namespace=namespace, id=id)
 
                 if resource not in x_refs:
                     x_refs.append(resource)
@@ -1347,27 +1350,30 @@ class SabioRk(data_source.HttpDataSource):
         session = self.requests_session
 
         batch_size = self.excel_batch_size
-
-        for i_batch in range(int(math.ceil(float(len(ids)) / batch_size))):
+        batches = [ids[i_batch * batch_size:min((i_batch + 1) * batch_size, len(ids))]
+                   for i_batch in range(int(math.ceil(float(len(ids)) / batch_size)))]
+
+        # download the batches concurrently, and parse and store them in order
+        responses = self.iter_requests((self.ENDPOINT_EXCEL_EXPORT, {
+            'entryIDs[]': batch_ids,
+            'fields[]': [
+                'EntryID',
+                'KineticMechanismType',
+                'Tissue',
+                'Parameter',
+            ],
+            'preview': False,
+            'format': 'tsv',
+            'distinctRows': 'false',
+        }) for batch_ids in batches)
+
+        for i_batch, (batch_ids, response) in enumerate(six.moves.zip(batches, responses)):
             if self.verbose:
                 print('  Downloading kinetic laws {}-{} of {} in Excel format'.format(
                     i_batch * batch_size + 1,
                     min(len(ids), (i_batch + 1) * batch_size),
                     len(ids)))
 
-            batch_ids = ids[i_batch * batch_size:min((i_batch + 1) * batch_size, len(ids))]
-            response = session.get(self.ENDPOINT_EXCEL_EXPORT, params={
-                'entryIDs[]': batch_ids,
-                'fields[]': [
-                    'EntryID',
-                    'KineticMechanismType',
-                    'Tissue',
-                    'Parameter',
-                ],
-                'preview': False,
-                'format': 'tsv',
-                'distinctRows': 'false',
-            })
             response.raise_for_status()
             if not response.text:
                 cache = session.cache
@@ -1577,12 +1583,7 @@ class SabioRk(data_source.HttpDataSource):
                 for node in list(synonym_label_node.parents)[1].find_all('span'):
                     name = node.get_text()
 
-                    q = self.session.query(Synonym).filter_by(name=name)
-                    if q.count():
-                        synonym = q[0]
-                    else:
-                        synonym = Synonym(name=name)
-                        self.session.add(synonym)
+                    synonym = self.get_or_create_object(Synonym, name=name)
 
                     c.synonyms.append(synonym)
 
@@ -1630,12 +1631,7 @@ class SabioRk(data_source.HttpDataSource):
                     namespace = 'None'
                     ValueError('Compound {} has unkonwn cross reference type to namespace {}'.format(c.id, url))
 
-                q = self.session.query(Resource).filter_by(namespace=namespace, id=id)
-                if q.count():
-                    resource = q[0]
-                else:
-                    resource = Resource(namespace=namespace, id=id)
-                    self.session.add(resource)
+                resource = self.get_or_create_object(Resource, namespace=namespace, id=id)
 
                 c.cross_references.append(resource)
 
@@ -1645,7 +1641,7 @@ class SabioRk(data_source.HttpDataSource):
             if self.commit_intermediate_results and (i_compound % 100 == 99):
                 self.session.commit()
 
-    def infer_compound_structures_from_names(self, compounds):
+    def infer_compound_structures_from_names(self, compounds, name_resolver=None):
         """ Try to use PubChem to infer the structure of compounds from their names
 
         Notes: we don't try look up structures from their cross references because SABIO has already gathered
@@ -1653,10 +1649,17 @@ class SabioRk(data_source.HttpDataSource):
 
         Args:
             compounds (:obj:`list` of :obj:`Compound`): list of compounds
+            name_resolver (:obj:`pubchem.PubChemNameResolver`, optional): resolver of the names of compounds;
+                defaults to the shared resolver which caches its results in :obj:`cache_dirname`
         """
         resource_query = self.session.query(Resource)
         structure_query = self.session.query(CompoundStructure)
 
+        if name_resolver is None:
+            name_resolver = pubchem.get_name_resolver(self.cache_dirname)
+        p_compounds_by_name = name_resolver.resolve_many(
+            [compound.name for compound in compounds if compound.name != 'Unknown'])
+
         for i_compound, compound in enumerate(compounds):
             if self.verbose and (i_compound % 100 == 0):
                 print('  Trying to infer the structure of compound {} of {}'.format(i_compound + 1, len(compounds)))
@@ -1664,18 +1667,7 @@ class SabioRk(data_source.HttpDataSource):
             if compound.name == 'Unknown':
                 continue
 
-            for i_try in range(self.PUBCHEM_MAX_TRIES):
-                try:
-                    p_compounds = pubchempy.get_compounds(compound.name, 'name')
-                    break
-                except pubchempy.PubChemHTTPError:
-                    if i_try < self.PUBCHEM_MAX_TRIES - 1:
-                        # sleep to avoid getting overloading PubChem server and then try again
-                        time.sleep(self.PUBCHEM_TRY_DELAY)
-                    else:
-                        raise
-
-            for p_compound in p_compounds:
+            for p_compound in p_compounds_by_name[compound.name]:
                 q = resource_query.filter_by(namespace='pubchem.compound', id=str(p_compound.cid))
                 if q.count():
                     resource = q.first()
@@ -0,0 +1,88 @@
+""" Flask application of Datanator, and its database and extensions
+
+The application is created when this module is first imported, which :obj:`datanator` defers until one of
+:obj:`datanator.db`, :obj:`datanator.ma` etc. is accessed, so that modules which don't need the database don't
+pay for importing Flask and SQLAlchemy. The routes of the API are registered by :obj:`datanator.api.server`.
+
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from flask import Flask, render_template
+from flask_login import LoginManager
+from flask_bcrypt import Bcrypt
+from flask_debugtoolbar import DebugToolbarExtension
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_marshmallow import Marshmallow
+from flask_cors import CORS
+import os
+
+
+def create_app(app_settings=None):
+    """ Create a Flask application
+
+    Args:
+        app_settings (:obj:`str`, optional): name of the configuration object; defaults to the value of the
+            `APP_SETTINGS` environment variable
+
+    Returns:
+        :obj:`flask.Flask`: application
+    """
+    app = Flask(
+        'datanator',
+        template_folder='api/client/templates',
+        static_folder='api/client/static'
+    )
+
+    # set config
+    app_settings = app_settings or os.getenv(
+        'APP_SETTINGS', 'datanator.config.config.CircleTestingConfig')
+
+    app.config.from_object(app_settings)
+
+    app.register_error_handler(401, unauthorized_page)
+    app.register_error_handler(404, page_not_found)
+
+    return app
+
+
+def register_blueprints(app):
+    # register blueprints
+    from datanator.api.urls import api_blueprint
+    app.register_blueprint(api_blueprint)
+
+
+def unauthorized_page(error):
+    return render_template('errors/401.html'), 401
+#
+# def forbidden_page(error):
+#     return render_template('errors/403.html'), 403
+#
+def page_not_found(error):
+    return render_template('errors/404.html'), 404
+#
+# def server_error_page(error):
+#     return render_template('errors/500.html'), 500
+
+
+#TODO: Include API Templates
+app = create_app()
+
+login_manager = LoginManager(app)
+bcrypt = Bcrypt(app)
+toolbar = DebugToolbarExtension(app)
+
+db = SQLAlchemy(app)
+ma = Marshmallow(app)
+cors = CORS(app)
+migrate = Migrate(app, db)
+
+# # flask login
+# from app.server.model import User
+# login_manager.login_view = 'user.login'
+# login_manager.login_message_category = 'danger'
+#
+# @login_manager.user_loader
+# def load_user(user_id):
+#     return User.query.filter(User.id == int(user_id)).first()
@@ -1,5 +1,13 @@
-from . import molecule_util
-from . import reaction_util
-from . import rna_seq_util
-from . import taxonomy_util
-from . import warning_util
+from . import import_util
+
+# submodules are imported when they are first accessed
+import_util.make_lazy(__name__, submodules=[
+    'build_util',
+    'constants',
+    'molecule_util',
+    'motif_util',
+    'reaction_util',
+    'rna_seq_util',
+    'taxonomy_util',
+    'warning_util',
+])
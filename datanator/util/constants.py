@@ -3,12 +3,50 @@ import pkg_resources
 
 ## Paths
 DATA_CACHE_DIR = os.path.expanduser(os.path.join('~', '.wc', 'data', 'datanator'))
+NCBI_TAXONOMY_INDEX_DIR = os.path.join(DATA_CACHE_DIR, 'ncbi_taxonomy_index')
 
 ## Endpoints
 CURRENT_VERSION_ENDPOINT = '/v0'
 
 # Speed Contstants
 METABOLITE_REACTION_LIMIT = 5
+OBJECT_CACHE_MAX_SIZE = 500000
+OBJECT_MERGE_CHUNK_SIZE = 500
+BUILD_STAGE_POLL_INTERVAL = 0.5
+API_RESPONSE_CACHE_MAX_SIZE = 1000
+API_RESPONSE_CACHE_VERSION_CHECK_INTERVAL = 5.
+IMPORT_PROFILE_N_MODULES = 25
+API_BATCH_MAX_SIZE = 1000
+HTTP_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Search Constants
+SEARCH_REGCONFIG = 'pg_catalog.english'
+SEARCH_RANK_PRECISION = 6
+SEARCH_PAGE_SIZE = 100
+SEARCH_REACTION_LIMIT = 100
+
+# Motif Scanning Constants
+PWM_SCAN_MIN_SCORE = 2.
+PWM_SCAN_WINDOW_SIZE = 10000
+PWM_SCORE_DISTRIBUTION_PRECISION = 0.01
+
+# EC Number Constants
+EC_NUMBER_LEVELS = 4
+
+# Structure Normalization Constants
+INCHI_NORMALIZATION_CACHE_FILENAME = 'InchiNormalization.sqlite'
+INCHI_NORMALIZATION_CACHE_SIZE = 100000
+INCHI_NORMALIZATION_POOL_MIN_SIZE = 1000
+
+# PubChem Constants
+PUBCHEM_CACHE_FILENAME = 'PubChemNames.sqlite'
+PUBCHEM_MAX_CONCURRENT_REQUESTS = 4
+PUBCHEM_MIN_REQUEST_INTERVAL = 0.2
+
+# Ezyme Constants
+EZYME_CACHE_FILENAME = 'EzymePredictions.sqlite'
+EZYME_MAX_CONCURRENT_REQUESTS = 4
+EZYME_REQUEST_TIMEOUT = 60.
 
 # Common Schema Constants
 DATA_DUMP_PATH = os.path.join(DATA_CACHE_DIR , 'CommonSchema.sql')
@@ -31,5 +69,10 @@ SABIO_TEST_BATCH = 100
 PAX_BUILD_BATCH = 300
 INTACT_INTERACTION_BUILD_BATCH = 100000
 ARRAY_EXPRESS_BUILD_BATCH = 1000
+ARRAY_EXPRESS_HARVEST_CHECKPOINT_INTERVAL = 100
 SABIO_BUILD_BATCH = 100000
 INTACT_INTERACTION_BUILD_SUB_BATCH = 5000
+INTACT_INTERACTION_CHUNK_SIZE = 10000
+PAX_PARSE_WINDOW_SIZE = 16
+UNIPROT_BUILD_CHUNK_SIZE = 100000
+SOURCE_RECORD_FINGERPRINT_CHUNK_SIZE = 10000
@@ -0,0 +1,72 @@
+""" Utilities for comparing EC numbers by the classes which they belong to
+
+:Date: 2018-09-20
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util.constants import EC_NUMBER_LEVELS
+import threading
+
+_ec_classes = {}
+_ec_classes_lock = threading.Lock()
+
+
+def get_ec_classes(ec_number):
+    """ Get the classes of an EC number at each of its levels (e.g. 1, 1.1, 1.1.1, and 1.1.1.1 for 1.1.1.1). The
+    classes of each EC number are only calculated once.
+
+    Args:
+        ec_number (:obj:`str`): EC number
+
+    Returns:
+        :obj:`tuple` of :obj:`str`: class of the EC number at each level, or :obj:`None` for levels which the EC
+        number doesn't have (e.g. the fourth level of 1.1.1 or 1.1.1.)
+    """
+    classes = _ec_classes.get(ec_number, None)
+    if classes is None:
+        parts = ec_number.split('.')
+        classes = []
+        for level in range(1, EC_NUMBER_LEVELS + 1):
+            if len(parts) >= level and parts[level - 1] and classes[-1:] != [None]:
+                classes.append('.'.join(parts[0:level]))
+            else:
+                classes.append(None)
+        classes = tuple(classes)
+        with _ec_classes_lock:
+            _ec_classes[ec_number] = classes
+    return classes
+
+
+def get_ec_level(ec_number):
+    """ Get the number of levels of an EC number
+
+    Args:
+        ec_number (:obj:`str`): EC number
+
+    Returns:
+        :obj:`int`: number of levels
+    """
+    classes = get_ec_classes(ec_number)
+    return EC_NUMBER_LEVELS - classes.count(None)
+
+
+def get_common_ec_level(ec_numbers_1, ec_numbers_2):
+    """ Get the deepest level at which one of a list of EC numbers belongs to the same class as one of another list
+    of EC numbers
+
+    Args:
+        ec_numbers_1 (:obj:`list` of :obj:`str`): EC numbers
+        ec_numbers_2 (:obj:`list` of :obj:`str`): EC numbers
+
+    Returns:
+        :obj:`int`: deepest common level, or 0 if the EC numbers don't share a class
+    """
+    classes_1 = [get_ec_classes(ec_number) for ec_number in ec_numbers_1]
+    classes_2 = [get_ec_classes(ec_number) for ec_number in ec_numbers_2]
+    for i_level in range(EC_NUMBER_LEVELS - 1, -1, -1):
+        level_classes_1 = set(classes[i_level] for classes in classes_1)
+        level_classes_1.discard(None)
+        if level_classes_1 and any(classes[i_level] in level_classes_1 for classes in classes_2):
+            return i_level + 1
+    return 0
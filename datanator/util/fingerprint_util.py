@@ -0,0 +1,75 @@
+""" Fingerprints of the content of the records of source databases, which are used to only integrate the records
+which have changed since the previous build of the common schema
+
+:Date: 2018-09-24
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+import hashlib
+import json
+import sqlalchemy
+
+
+def calc_fingerprint(values):
+    """ Calculate the fingerprint of JSON-serializable values. Values which aren't JSON-serializable (e.g. dates)
+    are serialized as strings.
+
+    Args:
+        values (:obj:`object`): values
+
+    Returns:
+        :obj:`str`: SHA1 digest of the values
+    """
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_column_values(obj, exclude=()):
+    """ Get the values of the columns of a SQLAlchemy object, excluding its primary and foreign keys, which are
+    surrogates of the content of the source databases
+
+    Args:
+        obj (:obj:`object`): SQLAlchemy object
+        exclude (:obj:`list` of :obj:`str`, optional): names of additional attributes to exclude
+
+    Returns:
+        :obj:`dict`: dictionary which maps the names of the attributes of the columns to their values
+    """
+    values = {}
+    for attr in sqlalchemy.inspect(obj).mapper.column_attrs:
+        if attr.key in exclude or any(column.primary_key or column.foreign_keys for column in attr.columns):
+            continue
+        values[attr.key] = getattr(obj, attr.key)
+    return values
+
+
+def get_object_values(obj, paths=(), exclude=()):
+    """ Get the values of the columns of a SQLAlchemy object and of the objects which are related to it
+
+    Args:
+        obj (:obj:`object`): SQLAlchemy object
+        paths (:obj:`list` of :obj:`str`, optional): dot-separated paths of relationships to the related objects
+            (e.g. `reactants.compound`); paths which the object doesn't have are ignored
+        exclude (:obj:`list` of :obj:`str`, optional): names of attributes to exclude
+
+    Returns:
+        :obj:`dict`: dictionary which maps the empty string to the values of the columns of the object, and each path
+        to the sorted values of the columns of the objects at the end of the path
+    """
+    values = {'': get_column_values(obj, exclude=exclude)}
+    for path in paths:
+        objs = [obj]
+        for attr in path.split('.'):
+            related_objs = []
+            for related in objs:
+                related = getattr(related, attr, None)
+                if related is None:
+                    continue
+                if isinstance(related, (list, tuple, set)):
+                    related_objs.extend(related)
+                else:
+                    related_objs.append(related)
+            objs = related_objs
+        values[path] = sorted(json.dumps(get_column_values(related, exclude=exclude), sort_keys=True, default=str)
+                              for related in objs)
+    return values
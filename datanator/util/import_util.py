@@ -0,0 +1,143 @@
+""" Utilities for deferring imports and for profiling the time spent importing modules
+
+:Date: 2018-09-17
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from __future__ import print_function
+from datanator.util.constants import IMPORT_PROFILE_N_MODULES
+import collections
+import importlib
+import re
+import subprocess
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """ Module whose submodules and attributes are only imported when they are first accessed
+
+    Attributes:
+        _lazy_submodules (:obj:`set` of :obj:`str`): names of submodules which are imported on first access
+        _lazy_attributes (:obj:`dict`): dictionary which maps the names of attributes which are imported on first
+            access to the names of the modules which define them
+    """
+
+    def __getattr__(self, name):
+        """ Import a lazy submodule or attribute
+
+        Args:
+            name (:obj:`str`): name of the submodule or attribute
+
+        Returns:
+            :obj:`object`: submodule or value of the attribute
+
+        Raises:
+            :obj:`AttributeError`: if the module doesn't have a submodule or attribute with this name
+        """
+        if name in self.__dict__.get('_lazy_submodules', ()):
+            value = importlib.import_module('.' + name, self.__name__)
+        elif name in self.__dict__.get('_lazy_attributes', {}):
+            value = getattr(importlib.import_module(self._lazy_attributes[name]), name)
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | self._lazy_submodules | set(self._lazy_attributes.keys()))
+
+
+def make_lazy(name, submodules=(), attributes=None):
+    """ Defer the import of the submodules and attributes of a module until they are first accessed. This should be
+    called at the end of the module's :obj:`__init__.py`.
+
+    Args:
+        name (:obj:`str`): name of the module
+        submodules (:obj:`list` of :obj:`str`, optional): names of the submodules
+        attributes (:obj:`dict`, optional): dictionary which maps the names of attributes to the names of the
+            modules which define them
+
+    Returns:
+        :obj:`LazyModule`: module
+    """
+    module = sys.modules[name]
+    module._lazy_submodules = set(submodules)
+    module._lazy_attributes = dict(attributes or {})
+    try:
+        module.__class__ = LazyModule
+    except TypeError:
+        # the class of modules can't be changed in Python 2, so the module is replaced by a lazy copy
+        lazy_module = LazyModule(name, module.__doc__)
+        lazy_module.__dict__.update(module.__dict__)
+        lazy_module._module = module
+        sys.modules[name] = module = lazy_module
+    return module
+
+
+ImportTime = collections.namedtuple('ImportTime', ['module', 'self_time', 'cumulative_time', 'depth'])
+# :obj:`collections.namedtuple`: time spent importing a module (in seconds) and its depth in the import tree
+
+
+def parse_import_times(lines):
+    """ Parse the import times which Python reports with the :obj:`-X importtime` option
+
+    Args:
+        lines (:obj:`list` of :obj:`str`): lines of the standard error of the Python process
+
+    Returns:
+        :obj:`tuple`:
+
+            * :obj:`list` of :obj:`ImportTime`: import time of each module
+            * :obj:`list` of :obj:`str`: the other lines
+    """
+    times = []
+    other_lines = []
+    for line in lines:
+        match = re.match(r'^import time:\s*(\d+) \|\s*(\d+) \|( *)(\S+)\s*$', line)
+        if match:
+            times.append(ImportTime(module=match.group(4),
+                                    self_time=int(match.group(1)) * 1e-6,
+                                    cumulative_time=int(match.group(2)) * 1e-6,
+                                    depth=(len(match.group(3)) - 1) // 2))
+        elif not line.startswith('import time:'):
+            other_lines.append(line)
+    return (times, other_lines)
+
+
+def profile_imports(args, n_modules=IMPORT_PROFILE_N_MODULES, out=None):
+    """ Run Python with arguments :obj:`args`, and report the time it spends importing modules
+
+    Args:
+        args (:obj:`list` of :obj:`str`): arguments to Python (e.g. :obj:`['-m', 'datanator', 'taxonomy']`)
+        n_modules (:obj:`int`, optional): number of the slowest modules to report
+        out (:obj:`file`, optional): stream to write the report to; defaults to standard output
+
+    Returns:
+        :obj:`int`: return code of the Python process
+
+    Raises:
+        :obj:`SystemExit`: if this version of Python can't profile imports
+    """
+    if sys.version_info < (3, 7):
+        raise SystemExit('Profiling imports requires Python 3.7 or later')
+    out = out or sys.stdout
+
+    process = subprocess.Popen([sys.executable, '-X', 'importtime'] + list(args),
+                               stderr=subprocess.PIPE, universal_newlines=True)
+    stderr = process.communicate()[1]
+    times, other_lines = parse_import_times(stderr.splitlines())
+    for line in other_lines:
+        print(line, file=sys.stderr)
+
+    print('', file=out)
+    print('Total import time: {:.3f} s ({} modules)'.format(sum(time.self_time for time in times), len(times)),
+          file=out)
+    print('', file=out)
+    print('{:>10}  {:>10}  {}'.format('Cumulative', 'Self', 'Module'), file=out)
+    print('{:>10}  {:>10}  {}'.format('=' * 10, '=' * 10, '=' * 6), file=out)
+    for time in sorted(times, key=lambda time: -time.cumulative_time)[0:n_modules]:
+        print('{:>10.3f}  {:>10.3f}  {}'.format(time.cumulative_time, time.self_time, time.module), file=out)
+
+    return process.returncode
@@ -7,10 +7,17 @@
 :License: MIT
 """
 
+from datanator.util.constants import INCHI_NORMALIZATION_CACHE_SIZE, INCHI_NORMALIZATION_POOL_MIN_SIZE
 import collections
+import json
+import multiprocessing
+import numpy
 import openbabel
+import os
 import pybel
 import re
+import sqlite3
+import threading
 
 
 class Molecule(object):
@@ -87,9 +94,7 @@ class Molecule(object):
         Returns:
             :obj:`float`: the similarity with the other molecule
         """
-        self_fp = self.get_fingerprint(fingerprint_type)
-        other_fp = other.get_fingerprint(fingerprint_type)
-        return self_fp | other_fp
+        return get_fingerprint_store(fingerprint_type).get_similarity(self.structure, other.structure)
 
     @staticmethod
     def get_fingerprint_types():
@@ -163,6 +168,479 @@ class Molecule(object):
         return self.to_format('can')
 
 
+class FingerprintStore(object):
+    """ Store of the fingerprints of molecules, keyed by their canonical InChI, which calculates Tanimoto similarities
+    between many molecules at once. Each structure is only parsed once per process. Fingerprints are stored as rows
+    of packed bits, which can optionally be saved to and memory-mapped from disk.
+
+    Attributes:
+        fingerprint_type (:obj:`str`): fingerprint type
+        filename (:obj:`str`): path to save the fingerprints (the keys are saved to `filename` + `.json`)
+        keys (:obj:`list` of :obj:`str`): canonical InChI of each row of the fingerprint matrix
+        _key_rows (:obj:`dict`): dictionary which maps canonical InChIs to rows of the fingerprint matrix
+        _structure_keys (:obj:`dict`): dictionary which maps structures to their canonical InChIs
+        _saved_fingerprints (:obj:`numpy.ndarray`): memory-mapped fingerprints loaded from :obj:`filename`
+        _new_fingerprints (:obj:`list` of :obj:`numpy.ndarray`): fingerprints calculated since the store was loaded
+        _fingerprints (:obj:`numpy.ndarray`): concatenation of the saved and new fingerprints
+        _lock (:obj:`threading.RLock`): lock
+    """
+
+    POPCOUNTS = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint16)
+    MAX_BLOCK_SIZE = 2 ** 24
+
+    def __init__(self, fingerprint_type='fp2', filename=None):
+        """
+        Args:
+            fingerprint_type (:obj:`str`, optional): fingerprint type
+            filename (:obj:`str`, optional): path to save the fingerprints
+        """
+        self.fingerprint_type = fingerprint_type
+        self.filename = filename
+        self.keys = []
+        self._key_rows = {}
+        self._structure_keys = {}
+        self._saved_fingerprints = None
+        self._new_fingerprints = []
+        self._fingerprints = None
+        self._lock = threading.RLock()
+
+        if filename and os.path.isfile(filename):
+            self._saved_fingerprints = numpy.load(filename, mmap_mode='r')
+            with open(filename + '.json', 'r') as file:
+                self.keys = json.load(file)
+            self._key_rows = {key: i_row for i_row, key in enumerate(self.keys)}
+
+    def save(self, filename=None):
+        """ Save the fingerprints to disk
+
+        Args:
+            filename (:obj:`str`, optional): path to save the fingerprints; defaults to :obj:`filename`
+        """
+        filename = filename or self.filename
+        with self._lock:
+            numpy.save(filename, self.get_fingerprint_matrix())
+            if not filename.endswith('.npy'):
+                os.rename(filename + '.npy', filename)
+            with open(filename + '.json', 'w') as file:
+                json.dump(self.keys, file)
+
+    def get_key(self, structure):
+        """ Get the canonical InChI of a structure, calculating its fingerprint if it isn't already in the store
+
+        Args:
+            structure (:obj:`str`): structure in InChI, MOL, or canonical SMILES format
+
+        Returns:
+            :obj:`str`: canonical InChI
+
+        Raises:
+            :obj:`ValueError`: if the structure is not valid
+        """
+        key = self._structure_keys.get(structure, None)
+        if key is not None:
+            return key
+
+        with self._lock:
+            mol = Molecule(structure=structure)
+            if mol.get_format() is None:
+                raise ValueError('Invalid structure: {}'.format(structure))
+            pybel_mol = mol.to_pybel()
+            key = pybel_mol.write('inchi').strip() or structure
+
+            if key not in self._key_rows:
+                words = pybel_mol.calcfp(self.fingerprint_type).fp
+                fingerprint = numpy.array(words, dtype=numpy.uint64).astype(numpy.uint32)
+                self._key_rows[key] = len(self.keys)
+                self.keys.append(key)
+                self._new_fingerprints.append(fingerprint)
+                self._fingerprints = None
+
+            self._structure_keys[structure] = key
+        return key
+
+    def get_rows(self, structures):
+        """ Get the rows of the fingerprint matrix which represent structures
+
+        Args:
+            structures (:obj:`list` of :obj:`str`): structures
+
+        Returns:
+            :obj:`numpy.ndarray`: row indices
+        """
+        return numpy.array([self._key_rows[self.get_key(structure)] for structure in structures], dtype=numpy.int64)
+
+    def get_fingerprint_matrix(self):
+        """ Get the fingerprints of all of the structures in the store
+
+        Returns:
+            :obj:`numpy.ndarray`: matrix of packed fingerprints (rows: canonical InChIs, columns: 32-bit words)
+        """
+        with self._lock:
+            if self._fingerprints is None or len(self._fingerprints) != len(self.keys):
+                parts = []
+                if self._saved_fingerprints is not None:
+                    parts.append(self._saved_fingerprints)
+                if self._new_fingerprints:
+                    parts.append(numpy.array(self._new_fingerprints, dtype=numpy.uint32))
+                if parts:
+                    self._fingerprints = numpy.concatenate(parts) if len(parts) > 1 else numpy.asarray(parts[0])
+                else:
+                    self._fingerprints = numpy.zeros((0, 0), dtype=numpy.uint32)
+            return self._fingerprints
+
+    def get_fingerprint(self, structure):
+        """ Get the fingerprint of a structure
+
+        Args:
+            structure (:obj:`str`): structure
+
+        Returns:
+            :obj:`numpy.ndarray`: packed fingerprint
+        """
+        row = self.get_rows([structure])[0]
+        return self.get_fingerprint_matrix()[row, :]
+
+    def get_similarity(self, structure_a, structure_b):
+        """ Calculate the Tanimoto similarity of two structures
+
+        Args:
+            structure_a (:obj:`str`): first structure
+            structure_b (:obj:`str`): second structure
+
+        Returns:
+            :obj:`float`: Tanimoto similarity
+        """
+        return float(self.get_similarities([structure_a], [structure_b])[0, 0])
+
+    def get_similarities(self, query_structures, library_structures):
+        """ Calculate the Tanimoto similarity of each query structure with each library structure
+
+        Args:
+            query_structures (:obj:`list` of :obj:`str`): query structures (e.g. the reactants of a reaction)
+            library_structures (:obj:`list` of :obj:`str`): library structures (e.g. the products of a reaction)
+
+        Returns:
+            :obj:`numpy.ndarray`: matrix of similarities (rows: query structures, columns: library structures)
+        """
+        query_rows = self.get_rows(query_structures)
+        library_rows = self.get_rows(library_structures)
+        fingerprints = self.get_fingerprint_matrix()
+        query_fps = numpy.ascontiguousarray(fingerprints[query_rows, :])
+        library_fps = numpy.ascontiguousarray(fingerprints[library_rows, :])
+        return self.calc_tanimoto(query_fps, library_fps)
+
+    @classmethod
+    def calc_tanimoto(cls, query_fps, library_fps):
+        """ Calculate the Tanimoto similarity of each pair of packed query and library fingerprints
+
+        Args:
+            query_fps (:obj:`numpy.ndarray`): packed query fingerprints
+            library_fps (:obj:`numpy.ndarray`): packed library fingerprints
+
+        Returns:
+            :obj:`numpy.ndarray`: matrix of similarities (rows: query fingerprints, columns: library fingerprints)
+        """
+        n_query = query_fps.shape[0]
+        n_library = library_fps.shape[0]
+        similarities = numpy.full((n_query, n_library), numpy.nan)
+        if not n_query or not n_library:
+            return similarities
+
+        query_bytes = query_fps.view(numpy.uint8)
+        library_bytes = library_fps.view(numpy.uint8)
+        block_size = max(1, cls.MAX_BLOCK_SIZE // max(1, n_library * library_bytes.shape[1]))
+        for start in range(0, n_query, block_size):
+            block = query_bytes[start:start + block_size, numpy.newaxis, :]
+            n_and = cls.POPCOUNTS[block & library_bytes[numpy.newaxis, :, :]].sum(axis=2)
+            n_or = cls.POPCOUNTS[block | library_bytes[numpy.newaxis, :, :]].sum(axis=2)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                similarities[start:start + block_size, :] = n_and / n_or.astype(numpy.float64)
+        return similarities
+
+
+_fingerprint_stores = {}
+_fingerprint_stores_lock = threading.Lock()
+
+
+def get_fingerprint_store(fingerprint_type='fp2'):
+    """ Get the process-wide fingerprint store for a fingerprint type
+
+    Args:
+        fingerprint_type (:obj:`str`, optional): fingerprint type
+
+    Returns:
+        :obj:`FingerprintStore`: fingerprint store
+    """
+    with _fingerprint_stores_lock:
+        if fingerprint_type not in _fingerprint_stores:
+            _fingerprint_stores[fingerprint_type] = FingerprintStore(fingerprint_type=fingerprint_type)
+        return _fingerprint_stores[fingerprint_type]
+
+
+def calc_inchi(structure):
+    """ Convert a structure to InChI format
+
+    Args:
+        structure (:obj:`str`): structure in InChI, MOL, or canonical SMILES format
+
+    Returns:
+        :obj:`str`: structure in InChI format, or :obj:`None` if the structure is not valid
+    """
+    try:
+        return Molecule(structure=structure).to_inchi()
+    except ValueError:
+        return None
+
+
+def calc_formula_and_connectivity(inchi):
+    """ Get the formula and connectivity layers of an InChI-encoded structure
+
+    Args:
+        inchi (:obj:`str`): InChI-encoded structure
+
+    Returns:
+        :obj:`str`: formula and connectivity layers, or :obj:`None` if the structure is not a valid InChI string
+    """
+    try:
+        return InchiMolecule(inchi).get_formula_and_connectivity()
+    except ValueError:
+        return None
+
+
+class InchiNormalizer(object):
+    """ Memoized conversion of structures to InChI format and to their InChI formula and connectivity layers, which
+    are used as keys to search for molecules and reactions
+
+    Results are keyed by the input structure string. They are cached in memory in a least-recently-used cache and,
+    optionally, in a SQLite database, which persists them across processes and runs. Invalid structures are also
+    cached. Lists of structures can be normalized at once, in which case the structures which aren't cached are
+    normalized in parallel by a pool of processes.
+
+    Attributes:
+        filename (:obj:`str`): path to the SQLite database which persists the results, or :obj:`None` to only cache
+            them in memory
+        cache_size (:obj:`int`): maximum number of results of each conversion to cache in memory
+        processes (:obj:`int`): number of processes to normalize lists of structures; if :obj:`None`, use all of
+            the cores
+        pool_min_size (:obj:`int`): minimum number of uncached structures to normalize with a pool of processes
+        _caches (:obj:`dict`): dictionary which maps the name of each conversion to its in-memory cache
+        _connection (:obj:`sqlite3.Connection`): connection to the SQLite database
+        _lock (:obj:`threading.RLock`): lock
+    """
+
+    CONVERSIONS = collections.OrderedDict([
+        ('inchi', calc_inchi),
+        ('formula_and_connectivity', calc_formula_and_connectivity),
+    ])
+    # :obj:`collections.OrderedDict`: dictionary which maps the name of each conversion to its function
+
+    SQLITE_MAX_VARIABLES = 999
+    # :obj:`int`: maximum number of parameters of a SQLite query
+
+    def __init__(self, filename=None, cache_size=INCHI_NORMALIZATION_CACHE_SIZE, processes=None,
+                 pool_min_size=INCHI_NORMALIZATION_POOL_MIN_SIZE):
+        """
+        Args:
+            filename (:obj:`str`, optional): path to the SQLite database which persists the results
+            cache_size (:obj:`int`, optional): maximum number of results of each conversion to cache in memory
+            processes (:obj:`int`, optional): number of processes to normalize lists of structures
+            pool_min_size (:obj:`int`, optional): minimum number of uncached structures to normalize with a pool of
+                processes
+        """
+        self.filename = None
+        self.cache_size = cache_size
+        self.processes = processes
+        self.pool_min_size = pool_min_size
+        self._caches = {name: collections.OrderedDict() for name in self.CONVERSIONS.keys()}
+        self._connection = None
+        self._lock = threading.RLock()
+        if filename:
+            self.open(filename)
+
+    def open(self, filename):
+        """ Persist the results in a SQLite database, replacing the current database
+
+        Args:
+            filename (:obj:`str`): path to the database
+        """
+        with self._lock:
+            self.close()
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._connection = sqlite3.connect(filename, check_same_thread=False)
+            for name in self.CONVERSIONS.keys():
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {} (structure TEXT PRIMARY KEY, value TEXT)'.format(name))
+            self._connection.commit()
+            self.filename = filename
+
+    def close(self):
+        """ Close the SQLite database """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self.filename = None
+
+    def get_inchi(self, structure):
+        """ Get the InChI format of a structure
+
+        Args:
+            structure (:obj:`str`): structure in InChI, MOL, or canonical SMILES format
+
+        Returns:
+            :obj:`str`: structure in InChI format
+
+        Raises:
+            :obj:`ValueError`: if the structure is not valid
+        """
+        inchi = self.normalize('inchi', [structure])[0]
+        if inchi is None:
+            raise ValueError('Invalid structure: {}'.format(structure))
+        return inchi
+
+    def get_formula_and_connectivity(self, inchi):
+        """ Get the formula and connectivity layers of an InChI-encoded structure
+
+        Args:
+            inchi (:obj:`str`): InChI-encoded structure
+
+        Returns:
+            :obj:`str`: formula and connectivity layers
+
+        Raises:
+            :obj:`ValueError`: if the structure is not a valid InChI string
+        """
+        formula_and_connectivity = self.normalize('formula_and_connectivity', [inchi])[0]
+        if formula_and_connectivity is None:
+            raise ValueError('{} is a not a valid InChI string'.format(inchi))
+        return formula_and_connectivity
+
+    def to_inchi(self, structure, only_formula_and_connectivity=False):
+        """ Get the InChI format of a structure, or only its formula and connectivity layers
+
+        Args:
+            structure (:obj:`str`): structure in InChI, MOL, or canonical SMILES format
+            only_formula_and_connectivity (:obj:`bool`, optional): if :obj:`True`, return only the formula and
+                connectivity layers
+
+        Returns:
+            :obj:`str`: structure in InChI format or just its formula and connectivity layers
+
+        Raises:
+            :obj:`ValueError`: if the structure is not valid
+        """
+        inchi = self.get_inchi(structure)
+        if only_formula_and_connectivity:
+            return self.get_formula_and_connectivity(inchi)
+        return inchi
+
+    def get_inchis(self, structures):
+        """ Get the InChI format of a list of structures
+
+        Args:
+            structures (:obj:`list` of :obj:`str`): structures in InChI, MOL, or canonical SMILES format
+
+        Returns:
+            :obj:`list` of :obj:`str`: structures in InChI format (:obj:`None` for invalid structures)
+        """
+        return self.normalize('inchi', structures)
+
+    def get_formulas_and_connectivities(self, inchis):
+        """ Get the formula and connectivity layers of a list of InChI-encoded structures
+
+        Args:
+            inchis (:obj:`list` of :obj:`str`): InChI-encoded structures
+
+        Returns:
+            :obj:`list` of :obj:`str`: formula and connectivity layers (:obj:`None` for invalid structures)
+        """
+        return self.normalize('formula_and_connectivity', inchis)
+
+    def normalize(self, conversion, structures):
+        """ Convert a list of structures, first from the in-memory cache, then from the SQLite database, and
+        finally by calculating the remaining conversions, in parallel if there are at least :obj:`pool_min_size`
+        of them
+
+        Args:
+            conversion (:obj:`str`): name of the conversion (a key of :obj:`CONVERSIONS`)
+            structures (:obj:`list` of :obj:`str`): structures
+
+        Returns:
+            :obj:`list` of :obj:`str`: converted structures (:obj:`None` for invalid structures)
+        """
+        cache = self._caches[conversion]
+        values = {}
+        with self._lock:
+            for structure in structures:
+                if structure in cache:
+                    values[structure] = cache.pop(structure)
+                    cache[structure] = values[structure]
+
+            missing = list(collections.OrderedDict.fromkeys(
+                structure for structure in structures if structure not in values))
+
+            if missing and self._connection is not None:
+                for i_chunk in range(0, len(missing), self.SQLITE_MAX_VARIABLES):
+                    chunk = missing[i_chunk:i_chunk + self.SQLITE_MAX_VARIABLES]
+                    rows = self._connection.execute('SELECT structure, value FROM {} WHERE structure IN ({})'.format(
+                        conversion, ', '.join('?' * len(chunk))), chunk)
+                    values.update(rows)
+                missing = [structure for structure in missing if structure not in values]
+
+        if missing:
+            func = self.CONVERSIONS[conversion]
+            processes = self.processes or multiprocessing.cpu_count()
+            if len(missing) >= self.pool_min_size and processes > 1:
+                pool = multiprocessing.Pool(processes=processes)
+                try:
+                    new_values = pool.map(func, missing, chunksize=max(1, len(missing) // (4 * processes)))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                new_values = [func(structure) for structure in missing]
+            values.update(zip(missing, new_values))
+
+            with self._lock:
+                if self._connection is not None:
+                    self._connection.executemany('INSERT OR REPLACE INTO {} (structure, value) VALUES (?, ?)'.format(
+                        conversion), zip(missing, new_values))
+                    self._connection.commit()
+
+        with self._lock:
+            for structure in missing:
+                cache[structure] = values[structure]
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+        return [values[structure] for structure in structures]
+
+
+_inchi_normalizer = None
+_inchi_normalizer_lock = threading.Lock()
+
+
+def get_inchi_normalizer(filename=None):
+    """ Get the process-wide InChI normalizer
+
+    Args:
+        filename (:obj:`str`, optional): path to a SQLite database to persist its results in; if :obj:`None`, use
+            the database which the normalizer already uses, if any
+
+    Returns:
+        :obj:`InchiNormalizer`: InChI normalizer
+    """
+    global _inchi_normalizer
+    with _inchi_normalizer_lock:
+        if _inchi_normalizer is None:
+            _inchi_normalizer = InchiNormalizer()
+        if filename and _inchi_normalizer.filename != filename:
+            _inchi_normalizer.open(filename)
+        return _inchi_normalizer
+
+
 class InchiMolecule(object):
     """ Represents the InChI-encoded structure of a molecule
 
@@ -0,0 +1,250 @@
+""" Utilities for scanning DNA sequences for transcription factor binding sites
+
+:Date: 2018-09-14
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util.constants import PWM_SCAN_MIN_SCORE, PWM_SCAN_WINDOW_SIZE, PWM_SCORE_DISTRIBUTION_PRECISION
+import numpy
+import six
+
+BASE_ENCODING = numpy.full(256, 4, dtype=numpy.uint8)
+BASE_ENCODING[numpy.frombuffer(b'ACGTacgt', dtype=numpy.uint8)] = [0, 1, 2, 3, 0, 1, 2, 3]
+# :obj:`numpy.ndarray`: index of each base (A=0, C=1, G=2, T=3, other=4) by its ASCII code
+
+
+class PositionWeightMatrixLibrary(object):
+    """ In-memory library of position weight matrices which can scan sequences against all of its matrices at once
+
+    The log-odds matrices are stacked into one array per motif width, so that each window of a sequence is scored
+    against all of the matrices of a width in a single vectorized pass over both strands. Scores follow the
+    conventions of :obj:`Bio.motifs`: the log2 odds of the normalized counts against the background, with
+    :obj:`-inf` for bases which were never observed.
+
+    Attributes:
+        ids (:obj:`list`): identifiers of the matrices
+        counts (:obj:`list` of :obj:`numpy.ndarray`): count matrix (width x 4, in A, C, G, T order) of each matrix
+        background (:obj:`numpy.ndarray`): background frequencies of A, C, G and T
+        widths (:obj:`numpy.ndarray`): width of each matrix
+        groups (:obj:`dict`): dictionary which maps each width to a tuple of the indices of its matrices, their
+            log-odds matrices (matrices x width x 5, with a final column for unknown bases), and the log-odds
+            matrices of their reverse complements
+        _score_thresholds (:obj:`dict`): dictionary which maps p-values to the score threshold of each matrix
+    """
+
+    ALPHABET = 'ACGT'
+
+    def __init__(self, counts, ids=None, background=None, pseudocount=0.):
+        """
+        Args:
+            counts (:obj:`list` of :obj:`list` of :obj:`list` of :obj:`float`): count matrix (width x 4, in A, C,
+                G, T order) of each matrix
+            ids (:obj:`list`, optional): identifiers of the matrices; defaults to their indices
+            background (:obj:`list` of :obj:`float`, optional): background frequencies of A, C, G and T; defaults
+                to a uniform background
+            pseudocount (:obj:`float`, optional): pseudocount added to each count
+        """
+        self.counts = [numpy.array(matrix, dtype=numpy.float64).reshape((-1, 4)) for matrix in counts]
+        self.ids = list(ids) if ids is not None else list(range(len(self.counts)))
+        if len(self.ids) != len(self.counts):
+            raise ValueError('The number of ids must equal the number of matrices')
+        if background is None:
+            background = [0.25] * 4
+        self.background = numpy.array(background, dtype=numpy.float64) / numpy.sum(background)
+        self.widths = numpy.array([matrix.shape[0] for matrix in self.counts], dtype=numpy.int64)
+
+        self.groups = {}
+        for width in numpy.unique(self.widths):
+            indices = numpy.flatnonzero(self.widths == width)
+            log_odds = numpy.full((len(indices), width, 5), -numpy.inf)
+            for i_group, index in enumerate(indices):
+                log_odds[i_group, :, 0:4] = self.calc_log_odds(self.counts[index], pseudocount=pseudocount)
+            rc_log_odds = log_odds[:, ::-1, :][:, :, [3, 2, 1, 0, 4]]
+            self.groups[int(width)] = (indices, log_odds, numpy.ascontiguousarray(rc_log_odds))
+
+        self._score_thresholds = {}
+
+    def calc_log_odds(self, counts, pseudocount=0.):
+        """ Calculate the log-odds matrix of a count matrix
+
+        Args:
+            counts (:obj:`numpy.ndarray`): count matrix (width x 4)
+            pseudocount (:obj:`float`, optional): pseudocount added to each count
+
+        Returns:
+            :obj:`numpy.ndarray`: log2 odds matrix (width x 4)
+        """
+        counts = counts + pseudocount
+        totals = numpy.sum(counts, axis=1, keepdims=True)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.log2(counts / totals / self.background)
+
+    def encode(self, sequence):
+        """ Encode a DNA sequence as an array of the indices of its bases (A=0, C=1, G=2, T=3, other=4)
+
+        Args:
+            sequence (:obj:`str`): DNA sequence
+
+        Returns:
+            :obj:`numpy.ndarray`: encoded sequence
+        """
+        if not isinstance(sequence, six.binary_type):
+            sequence = str(sequence).encode('ascii', 'replace')
+        return BASE_ENCODING[numpy.frombuffer(sequence, dtype=numpy.uint8)]
+
+    def scan(self, sequence, min_score=PWM_SCAN_MIN_SCORE, max_p_value=None, widths=None, both_strands=True,
+             window_size=PWM_SCAN_WINDOW_SIZE):
+        """ Find the binding sites of the matrices in a sequence
+
+        Long sequences (e.g. promoters or genomes) are scanned in overlapping windows of :obj:`window_size` bases,
+        and can be provided as an iterable of chunks (e.g. the lines of a FASTA file, whose header lines are skipped)
+        so that they never have to be held in memory.
+
+        Args:
+            sequence (:obj:`str` or iterable of :obj:`str`): DNA sequence, or chunks of a DNA sequence
+            min_score (:obj:`float`, optional): minimum log-odds score of a binding site
+            max_p_value (:obj:`float`, optional): maximum probability of a score at least as high under the
+                background distribution
+            widths (:obj:`list` of :obj:`int`, optional): if not :obj:`None`, only scan for the matrices of
+                these widths
+            both_strands (:obj:`bool`, optional): if :obj:`True`, also scan the reverse complement strand
+            window_size (:obj:`int`, optional): number of positions which are scored at once
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: index of the matrix, position (0-based, on the forward strand), strand
+            (1 or -1), and score of each binding site, sorted by matrix, position and strand
+        """
+        thresholds = numpy.full(len(self.counts), -numpy.inf)
+        if min_score is not None:
+            thresholds[:] = min_score
+        if max_p_value is not None:
+            thresholds = numpy.maximum(thresholds, self.get_score_thresholds(max_p_value))
+
+        groups = [self.groups[width] for width in sorted(self.groups.keys())
+                  if widths is None or width in widths]
+        if not groups:
+            return []
+        overlap = max(log_odds.shape[1] for _, log_odds, _ in groups) - 1
+
+        sites = []
+        for offset, window, final in self.iter_windows(sequence, window_size, overlap):
+            for indices, log_odds, rc_log_odds in groups:
+                strands = [(1, log_odds)]
+                if both_strands:
+                    strands.append((-1, rc_log_odds))
+
+                for strand, matrices in strands:
+                    scores = self.calc_scores(matrices, window)
+                    if not scores.shape[1]:
+                        continue
+                    if not final:
+                        scores = scores[:, 0:window_size]
+                    i_matrices, positions = numpy.nonzero(scores >= thresholds[indices][:, numpy.newaxis])
+                    for i_matrix, position in zip(i_matrices, positions):
+                        sites.append((int(indices[i_matrix]), int(offset + position), strand,
+                                      float(scores[i_matrix, position])))
+
+        sites.sort(key=lambda site: (site[0], site[1], -site[2]))
+        return sites
+
+    @staticmethod
+    def calc_scores(matrices, sequence):
+        """ Score each position of an encoded sequence against several log-odds matrices of the same width
+
+        Args:
+            matrices (:obj:`numpy.ndarray`): log-odds matrices (matrices x width x 5)
+            sequence (:obj:`numpy.ndarray`): encoded sequence
+
+        Returns:
+            :obj:`numpy.ndarray`: score of each matrix at each position (matrices x positions)
+        """
+        width = matrices.shape[1]
+        n_positions = max(len(sequence) - width + 1, 0)
+        scores = numpy.zeros((matrices.shape[0], n_positions))
+        for i_column in range(width):
+            scores += matrices[:, i_column, :][:, sequence[i_column:i_column + n_positions]]
+        return scores
+
+    def iter_windows(self, sequence, window_size, overlap):
+        """ Iterate over overlapping windows of a sequence. Each window holds the :obj:`window_size` positions
+        which should be scored in it, followed by :obj:`overlap` bases of context.
+
+        Args:
+            sequence (:obj:`str` or iterable of :obj:`str`): DNA sequence, or chunks of a DNA sequence (e.g. the
+                lines of a FASTA file); chunks which begin with `>` (e.g. FASTA headers) are skipped
+            window_size (:obj:`int`): number of positions which are scored in each window
+            overlap (:obj:`int`): number of bases which are shared by consecutive windows
+
+        Yields:
+            :obj:`tuple`: offset of the window, encoded window, and whether this is the last window (in which case
+            all of its positions should be scored)
+        """
+        if isinstance(sequence, (six.string_types, six.binary_type)):
+            chunks = (sequence[i_chunk:i_chunk + window_size] for i_chunk in range(0, len(sequence), window_size))
+        else:
+            chunks = (chunk for chunk in sequence if chunk.lstrip()[0:1] not in ('>', b'>'))
+
+        buffer = numpy.zeros(0, dtype=numpy.uint8)
+        offset = 0
+        for chunk in chunks:
+            buffer = numpy.concatenate((buffer, self.encode(chunk.strip())))
+            while len(buffer) >= window_size + overlap:
+                yield offset, buffer[0:window_size + overlap], False
+                buffer = buffer[window_size:]
+                offset += window_size
+        if len(buffer):
+            yield offset, buffer, True
+
+    def get_score_thresholds(self, p_value):
+        """ Get the lowest score of each matrix whose probability of being reached under the background
+        distribution is at most :obj:`p_value`
+
+        Args:
+            p_value (:obj:`float`): p-value
+
+        Returns:
+            :obj:`numpy.ndarray`: score threshold of each matrix
+        """
+        thresholds = self._score_thresholds.get(p_value, None)
+        if thresholds is None:
+            thresholds = numpy.array([self.calc_score_threshold(index, p_value)
+                                      for index in range(len(self.counts))])
+            self._score_thresholds[p_value] = thresholds
+        return thresholds
+
+    def calc_score_threshold(self, index, p_value, precision=PWM_SCORE_DISTRIBUTION_PRECISION):
+        """ Calculate the score threshold of a matrix for a p-value from the distribution of its scores under the
+        background, which is computed exactly for scores rounded to :obj:`precision`
+
+        Args:
+            index (:obj:`int`): index of the matrix
+            p_value (:obj:`float`): p-value
+            precision (:obj:`float`, optional): resolution of the score distribution
+
+        Returns:
+            :obj:`float`: score threshold
+        """
+        width = self.widths[index]
+        log_odds = self.groups[width][1][numpy.flatnonzero(self.groups[width][0] == index)[0], :, 0:4]
+
+        # the probability of sequences with unobserved bases is dropped because they never score high enough
+        distribution = numpy.ones(1)
+        min_bin = 0
+        for column in log_odds:
+            finite = numpy.isfinite(column)
+            bins = numpy.round(column[finite] / precision).astype(numpy.int64)
+            probs = self.background[finite]
+            if not len(bins):
+                return numpy.inf
+            new_distribution = numpy.zeros(len(distribution) + bins.max() - bins.min())
+            for bin, prob in zip(bins - bins.min(), probs):
+                new_distribution[bin:bin + len(distribution)] += prob * distribution
+            distribution = new_distribution
+            min_bin += bins.min()
+
+        tail = numpy.cumsum(distribution[::-1])[::-1]
+        significant = numpy.flatnonzero(tail <= p_value)
+        if not len(significant):
+            return numpy.inf
+        return (min_bin + significant[0]) * precision
@@ -30,15 +30,10 @@ def calc_reactant_product_pairs(reaction):
     reactants = sorted(reactants, key=key, reverse=True)
     products = sorted(products, key=key, reverse=True)
 
-    # create :obj:`molecule_util.Molecule` objects for each reactant and product
-    reactant_mols = [molecule_util.Molecule(structure=reactant.specie.structure) for reactant in reactants]
-    product_mols = [molecule_util.Molecule(structure=product.specie.structure) for product in products]
-
     # calculate similarities between each reactant and each product
-    similarities = numpy.full((len(reactants), len(products)), numpy.nan)
-    for i_reactant, reactant in enumerate(reactant_mols):
-        for i_product, product in enumerate(product_mols):
-            similarities[i_reactant, i_product] = reactant.get_similarity(product)
+    similarities = molecule_util.get_fingerprint_store().get_similarities(
+        [reactant.specie.structure for reactant in reactants],
+        [product.specie.structure for product in products])
 
     # initialize pairs of similar reactants and products
     pairs = []
@@ -7,8 +7,15 @@
 :License: MIT
 """
 
+from datanator.util.constants import NCBI_TAXONOMY_INDEX_DIR
 from ete3 import NCBITaxa
+import hashlib
+import json
+import numpy
+import os
+import shutil
 import six
+import threading
 
 
 def setup_database(force_update=False):
@@ -34,6 +41,390 @@ def setup_database(force_update=False):
         # database if one doesn't already exist
         ncbi_taxa.get_descendant_taxa('Homo')
 
+    if force_update or not NcbiTaxonomyIndex.exists():
+        get_index(rebuild=True)
+
+
+class NcbiTaxonomyIndex(object):
+    """ Compact, memory-mapped index of the lineages of the NCBI Taxonomy database which answers name, lineage
+    and latest common ancestor queries without querying ete3.
+
+    Each taxon is identified by its position in the sorted array of NCBI ids. Latest common ancestors are
+    computed by a range minimum query over the depths of an Euler tour of the taxonomy tree, using a sparse
+    table of the minima of blocks of :obj:`BLOCK_SIZE` consecutive positions.
+
+    Attributes:
+        dirname (:obj:`str`): directory which contains the index
+        taxids (:obj:`numpy.ndarray`): sorted NCBI ids of the taxa
+        parent (:obj:`numpy.ndarray`): index of the parent of each taxon (the root is its own parent)
+        depth (:obj:`numpy.ndarray`): number of links between each taxon and the root
+        rank (:obj:`numpy.ndarray`): index of the rank of each taxon within :obj:`ranks`
+        ranks (:obj:`list` of :obj:`str`): names of the ranks
+        name_blob (:obj:`numpy.ndarray`): UTF-8 encoded, concatenated names of the taxa
+        name_offsets (:obj:`numpy.ndarray`): offset of the name of each taxon within :obj:`name_blob`
+        name_hashes (:obj:`numpy.ndarray`): sorted hashes of the lower case names and synonyms of the taxa
+        name_hash_taxa (:obj:`numpy.ndarray`): index of the taxon of each hash in :obj:`name_hashes`
+        merged_taxids (:obj:`numpy.ndarray`): sorted NCBI ids which have been merged into other taxa
+        merged_into (:obj:`numpy.ndarray`): index of the taxon which each id in :obj:`merged_taxids` was merged into
+        euler (:obj:`numpy.ndarray`): Euler tour of the taxonomy tree
+        euler_depth (:obj:`numpy.ndarray`): depth of each position of the Euler tour
+        first (:obj:`numpy.ndarray`): first position of each taxon in the Euler tour
+        block_min (:obj:`numpy.ndarray`): sparse table of the positions of the minimum depths of 2^k consecutive blocks
+    """
+
+    BLOCK_SIZE = 64
+    ARRAYS = ('taxids', 'parent', 'depth', 'rank', 'name_blob', 'name_offsets', 'name_hashes', 'name_hash_taxa',
+              'merged_taxids', 'merged_into', 'euler', 'euler_depth', 'first', 'block_min')
+
+    def __init__(self, dirname=NCBI_TAXONOMY_INDEX_DIR):
+        """
+        Args:
+            dirname (:obj:`str`, optional): directory which contains the index
+        """
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'index.json'), 'r') as file:
+            self.ranks = json.load(file)['ranks']
+        for name in self.ARRAYS:
+            setattr(self, name, numpy.load(os.path.join(dirname, name + '.npy'), mmap_mode='r'))
+
+    @classmethod
+    def exists(cls, dirname=NCBI_TAXONOMY_INDEX_DIR):
+        """ Determine whether an index has been built
+
+        Args:
+            dirname (:obj:`str`, optional): directory which contains the index
+
+        Returns:
+            :obj:`bool`: :obj:`True` if the index has been built
+        """
+        return os.path.isfile(os.path.join(dirname, 'index.json'))
+
+    @classmethod
+    def build(cls, dirname=NCBI_TAXONOMY_INDEX_DIR, ncbi_taxa=None):
+        """ Build the index from the local sqlite copy of the NCBI Taxonomy database
+
+        Args:
+            dirname (:obj:`str`, optional): directory to save the index
+            ncbi_taxa (:obj:`NCBITaxa`, optional): local copy of the NCBI Taxonomy database
+
+        Returns:
+            :obj:`NcbiTaxonomyIndex`: index
+        """
+        ncbi_taxa = ncbi_taxa or NCBITaxa()
+
+        # taxa
+        rows = ncbi_taxa.db.execute('SELECT taxid, parent, spname, rank FROM species').fetchall()
+        taxids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+        order = numpy.argsort(taxids, kind='mergesort')
+        rows = [rows[i] for i in order]
+        taxids = taxids[order]
+        n_taxa = len(taxids)
+
+        parent = numpy.searchsorted(taxids, numpy.array([row[1] for row in rows], dtype=numpy.int64))
+        parent[parent >= n_taxa] = 0
+        parent[taxids[parent] != numpy.array([row[1] for row in rows], dtype=numpy.int64)] = 0
+        roots = numpy.flatnonzero(parent == numpy.arange(n_taxa))
+        root = roots[0] if len(roots) else 0
+        parent[parent == numpy.arange(n_taxa)] = root
+        parent = parent.astype(numpy.int32)
+
+        ranks = sorted(set(row[3] for row in rows))
+        rank_indices = {rank: i for i, rank in enumerate(ranks)}
+        rank = numpy.array([rank_indices[row[3]] for row in rows], dtype=numpy.int16)
+
+        names = [(row[2] or '').encode('utf-8') for row in rows]
+        name_offsets = numpy.zeros(n_taxa + 1, dtype=numpy.int64)
+        name_offsets[1:] = numpy.cumsum([len(name) for name in names])
+        name_blob = numpy.frombuffer(b''.join(names), dtype=numpy.uint8)
+
+        # names and synonyms; canonical names take precedence over synonyms
+        hashed_names = {}
+        for i_taxon, row in enumerate(rows):
+            hashed_names.setdefault(cls.hash_name(row[2] or ''), i_taxon)
+        for taxid, name in ncbi_taxa.db.execute('SELECT taxid, spname FROM synonym'):
+            i_taxon = numpy.searchsorted(taxids, taxid)
+            if i_taxon < n_taxa and taxids[i_taxon] == taxid:
+                hashed_names.setdefault(cls.hash_name(name), i_taxon)
+        name_hashes = numpy.array(list(hashed_names.keys()), dtype=numpy.uint64)
+        name_hash_taxa = numpy.array(list(hashed_names.values()), dtype=numpy.int32)
+        order = numpy.argsort(name_hashes)
+        name_hashes = name_hashes[order]
+        name_hash_taxa = name_hash_taxa[order]
+
+        # merged taxa
+        merged = [(old, new) for old, new in ncbi_taxa.db.execute('SELECT taxid_old, taxid_new FROM merged')
+                  if taxids[min(numpy.searchsorted(taxids, new), n_taxa - 1)] == new]
+        merged.sort()
+        merged_taxids = numpy.array([old for old, _ in merged], dtype=numpy.int64)
+        merged_into = numpy.searchsorted(taxids, numpy.array([new for _, new in merged], dtype=numpy.int64)).astype(numpy.int32)
+
+        # Euler tour
+        children_order = numpy.argsort(parent, kind='mergesort')
+        children_order = children_order[children_order != root]
+        children_start = numpy.searchsorted(parent[children_order], numpy.arange(n_taxa + 1))
+
+        children_order = children_order.tolist()
+        children_start = children_start.tolist()
+        depth = [0] * n_taxa
+        first = [0] * n_taxa
+        euler = [root]
+        stack = [(root, children_start[root])]
+        while stack:
+            node, i_child = stack[-1]
+            if i_child < children_start[node + 1]:
+                child = children_order[i_child]
+                stack[-1] = (node, i_child + 1)
+                depth[child] = depth[node] + 1
+                first[child] = len(euler)
+                euler.append(child)
+                stack.append((child, children_start[child]))
+            else:
+                stack.pop()
+                if stack:
+                    euler.append(stack[-1][0])
+        depth = numpy.array(depth, dtype=numpy.int32)
+        first = numpy.array(first, dtype=numpy.int32)
+        euler = numpy.array(euler, dtype=numpy.int32)
+        euler_depth = depth[euler]
+
+        # sparse table of block minima
+        n_blocks = (len(euler) + cls.BLOCK_SIZE - 1) // cls.BLOCK_SIZE
+        padded = numpy.full(n_blocks * cls.BLOCK_SIZE, numpy.iinfo(numpy.int32).max, dtype=numpy.int32)
+        padded[0:len(euler)] = euler_depth
+        block_min = [(numpy.argmin(padded.reshape(n_blocks, cls.BLOCK_SIZE), axis=1)
+                      + numpy.arange(n_blocks) * cls.BLOCK_SIZE).astype(numpy.int32)]
+        width = 1
+        while 2 * width <= n_blocks:
+            prev = block_min[-1]
+            left = prev[0:n_blocks - width]
+            right = prev[width:n_blocks]
+            level = prev.copy()
+            level[0:n_blocks - width] = numpy.where(euler_depth[left] <= euler_depth[right], left, right)
+            block_min.append(level)
+            width *= 2
+        block_min = numpy.array(block_min, dtype=numpy.int32)
+
+        # save index
+        tmp_dirname = dirname + '.tmp'
+        if os.path.isdir(tmp_dirname):
+            shutil.rmtree(tmp_dirname)
+        os.makedirs(tmp_dirname)
+        arrays = {
+            'taxids': taxids, 'parent': parent, 'depth': depth, 'rank': rank,
+            'name_blob': name_blob, 'name_offsets': name_offsets,
+            'name_hashes': name_hashes, 'name_hash_taxa': name_hash_taxa,
+            'merged_taxids': merged_taxids, 'merged_into': merged_into,
+            'euler': euler, 'euler_depth': euler_depth, 'first': first, 'block_min': block_min,
+        }
+        for name, array in arrays.items():
+            numpy.save(os.path.join(tmp_dirname, name + '.npy'), array)
+        with open(os.path.join(tmp_dirname, 'index.json'), 'w') as file:
+            json.dump({'ranks': ranks, 'block_size': cls.BLOCK_SIZE}, file)
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
+        os.rename(tmp_dirname, dirname)
+
+        return cls(dirname)
+
+    @staticmethod
+    def hash_name(name):
+        """ Calculate a stable 64-bit hash of the lower case form of a name
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`int`: hash
+        """
+        return int(hashlib.md5(name.lower().encode('utf-8')).hexdigest()[0:16], 16)
+
+    def get_taxon_index(self, ncbi_id):
+        """ Get the position of a taxon within the index
+
+        Args:
+            ncbi_id (:obj:`int`): NCBI id of the taxon
+
+        Returns:
+            :obj:`int`: position of the taxon, or :obj:`None` if the taxon isn't in the NCBI database
+        """
+        ncbi_id = int(ncbi_id)
+        i_taxon = int(numpy.searchsorted(self.taxids, ncbi_id))
+        if i_taxon < len(self.taxids) and self.taxids[i_taxon] == ncbi_id:
+            return i_taxon
+
+        i_merged = int(numpy.searchsorted(self.merged_taxids, ncbi_id))
+        if i_merged < len(self.merged_taxids) and self.merged_taxids[i_merged] == ncbi_id:
+            return int(self.merged_into[i_merged])
+
+        return None
+
+    def get_ncbi_id_by_name(self, name):
+        """ Get the NCBI id of the taxon with a name or synonym (case insensitive)
+
+        Args:
+            name (:obj:`str`): name
+
+        Returns:
+            :obj:`int`: NCBI id, or :obj:`None` if no taxon has the name
+        """
+        hash = numpy.uint64(self.hash_name(name))
+        i_hash = int(numpy.searchsorted(self.name_hashes, hash))
+        if i_hash < len(self.name_hashes) and self.name_hashes[i_hash] == hash:
+            return int(self.taxids[self.name_hash_taxa[i_hash]])
+        return None
+
+    def get_name(self, ncbi_id):
+        """ Get the name of a taxon
+
+        Args:
+            ncbi_id (:obj:`int`): NCBI id
+
+        Returns:
+            :obj:`str`: name, or :obj:`None` if the taxon isn't in the NCBI database
+        """
+        i_taxon = self.get_taxon_index(ncbi_id)
+        if i_taxon is None:
+            return None
+        return self.name_blob[self.name_offsets[i_taxon]:self.name_offsets[i_taxon + 1]].tobytes().decode('utf-8')
+
+    def get_rank(self, ncbi_id):
+        """ Get the rank of a taxon
+
+        Args:
+            ncbi_id (:obj:`int`): NCBI id
+
+        Returns:
+            :obj:`str`: rank, or :obj:`None` if the taxon isn't in the NCBI database
+        """
+        i_taxon = self.get_taxon_index(ncbi_id)
+        if i_taxon is None:
+            return None
+        return self.ranks[self.rank[i_taxon]]
+
+    def get_lineage(self, ncbi_id):
+        """ Get the lineage of a taxon, ordered from the root to the taxon
+
+        Args:
+            ncbi_id (:obj:`int`): NCBI id
+
+        Returns:
+            :obj:`list` of :obj:`int`: NCBI ids of the lineage, or :obj:`None` if the taxon isn't in the NCBI database
+        """
+        i_taxon = self.get_taxon_index(ncbi_id)
+        if i_taxon is None:
+            return None
+        lineage = [i_taxon]
+        for _ in range(self.depth[i_taxon]):
+            lineage.append(int(self.parent[lineage[-1]]))
+        return [int(self.taxids[i]) for i in reversed(lineage)]
+
+    def get_distance_to_root(self, ncbi_id):
+        """ Get the number of links between a taxon and the root of the NCBI taxonomy tree
+
+        Args:
+            ncbi_id (:obj:`int`): NCBI id
+
+        Returns:
+            :obj:`int`: distance to the root, or :obj:`None` if the taxon isn't in the NCBI database
+        """
+        i_taxon = self.get_taxon_index(ncbi_id)
+        if i_taxon is None:
+            return None
+        return int(self.depth[i_taxon])
+
+    def get_common_ancestor(self, ncbi_id_a, ncbi_id_b):
+        """ Get the latest common ancestor of two taxa
+
+        Args:
+            ncbi_id_a (:obj:`int`): NCBI id of the first taxon
+            ncbi_id_b (:obj:`int`): NCBI id of the second taxon
+
+        Returns:
+            :obj:`int`: NCBI id of the latest common ancestor, or :obj:`None` if either taxon isn't in the NCBI database
+        """
+        i_taxon_a = self.get_taxon_index(ncbi_id_a)
+        i_taxon_b = self.get_taxon_index(ncbi_id_b)
+        if i_taxon_a is None or i_taxon_b is None:
+            return None
+        return int(self.taxids[self._get_common_ancestor_index(i_taxon_a, i_taxon_b)])
+
+    def get_distance_to_common_ancestor(self, ncbi_id_a, ncbi_id_b):
+        """ Get the number of links between a taxon and its latest common ancestor with a second taxon
+
+        Args:
+            ncbi_id_a (:obj:`int`): NCBI id of the first taxon
+            ncbi_id_b (:obj:`int`): NCBI id of the second taxon
+
+        Returns:
+            :obj:`int`: distance from the first taxon to the latest common ancestor, or :obj:`None` if either taxon
+                isn't in the NCBI database
+        """
+        i_taxon_a = self.get_taxon_index(ncbi_id_a)
+        i_taxon_b = self.get_taxon_index(ncbi_id_b)
+        if i_taxon_a is None or i_taxon_b is None:
+            return None
+        i_ancestor = self._get_common_ancestor_index(i_taxon_a, i_taxon_b)
+        return int(self.depth[i_taxon_a] - self.depth[i_ancestor])
+
+    def _get_common_ancestor_index(self, i_taxon_a, i_taxon_b):
+        """ Get the position of the latest common ancestor of two taxa with a range minimum query over the
+        Euler tour
+
+        Args:
+            i_taxon_a (:obj:`int`): position of the first taxon
+            i_taxon_b (:obj:`int`): position of the second taxon
+
+        Returns:
+            :obj:`int`: position of the latest common ancestor
+        """
+        start, end = sorted((int(self.first[i_taxon_a]), int(self.first[i_taxon_b])))
+        block_size = self.BLOCK_SIZE
+        start_block = start // block_size
+        end_block = end // block_size
+
+        if start_block == end_block:
+            i_min = start + int(numpy.argmin(self.euler_depth[start:end + 1]))
+        else:
+            left_end = (start_block + 1) * block_size
+            right_start = end_block * block_size
+            candidates = [
+                start + int(numpy.argmin(self.euler_depth[start:left_end])),
+                right_start + int(numpy.argmin(self.euler_depth[right_start:end + 1])),
+            ]
+            n_blocks = end_block - start_block - 1
+            if n_blocks > 0:
+                level = n_blocks.bit_length() - 1
+                candidates.append(int(self.block_min[level, start_block + 1]))
+                candidates.append(int(self.block_min[level, end_block - (1 << level)]))
+            i_min = min(candidates, key=lambda i: self.euler_depth[i])
+
+        return int(self.euler[i_min])
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(rebuild=False):
+    """ Get the index of the local copy of the NCBI Taxonomy database, building it if necessary
+
+    Args:
+        rebuild (:obj:`bool`, optional): if :obj:`True`, rebuild the index from the local copy of the database
+
+    Returns:
+        :obj:`NcbiTaxonomyIndex`: index
+    """
+    global _index
+    with _index_lock:
+        if rebuild:
+            _index = NcbiTaxonomyIndex.build()
+        elif _index is None:
+            if NcbiTaxonomyIndex.exists():
+                _index = NcbiTaxonomyIndex()
+            else:
+                _index = NcbiTaxonomyIndex.build()
+    return _index
+
 
 class Taxon(object):
     """ Represents a taxon such as a genus, species, or strain
@@ -65,25 +456,25 @@ class Taxon(object):
         self.additional_name_beyond_nearest_ncbi_taxon = None
         self.cross_references = cross_references or []
 
-        ncbi_taxa = NCBITaxa()
+        index = get_index()
 
         if ncbi_id:
-            self.id_of_nearest_ncbi_taxon = ncbi_id
+            self.id_of_nearest_ncbi_taxon = int(ncbi_id)
             self.distance_from_nearest_ncbi_taxon = 0
             self.additional_name_beyond_nearest_ncbi_taxon = ''
-            self.name = ncbi_taxa.translate_to_names([ncbi_id])[0]
-            if self.name == ncbi_id:
+            self.name = index.get_name(ncbi_id)
+            if self.name is None:
                 raise ValueError('The NCBI taxonomy database does not contain a taxon with id {}'.format(ncbi_id))
         else:
             rank_names = name.split(' ')
             for i_rank in range(len(rank_names)):
                 partial_name = ' '.join(rank_names[0:len(rank_names) - i_rank])
-                result = ncbi_taxa.get_name_translator([partial_name])
-                if result:
-                    self.id_of_nearest_ncbi_taxon = result[partial_name][0]
+                result = index.get_ncbi_id_by_name(partial_name)
+                if result is not None:
+                    self.id_of_nearest_ncbi_taxon = result
                     self.distance_from_nearest_ncbi_taxon = i_rank
                     self.additional_name_beyond_nearest_ncbi_taxon = ''.join(' ' + n for n in rank_names[len(rank_names) - i_rank:])
-                    self.name = ncbi_taxa.translate_to_names([self.id_of_nearest_ncbi_taxon])[0] \
+                    self.name = index.get_name(self.id_of_nearest_ncbi_taxon) \
                         + self.additional_name_beyond_nearest_ncbi_taxon
                     return
 
@@ -110,11 +501,11 @@ class Taxon(object):
             return None
 
         cls = self.__class__
-        ncbi_taxa = NCBITaxa()
-        lineage = [cls(ncbi_id=id) for id in ncbi_taxa.get_lineage(self.id_of_nearest_ncbi_taxon)]
+        index = get_index()
+        lineage = [cls(ncbi_id=id) for id in index.get_lineage(self.id_of_nearest_ncbi_taxon)]
 
         if self.additional_name_beyond_nearest_ncbi_taxon:
-            base_name = ncbi_taxa.translate_to_names([self.id_of_nearest_ncbi_taxon])[0]
+            base_name = index.get_name(self.id_of_nearest_ncbi_taxon)
             names = self.additional_name_beyond_nearest_ncbi_taxon[1:].split(' ')
             for i_rank, name, in enumerate(names):
                 lineage.append(cls(name=base_name + ''.join(' ' + n for n in name[0:i_rank+1])))
@@ -128,8 +519,7 @@ class Taxon(object):
             :obj:`str`: rank of the taxon
         """
         if self.distance_from_nearest_ncbi_taxon == 0:
-            ncbi_taxa = NCBITaxa()
-            rank = ncbi_taxa.get_rank([self.id_of_nearest_ncbi_taxon])[self.id_of_nearest_ncbi_taxon]
+            rank = get_index().get_rank(self.id_of_nearest_ncbi_taxon)
             if rank != 'no rank':
                 return rank
 
@@ -145,15 +535,11 @@ class Taxon(object):
             :obj:`Taxon`: latest common ancestor
         """
         if self.id_of_nearest_ncbi_taxon is None:
-            return id_of_nearest_ncbi_taxon
+            return None
 
-        ncbi_taxa = NCBITaxa()
-        tree = ncbi_taxa.get_topology([self.id_of_nearest_ncbi_taxon, other.id_of_nearest_ncbi_taxon], intermediate_nodes=True)
-        self_node = tree.search_nodes(name=str(self.id_of_nearest_ncbi_taxon))[0]
-        other_node = tree.search_nodes(name=str(other.id_of_nearest_ncbi_taxon))[0]
-        ancestor = tree.get_common_ancestor(self_node, other_node)
+        ancestor = get_index().get_common_ancestor(self.id_of_nearest_ncbi_taxon, other.id_of_nearest_ncbi_taxon)
         cls = self.__class__
-        return cls(ncbi_id=float(ancestor.name))
+        return cls(ncbi_id=ancestor)
 
     def get_distance_to_common_ancestor(self, other):
         """ Calculate the number of links in the NCBI taxonomic tree between two taxa and their latest common ancestor
@@ -169,15 +555,11 @@ class Taxon(object):
              :obj:`int`: number of links between :obj:`self` and its latest common ancestor with :obj:`other` in the NCBI
                 taxonomic tree
         """
-        if self.id_of_nearest_ncbi_taxon is None:
-            return id_of_nearest_ncbi_taxon
+        if self.id_of_nearest_ncbi_taxon is None or other.id_of_nearest_ncbi_taxon is None:
+            return None
 
-        ncbi_taxa = NCBITaxa()
-        tree = ncbi_taxa.get_topology([self.id_of_nearest_ncbi_taxon, other.id_of_nearest_ncbi_taxon], intermediate_nodes=True)
-        self_node = tree.search_nodes(name=str(self.id_of_nearest_ncbi_taxon))[0]
-        other_node = tree.search_nodes(name=str(other.id_of_nearest_ncbi_taxon))[0]
-        ancestor = tree.get_common_ancestor(self_node, other_node)
-        return tree.get_distance(self_node, ancestor) + self.distance_from_nearest_ncbi_taxon
+        return get_index().get_distance_to_common_ancestor(self.id_of_nearest_ncbi_taxon, other.id_of_nearest_ncbi_taxon) \
+            + self.distance_from_nearest_ncbi_taxon
 
     def get_distance_to_root(self):
         """ Get the distance from the taxon to the root of the NCBI taxonomy tree
@@ -186,10 +568,9 @@ class Taxon(object):
             :obj:`int`: distance from the taxon to the root
         """
         if self.id_of_nearest_ncbi_taxon is None:
-            return id_of_nearest_ncbi_taxon
+            return None
 
-        ncbi_taxa = NCBITaxa()
-        return len(ncbi_taxa.get_lineage(self.id_of_nearest_ncbi_taxon)) - 1 + self.distance_from_nearest_ncbi_taxon
+        return get_index().get_distance_to_root(self.id_of_nearest_ncbi_taxon) + self.distance_from_nearest_ncbi_taxon
 
     def get_max_distance_to_common_ancestor(self):
         """ Get the maximum distance from the taxon to a common ancestor with another taxon
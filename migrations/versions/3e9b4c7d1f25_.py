@@ -0,0 +1,28 @@
+"""Add the fingerprints of the records of the source databases
+
+Revision ID: 3e9b4c7d1f25
+Revises: 8d3f1a7b2c60
+Create Date: 2018-10-17 11:05:43.127946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3e9b4c7d1f25'
+down_revision = '8d3f1a7b2c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('source_record_fingerprint',
+                    sa.Column('database_name', sa.Unicode(), nullable=False),
+                    sa.Column('record_id', sa.Unicode(), nullable=False),
+                    sa.Column('fingerprint', sa.Unicode(), nullable=True),
+                    sa.Column('updated', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('database_name', 'record_id'))
+
+
+def downgrade():
+    op.drop_table('source_record_fingerprint')
@@ -0,0 +1,36 @@
+"""Add the index of the participants of kinetic laws
+
+Revision ID: 5b2a6e0c9d41
+Revises: 21819b371a35
+Create Date: 2018-10-12 10:41:07.214519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '5b2a6e0c9d41'
+down_revision = '21819b371a35'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['reactant_inchis', 'product_inchis', 'modifier_inchis',
+           'reactant_formula_connectivities', 'product_formula_connectivities', 'modifier_formula_connectivities']
+
+
+def upgrade():
+    op.create_table('kinetic_law_participant_set',
+                    sa.Column('kinetic_law_id', sa.Integer(), nullable=False),
+                    *[sa.Column(column, postgresql.ARRAY(sa.Unicode()), nullable=True) for column in COLUMNS] +
+                    [sa.ForeignKeyConstraint(['kinetic_law_id'], ['kinetic_law.kinetic_law_id'], ),
+                     sa.PrimaryKeyConstraint('kinetic_law_id')])
+    for column in COLUMNS:
+        op.create_index('ix_kinetic_law_participant_set_' + column, 'kinetic_law_participant_set', [column],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for column in COLUMNS:
+        op.drop_index('ix_kinetic_law_participant_set_' + column, table_name='kinetic_law_participant_set')
+    op.drop_table('kinetic_law_participant_set')
@@ -0,0 +1,38 @@
+"""Add the index of the EC numbers of kinetic laws
+
+Revision ID: 8d3f1a7b2c60
+Revises: 5b2a6e0c9d41
+Create Date: 2018-10-15 14:22:51.608311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8d3f1a7b2c60'
+down_revision = '5b2a6e0c9d41'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['kinetic_law_id', 'ec_number', 'ec1', 'ec2', 'ec3', 'ec4']
+
+
+def upgrade():
+    op.create_table('kinetic_law_ec_number',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('kinetic_law_id', sa.Integer(), nullable=True),
+                    sa.Column('ec_number', sa.Unicode(), nullable=True),
+                    sa.Column('ec1', sa.Unicode(), nullable=True),
+                    sa.Column('ec2', sa.Unicode(), nullable=True),
+                    sa.Column('ec3', sa.Unicode(), nullable=True),
+                    sa.Column('ec4', sa.Unicode(), nullable=True),
+                    sa.ForeignKeyConstraint(['kinetic_law_id'], ['kinetic_law.kinetic_law_id'], ),
+                    sa.PrimaryKeyConstraint('id'))
+    for column in COLUMNS:
+        op.create_index(op.f('ix_kinetic_law_ec_number_' + column), 'kinetic_law_ec_number', [column], unique=False)
+
+
+def downgrade():
+    for column in COLUMNS:
+        op.drop_index(op.f('ix_kinetic_law_ec_number_' + column), table_name='kinetic_law_ec_number')
+    op.drop_table('kinetic_law_ec_number')
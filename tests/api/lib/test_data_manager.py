@@ -0,0 +1,32 @@
+""" Test of the base manager
+
+:Date: 2018-09-18
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.api.lib import data_manager
+from datanator.api.lib.complex.manager import ProteinComplexManager
+from datanator.api.lib.metabolite.manager import MetaboliteManager
+import mock
+import unittest
+
+
+class TestDataSource(unittest.TestCase):
+
+    def setUp(self):
+        self.data_sources = dict(data_manager.data_sources)
+        data_manager.data_sources.clear()
+
+    def tearDown(self):
+        data_manager.data_sources.clear()
+        data_manager.data_sources.update(self.data_sources)
+
+    def test_shared_lazy_data_source(self):
+        with mock.patch('datanator.core.common_schema.CommonSchema') as CommonSchema:
+            metabolite_manager = MetaboliteManager(cache_dirname='cache')
+            complex_manager = ProteinComplexManager(cache_dirname='cache')
+            CommonSchema.assert_not_called()
+
+            self.assertIs(metabolite_manager.data_source, complex_manager.data_source)
+            CommonSchema.assert_called_once_with(cache_dirname='cache')
@@ -53,6 +53,20 @@ class TestMetaboliteManager(unittest.TestCase):
         self.assertEqual(set(c.observable.specie.name for c in obs), set(['Uridine triphosphate']))
         self.assertEqual(set(c.observable.specie.structure for c in obs), set(['InChI=1S/C9H15N2O15P3/c12-5-1-2-11(9(15)10-5)8-7(14)6(13)4(24-8)3-23-28(19,20)26-29(21,22)25-27(16,17)18/h1-2,4,6-8,13-14H,3H2,(H,19,20)(H,21,22)(H,10,12,15)(H2,16,17,18)/t4-,6-,7-,8-/m1/s1']))
 
+    def test_get_observed_concentrations_by_metabolites(self):
+        obs = metabolite_manager.get_observed_concentrations_by_metabolites([self.proline, self.uridine_tp])
+        self.assertEqual(set(c.value for c in obs[self.proline.metabolite_id]), set([385.0, 451.0, 361.0, 143.0, 550.0, 531.67]))
+        self.assertEqual(set(c.value for c in obs[self.uridine_tp.metabolite_id]), set([2370.0, 3990.0, 8290.0, 663.0]))
+
+    def test_get_metabolites_by_ids(self):
+        metabolites = metabolite_manager.get_metabolites_by_ids([self.uridine_tp.metabolite_id, -1, self.proline.metabolite_id])
+        self.assertEqual(metabolites, [self.uridine_tp, self.proline])
+
+    def test_get_metabolites_by_structures(self):
+        metabolites = metabolite_manager.get_metabolites_by_structures([self.proline.structure._value_inchi, 'InChI=1S/unknown'])
+        self.assertIn(self.proline, metabolites[self.proline.structure._value_inchi])
+        self.assertEqual(metabolites['InChI=1S/unknown'], [])
+
     def test_get_concentration_by_structure(self):
 
         concentrations = metabolite_manager.get_concentration_by_structure(self.proline.structure._value_inchi, only_formula_and_connectivity=False)
@@ -7,6 +7,7 @@
 """
 
 from datanator.api.lib.search.manager import search_manager
+import decimal
 import unittest
 
 class TestSearchManager(unittest.TestCase):
@@ -17,6 +18,32 @@ class TestSearchManager(unittest.TestCase):
         self.assertGreater(len(dict['Reaction']), 0)
         self.assertEqual(len(dict['ProteinSubunit']), 0)
         self.assertEqual(len(dict['ProteinComplex']), 0)
+        self.assertEqual(dict['facets']['Metabolite'], len(dict['Metabolite']))
+
+    def test_search_pages(self):
+        dict = search_manager.search('glucose')
+        page_1 = search_manager.search('glucose', limit=2)
+        self.assertEqual(page_1['Metabolite'], dict['Metabolite'][0:2])
+        self.assertEqual(page_1['facets'], dict['facets'])
+
+        # the facets count the types which aren't on the page
+        page = search_manager.search('glucose', limit=1)
+        self.assertEqual(page['facets'], dict['facets'])
+        self.assertEqual(sum(1 for type in search_manager.SEARCH_TYPES if page[type]), 1)
+
+        page_2 = search_manager.search('glucose', limit=2, cursor=page_1['next_cursor'])
+        self.assertEqual(page_2['Metabolite'], dict['Metabolite'][2:4])
+        self.assertEqual(search_manager.search('glucose', limit=2, offset=2)['Metabolite'], page_2['Metabolite'])
+
+    def test_get_tsquery(self):
+        self.assertEqual(search_manager.get_tsquery('2-Oxopentanoate'), '2:* & Oxopentanoate:*')
+        self.assertEqual(search_manager.get_tsquery(' -'), None)
+
+    def test_cursor(self):
+        cursor = search_manager.encode_cursor(('Metabolite', 12, decimal.Decimal('0.060793')))
+        self.assertEqual(search_manager.decode_cursor(cursor), (decimal.Decimal('0.060793'), 'Metabolite', 12))
+        with self.assertRaisesRegexp(ValueError, 'Invalid cursor'):
+            search_manager.decode_cursor('abc')
 
     def test_get_object_by_id(self):
         obj = search_manager.get_object_by_id(5)
@@ -27,6 +27,18 @@ class TestProteinSubunitManager(unittest.TestCase):
         self.assertEqual(set(c.abundance for c in abundances),
                          set([1003.0, 1336.0]))
 
+    def test_get_observed_abundances_by_subunits(self):
+        abundances = subunit_manager.get_observed_abundances_by_subunits([self.protein_P00323, self.protein_P49418])
+        self.assertEqual(set(abundances.keys()), set([self.protein_P00323.subunit_id, self.protein_P49418.subunit_id]))
+        self.assertEqual(len(abundances[self.protein_P00323.subunit_id]),
+                         len(subunit_manager.get_observed_abundances(self.protein_P00323)))
+
+    def test_get_subunits_by_uniprot_ids(self):
+        subunits = subunit_manager.get_subunits_by_uniprot_ids(['P00323', 'unknown'])
+        self.assertIn(self.protein_P00323, subunits['P00323'])
+        self.assertEqual(subunits['unknown'], [])
+        self.assertEqual(subunit_manager.get_subunits_by_ids([self.protein_P00323.subunit_id]), [self.protein_P00323])
+
     def test_get_abundance_by_gene_name(self):
         gene_name = 'rplO'
         abundances = subunit_manager.get_abundance_by_gene_name(gene_name).filter(
@@ -11,13 +11,20 @@
 
 from datanator.core import data_model
 from datanator.data_source import sabio_rk
+from datanator.api.lib.reaction.manager import ReactionManager
 from datanator.api.query import reaction_kinetics
+from datanator.flask_app import app
 from datanator.util import taxonomy_util, molecule_util
 from datanator.core import models, common_schema
+from sqlalchemy_utils.functions import create_database, database_exists, drop_database
+import mock
 import unittest
 import random
+import sqlalchemy
+import sqlalchemy.orm
 import tempfile
 import shutil
+import warnings
 
 @unittest.skip('skip')
 class TestReactionKineticsQuery(unittest.TestCase):
@@ -176,3 +183,151 @@ class TestReactionKineticsQuery(unittest.TestCase):
 
         ans = self.q.get_metabolites_by_structure(struct[3414]._value_inchi, only_formula_and_connectivity=True).all()
         self.assertEqual(ans, struct[3414].metabolite)
+
+
+class TestReactionManagerObservedParameterValue(unittest.TestCase):
+    """ Tests of loading the observed parameter values of a reaction from a small set of kinetic laws in the test
+    database """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dirname = tempfile.mkdtemp()
+        cls.engine = sqlalchemy.create_engine(app.config['SQLALCHEMY_TEST_DATABASE_URI'])
+        if database_exists(cls.engine.url):
+            drop_database(cls.engine.url)
+        create_database(cls.engine.url)
+        models.db.metadata.create_all(cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        drop_database(cls.engine.url)
+        shutil.rmtree(cls.cache_dirname)
+
+    def setUp(self):
+        self.session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
+        self.manager = ReactionManager(cache_dirname=self.cache_dirname)
+        self.manager.data_source = mock.Mock(session=self.session)
+
+        self.taxon = models.Taxon(ncbi_id=2097, name='Mycoplasma genitalium')
+        self.compartment = models.CellCompartment(name='cytosol')
+        self.atp = models.Metabolite(metabolite_name='ATP', structure=models.Structure(_value_inchi='InChI=1S/ATP'))
+        self.adp = models.Metabolite(metabolite_name='ADP', structure=models.Structure(_value_inchi='InChI=1S/ADP'))
+        self.n_laws = 0
+
+    def tearDown(self):
+        self.session.close()
+        for table in reversed(models.db.metadata.sorted_tables):
+            self.engine.execute(table.delete())
+
+    def add_kinetic_laws(self, n_laws):
+        for i_law in range(self.n_laws, self.n_laws + n_laws):
+            metadata = models.Metadata(
+                name='Kinetic Law {}'.format(i_law + 1),
+                taxon=[self.taxon],
+                resource=[models.Resource(namespace='sabiork.reaction', _id=str(i_law + 1))],
+                conditions=[models.Conditions(temperature=37., ph=7.5)])
+            law = models.KineticLaw(_metadata=metadata)
+            law.reaction.append(models.Reaction(metabolite=self.atp, compartment=self.compartment,
+                                                coefficient=-1, _is_reactant=True))
+            law.reaction.append(models.Reaction(metabolite=self.adp, compartment=self.compartment,
+                                                coefficient=1, _is_product=True))
+            law.parameter.append(models.Parameter(metabolite=self.atp, observed_name='Km_ATP',
+                                                  value=1e-3 * (i_law + 1), error=1e-4, units='M'))
+            law.parameter.append(models.Parameter(observed_name='kcat', value=10. * (i_law + 1), units='s^(-1)'))
+            law.parameter.append(models.Parameter(observed_name='Ki', value=None))
+            self.session.add(law)
+        self.session.commit()
+        self.n_laws += n_laws
+
+    def get_observed_parameter_value(self):
+        """ Get the observed parameter values of all of the kinetic laws, counting the queries which this issues
+
+        Returns:
+            :obj:`tuple`:
+
+                * :obj:`list` of :obj:`data_model.ObservedValue`: observed values
+                * :obj:`int`: number of queries
+        """
+        laws = self.session.query(models.KineticLaw).order_by(models.KineticLaw.kinetic_law_id).all()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            with mock.patch.object(self.manager, 'get_kinetic_laws_by_reaction', return_value=laws):
+                observed_values = self.manager.get_observed_parameter_value(data_model.Reaction())
+        finally:
+            sqlalchemy.event.remove(self.engine, 'before_cursor_execute', before_cursor_execute)
+
+        return observed_values, len(statements)
+
+    def test_observed_values(self):
+        self.add_kinetic_laws(2)
+        observed_values, _ = self.get_observed_parameter_value()
+
+        self.assertEqual(sorted((val.observable.property, val.value) for val in observed_values),
+                         [('Km_ATP', 1e-3), ('Km_ATP', 2e-3), ('kcat', 10.), ('kcat', 20.)])
+
+        val = next(val for val in observed_values if val.value == 1e-3)
+        self.assertEqual(val.error, 1e-4)
+        self.assertEqual(val.units, 'M')
+        self.assertEqual(val.observable.specie.name, 'ATP')
+        self.assertEqual(val.metadata.genetics.taxon, 'Mycoplasma genitalium')
+        self.assertEqual(val.metadata.environment.temperature, 37.)
+
+        reaction = val.observable.interaction
+        self.assertEqual([(part.specie.name, part.specie.structure, part.coefficient, part.compartment.name)
+                          for part in reaction.participants],
+                         [('ATP', 'InChI=1S/ATP', -1, 'cytosol'), ('ADP', 'InChI=1S/ADP', 1, 'cytosol')])
+        self.assertIs(reaction.participants[0].specie, val.observable.specie)
+        law_id, = self.session.query(models.KineticLaw.kinetic_law_id).order_by(models.KineticLaw.kinetic_law_id).first()
+        self.assertEqual([(xr.namespace, xr.id) for xr in reaction.cross_references],
+                         [('common_schema.kinetic_law_id', str(law_id)), ('sabiork.reaction', '1')])
+
+    def test_number_of_queries_is_independent_of_the_number_of_laws(self):
+        self.add_kinetic_laws(2)
+        observed_values, n_queries = self.get_observed_parameter_value()
+        self.assertEqual(len(observed_values), 4)
+
+        self.add_kinetic_laws(8)
+        observed_values, n_queries_more_laws = self.get_observed_parameter_value()
+        self.assertEqual(len(observed_values), 20)
+        self.assertEqual(n_queries_more_laws, n_queries)
+
+        self.assertEqual(self.manager.load_kinetic_law_details([]), [])
+
+
+class TestReactionManagerPredictedEcNumbers(unittest.TestCase):
+    """ Tests of finding kinetic laws by the EC numbers which Ezyme predicts for a reaction """
+
+    def setUp(self):
+        self.cache_dirname = tempfile.mkdtemp()
+        self.manager = ReactionManager(cache_dirname=self.cache_dirname)
+        self.manager.data_source = mock.Mock()
+        self.manager.data_source.get_kinetic_laws_by_participant_structures.return_value = []
+        self.manager.data_source.get_kinetic_laws_by_ec_numbers.return_value.count.return_value = 0
+
+        self.reaction = data_model.Reaction(participants=[
+            data_model.ReactionParticipant(specie=data_model.Specie(structure='InChI=1S/ATP'), coefficient=-1),
+            data_model.ReactionParticipant(specie=data_model.Specie(structure='InChI=1S/ADP'), coefficient=1),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dirname)
+
+    def test_ezyme_errors_are_reported_rather_than_raised(self):
+        self.manager.ezyme = mock.Mock()
+        self.manager.ezyme.run_many.side_effect = IOError('Ezyme is unavailable')
+
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter('always')
+            laws = self.manager.get_kinetic_laws_by_reaction(self.reaction)
+
+        self.assertEqual(laws, self.manager.data_source.session.query.return_value.filter_by.return_value)
+        self.assertEqual(self.reaction.get_predicted_ec_numbers(), [])
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertIn('Ezyme is unavailable', str(caught_warnings[0].message))
@@ -0,0 +1,73 @@
+""" Test of the cache of serialized API responses
+
+:Date: 2018-09-12
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.api.cache import ResponseCache
+import shutil
+import tempfile
+import unittest
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.version = '1'
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def get_build_version(self):
+        return self.version
+
+    def test_get_key(self):
+        self.assertEqual(ResponseCache.get_key('Metabolite', {'id': 1, 'download': False}),
+                         ResponseCache.get_key('Metabolite', {'download': False, 'id': 1}))
+        self.assertNotEqual(ResponseCache.get_key('Metabolite', {'id': 1}),
+                            ResponseCache.get_key('Reaction', {'id': 1}))
+
+    def test_memory(self):
+        cache = ResponseCache(self.get_build_version, max_size=2, version_check_interval=0.)
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', b'{"a": 1}', {'Content-Type': 'application/json'})
+        self.assertEqual(cache.get('a'), (b'{"a": 1}', {'Content-Type': 'application/json'}))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+        # least recently used responses are evicted
+        cache.set('b', b'b')
+        cache.get('a')
+        cache.set('c', b'c')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a')[0], b'{"a": 1}')
+
+    def test_invalidation(self):
+        cache = ResponseCache(self.get_build_version, dirname=self.dirname, version_check_interval=0.)
+        cache.set('a', b'a')
+        self.assertEqual(cache.get('a')[0], b'a')
+
+        self.version = '2'
+        self.assertEqual(cache.get('a'), None)
+
+        cache.set('a', b'a2')
+        cache.clear()
+        self.assertEqual(cache.get('a'), None)
+
+    def test_version_check_interval(self):
+        cache = ResponseCache(self.get_build_version, version_check_interval=3600.)
+        cache.set('a', b'a')
+        self.version = '2'
+        self.assertEqual(cache.get('a')[0], b'a')
+
+    def test_disk(self):
+        cache_1 = ResponseCache(self.get_build_version, dirname=self.dirname, version_check_interval=0.)
+        cache_2 = ResponseCache(self.get_build_version, dirname=self.dirname, version_check_interval=0.)
+        cache_1.set('a', b'a', {'Content-Disposition': 'attachment; filename=a.json'})
+        self.assertEqual(cache_2.get('a'), (b'a', {'Content-Disposition': 'attachment; filename=a.json'}))
+
+        # responses of other builds are ignored
+        self.version = '2'
+        self.assertEqual(cache_2.get('a'), None)
@@ -0,0 +1,53 @@
+""" Test of the compiled serializers
+
+:Date: 2018-09-19
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.api import compiled_serializer
+from datanator.api import serializer
+from datanator.api.lib.metabolite.manager import metabolite_manager
+from datanator.core import data_model, models
+import unittest
+
+
+class TestCompiledSerializer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        session = metabolite_manager.data_source.session
+        cls.metabolites = session.query(models.Metabolite).filter(
+            models.Metabolite.metabolite_name.in_(['L-Proline', 'Uridine triphosphate'])).all()
+        cls.complexes = session.query(models.ProteinComplex).limit(5).all()
+        cls.subunits = session.query(models.ProteinSubunit).filter_by(uniprot_id='P00323').all()
+
+    def assert_dump_equal(self, schema_cls, obj, many=False):
+        self.assertEqual(compiled_serializer.dump(schema_cls, obj, many=many),
+                         schema_cls().dump(obj, many=many).data)
+
+    def test_model_schemas(self):
+        self.assert_dump_equal(serializer.MetaboliteSerializer, self.metabolites, many=True)
+        self.assert_dump_equal(serializer.MetaboliteSerializer, self.metabolites[0])
+        self.assert_dump_equal(serializer.ProteinComplexSerializer, self.complexes, many=True)
+        self.assert_dump_equal(serializer.ProteinSubunitSerializer, self.subunits, many=True)
+        self.assert_dump_equal(serializer.MetaboliteSerializer, [], many=True)
+
+    def test_schemas(self):
+        observed_values = metabolite_manager.get_observed_concentrations(self.metabolites[0])
+        self.assertGreater(len(observed_values), 0)
+        self.assert_dump_equal(serializer.ObservedValueSerializer, observed_values, many=True)
+
+        reaction = data_model.Reaction(name='reaction', participants=[
+            data_model.ReactionParticipant(specie=data_model.Specie(name='A', structure='InChI=1S/H2O/h1H2'),
+                                           coefficient=-1),
+        ])
+        self.assert_dump_equal(serializer.ReactionSerializer, reaction)
+
+    def test_compile(self):
+        serializer_1 = compiled_serializer.CompiledSerializer.get(serializer.MetaboliteSerializer)
+        self.assertIs(compiled_serializer.CompiledSerializer.get(serializer.MetaboliteSerializer), serializer_1)
+
+        serializer_1.compile()
+        self.assertIn('metabolite_name', [column[0] for column in serializer_1.columns])
+        self.assertIn('structure', [relationship[0] for relationship in serializer_1.relationships])
@@ -25,7 +25,7 @@ class TestViews(TestCase):
     #NOTE: Text Search tests
     def test_search_general(self):
         response = Search().get(self.general_search)
-        self.assertEqual(set(response[0].keys()),set(['complexes', 'metabolites', 'reactions', 'subunits']) )
+        self.assertEqual(set(response[0].keys()),set(['complexes', 'metabolites', 'reactions', 'subunits', 'facets', 'next_cursor']) )
 
     def test_search_metabolite(self):
         response = MetaboliteSearch().get(self.metabolite_search)
@@ -95,7 +95,7 @@ class TestAPIBlueprint(TestCase):
     def test_search_general(self):
         with self.client:
             response = self.client.get('/api/v0/search/{0}'.format(self.general_search)).json
-            self.assertEqual(set(response.keys()),set(['complexes', 'metabolites', 'reactions', 'subunits']) )
+            self.assertEqual(set(response.keys()),set(['complexes', 'metabolites', 'reactions', 'subunits', 'facets', 'next_cursor']) )
 
 
     def test_search_metabolite(self):
@@ -132,6 +132,36 @@ class TestAPIBlueprint(TestCase):
             response = self.client.get('/api/v0/reaction/{0}'.format(self.reaction_id)).json
             self.assertEqual(set(response.keys()),set(['object','parameters']))
 
+    #NOTE: Batch Tests
+    def test_metabolite_batch(self):
+        with self.client:
+            response = self.client.post('/api/v0/batch/metabolite', json={'ids': [self.metabolite_id, -1]}).json
+            self.assertEqual(set(response.keys()),set(['metabolites', 'not_found']))
+            self.assertEqual(set(response['metabolites'][0].keys()),set(['object','concentrations','reactions']))
+            self.assertEqual(response['not_found'], {'ids': [-1], 'inchis': []})
+
+            response = self.client.get('/api/v0/batch/metabolite?ids={0}&ids={0}'.format(self.metabolite_id)).json
+            self.assertEqual(len(response['metabolites']), 1)
+
+            self.assertEqual(self.client.post('/api/v0/batch/metabolite', json={}).status_code, 400)
+
+    def test_subunit_batch(self):
+        with self.client:
+            response = self.client.post('/api/v0/batch/subunit', json={'ids': [self.subunit_id], 'uniprot_ids': ['P00323']}).json
+            self.assertEqual(set(response.keys()),set(['subunits', 'not_found']))
+            self.assertEqual(set(response['subunits'][0].keys()),set(['object','abundances','complexes']))
+
+    def test_complex_batch(self):
+        with self.client:
+            response = self.client.post('/api/v0/batch/complex', json={'ids': [self.complex_id]}).json
+            self.assertEqual(set(response['complexes'][0].keys()),set(['object','subunits']))
+
+    def test_reaction_batch(self):
+        with self.client:
+            response = self.client.post('/api/v0/batch/reaction', json={'ids': [self.reaction_id]}).json
+            self.assertEqual(len(response['reactions']), 1)
+            self.assertEqual(response['not_found'], {'ids': []})
+
     #NOTE: Data Specific Tests
     def test_metabolite_concentrations(self):
         with self.client:
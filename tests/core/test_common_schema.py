@@ -7,19 +7,30 @@
 :Copyright: 2017, Karr Lab
 :License: MIT
 """
+import collections
 import unittest
-from datanator.core import common_schema, models
-from datanator.data_source import pax
+from datanator.core import common_schema, data_source, models
+from datanator.data_source import intact, pax, sabio_rk
+from datanator.flask_app import app
 import flask
+import mock
+import pandas
 import tempfile
 import shutil
 import random
 import os
 from six.moves import reload_module
-from sqlalchemy_utils.functions import drop_database
+from sqlalchemy_utils.functions import create_database, database_exists, drop_database
+import sqlalchemy
+import sqlalchemy.orm
 
 
 
+def run_fake_build_stage(options, stage):
+    """ Stand-in for :obj:`common_schema.run_build_stage` which the workers of the pool can unpickle """
+    return 1. if data_source._concurrent_writers else 0.
+
+
 class TestExistingDatabase(unittest.TestCase):
 
     @classmethod
@@ -54,6 +65,521 @@ class TestExistingDatabase(unittest.TestCase):
         self.assertGreater(len(subunits), 20000)
 
 
+class TestBuildStages(unittest.TestCase):
+
+    def test_dependencies(self):
+        stages = list(common_schema.CommonSchema.BUILD_STAGES.keys())
+        for i_stage, stage in enumerate(stages):
+            for dep in common_schema.CommonSchema.BUILD_STAGES[stage]:
+                self.assertLess(stages.index(dep), i_stage)
+
+        for dep in ['build_ecmdb', 'build_intact_complexes', 'build_corum']:
+            self.assertIn(dep, common_schema.CommonSchema.BUILD_STAGES['build_sabio'])
+        for stage in stages:
+            if stage not in ['build_uniprot', 'build_ncbi']:
+                self.assertIn(stage, common_schema.CommonSchema.BUILD_STAGES['build_uniprot'])
+                self.assertIn(stage, common_schema.CommonSchema.BUILD_STAGES['build_ncbi'])
+
+    def test_run_build_stages_serially(self):
+        schema = mock.Mock(BUILD_STAGES=common_schema.CommonSchema.BUILD_STAGES)
+        schema.run_build_stage.side_effect = lambda stage: 1.
+
+        timings = common_schema.CommonSchema.run_build_stages(schema, ['build_pax', 'build_sabio', 'build_ncbi'], jobs=1)
+        self.assertEqual(list(timings.keys()), ['build_pax', 'build_sabio', 'build_ncbi'])
+        self.assertEqual(list(timings.values()), [1., 1., 1.])
+        self.assertEqual([call[0][0] for call in schema.run_build_stage.call_args_list],
+                         ['build_pax', 'build_sabio', 'build_ncbi'])
+        schema.session.close.assert_not_called()
+        schema.merge_duplicate_objects.assert_not_called()
+
+    def test_run_build_stages_in_parallel(self):
+        schema = mock.Mock(BUILD_STAGES=common_schema.CommonSchema.BUILD_STAGES, cache_dirname=None, max_entries=10,
+                           verbose=False, load_entire_small_dbs=False, test=True)
+        schema.name = 'TestCommonSchema'
+        schema.get_build_watermarks.return_value = ({}, set([9606]))
+
+        stages = ['build_pax', 'build_ecmdb', 'build_intact_interactions', 'build_array_express']
+        with mock.patch.object(common_schema, 'run_build_stage', run_fake_build_stage):
+            timings = common_schema.CommonSchema.run_build_stages(schema, stages, jobs=2)
+
+        # each stage ran in a worker which avoids conflicting inserts with the other workers
+        self.assertEqual(list(timings.keys()), stages)
+        self.assertEqual(list(timings.values()), [1., 1., 1., 1.])
+        schema.run_build_stage.assert_not_called()
+        schema.engine.dispose.assert_called_once_with()
+        schema.merge_duplicate_objects.assert_called_once_with({}, set([9606]))
+
+    def test_run_build_stage_in_worker(self):
+        with mock.patch.object(common_schema, 'CommonSchema') as CommonSchema:
+            with mock.patch('sqlalchemy.create_engine') as create_engine:
+                with mock.patch('sqlalchemy.orm.sessionmaker') as sessionmaker:
+                    schema = CommonSchema.return_value
+                    constructor_engine = schema.engine
+                    constructor_session = schema.session
+                    schema.run_build_stage.return_value = 2.
+
+                    self.assertEqual(common_schema.run_build_stage({'name': 'TestCommonSchema'}, 'build_pax'), 2.)
+
+        CommonSchema.assert_called_once_with(name='TestCommonSchema')
+        constructor_session.close.assert_called_once_with()
+        constructor_engine.dispose.assert_called_once_with()
+        create_engine.return_value.dispose.assert_called_once_with()
+        sessionmaker.return_value.return_value.close.assert_called_once_with()
+
+
+class SmallDatabaseTestCase(unittest.TestCase):
+    """ Base class for tests which build the common schema from small fixtures in an empty test database """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dirname = tempfile.mkdtemp()
+        cls.cs = common_schema.CommonSchema(cache_dirname=cls.cache_dirname)
+
+        # replace the database of the common schema with an empty test database
+        cls.cs.session.close()
+        cls.cs.engine = sqlalchemy.create_engine(app.config['SQLALCHEMY_TEST_DATABASE_URI'])
+        if database_exists(cls.cs.engine.url):
+            drop_database(cls.cs.engine.url)
+        create_database(cls.cs.engine.url)
+        models.db.metadata.create_all(cls.cs.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.cs.engine.dispose()
+        drop_database(cls.cs.engine.url)
+        shutil.rmtree(cls.cache_dirname)
+
+    def setUp(self):
+        self.cs.session = sqlalchemy.orm.sessionmaker(bind=self.cs.engine)()
+        self.metabolites = {}
+
+    def tearDown(self):
+        self.cs.session.close()
+        for table in reversed(models.db.metadata.sorted_tables):
+            self.cs.engine.execute(table.delete())
+
+    def get_metabolite(self, name):
+        """ Get a metabolite of the fixtures, whose structure is derived from its name
+
+        Args:
+            name (:obj:`str`): name of the metabolite
+
+        Returns:
+            :obj:`models.Metabolite`: metabolite
+        """
+        if name not in self.metabolites:
+            structure = models.Structure(type='Structure', _value_inchi='InChI=1S/{}/c1-{}/h1H'.format(name, len(name)),
+                                         _structure_formula_connectivity='{}/c1-{}'.format(name, len(name)))
+            self.metabolites[name] = models.Metabolite(type='Metabolite', name=name, metabolite_name=name,
+                                                       structure=structure)
+        return self.metabolites[name]
+
+    def add_kinetic_law(self, id, reactants=(), products=(), modifiers=(), ec_numbers=()):
+        """ Add a kinetic law to the fixtures
+
+        Args:
+            id (:obj:`int`): SABIO-RK id of the kinetic law
+            reactants (:obj:`list` of :obj:`str`, optional): names of the reactants
+            products (:obj:`list` of :obj:`str`, optional): names of the products
+            modifiers (:obj:`list` of :obj:`str`, optional): names of the modifiers
+            ec_numbers (:obj:`list` of :obj:`str`, optional): EC numbers
+
+        Returns:
+            :obj:`models.KineticLaw`: kinetic law
+        """
+        metadata = models.Metadata(name='Kinetic Law {}'.format(id), resource=[
+            models.Resource(namespace='ec-code', _id=ec_number) for ec_number in ec_numbers])
+        law = models.KineticLaw(type='Kinetic Law', _metadata=metadata)
+        for names, role in [(reactants, '_is_reactant'), (products, '_is_product'), (modifiers, '_is_modifier')]:
+            for name in names:
+                law.reaction.append(models.Reaction(metabolite=self.get_metabolite(name), **{role: True}))
+        self.cs.session.add(law)
+        return law
+
+
+class TestKineticLawIndexes(SmallDatabaseTestCase):
+
+    def test_kinetic_law_participant_index(self):
+        law_1 = self.add_kinetic_law(1, reactants=['Glc', 'ATP'], products=['G6P', 'ADP'], modifiers=['Mg'])
+        law_2 = self.add_kinetic_law(2, reactants=['Glc', 'ATP'], products=['G6P', 'ADP'])
+        law_3 = self.add_kinetic_law(3, reactants=['Fru', 'ATP'], products=['F6P', 'ADP'], modifiers=['Mg'])
+        law_4 = self.add_kinetic_law(4)
+        law_4.reaction.append(models.Reaction(metabolite=models.Metabolite(metabolite_name='Unknown'), _is_reactant=True))
+        self.cs.session.commit()
+        self.cs.build_kinetic_law_participant_index()
+
+        session = self.cs.session
+        participant_set = session.query(models.KineticLawParticipantSet).filter_by(
+            kinetic_law_id=law_1.kinetic_law_id).first()
+        self.assertEqual(participant_set.reactant_inchis,
+                         sorted([self.get_metabolite('Glc').structure._value_inchi,
+                                 self.get_metabolite('ATP').structure._value_inchi]))
+        self.assertEqual(participant_set.modifier_formula_connectivities, ['Mg/c1-2'])
+        self.assertEqual(session.query(models.KineticLawParticipantSet).count(), 3)
+
+        def get_law_ids(**kwargs):
+            return [law.kinetic_law_id for law in self.cs.get_kinetic_laws_by_participant_structures(**kwargs)]
+
+        glc = self.get_metabolite('Glc').structure._value_inchi
+        atp = self.get_metabolite('ATP').structure._value_inchi
+        mg = self.get_metabolite('Mg').structure._value_inchi
+        self.assertEqual(get_law_ids(reactants=[atp]),
+                         sorted([law_1.kinetic_law_id, law_2.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(get_law_ids(reactants=[glc, atp]), sorted([law_1.kinetic_law_id, law_2.kinetic_law_id]))
+        self.assertEqual(get_law_ids(reactants=[atp], modifiers=[mg]),
+                         sorted([law_1.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(get_law_ids(reactants=['Glc/c1-3'], products=['ADP/c1-3'], only_formula_and_connectivity=True),
+                         sorted([law_1.kinetic_law_id, law_2.kinetic_law_id]))
+        self.assertEqual(get_law_ids(products=[glc]), [])
+        self.assertEqual(get_law_ids(reactants=['InChI=1S/unknown']), [])
+        self.assertEqual(self.cs.get_kinetic_laws_by_participant_structures(), [])
+
+        # the index is rebuilt
+        session.delete(next(rxn for rxn in law_2.reaction if rxn.metabolite.metabolite_name == 'Glc'))
+        session.commit()
+        self.cs.build_kinetic_law_participant_index()
+        self.assertEqual(get_law_ids(reactants=[glc, atp]), [law_1.kinetic_law_id])
+
+        # only the entries of the kinetic laws which changed are rebuilt
+        session.delete(next(rxn for rxn in law_1.reaction if rxn.metabolite.metabolite_name == 'Glc'))
+        session.delete(next(rxn for rxn in law_3.reaction if rxn.metabolite.metabolite_name == 'Mg'))
+        session.commit()
+        self.cs.build_kinetic_law_participant_index([law_1.kinetic_law_id])
+        self.assertEqual(get_law_ids(reactants=[glc, atp]), [])
+        self.assertEqual(get_law_ids(reactants=[atp], modifiers=[mg]),
+                         sorted([law_1.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(session.query(models.KineticLawParticipantSet).count(), 3)
+
+    def test_kinetic_law_ec_number_index(self):
+        law_1 = self.add_kinetic_law(1, ec_numbers=['3.4.21.62'])
+        law_2 = self.add_kinetic_law(2, ec_numbers=['3.4.21.73'])
+        law_3 = self.add_kinetic_law(3, ec_numbers=['3.4.22.1', '3.4.21.62'])
+        law_4 = self.add_kinetic_law(4, ec_numbers=['2.7.1'])
+        law_5 = self.add_kinetic_law(5)
+        self.cs.session.commit()
+        self.cs.build_kinetic_law_ec_number_index()
+
+        session = self.cs.session
+        ec_number = session.query(models.KineticLawEcNumber).filter_by(kinetic_law_id=law_1.kinetic_law_id).first()
+        self.assertEqual(ec_number.ec_number, '3.4.21.62')
+        self.assertEqual((ec_number.ec1, ec_number.ec2, ec_number.ec3, ec_number.ec4),
+                         ('3', '3.4', '3.4.21', '3.4.21.62'))
+        ec_number = session.query(models.KineticLawEcNumber).filter_by(kinetic_law_id=law_4.kinetic_law_id).first()
+        self.assertEqual((ec_number.ec1, ec_number.ec2, ec_number.ec3, ec_number.ec4), ('2', '2.7', '2.7.1', None))
+        self.assertEqual(session.query(models.KineticLawEcNumber).count(), 5)
+
+        def get_law_ids(ec_numbers, **kwargs):
+            return sorted(law.kinetic_law_id for law in self.cs.get_kinetic_laws_by_ec_numbers(ec_numbers, **kwargs))
+
+        self.assertEqual(get_law_ids(['3.4.21.62']), sorted([law_1.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(get_law_ids(['3.4.21.62', '2.7.1']),
+                         sorted([law_1.kinetic_law_id, law_3.kinetic_law_id, law_4.kinetic_law_id]))
+        self.assertEqual(get_law_ids(['3.4.21.62'], match_levels=3),
+                         sorted([law_1.kinetic_law_id, law_2.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(get_law_ids(['3.4.21.62'], match_levels=2),
+                         sorted([law_1.kinetic_law_id, law_2.kinetic_law_id, law_3.kinetic_law_id]))
+        self.assertEqual(get_law_ids(['2.7.1.1', '2.7'], match_levels=3), [law_4.kinetic_law_id])
+        self.assertEqual(get_law_ids(['1.1.1.1']), [])
+        self.assertEqual(get_law_ids([]), [])
+        self.assertNotIn(law_5.kinetic_law_id, get_law_ids(['3', '2'], match_levels=1))
+
+        # only the entries of the kinetic laws which changed are rebuilt
+        law_2._metadata.resource = [models.Resource(namespace='ec-code', _id='2.7.1.1')]
+        law_3._metadata.resource = []
+        session.commit()
+        self.cs.build_kinetic_law_ec_number_index([law_2.kinetic_law_id])
+        self.assertEqual(get_law_ids(['2.7.1.1']), [law_2.kinetic_law_id])
+        self.assertEqual(get_law_ids(['3.4.21.73']), [])
+        self.assertEqual(get_law_ids(['3.4.22.1']), [law_3.kinetic_law_id])
+        self.assertEqual(session.query(models.KineticLawEcNumber).count(), 5)
+
+
+class TestSourceRecords(SmallDatabaseTestCase):
+    """ Tests of tracking and deleting the integrated records of the source databases """
+
+    def test_record_fingerprints(self):
+        cs = self.cs
+        self.assertEqual(cs.get_changed_records('Source', collections.OrderedDict([('a', '1'), ('b', '2')])),
+                         (['a', 'b'], []))
+
+        cs.save_record_fingerprints('Source', {'a': '1', 'b': '2'})
+        cs.save_record_fingerprints('Other source', {'a': '3'})
+        cs.session.commit()
+        self.assertEqual(cs.get_changed_records('Source', collections.OrderedDict([('b', '3'), ('a', '1'), ('c', '4')]),
+                                                complete=False), (['b', 'c'], []))
+        self.assertEqual(cs.get_changed_records('Source', {'b': '2'}), ([], ['a']))
+        self.assertEqual(cs.get_changed_records('Source', {'b': '2'}, complete=False), ([], []))
+
+        # the fingerprints of the records which are integrated again are updated
+        cs.save_record_fingerprints('Source', {'b': '3'})
+        cs.session.commit()
+        self.assertEqual(cs.get_changed_records('Source', {'a': '1', 'b': '3'}), ([], []))
+        self.assertEqual(cs.session.query(models.SourceRecordFingerprint).count(), 3)
+
+        cs.delete_record_fingerprints('Source', ['a'])
+        cs.session.commit()
+        self.assertEqual(cs.get_changed_records('Source', {'a': '1', 'b': '3'}), (['a'], []))
+        self.assertEqual(cs.get_changed_records('Other source', {'a': '3'}), ([], []))
+
+    def test_delete_observations(self):
+        session = self.cs.session
+        dataset_1 = models.AbundanceDataSet(type='Protein Abundance Dataset', file_name='a.txt',
+                                            _metadata=models.Metadata(name='a.txt'))
+        dataset_2 = models.AbundanceDataSet(type='Protein Abundance Dataset', file_name='b.txt',
+                                            _metadata=models.Metadata(name='b.txt'))
+        session.add_all([dataset_1, dataset_2])
+        session.commit()
+        dataset_1_id = dataset_1.dataset_id
+        dataset_2_id = dataset_2.dataset_id
+
+        self.cs.delete_observations(models.AbundanceDataSet, [dataset_1_id])
+        session.commit()
+
+        # the observations are deleted from each of the tables of their class hierarchy
+        for model in [models.AbundanceDataSet, models.PhysicalProperty, models.Observation]:
+            table = model.__table__
+            id_column = list(table.primary_key.columns)[0]
+            self.assertEqual([id for id, in session.execute(sqlalchemy.select([id_column]))], [dataset_2_id])
+        self.assertEqual(self.cs.get_observation_ids_by_metadata_names(models.AbundanceDataSet, ['a.txt', 'b.txt']),
+                         [dataset_2_id])
+
+    def test_delete_pax_datasets(self):
+        session = self.cs.session
+        metadata_a = models.Metadata(name='a.txt')
+        metadata_b = models.Metadata(name='b.txt')
+        dataset_a = models.AbundanceDataSet(type='Protein Abundance Dataset', file_name='a.txt', _metadata=metadata_a)
+        dataset_b = models.AbundanceDataSet(type='Protein Abundance Dataset', file_name='b.txt', _metadata=metadata_b)
+
+        def add_subunit(uniprot_id, metadata, pax_load=1, **kwargs):
+            subunit = models.ProteinSubunit(type='Protein Subunit', uniprot_id=uniprot_id, pax_load=pax_load,
+                                            _metadata=metadata, **kwargs)
+            session.add(subunit)
+            return subunit
+
+        only_pax = add_subunit('P00001', metadata_a)
+        in_complex = add_subunit('P00002', metadata_a, proteincomplex=models.ProteinComplex(complex_name='Complex'))
+        with_binding_dataset = add_subunit('P00003', metadata_a)
+        with_other_abundances = add_subunit('P00004', metadata_a)
+        other_source = add_subunit('P00005', metadata_a, pax_load=None)
+        other_dataset = add_subunit('P00006', metadata_b, pax_load=2)
+        session.add(models.DNABindingDataset(type='DNA Binding Dataset', subunit=with_binding_dataset))
+        for subunit in [only_pax, in_complex, with_binding_dataset, with_other_abundances]:
+            session.add(models.AbundanceData(abundance=1., dataset=dataset_a, subunit=subunit,
+                                             uniprot_id=subunit.uniprot_id, pax_load=1))
+        for subunit in [with_other_abundances, other_dataset]:
+            session.add(models.AbundanceData(abundance=2., dataset=dataset_b, subunit=subunit,
+                                             uniprot_id=subunit.uniprot_id, pax_load=2))
+        session.commit()
+        kept_subunit_ids = sorted(subunit.subunit_id for subunit in [
+            in_complex, with_binding_dataset, with_other_abundances, other_source, other_dataset])
+        dataset_b_id = dataset_b.dataset_id
+
+        self.cs.delete_pax_datasets(['a.txt'])
+        session.commit()
+
+        self.assertEqual([id for id, in session.query(models.AbundanceDataSet.dataset_id)], [dataset_b_id])
+        self.assertEqual(sorted(id for id, in session.query(models.ProteinSubunit.subunit_id)), kept_subunit_ids)
+        self.assertEqual(sorted(id for id, in session.query(models.Observation.id)
+                                .filter(models.Observation.id.in_(kept_subunit_ids))),
+                         kept_subunit_ids)
+        self.assertEqual(sorted((abundance, dataset_id) for abundance, dataset_id in session.query(
+            models.AbundanceData.abundance, models.AbundanceData.dataset_id)), [(2., dataset_b_id), (2., dataset_b_id)])
+
+
+class TestBuildPax(SmallDatabaseTestCase):
+    """ Tests of integrating a small PaxDB fixture """
+
+    def setUp(self):
+        super(TestBuildPax, self).setUp()
+        self.pax_dirname = tempfile.mkdtemp()
+        self.paxdb = pax.Pax(cache_dirname=self.pax_dirname, download_backups=False)
+
+        pax_session = self.paxdb.session
+        pax_session.add(pax.Taxon(ncbi_id=2104, species_name='Mycoplasma pneumoniae'))
+        pax_session.add(pax.Dataset(id=1, file_name='2104-whole.txt', publication='http://pax-db.org/1', score=9.5,
+                                    weight=50, coverage=40, taxon_ncbi_id=2104))
+        pax_session.add(pax.Dataset(id=2, file_name='2104-membrane.txt', publication='http://pax-db.org/2',
+                                    score=4.5, weight=10, coverage=20, taxon_ncbi_id=2104))
+        for protein_id, uniprot_id in [(1, 'P75390'), (2, 'P75390'), (3, 'Q50341')]:
+            pax_session.add(pax.Protein(protein_id=protein_id, string_id='272634.MPN{}'.format(protein_id),
+                                        uniprot_id=uniprot_id))
+        for id, dataset_id, protein_id, abundance in [(1, 1, 1, '12.5'), (2, 1, 2, '3.5'), (3, 1, 3, '0.5'),
+                                                      (4, 2, 3, '7.0')]:
+            pax_session.add(pax.Observation(id=id, dataset_id=dataset_id, protein_id=protein_id, abundance=abundance))
+        pax_session.commit()
+
+        self.cs.session.add(models.Progress(database_name=common_schema.PAX_NAME, amount_loaded=0))
+        self.cs.session.commit()
+
+    def tearDown(self):
+        self.paxdb.session.close()
+        self.paxdb.engine.dispose()
+        shutil.rmtree(self.pax_dirname)
+        super(TestBuildPax, self).tearDown()
+
+    def build_pax(self):
+        with mock.patch.object(pax, 'Pax', return_value=self.paxdb):
+            self.cs.run_build_stage('build_pax')
+
+    def test_build_pax(self):
+        self.build_pax()
+        session = self.cs.session
+
+        for pax_dataset in self.paxdb.session.query(pax.Dataset).all():
+            dataset = session.query(models.AbundanceDataSet).filter_by(file_name=pax_dataset.file_name).one()
+            self.assertEqual((dataset.score, dataset.weight, dataset.coverage),
+                             (pax_dataset.score, pax_dataset.weight, pax_dataset.coverage))
+            self.assertEqual(dataset._metadata.name, pax_dataset.file_name)
+            self.assertEqual([taxon.ncbi_id for taxon in dataset._metadata.taxon], [2104])
+            self.assertEqual([resource._id for resource in dataset._metadata.resource], [pax_dataset.publication])
+
+            fingerprint = session.query(models.SourceRecordFingerprint).filter_by(
+                database_name=common_schema.PAX_NAME, record_id=pax_dataset.file_name).one()
+            self.assertEqual(fingerprint.fingerprint, self.cs.get_pax_dataset_fingerprints(
+                self.paxdb.session, [pax_dataset])[pax_dataset.file_name])
+
+        # the subunits are linked to the metadata of their dataset
+        whole = session.query(models.AbundanceDataSet).filter_by(file_name='2104-whole.txt').one()
+        subunits = session.query(models.ProteinSubunit).filter_by(_metadata_id=whole._metadata_id) \
+            .order_by(models.ProteinSubunit.subunit_id).all()
+        self.assertEqual([subunit.uniprot_id for subunit in subunits], ['P75390', 'P75390', 'Q50341'])
+        self.assertEqual(set(subunit.pax_load for subunit in subunits), set([1]))
+
+        # the abundances are linked to the first subunit of their dataset with the same UniProt id
+        abundances = session.query(models.AbundanceData).filter_by(dataset_id=whole.dataset_id) \
+            .order_by(models.AbundanceData.abundance).all()
+        self.assertEqual([(abundance.abundance, abundance.subunit_id) for abundance in abundances], [
+            (0.5, subunits[2].subunit_id), (3.5, subunits[0].subunit_id), (12.5, subunits[0].subunit_id)])
+
+        membrane = session.query(models.AbundanceDataSet).filter_by(file_name='2104-membrane.txt').one()
+        abundance = session.query(models.AbundanceData).filter_by(dataset_id=membrane.dataset_id).one()
+        self.assertEqual(abundance.abundance, 7.)
+        self.assertEqual(abundance.subunit.uniprot_id, 'Q50341')
+        self.assertEqual(abundance.subunit._metadata_id, membrane._metadata_id)
+        self.assertEqual(abundance.subunit.pax_load, 2)
+        self.assertNotIn(abundance.subunit_id, [subunit.subunit_id for subunit in subunits])
+
+    def test_rebuild_pax(self):
+        self.build_pax()
+        session = self.cs.session
+        whole = session.query(models.AbundanceDataSet).filter_by(file_name='2104-whole.txt').one()
+        whole_abundance_ids = sorted(id for id, in session.query(models.AbundanceData.abundance_id)
+                                     .filter_by(dataset_id=whole.dataset_id))
+        session.commit()
+
+        # only the datasets which changed are integrated again
+        self.paxdb.session.query(pax.Observation).filter_by(id=4).one().abundance = '8.0'
+        self.paxdb.session.commit()
+        self.build_pax()
+
+        self.assertEqual(session.query(models.AbundanceDataSet).count(), 2)
+        self.assertEqual(session.query(models.ProteinSubunit).count(), 4)
+        self.assertEqual(sorted(id for id, in session.query(models.AbundanceData.abundance_id)
+                                .filter_by(dataset_id=whole.dataset_id)), whole_abundance_ids)
+
+        membrane = session.query(models.AbundanceDataSet).filter_by(file_name='2104-membrane.txt').one()
+        abundance = session.query(models.AbundanceData).filter_by(dataset_id=membrane.dataset_id).one()
+        self.assertEqual(abundance.abundance, 8.)
+        self.assertEqual(abundance.subunit._metadata_id, membrane._metadata_id)
+
+
+class TestBuildSabio(SmallDatabaseTestCase):
+    """ Tests of integrating a small SABIO-RK fixture """
+
+    def setUp(self):
+        super(TestBuildSabio, self).setUp()
+        self.sabio_dirname = tempfile.mkdtemp()
+        self.sabiodb = sabio_rk.SabioRk(cache_dirname=self.sabio_dirname, download_backups=False)
+
+        sabio_session = self.sabiodb.session
+        self.compounds = {}
+        for id, name in [(1, 'ATP'), (2, 'ADP')]:
+            self.compounds[name] = sabio_rk.Compound(id=id, name=name, structures=[sabio_rk.CompoundStructure(
+                value=name, format='smiles', _value_inchi='InChI=1S/{}/c1-3/h1H'.format(name),
+                _value_inchi_formula_connectivity='{}/c1-3'.format(name))])
+        self.enzyme = sabio_rk.Enzyme(id=3, name='Hexokinase', molecular_weight=50000.)
+        subunit = sabio_rk.EnzymeSubunit(id=4, name='Hexokinase subunit', enzyme=self.enzyme, coefficient=2)
+        law = sabio_rk.KineticLaw(id=5, enzyme=self.enzyme, taxon=2104, temperature=37., ph=7.5,
+                                  reactants=[sabio_rk.ReactionParticipant(compound=self.compounds['ATP'],
+                                                                          type='Substrate')],
+                                  products=[sabio_rk.ReactionParticipant(compound=self.compounds['ADP'],
+                                                                         type='Product')])
+        sabio_session.add_all(list(self.compounds.values()) + [self.enzyme, subunit, law])
+        sabio_session.commit()
+
+        self.cs.session.add(models.Progress(database_name=common_schema.SABIO_NAME, amount_loaded=0))
+        self.cs.session.commit()
+
+    def tearDown(self):
+        self.sabiodb.session.close()
+        self.sabiodb.engine.dispose()
+        shutil.rmtree(self.sabio_dirname)
+        super(TestBuildSabio, self).tearDown()
+
+    def build_sabio(self):
+        with mock.patch.object(sabio_rk, 'SabioRk', return_value=self.sabiodb):
+            self.cs.run_build_stage('build_sabio')
+
+    def get_law_ids(self, reactant):
+        return [law.kinetic_law_id for law in self.cs.get_kinetic_laws_by_participant_structures(
+            reactants=['InChI=1S/{}/c1-3/h1H'.format(reactant)])]
+
+    def test_build_sabio(self):
+        self.build_sabio()
+        session = self.cs.session
+
+        metabolite = session.query(models.Metabolite).filter_by(metabolite_name='ATP').one()
+        self.assertEqual(metabolite.structure._value_inchi, 'InChI=1S/ATP/c1-3/h1H')
+        self.assertEqual(metabolite._metadata.name, 'ATP')
+        complx = session.query(models.ProteinComplex).filter_by(complex_name='Hexokinase').one()
+        self.assertEqual((complx.type, complx.molecular_weight), ('Enzyme', 50000.))
+        subunit = session.query(models.ProteinSubunit).filter_by(subunit_name='Hexokinase subunit').one()
+        self.assertEqual(subunit.proteincomplex_id, complx.complex_id)
+
+        law = session.query(models.KineticLaw).one()
+        self.assertEqual(law._metadata.name, 'Kinetic Law 5')
+        self.assertEqual(law.enzyme_id, complx.complex_id)
+        self.assertEqual(self.get_law_ids('ATP'), [law.kinetic_law_id])
+
+    def test_rebuild_sabio(self):
+        self.build_sabio()
+        session = self.cs.session
+        law_id, = session.query(models.KineticLaw.kinetic_law_id).one()
+        structure_id, = session.query(models.Metabolite.structure_id).filter_by(metabolite_name='ATP').one()
+        session.commit()
+
+        # a changed compound is updated in place, and the unchanged kinetic laws are reindexed with its new structure
+        structure = self.compounds['ATP'].structures[0]
+        structure.value = 'dATP'
+        structure._value_inchi = 'InChI=1S/dATP/c1-3/h1H'
+        structure._value_inchi_formula_connectivity = 'dATP/c1-3'
+        self.sabiodb.session.commit()
+        self.build_sabio()
+
+        metabolite = session.query(models.Metabolite).filter_by(metabolite_name='ATP').one()
+        self.assertEqual(metabolite.structure._value_inchi, 'InChI=1S/dATP/c1-3/h1H')
+        self.assertEqual(session.query(models.Structure).filter_by(struct_id=structure_id).count(), 0)
+        self.assertEqual(session.query(models.Structure).count(), 2)
+        self.assertEqual(session.query(models.KineticLaw.kinetic_law_id).one(), (law_id,))
+        self.assertEqual(self.get_law_ids('dATP'), [law_id])
+        self.assertEqual(self.get_law_ids('ATP'), [])
+        session.commit()
+
+        # a changed enzyme is updated in place, and its subunits and kinetic laws stay linked to it
+        self.enzyme.molecular_weight = 60000.
+        self.sabiodb.session.commit()
+        self.build_sabio()
+
+        complx = session.query(models.ProteinComplex).filter_by(complex_name='Hexokinase').one()
+        self.assertEqual(complx.molecular_weight, 60000.)
+        subunit = session.query(models.ProteinSubunit).filter_by(subunit_name='Hexokinase subunit').one()
+        self.assertEqual(subunit.proteincomplex_id, complx.complex_id)
+        law = session.query(models.KineticLaw).one()
+        self.assertEqual(law.enzyme_id, complx.complex_id)
+        self.assertEqual(self.get_law_ids('dATP'), [law.kinetic_law_id])
+        self.assertEqual(session.query(models.Metabolite).count(), 2)
+
+
 @unittest.skip('skip')
 class TestLoadingDatabase(unittest.TestCase):
     @classmethod
@@ -98,6 +624,12 @@ class TestLoadingDatabase(unittest.TestCase):
         taxon = session.query(models._metadata_taxon).filter_by(_metadata_id = metadata.id).first()
         self.assertEqual(taxon.taxon_id, comparison.taxon_ncbi_id)
 
+        abundance = session.query(models.AbundanceData).filter_by(dataset_id = dataset.dataset_id) \
+            .filter(models.AbundanceData.uniprot_id != None).first()
+        self.assertEqual(abundance.subunit.uniprot_id, abundance.uniprot_id)
+        self.assertEqual(abundance.subunit.pax_load, abundance.pax_load)
+        self.assertEqual(abundance.subunit._metadata_id, metadata.id)
+
 
     def test_jaspar(self):
         session = self.cs.session
@@ -169,7 +701,6 @@ class TestLoadingDatabase(unittest.TestCase):
         resource = session.query(models.Resource).filter_by(namespace = 'ec-code').filter_by(_id = '3.4.21.62').all()
         self.assertEqual(len(resource), 1)
 
-
     def test_corum(self):
         session = self.cs.session
         subunit = session.query(models.ProteinSubunit).filter_by(subunit_name = 'Histone deacetylase 5').first()
@@ -215,3 +746,46 @@ class TestLoadingDatabase(unittest.TestCase):
         uni = session.query(models.ProteinSubunit).filter_by(uniprot_id = 'Q72DQ8').first()
         self.assertEqual(uni.subunit_name, 'PYRH_DESVH')
         self.assertEqual(uni.length, '238')
+
+
+class TestMergeUniprotData(unittest.TestCase):
+
+    def test_merge_uniprot_data(self):
+        subunits = pandas.DataFrame([
+            dict(subunit_id=1, uniprot_id='Q72DQ8', subunit_name=None, gene_name=None, canonical_sequence=None,
+                 length=None, mass=None),
+            dict(subunit_id=2, uniprot_id='P00323', subunit_name='Flavodoxin', gene_name='', canonical_sequence=None,
+                 length='148', mass=None),
+            dict(subunit_id=3, uniprot_id='unknown', subunit_name=None, gene_name=None, canonical_sequence=None,
+                 length=None, mass=None),
+        ])
+        uniprot_data = pandas.DataFrame([
+            dict(uniprot_id='Q72DQ8', entry_name='PYRH_DESVH', gene_name='pyrH', canonical_sequence='MKY',
+                 length=238, mass=25420),
+            dict(uniprot_id='P00323', entry_name='FLAV_DESVH', gene_name='DVU_2680', canonical_sequence='MPK',
+                 length=None, mass=15960),
+        ])
+
+        updates = common_schema.CommonSchema.merge_uniprot_data(subunits, uniprot_data)
+        self.assertEqual(updates, [
+            dict(_subunit_id=1, _subunit_name='PYRH_DESVH', _gene_name='pyrH', _canonical_sequence='MKY',
+                 _length='238', _mass='25420'),
+            dict(_subunit_id=2, _subunit_name='Flavodoxin', _gene_name='DVU_2680', _canonical_sequence='MPK',
+                 _length='148', _mass='15960'),
+        ])
+
+
+class TestIntactInteractionRecords(unittest.TestCase):
+
+    def test_get_intact_interaction_record_id(self):
+        interaction = intact.ProteinInteraction(index=1, interaction_id='intact:EBI-7121552|imex:IM-12345-1',
+                                                protein_a='P49418', protein_b='O43426')
+        record_id = common_schema.CommonSchema.get_intact_interaction_record_id(interaction)
+        self.assertEqual(record_id, 'intact:EBI-7121552|imex:IM-12345-1:P49418:O43426')
+
+        # the ids don't depend on the positions of the interactions in the IntAct export
+        interaction.index = 2
+        self.assertEqual(common_schema.CommonSchema.get_intact_interaction_record_id(interaction), record_id)
+
+        interaction.protein_b = 'P12345'
+        self.assertNotEqual(common_schema.CommonSchema.get_intact_interaction_record_id(interaction), record_id)
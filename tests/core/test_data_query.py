@@ -9,9 +9,11 @@
 
 from datanator.core import data_model
 from datanator.core import data_query
+from datanator.util import taxonomy_util
 from datanator.util import warning_util
 import copy
 import math
+import mock
 import numpy
 import scipy.stats
 import unittest
@@ -98,6 +100,34 @@ class TestFilters(unittest.TestCase):
             metadata=data_model.ObservedResultMetadata(genetics=data_model.Genetics(taxon='Mycoplasma')))
         self.assertEqual(f.score(None, ov), math.exp(-1/f.scale))
 
+        # the distances to the observed taxa are only calculated once
+        ov = [
+            data_model.ObservedValue(metadata=data_model.ObservedResultMetadata(genetics=data_model.Genetics(taxon=taxon)))
+            for taxon in ['Mycoplasma', None, 'Mycoplasma genitalium G37', 'Mycoplasma', 'Mycoplasma genitalium G37']
+        ]
+        with mock.patch.object(taxonomy_util.Taxon, 'get_distance_to_common_ancestor') as get_distance:
+            numpy.testing.assert_equal(f.score_many(None, ov), [math.exp(-1/f.scale), 0.5, 1., math.exp(-1/f.scale), 1.])
+        get_distance.assert_not_called()
+
+        f._distances = {}
+        with mock.patch.object(taxonomy_util.Taxon, 'get_distance_to_common_ancestor', return_value=0) as get_distance:
+            numpy.testing.assert_equal(f.score_many(None, ov), [1., 0.5, 1., 1., 1.])
+        self.assertEqual(get_distance.call_count, 2)
+        self.assertEqual(sorted(f._distances.keys()), [
+            ('Mycoplasma genitalium', 'Mycoplasma'), ('Mycoplasma genitalium', 'Mycoplasma genitalium G37')])
+
+        # values of taxa which can't be resolved are scored the same as by score
+        ov = [
+            data_model.ObservedValue(metadata=data_model.ObservedResultMetadata(genetics=data_model.Genetics(taxon=taxon)))
+            for taxon in ['Mycoplasma', 'Not a taxon', None]
+        ]
+        get_distance = lambda target_taxon, observed_taxon: 1 if observed_taxon.name == 'Mycoplasma' else None
+        with mock.patch.object(taxonomy_util.Taxon, 'get_distance_to_common_ancestor', get_distance):
+            f._distances = {}
+            self.assertEqual(f.score(None, ov[1]), 0.5)
+            numpy.testing.assert_equal(f.score_many(None, ov), [f.score(None, o) for o in ov])
+            numpy.testing.assert_equal(f.score_many(None, ov), [math.exp(-1/f.scale), 0.5, 0.5])
+
     def test_OptionsFilter(self):
         f = data_query.OptionsFilter(('metadata', 'genetics', 'variation', ), [''])
         ov = data_model.ObservedValue(
@@ -526,6 +556,39 @@ class TestFilterRunner(unittest.TestCase):
         s = 2 * scipy.stats.norm.cdf(-1)
         numpy.testing.assert_almost_equal(list(runner.score(None, ov).ravel()), [1., 1., s, s, 1., 1., s, s], decimal=5)
 
+    def test_score_many(self):
+        ov = [
+            data_model.ObservedValue(value=1, metadata=data_model.ObservedResultMetadata(
+                environment=data_model.Environment(temperature=37, ph=7),
+                genetics=data_model.Genetics(taxon='Mycoplasma genitalium', variation=''))),
+            data_model.ObservedValue(value=1, metadata=data_model.ObservedResultMetadata(
+                environment=data_model.Environment(temperature=36, ph=float('nan')),
+                genetics=data_model.Genetics(taxon='Escherichia coli', variation='mutant'))),
+            data_model.ObservedValue(value=1, metadata=data_model.ObservedResultMetadata(
+                environment=data_model.Environment(temperature=None, ph=5),
+                genetics=data_model.Genetics(taxon='Mycoplasma genitalium', variation=None))),
+            data_model.ObservedValue(value=1, metadata=data_model.ObservedResultMetadata(
+                environment=data_model.Environment(temperature=39, ph=None),
+                genetics=data_model.Genetics(taxon=None))),
+        ]
+        f = [
+            data_query.TemperatureRangeFilter(min=36.5, max=37.5),
+            data_query.PhRangeFilter(min=6.5),
+            data_query.TemperatureNormalFilter(mean=37., std=1),
+            data_query.ExponentialFilter(('metadata', 'environment', 'ph', ), center=7., scale=2.),
+            data_query.WildtypeFilter(),
+            data_query.TaxonomicDistanceFilter('Mycoplasma pneumoniae'),
+        ]
+
+        # vectorized scores match the scores of the individual observed values
+        scores = data_query.FilterRunner(f).score(None, ov)
+        for i_filter, filter in enumerate(f):
+            numpy.testing.assert_equal(scores[:, i_filter], [filter.score(None, obs) for obs in ov])
+
+        # filters without a vectorized implementation are scored item by item
+        filter = data_query.Filter(('value', ))
+        numpy.testing.assert_equal(filter.score_many(None, ov), [1., 1., 1., 1.])
+
     def test_filter(self):
         ov = [
             data_model.ObservedValue(value=1, metadata=data_model.ObservedResultMetadata(
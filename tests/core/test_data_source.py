@@ -0,0 +1,448 @@
+""" Test of the identity cache of the data sources
+
+:Date: 2018-09-04
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.core import data_source
+from six.moves import BaseHTTPServer
+from six.moves.urllib.parse import urlparse, parse_qs
+import gc
+import os
+import shutil
+import sqlalchemy
+import sqlalchemy.ext.declarative
+import sqlalchemy.orm
+import tempfile
+import threading
+import unittest
+import weakref
+
+Base = sqlalchemy.ext.declarative.declarative_base()
+
+
+class Taxon(Base):
+    __tablename__ = 'taxon'
+    ncbi_id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String())
+
+
+class Resource(Base):
+    __tablename__ = 'resource'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    namespace = sqlalchemy.Column(sqlalchemy.String())
+    _id = sqlalchemy.Column(sqlalchemy.String())
+
+
+metadata_resource = sqlalchemy.Table(
+    'metadata_resource', Base.metadata,
+    sqlalchemy.Column('metadata_id', sqlalchemy.Integer, sqlalchemy.ForeignKey('metadata.id')),
+    sqlalchemy.Column('resource_id', sqlalchemy.Integer, sqlalchemy.ForeignKey('resource.id')),
+)
+
+
+class Metadata(Base):
+    __tablename__ = 'metadata'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String())
+    taxon_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('taxon.ncbi_id'))
+    resources = sqlalchemy.orm.relationship('Resource', secondary=metadata_resource)
+
+
+class Entity(Base):
+    __tablename__ = 'entity'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    type = sqlalchemy.Column(sqlalchemy.String())
+    metadata_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('metadata.id'))
+    _metadata = sqlalchemy.orm.relationship('Metadata')
+    __mapper_args__ = {'polymorphic_on': type, 'polymorphic_identity': 'entity'}
+
+
+class Subunit(Entity):
+    __tablename__ = 'subunit'
+    subunit_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('entity.id'), primary_key=True)
+    uniprot_id = sqlalchemy.Column(sqlalchemy.String())
+    __mapper_args__ = {'polymorphic_identity': 'subunit'}
+
+
+class Abundance(Base):
+    __tablename__ = 'abundance'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    subunit_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('subunit.subunit_id'))
+    subunit = sqlalchemy.orm.relationship('Subunit')
+
+
+class MockHttpDataSource(data_source.HttpDataSource):
+    base_model = Base
+    MIN_HTTP_REQUEST_INTERVAL = 0.
+    HTTP_RETRY_BACKOFF = 0.
+
+    def load_content(self):
+        pass
+
+
+class MockRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    n_requests = 0
+    n_failures = 0
+
+    def do_GET(self):
+        cls = self.__class__
+        cls.n_requests += 1
+        if cls.n_failures:
+            cls.n_failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        id = parse_qs(urlparse(self.path).query)['id'][0]
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(('id-' + id).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestObjectCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
+
+        self.queries = []
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute', self.log_query)
+
+    def tearDown(self):
+        self.session.close()
+
+    def log_query(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.queries.append(statement)
+
+    def test_get_or_create(self):
+        cache = data_source.ObjectCache(self.session)
+
+        res_1 = cache.get_or_create(Resource, namespace='pubmed', _id='1')
+        self.assertEqual(len(self.queries), 1)
+        self.assertIn(res_1, self.session.new)
+
+        res_2 = cache.get_or_create(Resource, namespace='pubmed', _id='1')
+        self.assertIs(res_2, res_1)
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+        res_3 = cache.get_or_create(Resource, namespace='pubmed', _id='2')
+        self.assertIsNot(res_3, res_1)
+
+        self.session.commit()
+        self.assertEqual(self.session.query(Resource).count(), 2)
+
+    def test_get_existing(self):
+        self.session.add(Taxon(ncbi_id=9606, name='Homo sapiens'))
+        self.session.commit()
+
+        cache = data_source.ObjectCache(self.session)
+        taxon = cache.get_or_create(Taxon, ncbi_id=9606)
+        self.assertEqual(taxon.name, 'Homo sapiens')
+        self.assertIs(cache.get_or_create(Taxon, ncbi_id='9606'), taxon)
+
+    def test_update_or_create(self):
+        cache = data_source.ObjectCache(self.session)
+        metadata = Metadata(name='ATP')
+        self.session.add(metadata)
+
+        subunit = cache.update_or_create(Subunit, {'uniprot_id': 'P00001'}, _metadata=metadata)
+        self.assertIn(subunit, self.session.new)
+        self.session.commit()
+
+        # objects whose other attributes change are updated rather than duplicated
+        cache = data_source.ObjectCache(self.session)
+        self.assertIs(cache.update_or_create(Subunit, {'uniprot_id': 'P00001'}, _metadata=None), subunit)
+        self.assertEqual(subunit._metadata, None)
+        self.assertIs(cache.get_or_create(Subunit, uniprot_id='P00001'), subunit)
+        self.session.commit()
+        self.assertEqual(self.session.query(Subunit).count(), 1)
+        self.assertEqual(self.session.query(Subunit).first().metadata_id, None)
+
+    def test_preload(self):
+        self.session.add(Taxon(ncbi_id=9606, name='Homo sapiens'))
+        self.session.add(Taxon(ncbi_id=562, name='Escherichia coli'))
+        self.session.commit()
+
+        cache = data_source.ObjectCache(self.session)
+        cache.preload(Taxon, 'ncbi_id')
+        n_queries = len(self.queries)
+
+        self.assertEqual(cache.get_or_create(Taxon, ncbi_id=562).name, 'Escherichia coli')
+        new_taxon = cache.get_or_create(Taxon, ncbi_id=2097)
+        self.assertIn(new_taxon, self.session.new)
+        self.assertEqual(len(self.queries), n_queries)
+
+        # lookups by other attributes still query the database
+        cache.get_or_create(Taxon, ncbi_id=9606, name='Homo sapiens')
+        self.assertEqual(len(self.queries), n_queries + 1)
+
+    def test_max_size(self):
+        cache = data_source.ObjectCache(self.session, max_size=2)
+        res_1 = cache.get_or_create(Resource, namespace='pubmed', _id='1')
+        cache.get_or_create(Resource, namespace='pubmed', _id='2')
+        cache.get_or_create(Resource, namespace='pubmed', _id='3')
+        self.assertEqual(len(cache._objects), 2)
+
+        # evicted, unflushed objects are still found
+        self.assertIs(cache.get_or_create(Resource, namespace='pubmed', _id='1'), res_1)
+        self.session.commit()
+        self.assertEqual(self.session.query(Resource).count(), 3)
+
+    def test_unhashable_values(self):
+        cache = data_source.ObjectCache(self.session)
+        self.assertEqual(cache.get_key(Taxon, {'name': ['a', 'b']}), None)
+
+    def test_get_object_cache(self):
+        cache = data_source.get_object_cache(self.session)
+        self.assertIs(data_source.get_object_cache(self.session), cache)
+
+        scoped_session = sqlalchemy.orm.scoped_session(sqlalchemy.orm.sessionmaker(bind=self.engine))
+        self.assertIsNot(data_source.get_object_cache(scoped_session), cache)
+        self.assertIs(data_source.get_object_cache(scoped_session), data_source.get_object_cache(scoped_session()))
+
+        cache.get_or_create(Taxon, ncbi_id=9606)
+        self.session.rollback()
+        self.assertEqual(len(cache._objects), 0)
+
+    def test_session_isnt_kept_alive(self):
+        session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
+        cache = data_source.get_object_cache(session)
+        self.assertIs(cache.session, session)
+
+        session_ref = weakref.ref(session)
+        del session
+        gc.collect()
+        self.assertIs(session_ref(), None)
+        self.assertIs(cache.session, None)
+
+    def test_objects_added_without_cache(self):
+        cache = data_source.get_object_cache(self.session)
+        cache.preload(Taxon, 'ncbi_id')
+
+        with self.session.no_autoflush:
+            self.session.add(Taxon(ncbi_id=9606, name='Homo sapiens'))
+            taxon = cache.get_or_create(Taxon, ncbi_id=9606)
+        self.assertEqual(taxon.name, 'Homo sapiens')
+        self.session.commit()
+        self.assertEqual(self.session.query(Taxon).count(), 1)
+
+    def test_changed_objects(self):
+        cache = data_source.get_object_cache(self.session)
+        cache.preload(Resource, 'namespace', '_id')
+        res = cache.get_or_create(Resource, namespace='pubmed', _id='1')
+        res._id = '2'
+        self.session.flush()
+
+        self.assertIs(cache.get_or_create(Resource, namespace='pubmed', _id='2'), res)
+        self.assertIsNot(cache.get_or_create(Resource, namespace='pubmed', _id='1'), res)
+        self.session.commit()
+        self.assertEqual(self.session.query(Resource).count(), 2)
+
+        # changes are noticed before the session is flushed
+        res._id = '3'
+        self.assertIs(cache.get_or_create(Resource, namespace='pubmed', _id='3'), res)
+        self.assertIsNot(cache.get_or_create(Resource, namespace='pubmed', _id='2'), res)
+        self.session.commit()
+        self.assertEqual(self.session.query(Resource).count(), 3)
+
+    def test_objects_of_other_classes_added_without_cache(self):
+        cache = data_source.get_object_cache(self.session)
+        cache.preload(Taxon, 'ncbi_id')
+        cache.preload(Resource, 'namespace', '_id')
+
+        # objects of other classes don't invalidate the preloaded classes or flush the session
+        self.session.add(Abundance())
+        n_queries = len(self.queries)
+        cache.get_or_create(Taxon, ncbi_id=9606)
+        self.assertEqual(len(self.queries), n_queries)
+        self.assertEqual(len(self.session.new), 2)
+
+        # misses for the class of the objects flush the session
+        self.session.add(Resource(namespace='pubmed', _id='1'))
+        self.assertTrue(cache.has_unflushed_objects(Resource))
+        self.assertFalse(cache.has_unflushed_objects(Taxon))
+        res = cache.get_or_create(Resource, namespace='pubmed', _id='1')
+        self.assertEqual(len(self.queries), n_queries + 1)
+        self.assertEqual(len(self.session.new), 0)
+        self.assertNotIn(res, self.session.new)
+        self.assertFalse(cache.has_unflushed_objects(Resource))
+
+    def test_concurrent(self):
+        dirname = tempfile.mkdtemp()
+        engine = sqlalchemy.create_engine('sqlite:///' + os.path.join(dirname, 'db.sqlite'))
+        Base.metadata.create_all(engine)
+
+        session_1 = sqlalchemy.orm.sessionmaker(bind=engine)()
+        session_2 = sqlalchemy.orm.sessionmaker(bind=engine)()
+        cache_1 = data_source.ObjectCache(session_1, concurrent=True)
+        cache_2 = data_source.ObjectCache(session_2, concurrent=True)
+        cache_1.preload(Taxon, 'ncbi_id')
+        cache_2.preload(Taxon, 'ncbi_id')
+
+        # objects which are identified by their primary keys are inserted with conflicts ignored
+        taxon_1 = cache_1.get_or_create(Taxon, ncbi_id=9606)
+        taxon_2 = cache_2.get_or_create(Taxon, ncbi_id=9606)
+        self.assertNotIn(taxon_1, session_1.new)
+        self.assertEqual(taxon_1.ncbi_id, 9606)
+        self.assertEqual(taxon_2.ncbi_id, 9606)
+
+        # the other objects are created in the transactions of the sessions
+        res_1 = cache_1.get_or_create(Resource, namespace='pubmed', _id='1')
+        res_2 = cache_2.get_or_create(Resource, namespace='pubmed', _id='1')
+        self.assertIn(res_1, session_1.new)
+        self.assertIn(res_2, session_2.new)
+
+        session_1.commit()
+        session_2.rollback()
+        self.assertEqual(session_1.query(Taxon).count(), 1)
+        self.assertEqual(session_1.query(Resource).count(), 1)
+
+        session_1.close()
+        session_2.close()
+        engine.dispose()
+        shutil.rmtree(dirname)
+
+    def test_set_concurrent_writers(self):
+        data_source.set_concurrent_writers(True)
+        try:
+            session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
+            self.assertTrue(data_source.get_object_cache(session).concurrent)
+        finally:
+            data_source.set_concurrent_writers(False)
+        self.assertFalse(data_source.get_object_cache(self.session).concurrent)
+
+
+class TestMergeDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_merge_duplicates(self):
+        # e.g. objects which two processes created at the same time
+        res_1 = Resource(namespace='pubmed', _id='1')
+        res_2 = Resource(namespace='pubmed', _id='1')
+        res_3 = Resource(namespace='pubmed', _id='2')
+        metadata_1 = Metadata(name='a', resources=[res_1, res_3])
+        metadata_2 = Metadata(name='a', resources=[res_2])
+        metadata_3 = Metadata(name='b', resources=[res_2])
+        subunit_1 = Subunit(uniprot_id='P00001', _metadata=metadata_1)
+        subunit_2 = Subunit(uniprot_id='P00001', _metadata=metadata_2)
+        subunit_3 = Subunit(uniprot_id='P00002', _metadata=metadata_2)
+        self.session.add_all([metadata_1, metadata_2, metadata_3, subunit_1, subunit_2, subunit_3,
+                              Abundance(subunit=subunit_1), Abundance(subunit=subunit_2)])
+        self.session.commit()
+        ids = (res_1.id, metadata_1.id, metadata_3.id, subunit_1.id, subunit_3.id)
+
+        self.assertEqual(data_source.merge_duplicates(self.session, Resource, ['namespace', '_id']), 1)
+        self.assertEqual(data_source.merge_duplicates(self.session, Metadata, ['name']), 1)
+        self.assertEqual(data_source.merge_duplicates(self.session, Subunit, ['uniprot_id', '_metadata']), 1)
+        self.assertEqual(data_source.merge_duplicates(self.session, Subunit, ['uniprot_id', '_metadata']), 0)
+        self.session.commit()
+        self.session.expire_all()
+
+        self.assertEqual(sorted(id for id, in self.session.query(Resource.id)), sorted([ids[0], res_3.id]))
+        self.assertEqual(sorted(id for id, in self.session.query(Metadata.id)), sorted([ids[1], ids[2]]))
+        self.assertEqual(sorted(id for id, in self.session.query(Subunit.id)), sorted([ids[3], ids[4]]))
+        self.assertEqual(self.session.query(Entity).count(), 2)
+
+        metadata = self.session.query(Metadata).get(ids[1])
+        self.assertEqual(sorted(res._id for res in metadata.resources), ['1', '2'])
+        self.assertEqual(self.session.query(metadata_resource).count(), 3)
+        self.assertEqual([res.id for res in self.session.query(Metadata).get(ids[2]).resources], [ids[0]])
+        self.assertEqual(self.session.query(Subunit).get(ids[4])._metadata, metadata)
+        self.assertEqual(set(abundance.subunit_id for abundance in self.session.query(Abundance)), set([ids[3]]))
+
+    def test_merge_new_duplicates(self):
+        # e.g. the objects of an earlier build
+        self.session.add_all([Resource(namespace='pubmed', _id='1'), Resource(namespace='pubmed', _id='1'),
+                              Resource(namespace='pubmed', _id='2')])
+        self.session.commit()
+        max_id = data_source.get_max_id(self.session, Resource)
+        self.assertEqual(max_id, 3)
+        self.assertEqual(data_source.get_max_id(self.session, Subunit), 0)
+
+        # only the new objects are merged, and only by the attributes which identify them
+        self.session.add_all([Resource(namespace='url', _id='1'),
+                              Resource(namespace='pubmed', _id='2'), Resource(namespace='pubmed', _id='2'),
+                              Resource(namespace='pubmed', _id='3'), Resource(namespace='pubmed', _id='3')])
+        self.session.commit()
+        self.assertEqual(data_source.merge_duplicates(self.session, Resource, ['_id'], after_id=max_id), 4)
+        self.session.commit()
+        self.assertEqual(sorted(id for id, in self.session.query(Resource.id)), [1, 2, 3, 7])
+
+        # objects which don't meet the criterion aren't merged
+        self.session.add_all([Subunit(uniprot_id='P00001'), Subunit(uniprot_id='P00001'), Subunit(uniprot_id='P00001')])
+        self.session.commit()
+        self.assertEqual(data_source.merge_duplicates(self.session, Subunit, ['uniprot_id'],
+                                                      criterion=Subunit.id != 3), 1)
+        self.session.commit()
+        self.assertEqual(sorted(id for id, in self.session.query(Subunit.id)), [1, 3])
+
+    def test_delete_unreferenced(self):
+        self.session.add_all([Taxon(ncbi_id=9606), Taxon(ncbi_id=562), Taxon(ncbi_id=2097),
+                              Metadata(name='a', taxon_id=562)])
+        self.session.commit()
+
+        # e.g. only the taxa which a build created
+        self.assertEqual(data_source.delete_unreferenced(self.session, Taxon, ids=[562, 2097]), 1)
+        self.assertEqual(sorted(id for id, in self.session.query(Taxon.ncbi_id)), [562, 9606])
+
+        self.assertEqual(data_source.delete_unreferenced(self.session, Taxon), 1)
+        self.assertEqual([id for id, in self.session.query(Taxon.ncbi_id)], [562])
+
+
+class TestHttpDataSource(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dirname = tempfile.mkdtemp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), MockRequestHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        MockRequestHandler.n_requests = 0
+        MockRequestHandler.n_failures = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dirname)
+
+    def test_iter_requests(self):
+        src = MockHttpDataSource(cache_dirname=self.cache_dirname, download_backups=False, load_content=False)
+        url_params = [(self.url, {'id': i}) for i in range(10)]
+
+        texts = [response.text for response in src.iter_requests(url_params, max_concurrent_requests=3)]
+        self.assertEqual(texts, ['id-{}'.format(i) for i in range(10)])
+        self.assertEqual(MockRequestHandler.n_requests, 10)
+
+        # responses are cached
+        texts = [response.text for response in src.iter_requests(url_params)]
+        self.assertEqual(texts, ['id-{}'.format(i) for i in range(10)])
+        self.assertEqual(MockRequestHandler.n_requests, 10)
+        self.assertEqual(src.requests_session.get(self.url, params={'id': 3}).text, 'id-3')
+        self.assertEqual(MockRequestHandler.n_requests, 10)
+
+    def test_download_request_retries(self):
+        src = MockHttpDataSource(cache_dirname=self.cache_dirname, download_backups=False, load_content=False)
+        MockRequestHandler.n_failures = 2
+        responses = list(src.iter_requests([(self.url, {'id': 1})]))
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(MockRequestHandler.n_requests, 3)
+
+        MockRequestHandler.n_failures = src.MAX_HTTP_RETRIES + 1
+        responses = list(src.iter_requests([(self.url, {'id': 2})]))
+        self.assertEqual(responses[0].status_code, 503)
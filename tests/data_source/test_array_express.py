@@ -12,8 +12,10 @@ from datanator.data_source.process_rna_seq import core
 from datanator.data_source.process_rna_seq import download_cdna
 from six.moves.urllib.request import urlretrieve
 import datetime
+import mock
 import os
 import pandas
+import requests
 import shutil
 import tempfile
 import unittest
@@ -420,3 +422,98 @@ class TestHTTPError(unittest.TestCase):
         ax = "E-MTAB-5530"
         src.load_content(test_url="https://www.ebi.ac.uk/arrayexpress/json/v3/experiments/{}".format(ax))
         print("blue")
+
+
+class TestHarvestExperiments(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dirname = tempfile.mkdtemp()
+        self.src = array_express.ArrayExpress(cache_dirname=self.cache_dirname, download_backups=False, load_content=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dirname)
+
+    def test_resume(self):
+        src = self.src
+        session = src.session
+        for id in ['E-1', 'E-2', 'E-3']:
+            session.add(array_express.Experiment(id=id))
+        session.add(array_express.ExperimentHarvest(experiment_id='E-1'))
+        session.commit()
+
+        urls = []
+
+        def iter_requests(url_params):
+            for url, params in url_params:
+                urls.append(url)
+                response = mock.Mock()
+                if url.endswith('/samples'):
+                    response.json.return_value = {}
+                else:
+                    response.json.return_value = {'protocols': {'protocol': {'accession': 'P-' + url.split('/')[-2]}}}
+                yield response
+
+        with mock.patch.object(src, 'iter_requests', side_effect=iter_requests):
+            src.harvest_experiments()
+        session.commit()
+
+        self.assertEqual(urls, [
+            src.get_experiment_samples_url(array_express.Experiment(id='E-2')),
+            src.get_experiment_protocols_url(array_express.Experiment(id='E-2')),
+            src.get_experiment_samples_url(array_express.Experiment(id='E-3')),
+            src.get_experiment_protocols_url(array_express.Experiment(id='E-3')),
+        ])
+        self.assertEqual(set(id for id, in session.query(array_express.ExperimentHarvest.experiment_id)),
+                         set(['E-1', 'E-2', 'E-3']))
+        protocol = session.query(array_express.Protocol).filter_by(protocol_accession='P-E-2').first()
+        self.assertEqual([experiment.id for experiment in protocol.experiments], ['E-2'])
+        self.assertEqual(session.query(array_express.Protocol).filter_by(protocol_accession='P-E-1').count(), 0)
+
+    def test_failed_loads_are_retried(self):
+        src = self.src
+        session = src.session
+        for id in ['E-1', 'E-2', 'E-3']:
+            session.add(array_express.Experiment(id=id))
+        session.commit()
+
+        failed_urls = [
+            src.get_experiment_samples_url(array_express.Experiment(id='E-1')),
+            src.get_experiment_protocols_url(array_express.Experiment(id='E-2')),
+        ]
+
+        def iter_requests(url_params):
+            for url, params in url_params:
+                response = mock.Mock()
+                if url in failed_urls:
+                    response.raise_for_status.side_effect = requests.HTTPError(
+                        '500 Server Error: Internal Server Error for url: ' + url)
+                if url.endswith('/samples'):
+                    response.json.return_value = {}
+                else:
+                    response.json.return_value = {'protocols': {'protocol': {'accession': 'P-' + url.split('/')[-2]}}}
+                yield response
+
+        with mock.patch.object(src, 'iter_requests', side_effect=iter_requests):
+            src.harvest_experiments()
+        session.commit()
+        self.assertEqual(set(id for id, in session.query(array_express.ExperimentHarvest.experiment_id)), set(['E-3']))
+
+        # the failed experiments are harvested again
+        failed_urls = []
+        with mock.patch.object(src, 'iter_requests', side_effect=iter_requests):
+            src.harvest_experiments()
+        session.commit()
+        self.assertEqual(set(id for id, in session.query(array_express.ExperimentHarvest.experiment_id)),
+                         set(['E-1', 'E-2', 'E-3']))
+        protocol = session.query(array_express.Protocol).filter_by(protocol_accession='P-E-1').first()
+        self.assertEqual([experiment.id for experiment in protocol.experiments], ['E-1'])
+
+    def test_other_errors_are_raised(self):
+        src = self.src
+        experiment = array_express.Experiment(id='E-1')
+        response = mock.Mock()
+        response.raise_for_status.side_effect = requests.HTTPError('404 Client Error: Not Found for url: ')
+        with self.assertRaises(requests.HTTPError):
+            src.load_experiment_samples(experiment, response=response)
+        with self.assertRaises(requests.HTTPError):
+            src.load_experiment_protocols(experiment, response=response)
@@ -12,7 +12,14 @@ from datanator.data_source import ezyme
 from datanator.core import data_model
 from datanator.util import molecule_util
 from datanator.util import warning_util
+import json
+import mock
+import os
+import requests
+import shutil
+import tempfile
 import unittest
+import warnings
 
 warning_util.disable_warnings()
 
@@ -241,3 +248,101 @@ class TestEzyme(unittest.TestCase):
         ])
         result = ezyme.Ezyme().run(rxn)
         self.assertEqual(result, None)
+
+
+class TestLocalEzyme(unittest.TestCase):
+    h2o = 'InChI=1S/H2O/h1H2'
+    leu = 'InChI=1S/C6H13NO2/c1-4(2)3-5(7)6(8)9/h4-5H,3,7H2,1-2H3,(H,8,9)/t5-/m0/s1'
+    leuleu = ('InChI=1S/C12H24N2O3/c1-7(2)5-9(13)11(15)14-10(12(16)17)6-8(3)4/h7-10H,5-6,13H2,1-4H3,(H,14,15)'
+              '(H,16,17)/t9-,10-/m0/s1')
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'ezyme.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def make_reaction(self, reactants, products):
+        return data_model.Reaction(participants=[
+            data_model.ReactionParticipant(specie=data_model.Specie(structure=structure), coefficient=-1, order=i)
+            for i, structure in enumerate(reactants)
+        ] + [
+            data_model.ReactionParticipant(specie=data_model.Specie(structure=structure), coefficient=1,
+                                           order=len(reactants) + i)
+            for i, structure in enumerate(products)
+        ])
+
+    def test_get_key(self):
+        rxn = self.make_reaction([self.leuleu, self.h2o], [self.leu])
+        self.assertEqual(json.loads(ezyme.Ezyme.get_key(rxn)), [[self.leuleu, self.leu], [self.h2o, '']])
+
+        self.assertEqual(ezyme.Ezyme.get_key(self.make_reaction([self.leuleu, ''], [self.leu])), None)
+
+    def test_run_many(self):
+        rxn_1 = self.make_reaction([self.leuleu, self.h2o], [self.leu])
+        rxn_2 = self.make_reaction([self.leu], [self.leuleu])
+        rxn_3 = self.make_reaction([self.leuleu, ''], [self.leu])
+        predictions = {
+            ezyme.Ezyme.get_key(rxn_1): [ezyme.EzymeResult('3.5.1', 12.)],
+        }
+
+        stub = ezyme.LocalEzyme(predictions=predictions, cache_filename=self.filename)
+        results = stub.run_many([rxn_1, rxn_2, rxn_1, rxn_3])
+        self.assertEqual([[result.__dict__ for result in rxn_results] if rxn_results is not None else None
+                          for rxn_results in results],
+                         [[{'ec_number': '3.5.1', 'score': 12.}], [], [{'ec_number': '3.5.1', 'score': 12.}], None])
+        self.assertEqual(len(stub.submitted), 2)
+
+        # predictions are cached in memory
+        self.assertEqual(stub.run(rxn_1)[0].ec_number, '3.5.1')
+        self.assertEqual(len(stub.submitted), 2)
+        stub.close()
+
+        # predictions are persisted
+        stub = ezyme.LocalEzyme(cache_filename=self.filename)
+        self.assertEqual(stub.run(rxn_1)[0].__dict__, {'ec_number': '3.5.1', 'score': 12.})
+        self.assertEqual(stub.run(rxn_2), [])
+        self.assertEqual(stub.submitted, [])
+        stub.close()
+
+    def test_errors(self):
+        rxn_1 = self.make_reaction([self.leuleu, self.h2o], [self.leu])
+        rxn_2 = self.make_reaction([self.leu], [self.leuleu])
+        predictions = {
+            ezyme.Ezyme.get_key(rxn_1): [ezyme.EzymeResult('3.5.1', 12.)],
+        }
+
+        stub = ezyme.LocalEzyme(predictions=predictions, cache_filename=self.filename)
+        predict = stub.predict
+
+        def predict_or_fail(pairs):
+            if json.dumps(pairs) == ezyme.Ezyme.get_key(rxn_2):
+                raise requests.exceptions.Timeout('Ezyme timed out')
+            return predict(pairs)
+
+        with mock.patch.object(stub, 'predict', side_effect=predict_or_fail):
+            with warnings.catch_warnings(record=True) as caught_warnings:
+                warnings.simplefilter('always')
+                results = stub.run_many([rxn_1, rxn_2])
+        self.assertEqual(results[0][0].__dict__, {'ec_number': '3.5.1', 'score': 12.})
+        self.assertEqual(results[1], None)
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertIn('Ezyme timed out', str(caught_warnings[0].message))
+        stub.close()
+
+        # the prediction which succeeded was persisted, and the reaction which failed is submitted again
+        stub = ezyme.LocalEzyme(cache_filename=self.filename)
+        self.assertEqual(stub.run(rxn_1)[0].ec_number, '3.5.1')
+        self.assertEqual(stub.run(rxn_2), [])
+        self.assertEqual(stub.submitted, [json.loads(ezyme.Ezyme.get_key(rxn_2))])
+        stub.close()
+
+    def test__run_timeout_and_unexpected_response(self):
+        stub = ezyme.Ezyme(request_timeout=5.)
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(text='<html>Service unavailable</html>')
+        with mock.patch.object(stub, 'get_requests_session', return_value=session):
+            with self.assertRaisesRegex(ValueError, 'location of the results'):
+                stub._run(['reactant'], ['product'])
+        self.assertEqual(session.post.call_args[1]['timeout'], 5.)
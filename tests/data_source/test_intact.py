@@ -9,6 +9,7 @@ Test for IntAct database module
 """
 
 from datanator.data_source import intact
+import os
 import shutil
 import unittest
 import tempfile
@@ -86,3 +87,89 @@ class TestLoadingIntAct(unittest.TestCase):
         self.assertEqual(q.method, 'two hybrid')
         self.assertEqual(q.publication, '12674497')
         self.assertEqual(q.publication_author, 'Moraes et al. (2003)')
+
+
+class TestStreamingInteractions(unittest.TestCase):
+    """
+    Testing parsing PSI-MI TAB files in chunks
+    """
+
+    ROWS = [
+        [
+            'uniprotkb:Q14103-2', 'uniprotkb:Q9Y6M1',
+            'intact:EBI-1|uniprotkb:HNRNPD(gene name)|psi-mi:hnrpd_human(display_short)',
+            'uniprotkb:IGF2BP2(gene name)|psi-mi:if2b2_human(display_short)',
+            'psi-mi:"MI:0018"(two hybrid)', 'Moraes et al. (2003)', 'imex:IM-1|pubmed:12674497',
+            'psi-mi:"MI:0915"(physical association)', 'intact:EBI-2', 'intact-miscore:0.37',
+            'psi-mi:"MI:0499"(unspecified role)', 'psi-mi:"MI:0499"(unspecified role)',
+            'psi-mi:"MI:0326"(protein)', 'psi-mi:"MI:0326"(protein)', '-', '-', '-', '-',
+        ],
+        [
+            'intact:EBI-3', 'uniprotkb:P21127',
+            'psi-mi:ino80_yeast(display_short)', 'uniprotkb:CDK11B(gene name)',
+            'psi-mi:"MI:0007"(anti tag coimmunoprecipitation)', 'Chen et al. (2003)', 'pubmed:12624090',
+            '-', 'intact:EBI-4', '-',
+            '-', '-', '-', '-', 'binding site:1-10', '-', '1', '2',
+        ],
+        [
+            'uniprotkb:Q8IVG9', 'uniprotkb:Q8IVG9',
+            '-', '-', '-', '-', '-', '-', 'intact:EBI-5', '-',
+            '-', '-', '-', '-', '-', '-', '-', '-',
+        ],
+    ]
+
+    def setUp(self):
+        self.cache_dirname = tempfile.mkdtemp()
+        self.intact = intact.IntAct(cache_dirname=self.cache_dirname, download_backups=False, load_content=False,
+                                    chunk_size=2)
+
+        os.makedirs(os.path.join(self.cache_dirname, 'intact', 'psimitab'))
+        with open(self.intact.get_psimitab_filename(), 'w') as file:
+            file.write('\t'.join(intact.IntAct.PSIMITAB_COLUMNS + ['Expansion method(s)']) + '\n')
+            for row in self.ROWS:
+                file.write('\t'.join(row + ['-']) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dirname)
+
+    def test_add_interactions(self):
+        self.intact.add_interactions()
+        self.intact.session.commit()
+        self.assertEqual(self.intact.session.query(intact.ProteinInteraction).count(), 3)
+
+        q = self.intact.session.query(intact.ProteinInteraction).filter_by(protein_a='Q14103-2').first()
+        self.assertEqual(q.protein_b, 'Q9Y6M1')
+        self.assertEqual(q.gene_a, 'HNRNPD')
+        self.assertEqual(q.gene_b, 'IGF2BP2')
+        self.assertEqual(q.type_a, 'protein')
+        self.assertEqual(q.role_b, 'unspecified role')
+        self.assertEqual(q.method, 'two hybrid')
+        self.assertEqual(q.interaction_type, 'physical association')
+        self.assertEqual(q.publication, '12674497')
+        self.assertEqual(q.publication_author, 'Moraes et al. (2003)')
+        self.assertEqual(q.confidence, 'intact-miscore:0.37')
+
+        q = self.intact.session.query(intact.ProteinInteraction).filter_by(interaction_id='intact:EBI-4').first()
+        self.assertEqual(q.protein_a, 'ino80_yeast')
+        self.assertEqual(q.gene_a, None)
+        self.assertEqual(q.protein_b, 'P21127')
+        self.assertEqual(q.gene_b, 'CDK11B')
+        self.assertEqual(q.interaction_type, None)
+        self.assertEqual(q.publication, '12624090')
+        self.assertEqual(q.feature_a, 'binding site:1-10')
+        self.assertEqual(q.stoich_b, '2')
+
+        q = self.intact.session.query(intact.ProteinInteraction).filter_by(interaction_id='intact:EBI-5').first()
+        self.assertEqual(q.protein_a, 'Q8IVG9')
+        self.assertEqual(q.method, None)
+        self.assertEqual(q.publication, None)
+
+    def test_max_entries(self):
+        self.intact.max_entries = 3
+        self.intact.add_interactions()
+        self.assertEqual(self.intact.session.query(intact.ProteinInteraction).count(), 3)
+
+        self.intact.session.query(intact.ProteinInteraction).delete()
+        self.intact.max_entries = 1
+        self.intact.add_interactions()
+        self.assertEqual(self.intact.session.query(intact.ProteinInteraction).count(), 1)
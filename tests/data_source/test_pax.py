@@ -11,6 +11,7 @@
 import unittest
 from datanator.data_source import pax
 from sqlalchemy.orm import sessionmaker
+import os
 import tempfile
 import shutil
 
@@ -89,3 +90,55 @@ class TestPaxDBCreation(unittest.TestCase):
             self.assertEqual(refined_data.score, 0.61)
             self.assertEqual(refined_data.weight, 20)
             self.assertEqual(refined_data.taxon_ncbi_id, 882)
+
+
+class TestParseDatasetFile(unittest.TestCase):
+
+    HEADER = ('#id: 1\n'
+              '#name: D.vulgaris - Whole organism (Integrated)\n'
+              '#score: 2.47\n'
+              '#weight: 100.0%\n'
+              '#description: <a href="http://www.ncbi.nlm.nih.gov/pubmed/16950916" target="_blank">Zhang</a>\n'
+              '#organ: WHOLE_ORGANISM\n'
+              '#integrated : false\n'
+              '#coverage: 27\n'
+              '#\n'
+              '#\n'
+              '#\n'
+              '#internal_id\tstring_external_id\tabundance\n')
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dirname, '882'))
+        self.filename = os.path.join(self.dirname, '882', '882-Desulfo_Form_Exp_SC_zhang_2006.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_parse_dataset_file(self):
+        with open(self.filename, 'w') as file:
+            file.write(self.HEADER)
+            file.write('1\t882.DVU0001\t10.5\n')
+            file.write('2\t882.DVU0002\t3\n')
+
+        metadata, observations = pax.parse_dataset_file(self.filename)
+        self.assertEqual(metadata, {
+            'ncbi_id': 882,
+            'file_name': '882/882-Desulfo_Form_Exp_SC_zhang_2006.txt',
+            'species_name': 'D.vulgaris',
+            'score': 2.47,
+            'weight': 100.,
+            'publication': 'http://www.ncbi.nlm.nih.gov/pubmed/16950916',
+            'organ': 'WHOLE_ORGANISM',
+            'coverage': 27.,
+        })
+        self.assertEqual(observations.to_dict('records'), [
+            {'protein_id': 1, 'string_id': '882.DVU0001', 'abundance': '10.5'},
+            {'protein_id': 2, 'string_id': '882.DVU0002', 'abundance': '3'},
+        ])
+
+    def test_parse_invalid_dataset_file(self):
+        with open(self.filename, 'w') as file:
+            file.write(self.HEADER.replace('#score', '#scores'))
+
+        self.assertEqual(pax.parse_dataset_file(self.filename), (None, 'invalid #score field'))
@@ -0,0 +1,102 @@
+""" Tests of the PubChem name resolver
+
+:Date: 2018-09-21
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.data_source import pubchem
+import mock
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import warnings
+
+
+class TestPubChemNameResolver(unittest.TestCase):
+    water = pubchem.PubChemCompound(cid=962, inchi='InChI=1S/H2O/h1H2')
+    aspartate = [
+        pubchem.PubChemCompound(cid=5960, inchi='InChI=1S/C4H7NO4/c5-2(4(8)9)1-3(6)7/h2H,1,5H2,(H,6,7)(H,8,9)/t2-/m0/s1'),
+        pubchem.PubChemCompound(cid=5460294,
+                                inchi='InChI=1S/C4H7NO4/c5-2(4(8)9)1-3(6)7/h2H,1,5H2,(H,6,7)(H,8,9)/p-1/t2-/m0/s1'),
+    ]
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.backend = pubchem.LocalPubChemBackend({'water': [self.water], 'Aspartate': self.aspartate})
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_resolve(self):
+        resolver = pubchem.PubChemNameResolver(backend=self.backend, min_request_interval=0.)
+        self.assertEqual(resolver.resolve('water'), [self.water])
+
+        results = resolver.resolve_many(['Aspartate', 'unknown', 'water', 'unknown'])
+        self.assertEqual(list(results.keys()), ['Aspartate', 'unknown', 'water'])
+        self.assertEqual(results['Aspartate'], self.aspartate)
+        self.assertEqual(results['unknown'], [])
+        self.assertEqual(sorted(self.backend.names), ['Aspartate', 'unknown', 'water'])
+
+        self.assertEqual(resolver.resolve('unknown'), [])
+        self.assertEqual(len(self.backend.names), 3)
+
+    def test_persistence(self):
+        filename = os.path.join(self.dirname, 'pubchem', 'names.sqlite')
+        resolver = pubchem.PubChemNameResolver(backend=self.backend, filename=filename, min_request_interval=0.)
+        resolver.resolve_many(['water', 'Aspartate', 'unknown'])
+        resolver.close()
+
+        backend = pubchem.LocalPubChemBackend()
+        resolver = pubchem.PubChemNameResolver(backend=backend, filename=filename)
+        results = resolver.resolve_many(['water', 'Aspartate', 'unknown'])
+        self.assertEqual(results['water'], [self.water])
+        self.assertEqual(results['Aspartate'], self.aspartate)
+        self.assertEqual(results['unknown'], [])
+        self.assertEqual(backend.names, [])
+        resolver.close()
+
+    def test_errors(self):
+        filename = os.path.join(self.dirname, 'names.sqlite')
+        resolver = pubchem.PubChemNameResolver(backend=self.backend, filename=filename, min_request_interval=0.)
+        get_compounds = self.backend.get_compounds
+
+        def get_compounds_or_fail(name):
+            if name == 'Aspartate':
+                raise IOError('PubChem is unavailable')
+            return get_compounds(name)
+
+        with mock.patch.object(self.backend, 'get_compounds', side_effect=get_compounds_or_fail):
+            with warnings.catch_warnings(record=True) as caught_warnings:
+                warnings.simplefilter('always')
+                results = resolver.resolve_many(['water', 'Aspartate', 'unknown'])
+        self.assertEqual(list(results.keys()), ['water', 'Aspartate', 'unknown'])
+        self.assertEqual(results['water'], [self.water])
+        self.assertEqual(results['Aspartate'], [])
+        self.assertEqual(results['unknown'], [])
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertIn('Aspartate', str(caught_warnings[0].message))
+        resolver.close()
+
+        # the names which were resolved were cached, and the name which failed is tried again
+        backend = pubchem.LocalPubChemBackend({'Aspartate': self.aspartate})
+        resolver = pubchem.PubChemNameResolver(backend=backend, filename=filename, min_request_interval=0.)
+        results = resolver.resolve_many(['water', 'Aspartate', 'unknown'])
+        self.assertEqual(results['water'], [self.water])
+        self.assertEqual(results['Aspartate'], self.aspartate)
+        self.assertEqual(backend.names, ['Aspartate'])
+        resolver.close()
+
+    def test_rate_limit(self):
+        resolver = pubchem.PubChemNameResolver(backend=self.backend, max_concurrent_requests=4,
+                                               min_request_interval=0.05)
+        start = time.time()
+        resolver.resolve_many(['name {}'.format(i) for i in range(5)])
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_get_name_resolver(self):
+        self.assertIs(pubchem.get_name_resolver(self.dirname), pubchem.get_name_resolver(self.dirname))
+        self.assertEqual(pubchem.get_name_resolver(self.dirname).filename,
+                         os.path.join(self.dirname, 'PubChemNames.sqlite'))
@@ -12,12 +12,14 @@ from cement.utils import test
 from datanator.__main__ import App
 from datanator.util import warning_util
 import datanator
+import datanator.__main__
 import mock
 import os
 import re
 import shutil
 import sqlalchemy.orm
 import sqlalchemy_utils
+import sys
 import tempfile
 import unittest
 from os import path
@@ -39,6 +41,14 @@ class BaseControllerTestCase(unittest.TestCase):
                     app.run()
                 self.assertEqual(capture_output.get_text(), datanator.__version__)
 
+    def test_import_profile(self):
+        with mock.patch.object(sys, 'argv', ['datanator', '--import-profile', 'taxonomy']):
+            with mock.patch('datanator.util.import_util.profile_imports', return_value=0) as profile_imports:
+                with self.assertRaises(SystemExit) as context:
+                    datanator.__main__.main()
+        profile_imports.assert_called_once_with(['-m', 'datanator', 'taxonomy'])
+        self.assertEqual(context.exception.code, 0)
+
 
 class TestUploadData(unittest.TestCase):
 
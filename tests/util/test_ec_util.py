@@ -0,0 +1,34 @@
+""" Tests of the EC number utilities
+
+:Date: 2018-09-20
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util import ec_util
+import unittest
+
+
+class TestEcUtil(unittest.TestCase):
+
+    def test_get_ec_classes(self):
+        self.assertEqual(ec_util.get_ec_classes('1.2.3.4'), ('1', '1.2', '1.2.3', '1.2.3.4'))
+        self.assertEqual(ec_util.get_ec_classes('1.2.3'), ('1', '1.2', '1.2.3', None))
+        self.assertEqual(ec_util.get_ec_classes('1.2.3.'), ('1', '1.2', '1.2.3', None))
+        self.assertEqual(ec_util.get_ec_classes('1.2.3.-'), ('1', '1.2', '1.2.3', '1.2.3.-'))
+        self.assertEqual(ec_util.get_ec_classes(''), (None, None, None, None))
+        self.assertIs(ec_util.get_ec_classes('1.2.3.4'), ec_util.get_ec_classes('1.2.3.4'))
+
+    def test_get_ec_level(self):
+        self.assertEqual(ec_util.get_ec_level('1.2.3.4'), 4)
+        self.assertEqual(ec_util.get_ec_level('1.2.3.'), 3)
+        self.assertEqual(ec_util.get_ec_level('1'), 1)
+
+    def test_get_common_ec_level(self):
+        self.assertEqual(ec_util.get_common_ec_level(['1.1.1.1'], ['1.1.1.1']), 4)
+        self.assertEqual(ec_util.get_common_ec_level(['1.1.1.1'], ['1.1.1.2']), 3)
+        self.assertEqual(ec_util.get_common_ec_level(['1.1.1.1'], ['1.1.1']), 3)
+        self.assertEqual(ec_util.get_common_ec_level(['1.1.1'], ['1.1.1.1']), 3)
+        self.assertEqual(ec_util.get_common_ec_level(['2.1.1.1', '1.1.2.1'], ['1.1.1.1']), 2)
+        self.assertEqual(ec_util.get_common_ec_level(['1.1.1.1'], ['2.1.1.1']), 0)
+        self.assertEqual(ec_util.get_common_ec_level([], ['1.1.1.1']), 0)
@@ -0,0 +1,65 @@
+""" Tests of the fingerprint utilities
+
+:Date: 2018-09-24
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util import fingerprint_util
+import datetime
+import sqlalchemy
+import sqlalchemy.ext.declarative
+import sqlalchemy.orm
+import unittest
+
+Base = sqlalchemy.ext.declarative.declarative_base()
+
+
+class Dataset(Base):
+    __tablename__ = 'dataset'
+    _id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String())
+    created = sqlalchemy.Column(sqlalchemy.DateTime)
+
+
+class Sample(Base):
+    __tablename__ = 'sample'
+    _id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    name = sqlalchemy.Column(sqlalchemy.String())
+    dataset_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('dataset._id'))
+    dataset = sqlalchemy.orm.relationship('Dataset', backref=sqlalchemy.orm.backref('samples'))
+
+
+class TestFingerprintUtil(unittest.TestCase):
+
+    def test_calc_fingerprint(self):
+        self.assertEqual(fingerprint_util.calc_fingerprint({'a': 1, 'b': [2, 3]}),
+                         fingerprint_util.calc_fingerprint({'b': [2, 3], 'a': 1}))
+        self.assertNotEqual(fingerprint_util.calc_fingerprint({'a': 1, 'b': [2, 3]}),
+                            fingerprint_util.calc_fingerprint({'a': 1, 'b': [3, 2]}))
+        self.assertEqual(len(fingerprint_util.calc_fingerprint(datetime.datetime(2018, 9, 24))), 40)
+
+    def test_get_column_values(self):
+        dataset = Dataset(_id=1, name='dataset', created=datetime.datetime(2018, 9, 24))
+        sample = Sample(_id=2, name='sample', dataset_id=1)
+        self.assertEqual(fingerprint_util.get_column_values(dataset),
+                         {'name': 'dataset', 'created': datetime.datetime(2018, 9, 24)})
+        self.assertEqual(fingerprint_util.get_column_values(dataset, exclude=('created',)), {'name': 'dataset'})
+        self.assertEqual(fingerprint_util.get_column_values(sample), {'name': 'sample'})
+
+    def test_get_object_values(self):
+        dataset_1 = Dataset(_id=1, name='dataset', samples=[Sample(_id=1, name='a'), Sample(_id=2, name='b')])
+        dataset_2 = Dataset(_id=2, name='dataset', samples=[Sample(_id=4, name='b'), Sample(_id=3, name='a')])
+        values_1 = fingerprint_util.get_object_values(dataset_1, ['samples', 'missing'])
+        values_2 = fingerprint_util.get_object_values(dataset_2, ['samples', 'missing'])
+        self.assertEqual(values_1, values_2)
+        self.assertEqual(values_1['samples'], ['{"name": "a"}', '{"name": "b"}'])
+        self.assertEqual(values_1['missing'], [])
+
+        dataset_2.samples[0].name = 'c'
+        self.assertNotEqual(fingerprint_util.calc_fingerprint(fingerprint_util.get_object_values(dataset_1, ['samples'])),
+                            fingerprint_util.calc_fingerprint(fingerprint_util.get_object_values(dataset_2, ['samples'])))
+
+        sample = Sample(_id=1, name='a', dataset=dataset_1)
+        self.assertEqual(fingerprint_util.get_object_values(sample, ['dataset'])['dataset'],
+                         ['{"created": null, "name": "dataset"}'])
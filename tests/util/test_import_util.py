@@ -0,0 +1,77 @@
+""" Tests of the import utilities
+
+:Date: 2018-09-17
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util import import_util
+from six.moves import StringIO
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+class TestLazyModule(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dirname, 'lazy_pkg'))
+        with open(os.path.join(self.dirname, 'lazy_pkg', '__init__.py'), 'w') as file:
+            file.write('from datanator.util import import_util\n')
+            file.write("import_util.make_lazy(__name__, submodules=['sub'], attributes={'value': 'lazy_pkg.sub'})\n")
+        with open(os.path.join(self.dirname, 'lazy_pkg', 'sub.py'), 'w') as file:
+            file.write('value = 1\n')
+        sys.path.insert(0, self.dirname)
+
+    def tearDown(self):
+        sys.path.remove(self.dirname)
+        for name in ['lazy_pkg', 'lazy_pkg.sub']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.dirname)
+
+    def test(self):
+        import lazy_pkg
+        self.assertIsInstance(lazy_pkg, import_util.LazyModule)
+        self.assertNotIn('lazy_pkg.sub', sys.modules)
+        self.assertIn('sub', dir(lazy_pkg))
+
+        self.assertEqual(lazy_pkg.value, 1)
+        self.assertIn('lazy_pkg.sub', sys.modules)
+        self.assertIs(lazy_pkg.sub, sys.modules['lazy_pkg.sub'])
+
+        with self.assertRaisesRegexp(AttributeError, 'has no attribute'):
+            lazy_pkg.other
+
+    def test_datanator(self):
+        code = 'import datanator, sys; print(sorted(set(["flask", "sqlalchemy", "numpy"]) & set(sys.modules)))'
+        output = subprocess.check_output([sys.executable, '-c', code]).decode()
+        self.assertEqual(output.strip(), '[]')
+
+
+class TestImportProfile(unittest.TestCase):
+
+    def test_parse_import_times(self):
+        times, other_lines = import_util.parse_import_times([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       203 |        203 |   _io',
+            'import time:       401 |       1093 | _frozen_importlib_external',
+            'Warning',
+        ])
+        self.assertEqual(times, [
+            import_util.ImportTime(module='_io', self_time=203e-6, cumulative_time=203e-6, depth=1),
+            import_util.ImportTime(module='_frozen_importlib_external', self_time=401e-6, cumulative_time=1093e-6,
+                                   depth=0),
+        ])
+        self.assertEqual(other_lines, ['Warning'])
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Profiling imports requires Python 3.7 or later')
+    def test_profile_imports(self):
+        out = StringIO()
+        self.assertEqual(import_util.profile_imports(['-c', 'import json'], n_modules=1000, out=out), 0)
+        report = out.getvalue()
+        self.assertIn('Total import time', report)
+        self.assertRegexpMatches(report, r'\d+\.\d+  json\n')
@@ -10,7 +10,10 @@ from datanator.util import molecule_util
 from datanator.util import warning_util
 from wc_utils.util.types import assert_value_equal
 import numpy
+import os
 import pybel
+import shutil
+import tempfile
 import unittest
 
 warning_util.disable_warnings()
@@ -74,6 +77,115 @@ class TestMolecule(unittest.TestCase):
         numpy.testing.assert_almost_equal(atp.get_similarity(adp), 0.955, decimal=3)
 
 
+class TestFingerprintStore(unittest.TestCase):
+    adp = TestMolecule.adp['smiles']
+    atp = TestMolecule.atp['smiles']
+    h2o = TestMolecule.h2o
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_get_key(self):
+        store = molecule_util.FingerprintStore()
+        self.assertEqual(store.get_key(self.h2o['smiles']), self.h2o['inchi'])
+        self.assertEqual(store.get_key(self.h2o['mol']), self.h2o['inchi'])
+        self.assertEqual(store.get_key(self.h2o['inchi']), self.h2o['inchi'])
+        self.assertEqual(store.keys, [self.h2o['inchi']])
+        self.assertEqual(store.get_fingerprint_matrix().shape[0], 1)
+
+        with self.assertRaisesRegexp(ValueError, 'Invalid structure'):
+            store.get_key(self.h2o['inchi'][6:])
+
+    def test_get_fingerprint(self):
+        store = molecule_util.FingerprintStore()
+        fp = molecule_util.Molecule(structure=self.adp).get_fingerprint('fp2')
+        numpy.testing.assert_equal(store.get_fingerprint(self.adp), numpy.array(fp.fp, dtype=numpy.uint64))
+
+    def test_get_similarities(self):
+        store = molecule_util.FingerprintStore()
+        queries = [self.adp, self.atp]
+        library = [self.atp, self.h2o['smiles'], self.adp]
+        similarities = store.get_similarities(queries, library)
+        self.assertEqual(similarities.shape, (2, 3))
+        for i_query, query in enumerate(queries):
+            for i_library, lib in enumerate(library):
+                fp_query = molecule_util.Molecule(structure=query).get_fingerprint('fp2')
+                fp_lib = molecule_util.Molecule(structure=lib).get_fingerprint('fp2')
+                numpy.testing.assert_almost_equal(similarities[i_query, i_library], fp_query | fp_lib)
+
+        numpy.testing.assert_almost_equal(store.get_similarity(self.adp, self.atp), 0.955, decimal=3)
+        self.assertEqual(store.get_similarities([], library).shape, (0, 3))
+
+    def test_calc_tanimoto(self):
+        query = numpy.array([[0b1111, 0], [0, 0]], dtype=numpy.uint32)
+        library = numpy.array([[0b0011, 0], [0b1111, 0b1], [0, 0]], dtype=numpy.uint32)
+        similarities = molecule_util.FingerprintStore.calc_tanimoto(query, library)
+        numpy.testing.assert_equal(similarities, numpy.array([[0.5, 0.8, 0.], [0., 0., numpy.nan]]))
+
+    def test_save(self):
+        filename = os.path.join(self.dirname, 'fp2.npy')
+        store = molecule_util.FingerprintStore(filename=filename)
+        similarities = store.get_similarities([self.adp], [self.atp, self.h2o['smiles']])
+        store.save()
+
+        store_2 = molecule_util.FingerprintStore(filename=filename)
+        self.assertEqual(store_2.keys, store.keys)
+        numpy.testing.assert_equal(store_2.get_fingerprint_matrix(), store.get_fingerprint_matrix())
+        numpy.testing.assert_equal(store_2.get_similarities([self.adp], [self.atp, self.h2o['smiles']]), similarities)
+        self.assertEqual(len(store_2.keys), 3)
+
+    def test_get_fingerprint_store(self):
+        self.assertIs(molecule_util.get_fingerprint_store('fp2'), molecule_util.get_fingerprint_store('fp2'))
+        self.assertIsNot(molecule_util.get_fingerprint_store('fp2'), molecule_util.get_fingerprint_store('fp3'))
+
+
+class TestInchiNormalizer(unittest.TestCase):
+    adp = TestMolecule.adp['smiles']
+    h2o = TestMolecule.h2o
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_to_inchi(self):
+        normalizer = molecule_util.InchiNormalizer(cache_size=1)
+        self.assertEqual(normalizer.to_inchi(self.h2o['smiles']), self.h2o['inchi'])
+        self.assertEqual(normalizer.to_inchi(self.h2o['mol'], only_formula_and_connectivity=True), 'H2O')
+        self.assertEqual(list(normalizer._caches['inchi'].keys()), [self.h2o['mol']])
+
+        with self.assertRaisesRegexp(ValueError, 'Invalid structure'):
+            normalizer.get_inchi(self.h2o['inchi'][6:])
+        with self.assertRaisesRegexp(ValueError, 'not a valid InChI string'):
+            normalizer.get_formula_and_connectivity(self.h2o['inchi'][6:])
+
+    def test_normalize_many(self):
+        normalizer = molecule_util.InchiNormalizer(processes=2, pool_min_size=2)
+        structures = [self.adp, self.h2o['smiles'], 'invalid', self.h2o['smiles']]
+        inchis = normalizer.get_inchis(structures)
+        expected = [molecule_util.Molecule(structure=structure).to_inchi() for structure in structures[0:2]]
+        self.assertEqual(inchis, expected + [None, self.h2o['inchi']])
+        self.assertEqual(normalizer.get_formulas_and_connectivities(inchis[1:3]), ['H2O', None])
+
+    def test_persistence(self):
+        filename = os.path.join(self.dirname, 'normalizer', 'inchi.sqlite')
+        normalizer = molecule_util.InchiNormalizer(filename=filename)
+        self.assertEqual(normalizer.get_inchis([self.h2o['smiles'], 'invalid']), [self.h2o['inchi'], None])
+        normalizer.close()
+
+        normalizer_2 = molecule_util.InchiNormalizer(filename=filename)
+        normalizer_2.CONVERSIONS = {'inchi': None}
+        self.assertEqual(normalizer_2.get_inchis([self.h2o['smiles'], 'invalid']), [self.h2o['inchi'], None])
+        normalizer_2.close()
+
+    def test_get_inchi_normalizer(self):
+        self.assertIs(molecule_util.get_inchi_normalizer(), molecule_util.get_inchi_normalizer())
+
+
 class TestInchiMolecule(unittest.TestCase):
 
     def test(self):
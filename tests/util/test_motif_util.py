@@ -0,0 +1,100 @@
+""" Tests of the motif utilities
+
+:Date: 2018-09-14
+:Copyright: 2018, Karr Lab
+:License: MIT
+"""
+
+from datanator.util import motif_util
+import numpy
+import unittest
+
+
+class TestPositionWeightMatrixLibrary(unittest.TestCase):
+
+    def setUp(self):
+        # binding matrices (width x A, C, G, T) of widths 4, 4 and 3
+        self.counts = [
+            [[10, 0, 0, 0], [0, 10, 0, 0], [0, 0, 10, 0], [0, 0, 0, 10]],
+            [[5, 5, 0, 0], [0, 0, 5, 5], [10, 0, 0, 0], [0, 0, 0, 10]],
+            [[0, 0, 10, 0], [10, 0, 0, 0], [0, 0, 10, 0]],
+        ]
+        self.library = motif_util.PositionWeightMatrixLibrary(self.counts, ids=['ACGT', 'MKAT', 'GAG'])
+
+    def calc_score(self, counts, site):
+        score = 0.
+        for column, base in zip(counts, site):
+            if base not in 'ACGT' or not column['ACGT'.index(base)]:
+                return -numpy.inf
+            score += numpy.log2(column['ACGT'.index(base)] / float(sum(column)) / 0.25)
+        return score
+
+    def scan(self, sequence, min_score):
+        complements = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+        sites = []
+        for index, counts in enumerate(self.counts):
+            width = len(counts)
+            for position in range(len(sequence) - width + 1):
+                site = sequence[position:position + width]
+                rc_site = ''.join(complements.get(base, 'N') for base in reversed(site))
+                for strand, bases in [(1, site), (-1, rc_site)]:
+                    score = self.calc_score(counts, bases)
+                    if score >= min_score:
+                        sites.append((index, position, strand, score))
+        return sites
+
+    def test_init(self):
+        self.assertEqual(sorted(self.library.groups.keys()), [3, 4])
+        self.assertEqual(list(self.library.groups[4][0]), [0, 1])
+        self.assertEqual(self.library.groups[4][1].shape, (2, 4, 5))
+        self.assertEqual(self.library.groups[4][1][0, 0, 0], 2.)
+        self.assertEqual(self.library.groups[4][1][0, 0, 1], -numpy.inf)
+
+        with self.assertRaisesRegexp(ValueError, 'number of ids'):
+            motif_util.PositionWeightMatrixLibrary(self.counts, ids=['ACGT'])
+
+    def test_encode(self):
+        numpy.testing.assert_equal(self.library.encode('ACGTacgtN-'), [0, 1, 2, 3, 0, 1, 2, 3, 4, 4])
+
+    def test_scan(self):
+        sequence = 'TTACGTAGAGNACGTCATTCTCAAACGTGGAG'
+        sites = self.library.scan(sequence, min_score=2.)
+        expected = sorted(self.scan(sequence, 2.), key=lambda site: (site[0], site[1], -site[2]))
+        self.assertEqual([site[0:3] for site in sites], [site[0:3] for site in expected])
+        numpy.testing.assert_allclose([site[3] for site in sites], [site[3] for site in expected])
+
+        # ACGT is its own reverse complement
+        self.assertIn((0, 2, 1, 8.), sites)
+        self.assertIn((0, 2, -1, 8.), sites)
+
+        self.assertEqual(self.library.scan(sequence, min_score=2., widths=[3]),
+                         [site for site in sites if site[0] == 2])
+        self.assertEqual(self.library.scan(sequence, min_score=2., both_strands=False),
+                         [site for site in sites if site[2] == 1])
+        self.assertEqual(self.library.scan('AC'), [])
+
+    def test_scan_windows(self):
+        sequence = 'TTACGTAGAGNACGTCATTCTCAAACGTGGAG' * 10
+        sites = self.library.scan(sequence, min_score=2.)
+        self.assertEqual(self.library.scan(sequence, min_score=2., window_size=7), sites)
+        self.assertEqual(self.library.scan(iter([sequence[i:i + 5] for i in range(0, len(sequence), 5)]),
+                                           min_score=2., window_size=11), sites)
+
+        # the header lines of FASTA files are skipped
+        lines = ['>seq1 promoter\n'] + [sequence[i:i + 60] + '\n' for i in range(0, len(sequence), 60)]
+        self.assertEqual(self.library.scan(iter(lines), min_score=2., window_size=11), sites)
+        self.assertEqual(self.library.scan(iter(line.encode() for line in lines), min_score=2., window_size=11), sites)
+
+    def test_score_thresholds(self):
+        # the only site of ACGT scores 8 and has a probability of 4 ** -4
+        thresholds = self.library.get_score_thresholds(4 ** -4)
+        self.assertAlmostEqual(thresholds[0], 8.)
+        self.assertEqual(thresholds[2], numpy.inf)
+        numpy.testing.assert_equal(self.library.get_score_thresholds(4 ** -4), thresholds)
+
+        self.assertEqual(self.library.get_score_thresholds(1.)[0], 8.)
+        self.assertAlmostEqual(self.library.get_score_thresholds(4 ** -3)[2], 6.)
+
+        sequence = 'TTACGTAGAGNACGTCATTCTCAAACGTGGAG'
+        sites = self.library.scan(sequence, min_score=None, max_p_value=4 ** -4)
+        self.assertEqual(set(site[0] for site in sites), set([0]))
@@ -8,6 +8,11 @@
 """
 
 from datanator.util import taxonomy_util
+import mock
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
 
 
@@ -172,3 +177,86 @@ class TestTaxonomyUtil(unittest.TestCase):
         self.assertEqual(taxonomy_util.Taxon(name='mycoplasma genitalium G37').get_max_distance_to_common_ancestor(), 10)
         self.assertEqual(taxonomy_util.Taxon(name='mycoplasma genitalium XXX').get_max_distance_to_common_ancestor(), 10)
         self.assertEqual(taxonomy_util.Taxon(name='mycoplasma genitalium XXX YYY').get_max_distance_to_common_ancestor(), 11)
+
+
+class TestNcbiTaxonomyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+        self.index = taxonomy_util.NcbiTaxonomyIndex.build(dirname=os.path.join(self.dirname, 'index'),
+                                                           ncbi_taxa=self.get_ncbi_taxa())
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def get_ncbi_taxa(self):
+        # root
+        # └── cellular organisms (131567)
+        #     ├── Bacteria (2)
+        #     │   ├── Mycoplasma (2093)
+        #     │   │   ├── Mycoplasma genitalium (2097)
+        #     │   │   │   └── Mycoplasma genitalium G37 (243273)
+        #     │   │   └── Mycoplasma pneumoniae (2104)
+        #     │   └── Escherichia (561)
+        #     └── Eukaryota (2759)
+        db = sqlite3.connect(':memory:')
+        db.execute('CREATE TABLE species (taxid INT PRIMARY KEY, parent INT, spname VARCHAR(50), rank VARCHAR(50))')
+        db.execute('CREATE TABLE synonym (taxid INT, spname VARCHAR(50))')
+        db.execute('CREATE TABLE merged (taxid_old INT, taxid_new INT)')
+        db.executemany('INSERT INTO species VALUES (?, ?, ?, ?)', [
+            (1, 1, 'root', 'no rank'),
+            (131567, 1, 'cellular organisms', 'no rank'),
+            (2, 131567, 'Bacteria', 'superkingdom'),
+            (2759, 131567, 'Eukaryota', 'superkingdom'),
+            (2093, 2, 'Mycoplasma', 'genus'),
+            (561, 2, 'Escherichia', 'genus'),
+            (2097, 2093, 'Mycoplasma genitalium', 'species'),
+            (2104, 2093, 'Mycoplasma pneumoniae', 'species'),
+            (243273, 2097, 'Mycoplasma genitalium G37', 'no rank'),
+        ])
+        db.execute('INSERT INTO synonym VALUES (2, "Eubacteria")')
+        db.execute('INSERT INTO merged VALUES (99999, 2104)')
+        return mock.Mock(db=db)
+
+    def test_load(self):
+        self.assertTrue(taxonomy_util.NcbiTaxonomyIndex.exists(os.path.join(self.dirname, 'index')))
+        index = taxonomy_util.NcbiTaxonomyIndex(os.path.join(self.dirname, 'index'))
+        self.assertEqual(index.get_name(2097), 'Mycoplasma genitalium')
+
+    def test_names(self):
+        self.assertEqual(self.index.get_ncbi_id_by_name('mycoplasma genitalium'), 2097)
+        self.assertEqual(self.index.get_ncbi_id_by_name('Eubacteria'), 2)
+        self.assertEqual(self.index.get_ncbi_id_by_name('mycoplasma XXX'), None)
+        self.assertEqual(self.index.get_name(243273), 'Mycoplasma genitalium G37')
+        self.assertEqual(self.index.get_name(99999), 'Mycoplasma pneumoniae')
+        self.assertEqual(self.index.get_name(-1), None)
+        self.assertEqual(self.index.get_rank(2093), 'genus')
+
+    def test_lineage(self):
+        self.assertEqual(self.index.get_lineage(243273), [1, 131567, 2, 2093, 2097, 243273])
+        self.assertEqual(self.index.get_distance_to_root(1), 0)
+        self.assertEqual(self.index.get_distance_to_root(243273), 5)
+
+    def test_common_ancestor(self):
+        self.assertEqual(self.index.get_common_ancestor(2097, 2104), 2093)
+        self.assertEqual(self.index.get_common_ancestor(243273, 2097), 2097)
+        self.assertEqual(self.index.get_common_ancestor(243273, 561), 2)
+        self.assertEqual(self.index.get_common_ancestor(243273, 2759), 131567)
+        self.assertEqual(self.index.get_common_ancestor(561, 561), 561)
+        self.assertEqual(self.index.get_common_ancestor(561, -1), None)
+
+        self.assertEqual(self.index.get_distance_to_common_ancestor(243273, 2104), 2)
+        self.assertEqual(self.index.get_distance_to_common_ancestor(2104, 243273), 1)
+        self.assertEqual(self.index.get_distance_to_common_ancestor(243273, 2759), 4)
+
+    def test_common_ancestor_across_blocks(self):
+        with mock.patch.object(taxonomy_util.NcbiTaxonomyIndex, 'BLOCK_SIZE', 2):
+            index = taxonomy_util.NcbiTaxonomyIndex.build(dirname=os.path.join(self.dirname, 'index_2'),
+                                                          ncbi_taxa=self.get_ncbi_taxa())
+            for ncbi_id_a in index.taxids:
+                for ncbi_id_b in index.taxids:
+                    lineage_a = index.get_lineage(ncbi_id_a)
+                    lineage_b = index.get_lineage(ncbi_id_b)
+                    common_lineage = [a for a, b in zip(lineage_a, lineage_b) if a == b]
+                    self.assertEqual(index.get_common_ancestor(ncbi_id_a, ncbi_id_b), common_lineage[-1])